@@ -0,0 +1,65 @@
+"""add rule_message_matches and rule_match_state tables
+
+Revision ID: 2b6f1c9d4e8a
+Revises: 7d3a9e5c2b18
+Create Date: 2026-10-16 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b6f1c9d4e8a'
+down_revision = '7d3a9e5c2b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """创建规则匹配结果表
+
+    已有消息的匹配结果不在迁移中计算，由规则匹配服务的后台对账按 (规则, 群组) 分批回填。
+    """
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+
+    if 'rule_message_matches' not in tables:
+        op.create_table(
+            'rule_message_matches',
+            sa.Column('rule_id', sa.Integer(), nullable=False),
+            sa.Column('message_id', sa.Integer(), nullable=False),
+            sa.Column('group_id', sa.Integer(), nullable=False),
+            sa.Column('message_date', sa.DateTime(timezone=True), nullable=False),
+            sa.Column('matched_keyword', sa.String(length=255), nullable=True),
+            sa.Column('matched_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+            sa.ForeignKeyConstraint(['rule_id'], ['filter_rules.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['message_id'], ['telegram_messages.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('rule_id', 'message_id'),
+        )
+        op.create_index(
+            'ix_rule_message_matches_lookup', 'rule_message_matches',
+            ['group_id', 'rule_id', 'message_date', 'message_id', 'matched_keyword'], unique=False,
+        )
+        op.create_index('ix_rule_message_matches_message', 'rule_message_matches', ['message_id'], unique=False)
+
+    if 'rule_match_state' not in tables:
+        op.create_table(
+            'rule_match_state',
+            sa.Column('rule_id', sa.Integer(), nullable=False),
+            sa.Column('group_id', sa.Integer(), nullable=False),
+            sa.Column('fingerprint', sa.String(length=64), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('scanned_through_id', sa.Integer(), nullable=False),
+            sa.Column('high_water_id', sa.Integer(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+            sa.ForeignKeyConstraint(['rule_id'], ['filter_rules.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('rule_id', 'group_id'),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('rule_match_state')
+    op.drop_index('ix_rule_message_matches_message', table_name='rule_message_matches')
+    op.drop_index('ix_rule_message_matches_lookup', table_name='rule_message_matches')
+    op.drop_table('rule_message_matches')
@@ -0,0 +1,52 @@
+"""add file_content_index table
+
+Revision ID: 4f2b8d6e1a7c
+Revises: 9c4e7a2b1d3f
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2b8d6e1a7c'
+down_revision = '9c4e7a2b1d3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """创建文件内容索引表
+
+    表中数据由文件整理时增量登记，已有的媒体库由后台对账任务首次运行时补齐。
+    """
+    inspector = sa.inspect(op.get_bind())
+    if 'file_content_index' in inspector.get_table_names():
+        return
+
+    op.create_table(
+        'file_content_index',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('file_path', sa.String(length=1000), nullable=False),
+        sa.Column('file_size', sa.BigInteger(), nullable=False),
+        sa.Column('mtime', sa.Float(), nullable=False),
+        sa.Column('partial_hash', sa.String(length=64), nullable=False),
+        sa.Column('full_hash', sa.String(length=64), nullable=True),
+        sa.Column('verified_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('file_path'),
+    )
+    op.create_index('ix_file_content_index_id', 'file_content_index', ['id'], unique=False)
+    op.create_index('ix_file_content_index_size_partial', 'file_content_index',
+                    ['file_size', 'partial_hash'], unique=False)
+    op.create_index('ix_file_content_index_full_hash', 'file_content_index', ['full_hash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_file_content_index_full_hash', table_name='file_content_index')
+    op.drop_index('ix_file_content_index_size_partial', table_name='file_content_index')
+    op.drop_index('ix_file_content_index_id', table_name='file_content_index')
+    op.drop_table('file_content_index')
@@ -0,0 +1,72 @@
+"""add group_stats and group_activity_hourly tables
+
+Revision ID: 5e8c2a7f9b31
+Revises: 2b6f1c9d4e8a
+Create Date: 2026-10-16 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8c2a7f9b31'
+down_revision = '2b6f1c9d4e8a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """创建群组统计表
+
+    维护触发器和已有消息的计数回填不在迁移中执行，由应用启动时的
+    ensure_group_stats() 检测到触发器缺失后创建并重建（非SQLite数据库不使用触发器）。
+    """
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = inspector.get_table_names()
+
+    if 'group_stats' not in tables:
+        op.create_table(
+            'group_stats',
+            sa.Column('group_id', sa.Integer(), nullable=False),
+            sa.Column('total_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('media_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('photo_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('video_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('document_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('audio_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('voice_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('sticker_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('video_note_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('forwarded_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('pinned_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('reaction_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('downloaded_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('downloaded_media_size', sa.BigInteger(), nullable=False, server_default='0'),
+            sa.Column('last_message_date', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+            sa.ForeignKeyConstraint(['group_id'], ['telegram_groups.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('group_id'),
+        )
+
+    if 'group_activity_hourly' not in tables:
+        op.create_table(
+            'group_activity_hourly',
+            sa.Column('group_id', sa.Integer(), nullable=False),
+            sa.Column('hour_start', sa.String(length=19), nullable=False),
+            sa.Column('new_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('new_downloads', sa.Integer(), nullable=False, server_default='0'),
+            sa.ForeignKeyConstraint(['group_id'], ['telegram_groups.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('group_id', 'hour_start'),
+        )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for name in ('group_stats_ai', 'group_stats_ad', 'group_stats_au',
+                     'group_activity_hourly_prune', 'group_stats_group_ad'):
+            op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.drop_table('group_activity_hourly')
+    op.drop_table('group_stats')
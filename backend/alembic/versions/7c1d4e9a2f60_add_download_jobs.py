@@ -0,0 +1,62 @@
+"""add download_jobs table
+
+Revision ID: 7c1d4e9a2f60
+Revises: 5e8c2a7f9b31
+Create Date: 2026-10-16 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1d4e9a2f60'
+down_revision = '5e8c2a7f9b31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """创建持久化下载作业队列表"""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'download_jobs' in inspector.get_table_names():
+        return
+
+    op.create_table(
+        'download_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False, server_default='media'),
+        sa.Column('target_id', sa.Integer(), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('batch_id', sa.String(length=32), nullable=True),
+        sa.Column('force', sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column('state', sa.String(length=20), nullable=False, server_default='queued'),
+        sa.Column('priority', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('max_attempts', sa.Integer(), nullable=False, server_default='3'),
+        sa.Column('worker_id', sa.String(length=64), nullable=True),
+        sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('available_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_download_jobs_id', 'download_jobs', ['id'])
+    op.create_index('ix_download_jobs_claim', 'download_jobs', ['state', 'kind', 'priority', 'id'])
+    op.create_index('ix_download_jobs_target', 'download_jobs', ['kind', 'target_id', 'state'])
+    op.create_index('ix_download_jobs_lease', 'download_jobs', ['state', 'lease_expires_at'])
+    op.create_index('ix_download_jobs_batch', 'download_jobs', ['batch_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_download_jobs_batch', table_name='download_jobs')
+    op.drop_index('ix_download_jobs_lease', table_name='download_jobs')
+    op.drop_index('ix_download_jobs_target', table_name='download_jobs')
+    op.drop_index('ix_download_jobs_claim', table_name='download_jobs')
+    op.drop_index('ix_download_jobs_id', table_name='download_jobs')
+    op.drop_table('download_jobs')
@@ -0,0 +1,80 @@
+"""add telegram_messages_fts full-text index
+
+Revision ID: 7d3a9e5c2b18
+Revises: 4f2b8d6e1a7c
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3a9e5c2b18'
+down_revision = '4f2b8d6e1a7c'
+branch_labels = None
+depends_on = None
+
+
+FTS_TABLE = 'telegram_messages_fts'
+
+
+def upgrade() -> None:
+    """创建消息全文索引(FTS5, trigram分词)及同步触发器，并回填已有消息
+
+    仅SQLite适用；SQLite版本低于3.34(无trigram分词器)时跳过，应用会回退为LIKE匹配。
+    """
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+
+    inspector = sa.inspect(bind)
+    if FTS_TABLE in inspector.get_table_names():
+        return
+
+    try:
+        op.execute(f"""
+            CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+                text, sender_name, media_filename, hashtags,
+                content='telegram_messages', content_rowid='id',
+                tokenize='trigram'
+            )
+        """)
+    except sa.exc.OperationalError:
+        return
+
+    op.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON telegram_messages BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, text, sender_name, media_filename, hashtags)
+            VALUES (new.id, new.text, new.sender_name, new.media_filename, new.hashtags);
+        END
+    """)
+    op.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON telegram_messages BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text, sender_name, media_filename, hashtags)
+            VALUES ('delete', old.id, old.text, old.sender_name, old.media_filename, old.hashtags);
+        END
+    """)
+    op.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+        AFTER UPDATE OF text, sender_name, media_filename, hashtags ON telegram_messages BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text, sender_name, media_filename, hashtags)
+            VALUES ('delete', old.id, old.text, old.sender_name, old.media_filename, old.hashtags);
+            INSERT INTO {FTS_TABLE}(rowid, text, sender_name, media_filename, hashtags)
+            VALUES (new.id, new.text, new.sender_name, new.media_filename, new.hashtags);
+        END
+    """)
+
+    # 回填已有消息
+    op.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+
+    op.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au")
+    op.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad")
+    op.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai")
+    op.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
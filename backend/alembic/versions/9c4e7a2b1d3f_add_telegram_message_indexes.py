@@ -0,0 +1,74 @@
+"""add telegram_messages composite indexes
+
+Revision ID: 9c4e7a2b1d3f
+Revises: b2c3d4e5f6g7, 20250920_data_init, 8a1d14e65d0b
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e7a2b1d3f'
+down_revision = ('b2c3d4e5f6g7', '20250920_data_init', '8a1d14e65d0b')
+branch_labels = None
+depends_on = None
+
+MEDIA_ROWS_CONDITION = "media_type IS NOT NULL AND media_type != 'text'"
+
+
+def _existing_indexes() -> set:
+    inspector = sa.inspect(op.get_bind())
+    return {index['name'] for index in inspector.get_indexes('telegram_messages')}
+
+
+def upgrade() -> None:
+    """为 telegram_messages 添加复合索引
+
+    创建唯一索引前先清理 (group_id, message_id) 重复的消息，保留最早写入的一条。
+    """
+    existing = _existing_indexes()
+
+    if 'uq_telegram_messages_group_message' not in existing:
+        op.execute(sa.text(
+            "DELETE FROM telegram_messages WHERE id NOT IN ("
+            "SELECT MIN(id) FROM telegram_messages GROUP BY group_id, message_id)"
+        ))
+        op.create_index('uq_telegram_messages_group_message', 'telegram_messages',
+                        ['group_id', 'message_id'], unique=True)
+
+    if 'ix_telegram_messages_group_date' not in existing:
+        op.create_index('ix_telegram_messages_group_date', 'telegram_messages',
+                        ['group_id', sa.text('date DESC')], unique=False)
+
+    if 'ix_telegram_messages_group_media_date' not in existing:
+        op.create_index('ix_telegram_messages_group_media_date', 'telegram_messages',
+                        ['group_id', 'media_type', 'date'], unique=False,
+                        sqlite_where=sa.text(MEDIA_ROWS_CONDITION),
+                        postgresql_where=sa.text(MEDIA_ROWS_CONDITION))
+
+    if 'ix_telegram_messages_media_downloaded' not in existing:
+        op.create_index('ix_telegram_messages_media_downloaded', 'telegram_messages',
+                        ['media_downloaded'], unique=False)
+
+    if 'ix_telegram_messages_is_downloading' not in existing:
+        op.create_index('ix_telegram_messages_is_downloading', 'telegram_messages',
+                        ['is_downloading'], unique=False)
+
+    # 让查询规划器拿到新索引的统计信息
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute(sa.text("ANALYZE telegram_messages"))
+
+
+def downgrade() -> None:
+    existing = _existing_indexes()
+    for name in (
+        'ix_telegram_messages_is_downloading',
+        'ix_telegram_messages_media_downloaded',
+        'ix_telegram_messages_group_media_date',
+        'ix_telegram_messages_group_date',
+        'uq_telegram_messages_group_message',
+    ):
+        if name in existing:
+            op.drop_index(name, table_name='telegram_messages')
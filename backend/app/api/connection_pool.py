@@ -13,7 +13,7 @@ Author: TgGod Team
 Version: 1.0.0
 """
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
@@ -309,6 +309,40 @@ async def reset_connection_pool_stats():
         logger.error(f"重置连接池统计失败: {e}")
         raise HTTPException(status_code=500, detail=f"重置连接池统计失败: {str(e)}")
 
+# ========== Telegram下载客户端池API ==========
+
+@router.get("/connection-pool/download-clients")
+async def get_download_client_pool_status():
+    """获取Telegram下载客户端池的租约与延迟指标"""
+    try:
+        from ..services.download_client_pool import get_download_client_pool
+        stats = get_download_client_pool().get_stats()
+
+        return {
+            "success": True,
+            "data": stats,
+            "message": f"下载客户端池: {stats['connected']}/{stats['pool_size']} 已连接, {stats['leased']} 租用中"
+        }
+    except Exception as e:
+        logger.error(f"获取下载客户端池状态失败: {e}")
+        raise HTTPException(status_code=500, detail=f"获取下载客户端池状态失败: {str(e)}")
+
+@router.post("/connection-pool/download-clients/recycle")
+async def recycle_download_client_pool():
+    """回收下载客户端池，下次租用时基于最新主session重建连接"""
+    try:
+        from ..services.download_client_pool import get_download_client_pool
+        await get_download_client_pool().recycle()
+
+        return {
+            "success": True,
+            "data": {"recycled_at": datetime.now().isoformat()},
+            "message": "下载客户端池已回收"
+        }
+    except Exception as e:
+        logger.error(f"回收下载客户端池失败: {e}")
+        raise HTTPException(status_code=500, detail=f"回收下载客户端池失败: {str(e)}")
+
 # ========== 连接池调优相关API ==========
 
 @router.get("/connection-pool/tuning/analysis")
@@ -519,6 +553,51 @@ async def run_stress_test(
         logger.error(f"压力测试失败: {e}")
         raise HTTPException(status_code=500, detail=f"压力测试失败: {str(e)}")
 
+@router.post("/connection-pool/benchmark/endpoint-load")
+async def run_endpoint_load_test(
+    request: Request,
+    concurrent_requests: int = Query(20, description="并发请求数", ge=1, le=200),
+    requests_per_endpoint: int = Query(100, description="每个接口的请求数", ge=10, le=2000)
+):
+    """运行读接口并发负载测试，返回各接口p50/p95/p99延迟和事件循环延迟"""
+    try:
+        benchmark = get_benchmark_instance()
+        # 透传调用方的认证信息，消息列表等接口需要登录
+        headers = {}
+        if request.headers.get("authorization"):
+            headers["Authorization"] = request.headers["authorization"]
+        result = await benchmark.run_endpoint_load_test(
+            concurrent_requests=concurrent_requests,
+            requests_per_endpoint=requests_per_endpoint,
+            headers=headers
+        )
+
+        worst_p99 = max((r["p99_ms"] for r in result["endpoints"].values()), default=0.0)
+        return {
+            "success": True,
+            "data": result,
+            "message": f"接口负载测试完成，最高p99延迟 {worst_p99:.2f}ms"
+        }
+    except Exception as e:
+        logger.error(f"接口负载测试失败: {e}")
+        raise HTTPException(status_code=500, detail=f"接口负载测试失败: {str(e)}")
+
+@router.get("/connection-pool/benchmark/query-plans")
+async def run_query_plan_check():
+    """运行查询计划回归检查"""
+    try:
+        benchmark = get_benchmark_instance()
+        result = benchmark.run_query_plan_check()
+
+        return {
+            "success": True,
+            "data": result,
+            "message": "查询计划检查通过" if result["passed"] else f"查询计划检查未通过: {', '.join(result['failed_checks'])}"
+        }
+    except Exception as e:
+        logger.error(f"查询计划检查失败: {e}")
+        raise HTTPException(status_code=500, detail=f"查询计划检查失败: {str(e)}")
+
 @router.get("/connection-pool/benchmark/results")
 async def get_benchmark_results():
     """获取基准测试结果"""
@@ -589,4 +668,21 @@ async def cleanup_sessions():
         }
     except Exception as e:
         logger.error(f"清理会话失败: {e}")
-        raise HTTPException(status_code=500, detail=f"清理会话失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"清理会话失败: {str(e)}")
+
+
+@router.get("/connection-pool/writer/stats")
+async def get_db_writer_stats():
+    """获取单写线程的队列深度、批量大小和提交耗时"""
+    try:
+        from ..utils.db_writer import db_writer
+        stats = db_writer.get_stats()
+
+        return {
+            "success": True,
+            "data": stats,
+            "message": f"写队列深度: {stats['queue_depth']}, 平均批量: {stats['avg_batch_size']}"
+        }
+    except Exception as e:
+        logger.error(f"获取写线程统计失败: {e}")
+        raise HTTPException(status_code=500, detail=f"获取写线程统计失败: {str(e)}")
@@ -1,15 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, and_, or_
+from sqlalchemy import func, desc, and_, or_, case
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
+import asyncio
 import time
 import logging
 
 from ..database import get_db
+from ..models.group_stats import GroupStats
 from ..models.telegram import TelegramGroup, TelegramMessage
 from ..models.user import User
+from ..services.progress_service import get_progress_service
+from ..services.system_metrics_sampler import get_system_metrics_sampler
 from ..utils.auth import get_current_active_user
+from ..utils.group_stats import (
+    activity_statement,
+    is_group_stats_available,
+    media_distribution,
+    rebuild_group_stats,
+    stats_to_dict,
+    totals_statement,
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -40,68 +52,29 @@ def set_cached_data(cache_key: str, data: Dict[str, Any]):
 @router.get("/overview")
 async def get_dashboard_overview(
     db: Session = Depends(get_db),
-    force_refresh: bool = Query(False, description="强制刷新缓存"),
+    force_refresh: bool = Query(False, description="保留兼容，统计始终实时"),
     current_user: User = Depends(get_current_active_user)
 ):
-    """获取仪表盘概览数据"""
-    
-    cache_key = "dashboard_overview"
-    cached_data = get_cached_data(cache_key, force_refresh)
-    if cached_data:
-        logger.info("返回缓存的仪表盘概览数据")
-        return cached_data
-    
+    """获取仪表盘概览数据
+
+    消息计数读取 group_stats 增量统计表（每个群组一行），不再扫描消息表，也不需要缓存。
+    """
     try:
         # 基础统计
-        total_groups = db.query(TelegramGroup).count()
-        active_groups = db.query(TelegramGroup).filter(TelegramGroup.is_active == True).count()
-        total_messages = db.query(TelegramMessage).count()
-        
-        # 媒体统计
-        media_messages = db.query(TelegramMessage).filter(
-            TelegramMessage.media_type.isnot(None)
-        ).count()
+        total_groups, active_groups = db.query(
+            func.count(TelegramGroup.id),
+            func.coalesce(func.sum(case((TelegramGroup.is_active == True, 1), else_=0)), 0)
+        ).one()
+        totals = stats_to_dict(db.execute(totals_statement()).mappings().first())
+        total_messages = totals["total_messages"]
+        media_messages = totals["media_messages"]
+        downloaded_media = totals["downloaded_messages"]
         
-        downloaded_media = db.query(TelegramMessage).filter(
-            TelegramMessage.media_downloaded == True
-        ).count()
+        # 今日数据（最近24小时，按整点对齐）
+        activity = db.execute(activity_statement(24)).mappings().first()
         
-        # 今日数据（最近24小时）
-        yesterday = datetime.now() - timedelta(days=1)
-        today_messages = db.query(TelegramMessage).filter(
-            TelegramMessage.created_at >= yesterday
-        ).count()
-        
-        today_media_downloads = db.query(TelegramMessage).filter(
-            and_(
-                TelegramMessage.media_downloaded == True,
-                TelegramMessage.updated_at >= yesterday
-            )
-        ).count()
-        
-        # 存储统计
-        total_media_size = db.query(func.sum(TelegramMessage.media_size)).filter(
-            TelegramMessage.media_downloaded == True
-        ).scalar() or 0
-        
-        # 消息类型分布
-        message_types = db.query(
-            TelegramMessage.media_type,
-            func.count(TelegramMessage.id).label('count')
-        ).filter(
-            TelegramMessage.media_type.isnot(None)
-        ).group_by(TelegramMessage.media_type).all()
-        
-        media_distribution = {media_type: count for media_type, count in message_types}
-        
-        # 下载进度中的任务（模拟，基于有下载进度但未完成的消息）
-        downloading_tasks = db.query(TelegramMessage).filter(
-            and_(
-                TelegramMessage.download_progress > 0,
-                TelegramMessage.download_progress < 100,
-                TelegramMessage.media_downloaded == False
-            )
-        ).count()
+        # 正在下载的文件以进度服务中的活动条目为准
+        downloading_tasks = len(get_progress_service().snapshot()["downloads"])
         
         overview_data = {
             "basic_stats": {
@@ -113,21 +86,18 @@ async def get_dashboard_overview(
             },
             "download_stats": {
                 "downloaded_media": downloaded_media,
-                "total_media_size": total_media_size,
+                "total_media_size": totals["downloaded_media_size"],
                 "downloading_tasks": downloading_tasks,
                 "download_completion_rate": round((downloaded_media / media_messages * 100) if media_messages > 0 else 0, 2)
             },
             "today_stats": {
-                "new_messages": today_messages,
-                "new_downloads": today_media_downloads
+                "new_messages": activity["new_messages"] or 0,
+                "new_downloads": activity["new_downloads"] or 0
             },
-            "media_distribution": media_distribution,
+            "media_distribution": media_distribution(totals),
             "last_updated": datetime.now().isoformat()
         }
         
-        # 缓存数据
-        set_cached_data(cache_key, overview_data)
-        
         return overview_data
         
     except Exception as e:
@@ -138,35 +108,48 @@ async def get_dashboard_overview(
 async def get_groups_summary(
     db: Session = Depends(get_db),
     limit: int = Query(10, ge=1, le=50),
-    force_refresh: bool = Query(False),
+    force_refresh: bool = Query(False, description="保留兼容，统计始终实时"),
     current_user: User = Depends(get_current_active_user)
 ):
     """获取群组汇总信息"""
     
-    cache_key = f"groups_summary_{limit}"
-    cached_data = get_cached_data(cache_key, force_refresh)
-    if cached_data:
-        return cached_data
-    
     try:
-        # 获取群组消息统计
-        groups_stats = db.query(
-            TelegramGroup.id,
-            TelegramGroup.title,
-            TelegramGroup.username,
-            TelegramGroup.member_count,
-            TelegramGroup.is_active,
-            func.count(TelegramMessage.id).label('message_count'),
-            func.count(func.nullif(TelegramMessage.media_type, None)).label('media_count'),
-            func.count(func.nullif(TelegramMessage.media_downloaded, False)).label('downloaded_count'),
-            func.max(TelegramMessage.date).label('last_message_date')
-        ).outerjoin(
-            TelegramMessage, TelegramGroup.id == TelegramMessage.group_id
-        ).group_by(
-            TelegramGroup.id
-        ).order_by(
-            desc('message_count')
-        ).limit(limit).all()
+        if is_group_stats_available():
+            # 按群组读取增量统计行
+            message_count = func.coalesce(GroupStats.total_messages, 0)
+            groups_stats = db.query(
+                TelegramGroup.id,
+                TelegramGroup.title,
+                TelegramGroup.username,
+                TelegramGroup.member_count,
+                TelegramGroup.is_active,
+                message_count.label('message_count'),
+                func.coalesce(GroupStats.media_messages, 0).label('media_count'),
+                func.coalesce(GroupStats.downloaded_messages, 0).label('downloaded_count'),
+                GroupStats.last_message_date.label('last_message_date')
+            ).outerjoin(
+                GroupStats, TelegramGroup.id == GroupStats.group_id
+            ).order_by(
+                message_count.desc()
+            ).limit(limit).all()
+        else:
+            groups_stats = db.query(
+                TelegramGroup.id,
+                TelegramGroup.title,
+                TelegramGroup.username,
+                TelegramGroup.member_count,
+                TelegramGroup.is_active,
+                func.count(TelegramMessage.id).label('message_count'),
+                func.count(func.nullif(TelegramMessage.media_type, None)).label('media_count'),
+                func.count(func.nullif(TelegramMessage.media_downloaded, False)).label('downloaded_count'),
+                func.max(TelegramMessage.date).label('last_message_date')
+            ).outerjoin(
+                TelegramMessage, TelegramGroup.id == TelegramMessage.group_id
+            ).group_by(
+                TelegramGroup.id
+            ).order_by(
+                desc('message_count')
+            ).limit(limit).all()
         
         groups_data = []
         for group_stat in groups_stats:
@@ -189,7 +172,6 @@ async def get_groups_summary(
             "last_updated": datetime.now().isoformat()
         }
         
-        set_cached_data(cache_key, summary_data)
         return summary_data
         
     except Exception as e:
@@ -401,57 +383,42 @@ async def get_system_info(
         return cached_data
     
     try:
-        import os
         from ..config import settings
         
         # 数据库统计
+        totals = stats_to_dict(db.execute(totals_statement()).mappings().first())
         db_stats = {
             "total_groups": db.query(TelegramGroup).count(),
-            "total_messages": db.query(TelegramMessage).count(),
-            "media_files": db.query(TelegramMessage).filter(TelegramMessage.media_type.isnot(None)).count()
+            "total_messages": totals["total_messages"],
+            "media_files": totals["media_messages"]
         }
         
-        # 尝试获取系统资源信息
+        # 系统资源信息来自系统指标采样器的最新快照
         try:
-            import psutil
-            
-            # 磁盘使用情况
-            media_root = getattr(settings, 'media_root', './media')
-            disk_usage = None
-            try:
-                if os.path.exists(media_root):
-                    disk_info = psutil.disk_usage(media_root)
-                    # 确保返回的是3个值
-                    if len(disk_info) == 3:
-                        total, used, free = disk_info
-                        disk_usage = {
-                            "total": total,
-                            "used": used,
-                            "free": free,
-                            "usage_percent": round((used / total) * 100, 2) if total > 0 else 0
-                        }
-                    else:
-                        logger.warning(f"psutil.disk_usage返回了{len(disk_info)}个值，期望3个")
-                else:
-                    logger.warning(f"媒体目录不存在: {media_root}")
-            except Exception as disk_error:
-                logger.error(f"获取磁盘使用情况失败: {disk_error}")
-                disk_usage = None
-            
+            snapshot = get_system_metrics_sampler().latest()
+
+            # 磁盘使用情况(媒体目录所在分区)
+            disk = snapshot.media_disk
+            disk_usage = {
+                "total": disk.total,
+                "used": disk.used,
+                "free": disk.free,
+                "usage_percent": round((disk.used / disk.total) * 100, 2) if disk.total > 0 else 0
+            } if disk else None
+
             # 内存使用情况
-            memory = psutil.virtual_memory()
             memory_info = {
-                "total": memory.total,
-                "available": memory.available,
-                "used": memory.used,
-                "usage_percent": memory.percent
+                "total": snapshot.memory_total,
+                "available": snapshot.memory_available,
+                "used": snapshot.memory_used,
+                "usage_percent": snapshot.memory_percent
             }
-            
+
             # CPU使用情况
-            cpu_percent = psutil.cpu_percent(interval=1)
-            
-        except ImportError:
-            logger.error("psutil模块未安装，无法获取系统资源信息")
+            cpu_percent = snapshot.cpu_percent
+
+        except Exception as e:
+            logger.error(f"获取系统资源信息失败: {e}")
             # 返回空数据而不是模拟数据
             disk_usage = None
             memory_info = None
@@ -583,6 +550,25 @@ async def get_storage_analysis(
         logger.error(f"获取存储分析失败: {e}")
         raise HTTPException(status_code=500, detail=f"获取存储分析失败: {str(e)}")
 
+@router.post("/group-stats/rebuild")
+async def rebuild_dashboard_group_stats(
+    group_id: Optional[int] = Query(None, description="只重建指定群组"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """从消息表重建群组统计计数（用于修复或手工改库后的校正）"""
+    if not is_group_stats_available():
+        raise HTTPException(status_code=400, detail="当前数据库不支持增量群组统计")
+    try:
+        rows = await asyncio.to_thread(rebuild_group_stats, group_id)
+        return {
+            "success": True,
+            "data": {"rebuilt_groups": rows},
+            "message": f"已重建 {rows} 个群组的统计"
+        }
+    except Exception as e:
+        logger.error(f"重建群组统计失败: {e}")
+        raise HTTPException(status_code=500, detail=f"重建群组统计失败: {str(e)}")
+
 @router.delete("/cache")
 async def clear_dashboard_cache(
     current_user: User = Depends(get_current_active_user)
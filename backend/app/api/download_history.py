@@ -8,12 +8,13 @@ import os
 from typing import List, Optional
 from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import desc, and_, or_, func
+from sqlalchemy import desc, and_, or_, func, select
 
 logger = logging.getLogger(__name__)
 
-from ..database import get_db
+from ..database import get_db, get_async_db
 from ..models.rule import DownloadTask, DownloadRecord
 from ..models.telegram import TelegramGroup
 from ..schemas.download_history import (
@@ -27,7 +28,7 @@ router = APIRouter(prefix="/download-history", tags=["下载历史"])
 
 @router.get("/records", response_model=DownloadHistoryListResponse, summary="获取下载历史记录")
 async def get_download_records(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=100, description="每页数量"),
     task_id: Optional[int] = Query(None, description="任务ID过滤"),
@@ -42,20 +43,16 @@ async def get_download_records(
     获取下载历史记录列表，支持分页和多种过滤条件
     """
     try:
-        # 构建基础查询
-        query = db.query(DownloadRecord).options(
-            joinedload(DownloadRecord.task).joinedload(DownloadTask.group)
-        )
-        
         # 应用过滤条件
         conditions = []
+        join_task = False
         
         if task_id:
             conditions.append(DownloadRecord.task_id == task_id)
         
         if group_id:
             conditions.append(DownloadTask.group_id == group_id)
-            query = query.join(DownloadTask)
+            join_task = True
         
         if file_type:
             conditions.append(DownloadRecord.file_type == file_type)
@@ -77,17 +74,26 @@ async def get_download_records(
             ]
             conditions.append(or_(*search_conditions))
         
-        # 应用所有条件
-        if conditions:
-            query = query.filter(and_(*conditions))
-        
         # 获取总数
-        total = query.count()
+        count_stmt = select(func.count(DownloadRecord.id))
+        if join_task:
+            count_stmt = count_stmt.join(DownloadTask, DownloadRecord.task_id == DownloadTask.id)
+        if conditions:
+            count_stmt = count_stmt.where(and_(*conditions))
+        total = await db.scalar(count_stmt) or 0
         
-        # 应用分页和排序
-        records = query.order_by(desc(DownloadRecord.download_completed_at)).offset(
+        # 构建分页查询，任务和群组通过joinedload一次性加载，避免异步会话中的延迟加载
+        stmt = select(DownloadRecord).options(
+            joinedload(DownloadRecord.task).joinedload(DownloadTask.group)
+        )
+        if join_task:
+            stmt = stmt.join(DownloadTask, DownloadRecord.task_id == DownloadTask.id)
+        if conditions:
+            stmt = stmt.where(and_(*conditions))
+        stmt = stmt.order_by(desc(DownloadRecord.download_completed_at)).offset(
             (page - 1) * page_size
-        ).limit(page_size).all()
+        ).limit(page_size)
+        records = (await db.execute(stmt)).scalars().all()
         
         # 转换为响应格式
         record_list = []
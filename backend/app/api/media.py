@@ -1,18 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import OperationalError
-from typing import Optional, List
+from typing import Literal, Optional, List
 from pydantic import BaseModel
 import os
+import time
 import uuid
 import logging
-import mimetypes
-from datetime import datetime
-from ..database import get_db, SessionLocal
-from ..models import TelegramMessage
+from ..config import settings
+from ..core.metrics import DOWNLOAD_DURATION
+from ..core.rate_governor import LANE_BULK, LANE_INTERACTIVE, rate_governor
+from ..database import get_db, get_async_db
+from ..models import TelegramGroup, TelegramMessage
+from ..models.download_job import JOB_CANCELLED, JOB_KIND_MEDIA, JOB_LEASED, JOB_QUEUED
 from ..utils.db_retry import db_retry, safe_db_operation
 from ..utils.db_optimization import optimized_db_session
+from ..services.download_job_queue import PRIORITY_BATCH, PRIORITY_INTERACTIVE, download_job_queue
+from ..services.progress_service import progress_service
+from ..services.thumbnail_service import DEFAULT_PRESET, thumbnail_service
+from ..utils.media_streaming import guess_media_type, stream_media_file
 import asyncio
 
 router = APIRouter()
@@ -22,7 +31,7 @@ logger = logging.getLogger(__name__)
 class BatchDownloadRequest(BaseModel):
     message_ids: List[int]
     force: bool = False
-    max_concurrent: int = 3  # Maximum concurrent downloads
+    max_concurrent: int = 3  # 保留字段兼容旧客户端，并发由作业队列的全局/用户/群组上限控制
 
 class BatchDownloadResponse(BaseModel):
     batch_id: str
@@ -43,33 +52,8 @@ class BatchStatusResponse(BaseModel):
     overall_status: str
     files: List[dict]
 
-# 简单的下载队列，防止并发冲突
-download_queue = asyncio.Queue()
-download_worker_started = False
-
-# 正在下载的消息ID集合，防止重复下载
-downloading_messages = set()
-
-# 已取消的下载任务集合
-cancelled_downloads = set()
-
-# 批量下载管理
-batch_downloads = {}  # batch_id -> {message_ids, status, started_at, max_concurrent}
-batch_semaphores = {}  # batch_id -> asyncio.Semaphore for controlling concurrency
-
-# 🔥 新增：并发下载管理系统
-MAX_CONCURRENT_DOWNLOADS = 10  # 全局最大并发下载数
-USER_CONCURRENT_LIMIT = 5      # 每用户最大并发下载数
-
-# 并发下载控制
-concurrent_downloads = {}       # message_id -> download_task
-global_download_semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
-user_download_semaphores = {}   # user_id -> Semaphore 
-concurrent_download_stats = {   # 统计信息
-    "total_active": 0,
-    "user_active": {},          # user_id -> count
-    "started_at": None
-}
+# 手动下载(单个和批量)登记为持久化下载作业，由作业队列按全局/用户/群组并发上限调度，
+# 排队中的下载在进程重启后继续执行(见 services/download_job_queue.py)
 
 def build_media_url(file_path: str, is_thumbnail: bool = False) -> str:
     """构建媒体文件的访问URL"""
@@ -106,7 +90,6 @@ def build_media_url(file_path: str, is_thumbnail: bool = False) -> str:
 @router.post("/batch-download", response_model=BatchDownloadResponse)
 async def start_batch_download(
     request: BatchDownloadRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -114,7 +97,6 @@ async def start_batch_download(
     
     Args:
         request: 批量下载请求，包含消息ID列表和配置
-        background_tasks: 后台任务管理器
         db: 数据库会话
     
     Returns:
@@ -134,6 +116,7 @@ async def start_batch_download(
     
     # 验证并分类消息
     valid_messages = []
+    message_groups = {}
     already_downloaded = []
     failed_to_start = []
     
@@ -148,6 +131,7 @@ async def start_batch_download(
                         "reason": "消息不存在"
                     })
                     continue
+                message_groups[message_id] = message.group_id
                 
                 if not message.media_type or not message.media_file_id:
                     failed_to_start.append({
@@ -197,30 +181,17 @@ async def start_batch_download(
     # 生成批量下载ID
     batch_id = f"batch_{uuid.uuid4().hex[:8]}"
     
-    # 记录批量下载信息
-    from datetime import datetime, timezone
-    global batch_downloads, batch_semaphores
-    
-    batch_downloads[batch_id] = {
-        "message_ids": valid_messages,
-        "total_files": len(valid_messages),
-        "status": "started",
-        "started_at": datetime.now(timezone.utc),
-        "max_concurrent": min(request.max_concurrent, 5),  # 最多5个并发
-        "force": request.force
-    }
-    
-    # 创建信号量控制并发数
-    batch_semaphores[batch_id] = asyncio.Semaphore(batch_downloads[batch_id]["max_concurrent"])
-    
-    # 启动下载工作进程（如果还没启动）
-    global download_worker_started
-    if not download_worker_started:
-        background_tasks.add_task(start_download_worker)
-        download_worker_started = True
-    
-    # 启动批量下载管理器
-    background_tasks.add_task(batch_download_manager, batch_id)
+    # 登记为持久化下载作业，并发由作业队列的全局/用户/群组上限控制
+    await download_job_queue.enqueue(JOB_KIND_MEDIA, [
+        {
+            "target_id": message_id,
+            "group_id": message_groups.get(message_id),
+            "batch_id": batch_id,
+            "force": request.force,
+            "priority": PRIORITY_BATCH,
+        }
+        for message_id in valid_messages
+    ])
     
     logger.info(f"批量下载任务启动: {batch_id}, 文件数量: {len(valid_messages)}")
     
@@ -249,16 +220,15 @@ async def get_batch_download_status(
     Returns:
         批量下载状态信息
     """
-    global batch_downloads
-    
-    if batch_id not in batch_downloads:
+    jobs = download_job_queue.get_batch(batch_id)
+    if not jobs:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="批量下载任务不存在"
         )
     
-    batch_info = batch_downloads[batch_id]
-    message_ids = batch_info["message_ids"]
+    job_states = {job["target_id"]: job["state"] for job in jobs}
+    message_ids = list(job_states)
     
     # 获取所有文件的状态 - 使用优化的数据库会话
     files_status = []
@@ -302,19 +272,21 @@ async def get_batch_download_status(
                         file_status["status"] = "file_missing"
                         file_status["error"] = "文件记录存在但实际文件丢失"
                         failed += 1
-                elif message.media_download_error:
-                    if message.media_download_error == "下载已取消":
-                        file_status["status"] = "cancelled"
-                    else:
-                        file_status["status"] = "failed"
-                    file_status["error"] = message.media_download_error
-                    failed += 1
-                elif message_id in downloading_messages:
+                elif job_states[message_id] == JOB_LEASED:
                     file_status["status"] = "downloading"
                     downloading += 1
-                else:
+                elif job_states[message_id] == JOB_QUEUED:
+                    # 包括失败后等待重试的作业
                     file_status["status"] = "pending"
                     pending += 1
+                elif job_states[message_id] == JOB_CANCELLED or message.media_download_error == "下载已取消":
+                    file_status["status"] = "cancelled"
+                    file_status["error"] = message.media_download_error or "下载已取消"
+                    failed += 1
+                else:
+                    file_status["status"] = "failed"
+                    file_status["error"] = message.media_download_error or "下载失败"
+                    failed += 1
                 
                 files_status.append(file_status)
     except Exception as db_error:
@@ -361,47 +333,42 @@ async def cancel_batch_download(
     Returns:
         取消结果
     """
-    global batch_downloads, cancelled_downloads
-    
-    if batch_id not in batch_downloads:
+    jobs = download_job_queue.get_batch(batch_id)
+    if not jobs:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="批量下载任务不存在"
         )
     
-    batch_info = batch_downloads[batch_id]
-    message_ids = batch_info["message_ids"]
-    
-    # 标记批量任务为取消状态
-    batch_info["status"] = "cancelled"
+    message_ids = [job["target_id"] for job in jobs]
     
-    # 取消所有相关的单个下载任务
-    cancelled_count = 0
-    for message_id in message_ids:
-        if message_id in downloading_messages:
-            cancelled_downloads.add(message_id)
-            cancelled_count += 1
-            
-            # 更新数据库状态（使用优化的数据库会话）
-            def update_cancel_status():
-                try:
-                    with optimized_db_session(autocommit=True, max_retries=3) as db_session:
-                        message = db_session.query(TelegramMessage).filter(TelegramMessage.message_id == message_id).first()
-                        if message and not message.media_downloaded:
-                            message.download_progress = 0
-                            message.downloaded_size = 0
-                            message.download_speed = 0
-                            message.estimated_time_remaining = 0
-                            message.download_started_at = None
-                            message.media_download_error = "下载已取消"
-                except Exception as e:
-                    logger.error(f"取消下载时数据库更新失败: {str(e)}")
-                    raise
-            
+    # 取消批量中排队和执行中的作业
+    cancelled = await download_job_queue.cancel(JOB_KIND_MEDIA, batch_id=batch_id)
+    cancelled_count = len(cancelled)
+    for item in cancelled:
+        message_id = item["target_id"]
+        
+        # 更新数据库状态（使用优化的数据库会话）
+        def update_cancel_status():
             try:
-                update_cancel_status()
+                with optimized_db_session(autocommit=True, max_retries=3) as db_session:
+                    message = db_session.query(TelegramMessage).filter(TelegramMessage.message_id == message_id).first()
+                    if message and not message.media_downloaded:
+                        message.is_downloading = False
+                        message.download_progress = 0
+                        message.downloaded_size = 0
+                        message.download_speed = 0
+                        message.estimated_time_remaining = 0
+                        message.download_started_at = None
+                        message.media_download_error = "下载已取消"
             except Exception as e:
-                logger.error(f"取消下载时数据库更新失败 (消息 {message_id}): {str(e)}")
+                logger.error(f"取消下载时数据库更新失败: {str(e)}")
+                raise
+        
+        try:
+            update_cancel_status()
+        except Exception as e:
+            logger.error(f"取消下载时数据库更新失败 (消息 {message_id}): {str(e)}")
     
     logger.info(f"批量下载任务已取消: {batch_id}, 取消了 {cancelled_count} 个下载")
     
@@ -413,271 +380,9 @@ async def cancel_batch_download(
         "total_files": len(message_ids)
     }
 
-# 🔥 新增：并发下载管理器
-def get_user_semaphore(user_id: int = None) -> asyncio.Semaphore:
-    """获取用户下载信号量，用于控制每用户并发数"""
-    if user_id is None:
-        user_id = 0  # 默认用户
-    
-    if user_id not in user_download_semaphores:
-        user_download_semaphores[user_id] = asyncio.Semaphore(USER_CONCURRENT_LIMIT)
-    
-    return user_download_semaphores[user_id]
-
-def update_download_stats(message_id: int, user_id: int = None, operation: str = "start"):
-    """更新下载统计信息"""
-    global concurrent_download_stats
-    
-    if user_id is None:
-        user_id = 0
-    
-    if operation == "start":
-        concurrent_download_stats["total_active"] += 1
-        if user_id not in concurrent_download_stats["user_active"]:
-            concurrent_download_stats["user_active"][user_id] = 0
-        concurrent_download_stats["user_active"][user_id] += 1
-        
-        if concurrent_download_stats["started_at"] is None:
-            concurrent_download_stats["started_at"] = datetime.now()
-    
-    elif operation == "finish":
-        concurrent_download_stats["total_active"] = max(0, concurrent_download_stats["total_active"] - 1)
-        if user_id in concurrent_download_stats["user_active"]:
-            concurrent_download_stats["user_active"][user_id] = max(0, concurrent_download_stats["user_active"][user_id] - 1)
-            if concurrent_download_stats["user_active"][user_id] == 0:
-                del concurrent_download_stats["user_active"][user_id]
-
-async def concurrent_download_manager(message_id: int, force: bool = False, user_id: int = None):
-    """
-    并发下载管理器 - 替代原有的串行队列系统
-    
-    Args:
-        message_id: 消息ID
-        force: 是否强制重新下载
-        user_id: 用户ID（用于并发限制）
-    """
-    global concurrent_downloads
-    
-    # 检查是否已在下载中
-    if message_id in concurrent_downloads:
-        logger.warning(f"消息 {message_id} 已在下载中，跳过重复请求")
-        return
-    
-    # 更新数据库中的下载状态标志
-    try:
-        with optimized_db_session(autocommit=True) as flag_db:
-            db_message = flag_db.query(TelegramMessage).filter(
-                TelegramMessage.message_id == message_id
-            ).first()
-            
-            if db_message:
-                db_message.is_downloading = True
-                logger.info(f"已将消息 {message_id} 在数据库中标记为正在下载")
-    except Exception as e:
-        logger.warning(f"更新下载状态标志失败: {e}")
-    
-    # 获取信号量
-    global_semaphore = global_download_semaphore
-    user_semaphore = get_user_semaphore(user_id)
-    
-    try:
-        # 使用双层信号量控制并发
-        async with global_semaphore:  # 全局并发限制
-            async with user_semaphore:  # 用户并发限制
-                
-                # 更新统计信息
-                update_download_stats(message_id, user_id, "start")
-                
-                # 创建下载任务
-                download_task = asyncio.create_task(
-                    concurrent_download_single_file(message_id, force, user_id)
-                )
-                concurrent_downloads[message_id] = download_task
-                
-                logger.info(f"开始并发下载: 消息 {message_id}, 用户 {user_id}, 当前并发数: {concurrent_download_stats['total_active']}")
-                
-                try:
-                    # 执行下载
-                    await download_task
-                except Exception as e:
-                    logger.error(f"并发下载异常: 消息 {message_id}, 错误: {str(e)}")
-                    
-                    # 更新数据库下载状态为失败
-                    try:
-                        with optimized_db_session(autocommit=True) as update_db:
-                            db_message = update_db.query(TelegramMessage).filter(
-                                TelegramMessage.message_id == message_id
-                            ).first()
-                            
-                            if db_message:
-                                db_message.is_downloading = False
-                                db_message.media_download_error = str(e)
-                                logger.info(f"已将消息 {message_id} 更新为下载失败")
-                    except Exception as update_err:
-                        logger.warning(f"更新下载失败状态出错: {update_err}")
-                    
-                    raise
-                finally:
-                    # 清理任务
-                    if message_id in concurrent_downloads:
-                        del concurrent_downloads[message_id]
-                    update_download_stats(message_id, user_id, "finish")
-                    
-                    # 尝试重置数据库中的下载中标记（如果下载已完成则保持标记不变）
-                    try:
-                        with optimized_db_session(autocommit=True) as reset_db:
-                            db_message = reset_db.query(TelegramMessage).filter(
-                                TelegramMessage.message_id == message_id
-                            ).first()
-                            
-                            # 只有当下载未成功时才重置下载中状态
-                            if db_message and not db_message.media_downloaded:
-                                db_message.is_downloading = False
-                                logger.info(f"已重置消息 {message_id} 的下载中状态")
-                    except Exception as reset_err:
-                        logger.warning(f"重置下载状态标记失败: {reset_err}")
-                    
-                    logger.info(f"完成并发下载: 消息 {message_id}, 剩余并发数: {concurrent_download_stats['total_active']}")
-    
-    except Exception as e:
-        logger.error(f"并发下载管理器异常: 消息 {message_id}, 错误: {str(e)}")
-        raise
-
-async def concurrent_download_single_file(message_id: int, force: bool = False, user_id: int = None):
-    """
-    单个文件的并发下载处理 - 不再依赖串行队列
-    
-    Args:
-        message_id: 消息ID
-        force: 是否强制重新下载
-        user_id: 用户ID
-    """
-    logger.info(f"执行并发下载: 消息 {message_id}, force={force}, user={user_id}")
-    
-    global downloading_messages
-    try:
-        # 添加到正在下载的消息集合中
-        downloading_messages.add(message_id)
-        
-        # 直接调用下载背景任务，绕过串行队列
-        await download_media_background(message_id, force)
-        logger.info(f"并发下载成功: 消息 {message_id}")
-    
-    except Exception as e:
-        logger.error(f"并发下载失败: 消息 {message_id}, 错误: {str(e)}")
-        # 更新数据库状态为失败（使用优化的数据库会话）
-        try:
-            with optimized_db_session(autocommit=True, max_retries=3) as db:
-                message = db.query(TelegramMessage).filter(
-                    TelegramMessage.message_id == message_id
-                ).first()
-                
-                if message:
-                    message.media_download_error = str(e)
-                    message.download_progress = 0
-        except Exception as db_error:
-            logger.error(f"更新下载失败状态时数据库错误: {str(db_error)}")
-        
-        raise
-    finally:
-        # 无论成功还是失败，都要从下载集合中移除
-        downloading_messages.discard(message_id)
-        logger.info(f"已从下载队列中移除消息: {message_id}")
-
-async def batch_download_manager(batch_id: str):
-    """
-    批量下载管理器，负责控制并发下载
-    
-    Args:
-        batch_id: 批量下载ID
-    """
-    global batch_downloads, batch_semaphores
-    
-    if batch_id not in batch_downloads:
-        logger.error(f"批量下载管理器: 任务 {batch_id} 不存在")
-        return
-    
-    batch_info = batch_downloads[batch_id]
-    message_ids = batch_info["message_ids"]
-    force = batch_info.get("force", False)
-    semaphore = batch_semaphores.get(batch_id)
-    
-    if not semaphore:
-        logger.error(f"批量下载管理器: 任务 {batch_id} 没有对应的信号量")
-        return
-    
-    logger.info(f"批量下载管理器启动: {batch_id}, 并发数: {batch_info['max_concurrent']}")
-    
-    # 创建下载任务
-    download_tasks = []
-    for message_id in message_ids:
-        if batch_info["status"] == "cancelled":
-            logger.info(f"批量下载任务已取消，停止创建新的下载任务: {batch_id}")
-            break
-        
-        # 使用信号量控制并发
-        task = asyncio.create_task(batch_download_single_file(batch_id, message_id, force, semaphore))
-        download_tasks.append(task)
-    
-    # 等待所有下载任务完成
-    if download_tasks:
-        try:
-            await asyncio.gather(*download_tasks, return_exceptions=True)
-        except Exception as e:
-            logger.error(f"批量下载管理器异常: {batch_id}, 错误: {str(e)}")
-    
-    # 清理资源
-    if batch_id in batch_semaphores:
-        del batch_semaphores[batch_id]
-    
-    # 更新批量任务状态
-    if batch_id in batch_downloads:
-        if batch_downloads[batch_id]["status"] != "cancelled":
-            batch_downloads[batch_id]["status"] = "completed"
-    
-    logger.info(f"批量下载管理器完成: {batch_id}")
-
-async def batch_download_single_file(batch_id: str, message_id: int, force: bool, semaphore: asyncio.Semaphore):
-    """
-    批量下载中的单个文件下载任务
-    
-    Args:
-        batch_id: 批量下载ID
-        message_id: 消息ID
-        force: 是否强制重新下载
-        semaphore: 并发控制信号量
-    """
-    # 获取信号量，控制并发数
-    async with semaphore:
-        # 检查批量任务是否已取消
-        global batch_downloads
-        if batch_id in batch_downloads and batch_downloads[batch_id]["status"] == "cancelled":
-            logger.info(f"批量下载已取消，跳过文件下载: batch={batch_id}, message={message_id}")
-            return
-        
-        # 检查单个文件是否已经在下载中
-        global downloading_messages
-        if message_id in downloading_messages:
-            logger.info(f"文件已在下载队列中，跳过: message={message_id}")
-            return
-        
-        try:
-            # 添加到下载中的集合
-            downloading_messages.add(message_id)
-            
-            # 将下载任务添加到队列
-            await download_queue.put((message_id, force))
-            logger.info(f"批量下载文件已添加到队列: batch={batch_id}, message={message_id}")
-            
-        except Exception as e:
-            logger.error(f"批量下载单个文件时发生异常: batch={batch_id}, message={message_id}, 错误: {str(e)}")
-            # 确保从下载集合中移除
-            downloading_messages.discard(message_id)
-
 @router.post("/start-download/{message_id}")
 async def download_media_file(
     message_id: int,
-    background_tasks: BackgroundTasks,
     force: bool = False,  # 是否强制重新下载
     db: Session = Depends(get_db)
 ):
@@ -708,6 +413,7 @@ async def download_media_file(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="该消息不包含媒体文件"
                 )
+            group_id = message.group_id
             
             # 如果已下载且不强制重新下载，返回现有文件信息
             if message.media_downloaded and message.media_path and not force:
@@ -737,11 +443,8 @@ async def download_media_file(
             detail=f"数据库访问失败: {str(db_error)}"
         )
     
-    # 🔥 检查是否已经在并发下载中或数据库标记为下载中
-    global concurrent_downloads
-    
-    # 检查并发下载状态
-    if message_id in concurrent_downloads:
+    # 检查是否已有排队中或执行中的下载作业
+    if download_job_queue.active_jobs(JOB_KIND_MEDIA, [message_id]):
         return {
             "status": "download_in_progress", 
             "message": "该文件正在下载中，请稍候",
@@ -749,34 +452,18 @@ async def download_media_file(
             "media_type": message.media_type
         }
     
-    # 检查数据库中的下载状态标志
+    # 登记为持久化下载作业，界面发起的单个下载优先于批量下载
     try:
-        with optimized_db_session() as check_db:
-            db_message = check_db.query(TelegramMessage).filter(
-                TelegramMessage.message_id == message_id
-            ).first()
-            
-            if db_message and db_message.is_downloading:
-                logger.info(f"消息 {message_id} 数据库中标记为正在下载中")
-                return {
-                    "status": "download_in_progress", 
-                    "message": "该文件正在其他会话下载中，请稍候",
-                    "message_id": message_id,
-                    "media_type": message.media_type
-                }
-    except Exception as e:
-        # 如果检查失败，继续下载流程
-        logger.warning(f"检查下载状态标志失败: {e}")
-    
-    # 🔥 使用新的并发下载管理器替代串行队列
-    try:
-        # 启动并发下载任务
-        background_tasks.add_task(concurrent_download_manager, message_id, force, None)
-        
-        logger.info(f"已启动并发下载任务: 消息 {message_id}, 当前并发下载数: {len(concurrent_downloads)}")
+        await download_job_queue.enqueue(JOB_KIND_MEDIA, [{
+            "target_id": message_id,
+            "group_id": group_id,
+            "force": force,
+            "priority": PRIORITY_INTERACTIVE,
+        }])
+        logger.info(f"已登记下载作业: 消息 {message_id}")
         
     except Exception as e:
-        logger.error(f"启动并发下载任务失败: 消息 {message_id}, 错误: {str(e)}")
+        logger.error(f"登记下载作业失败: 消息 {message_id}, 错误: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"启动下载任务失败: {str(e)}"
@@ -855,9 +542,23 @@ async def get_download_status(
                         "error": message.media_download_error
                     }
             
-            # 检查是否正在下载中 - 同时检查内存状态和数据库标记
-            global downloading_messages, concurrent_downloads
-            if message_id in downloading_messages or message_id in concurrent_downloads or message.is_downloading:
+            # 检查是否正在下载中 - 同时检查下载作业和数据库标记
+            if message.is_downloading or download_job_queue.active_jobs(JOB_KIND_MEDIA, [message_id]):
+                # 优先使用进度服务中的实时进度，数据库中只有按检查点间隔写入的值
+                live = progress_service.get_download(None, message.id)
+                if live:
+                    return {
+                        "status": "downloading",
+                        "message": "文件正在下载中",
+                        "progress": live["percent"],
+                        "downloaded_size": live["current"],
+                        "total_size": live["total"] or message.media_size or 0,
+                        "download_speed": live["speed"],
+                        "estimated_time_remaining": live["eta_seconds"] or 0,
+                        "download_started_at": message.download_started_at.isoformat() if message.download_started_at else None,
+                        "media_type": message.media_type,
+                        "file_id": message.media_file_id
+                    }
                 return {
                     "status": "downloading",
                     "message": "文件正在下载中",
@@ -925,34 +626,22 @@ async def cancel_download(
             detail=f"数据库访问失败: {str(db_error)}"
         )
     
-    # 检查是否正在下载中 - 检查内存队列、并发下载和数据库标记
-    global downloading_messages, cancelled_downloads, concurrent_downloads
-    
-    is_downloading = (
-        message_id in downloading_messages or 
-        message_id in concurrent_downloads or 
-        message.is_downloading
-    )
+    # 检查是否正在下载中 - 检查下载作业和数据库标记
+    has_job = bool(download_job_queue.active_jobs(JOB_KIND_MEDIA, [message_id]))
     
-    if not is_downloading:
+    if not (has_job or message.is_downloading):
         return {
             "status": "not_downloading",
             "message": "该文件当前未在下载中"
         }
     
-    # 标记为已取消
-    cancelled_downloads.add(message_id)
-    
-    # 如果在并发下载中，需要取消任务
-    if message_id in concurrent_downloads:
+    # 取消下载作业，本进程中正在执行的下载随之停止
+    if has_job:
         try:
-            download_task = concurrent_downloads[message_id]
-            if not download_task.done():
-                download_task.cancel()
-            del concurrent_downloads[message_id]
-            logger.info(f"已从并发下载中移除: 消息 {message_id}")
+            await download_job_queue.cancel(JOB_KIND_MEDIA, [message_id])
+            logger.info(f"已取消下载作业: 消息 {message_id}")
         except Exception as e:
-            logger.error(f"取消并发下载任务失败: {e}")
+            logger.error(f"取消下载作业失败: {e}")
     
     def reset_download_status():
         try:
@@ -960,6 +649,7 @@ async def cancel_download(
                 # 重置下载状态
                 message = db_session.query(TelegramMessage).filter(TelegramMessage.message_id == message_id).first()
                 if message:
+                    message.is_downloading = False
                     message.download_progress = 0
                     message.downloaded_size = 0
                     message.download_speed = 0
@@ -994,21 +684,13 @@ async def get_download_stats():
     获取当前并发下载统计信息
     
     Returns:
-        并发下载统计数据
+        下载作业队列统计数据
     """
-    global concurrent_download_stats, concurrent_downloads
-    
     return {
         "status": "success",
-        "stats": {
-            "total_active_downloads": concurrent_download_stats["total_active"],
-            "user_active_downloads": concurrent_download_stats["user_active"],
-            "max_concurrent_downloads": MAX_CONCURRENT_DOWNLOADS,
-            "user_concurrent_limit": USER_CONCURRENT_LIMIT,
-            "started_at": concurrent_download_stats["started_at"],
-            "current_downloads": list(concurrent_downloads.keys()),
-            "available_slots": MAX_CONCURRENT_DOWNLOADS - concurrent_download_stats["total_active"]
-        }
+        "stats": download_job_queue.get_stats(),
+        "jobs": download_job_queue.count_by_state(),
+        "thumbnails": thumbnail_service.get_stats()
     }
 
 @router.post("/cancel-concurrent-download/{message_id}")
@@ -1026,10 +708,8 @@ async def cancel_concurrent_download(
     Returns:
         取消状态
     """
-    global concurrent_downloads
-    
-    # 检查是否在并发下载中
-    if message_id not in concurrent_downloads:
+    # 检查是否有排队中或执行中的下载作业
+    if not download_job_queue.active_jobs(JOB_KIND_MEDIA, [message_id]):
         return {
             "status": "not_downloading",
             "message": "该文件未在下载中",
@@ -1037,14 +717,9 @@ async def cancel_concurrent_download(
         }
     
     try:
-        # 取消下载任务
-        download_task = concurrent_downloads[message_id]
-        if not download_task.done():
-            download_task.cancel()
-            logger.info(f"已取消并发下载任务: 消息 {message_id}")
-        
-        # 从并发下载字典中移除
-        del concurrent_downloads[message_id]
+        # 取消下载作业，本进程中正在执行的下载随之停止
+        await download_job_queue.cancel(JOB_KIND_MEDIA, [message_id])
+        logger.info(f"已取消并发下载任务: 消息 {message_id}")
         
         # 更新数据库状态 - 使用优化的数据库会话
         with optimized_db_session(autocommit=True, max_retries=3) as db_session:
@@ -1054,6 +729,7 @@ async def cancel_concurrent_download(
             
             if message:
                 message.media_download_error = "下载已取消"
+                message.is_downloading = False
                 message.download_progress = 0
         
         return {
@@ -1073,7 +749,6 @@ async def cancel_concurrent_download(
 @router.post("/batch-concurrent-download")
 async def start_batch_concurrent_download(
     request: BatchDownloadRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -1081,7 +756,6 @@ async def start_batch_concurrent_download(
     
     Args:
         request: 批量下载请求
-        background_tasks: 后台任务
         db: 数据库会话
     
     Returns:
@@ -1099,35 +773,44 @@ async def start_batch_concurrent_download(
             detail="一次最多可下载50个文件"
         )
     
-    # 过滤已在下载中的文件
-    valid_message_ids = []
+    # 群组ID用于作业队列的按群组并发限制
+    message_groups = dict(
+        db.query(TelegramMessage.message_id, TelegramMessage.group_id)
+        .filter(TelegramMessage.message_id.in_(request.message_ids))
+        .all()
+    )
+    
+    # 登记下载作业，已有排队中或执行中作业的文件不会重复登记
+    failed_to_start = []
+    successfully_started = []
     already_downloading = []
     
-    for message_id in request.message_ids:
-        if message_id in concurrent_downloads:
-            already_downloading.append(message_id)
-        else:
-            valid_message_ids.append(message_id)
+    try:
+        results = await download_job_queue.enqueue(JOB_KIND_MEDIA, [
+            {
+                "target_id": message_id,
+                "group_id": message_groups.get(message_id),
+                "force": request.force,
+                "priority": PRIORITY_BATCH,
+            }
+            for message_id in request.message_ids
+        ])
+        for result in results:
+            if result["created"]:
+                successfully_started.append(result["target_id"])
+            else:
+                already_downloading.append(result["target_id"])
+    except Exception as e:
+        failed_to_start = [{"message_id": message_id, "error": str(e)} for message_id in request.message_ids]
+        logger.error(f"登记批量并发下载作业失败: {str(e)}")
     
-    if not valid_message_ids:
+    if not successfully_started and not failed_to_start:
         return {
             "status": "all_already_downloading",
             "message": "所有文件都已在下载中",
             "already_downloading": already_downloading
         }
     
-    # 启动并发下载任务
-    failed_to_start = []
-    successfully_started = []
-    
-    for message_id in valid_message_ids:
-        try:
-            background_tasks.add_task(concurrent_download_manager, message_id, request.force, None)
-            successfully_started.append(message_id)
-        except Exception as e:
-            failed_to_start.append({"message_id": message_id, "error": str(e)})
-            logger.error(f"启动并发下载失败: 消息 {message_id}, 错误: {str(e)}")
-    
     logger.info(f"批量并发下载启动: {len(successfully_started)} 个文件成功, {len(failed_to_start)} 个文件失败")
     
     return {
@@ -1140,7 +823,7 @@ async def start_batch_concurrent_download(
         "started_downloads": successfully_started,
         "already_downloading_list": already_downloading,
         "failed_downloads": failed_to_start,
-        "current_concurrent_downloads": len(concurrent_downloads)
+        "current_concurrent_downloads": len(download_job_queue.get_stats()["running"].get(JOB_KIND_MEDIA, []))
     }
 
 @router.delete("/media/{message_id}")
@@ -1202,68 +885,64 @@ async def delete_media_file(
             detail=f"删除文件失败: {str(e)}"
         )
 
-@router.get("/download/{message_id}")
-async def serve_media_file(
-    message_id: int,
-    db: Session = Depends(get_db)
-):
-    """
-    提供媒体文件下载服务
-    
-    Args:
-        message_id: 消息ID
-        db: 数据库会话
-    
-    Returns:
-        媒体文件响应
-    """
-    message = db.query(TelegramMessage).filter(TelegramMessage.message_id == message_id).first()
+_MEDIA_COLUMNS = (
+    TelegramMessage.message_id,
+    TelegramMessage.media_type,
+    TelegramMessage.media_downloaded,
+    TelegramMessage.media_path,
+    TelegramMessage.media_thumbnail_path,
+    TelegramMessage.media_filename,
+    TelegramMessage.media_file_id,
+    TelegramMessage.media_duration,
+    TelegramGroup.telegram_id.label("chat_id"),
+)
+
+
+async def _get_media_message(db: AsyncSession, message_id: int, group_id: Optional[int] = None):
+    """按 (group_id, message_id) 唯一索引读取媒体相关字段；未指定群组时沿用旧接口的按消息ID查找"""
+    query = (
+        select(*_MEDIA_COLUMNS)
+        .join(TelegramGroup, TelegramGroup.id == TelegramMessage.group_id)
+        .where(TelegramMessage.message_id == message_id)
+    )
+    if group_id is not None:
+        query = query.where(TelegramMessage.group_id == group_id)
+    message = (await db.execute(query.limit(1))).first()
     if not message:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="消息不存在"
         )
-    
     if not message.media_type:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="该消息不包含媒体文件"
         )
-    
+    return message
+
+
+def _serve_download(request: Request, message, download: bool) -> Response:
     if not message.media_downloaded or not message.media_path:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="媒体文件未下载"
         )
-    
-    if not os.path.exists(message.media_path):
+
+    try:
+        return stream_media_file(
+            request,
+            message.media_path,
+            media_type=guess_media_type(message.media_path, message.media_type),
+            filename=message.media_filename or f"media_{message.message_id}",
+            # URL按消息寻址，强制重新下载后内容可能变化，不能标记 immutable
+            max_age=settings.media_cache_max_age,
+            attachment=download,
+        )
+    except FileNotFoundError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="媒体文件不存在"
         )
-    
-    try:
-        # 获取MIME类型
-        mime_type, _ = mimetypes.guess_type(message.media_path)
-        if not mime_type:
-            # 根据媒体类型设置默认MIME类型
-            mime_type_mapping = {
-                'photo': 'image/jpeg',
-                'video': 'video/mp4',
-                'document': 'application/octet-stream',
-                'audio': 'audio/mpeg',
-                'voice': 'audio/ogg'
-            }
-            mime_type = mime_type_mapping.get(message.media_type, 'application/octet-stream')
-        
-        # 设置文件名
-        filename = message.media_filename or f"media_{message_id}"
-        
-        return FileResponse(
-            path=message.media_path,
-            media_type=mime_type,
-            filename=filename
-        )
     except Exception as e:
         logger.error(f"提供媒体文件失败: {str(e)}")
         raise HTTPException(
@@ -1271,133 +950,147 @@ async def serve_media_file(
             detail=f"提供媒体文件失败: {str(e)}"
         )
 
-@router.get("/thumbnail/{message_id}")
-async def serve_media_thumbnail(
+
+async def _serve_thumbnail(request: Request, message, size: str, fmt: Optional[str]) -> Response:
+    fmt = thumbnail_service.negotiate_format(request.headers.get("accept"), fmt)
+    try:
+        path = await thumbnail_service.get_thumbnail(message, size, fmt, chat_id=message.chat_id)
+    except Exception as e:
+        logger.error(f"生成缩略图失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"提供缩略图失败: {str(e)}"
+        )
+
+    if path:
+        try:
+            return stream_media_file(
+                request,
+                path,
+                media_type=thumbnail_service.mime_type(fmt),
+                filename=f"thumbnail_{message.message_id}_{size}.{fmt}",
+                max_age=settings.thumbnail_cache_max_age,
+                vary="Accept",
+                # 缓存文件名即内容摘要，命中时刷新的 mtime 不影响ETag
+                etag=os.path.basename(path),
+            )
+        except FileNotFoundError:
+            # 刚好被缓存淘汰
+            pass
+
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="缩略图不存在"
+    )
+
+
+@router.api_route("/download/{group_id}/{message_id}", methods=["GET", "HEAD"])
+async def stream_media_file_by_group(
+    group_id: int,
     message_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    download: bool = Query(False, description="以附件形式下载"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    提供媒体文件缩略图服务
-    
+    媒体文件流式输出
+
+    支持 Range(206)、ETag/If-None-Match、Last-Modified/If-Modified-Since 条件请求，
+    已下载的媒体内容不变，返回长期缓存头。
+
+    Args:
+        group_id: 群组ID
+        message_id: 群组内的消息ID
+        download: 是否以附件形式下载，默认内联显示
+    """
+    message = await _get_media_message(db, message_id, group_id)
+    return _serve_download(request, message, download)
+
+
+@router.api_route("/thumbnail/{group_id}/{message_id}", methods=["GET", "HEAD"])
+async def stream_media_thumbnail_by_group(
+    group_id: int,
+    message_id: int,
+    request: Request,
+    size: Literal["small", "medium", "large"] = Query(DEFAULT_PRESET, description="预设尺寸"),
+    format: Optional[Literal["webp", "jpeg"]] = Query(None, description="图片格式，默认按Accept协商"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    媒体缩略图输出
+
+    按需生成预设尺寸的 WebP/JPEG 缩略图（缓存命中时直接返回），媒体未下载时
+    使用 Telegram 内嵌缩略图。条件请求与缓存语义同媒体文件。
+
+    Args:
+        group_id: 群组ID
+        message_id: 群组内的消息ID
+        size: small(160) / medium(320) / large(640)
+        format: webp / jpeg
+    """
+    message = await _get_media_message(db, message_id, group_id)
+    return await _serve_thumbnail(request, message, size, format)
+
+
+@router.api_route("/download/{message_id}", methods=["GET", "HEAD"])
+async def serve_media_file(
+    message_id: int,
+    request: Request,
+    download: bool = Query(False, description="以附件形式下载"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    提供媒体文件下载服务（兼容旧地址，消息ID在不同群组间可能重复，新代码应使用带群组ID的地址）
+
     Args:
         message_id: 消息ID
+        download: 是否以附件形式下载
         db: 数据库会话
     
     Returns:
-        缩略图文件响应
+        媒体文件响应
     """
-    message = db.query(TelegramMessage).filter(TelegramMessage.message_id == message_id).first()
-    if not message:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="消息不存在"
-        )
-    
-    if not message.media_type:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="该消息不包含媒体文件"
-        )
-    
-    # 检查是否有缩略图
-    if not message.media_thumbnail_path:
-        # 如果没有缩略图但有原文件，对于图片可以返回原文件
-        if message.media_type == "photo" and message.media_downloaded and message.media_path:
-            if os.path.exists(message.media_path):
-                try:
-                    # 获取MIME类型
-                    mime_type, _ = mimetypes.guess_type(message.media_path)
-                    if not mime_type:
-                        mime_type = 'image/jpeg'
-                    
-                    # 设置文件名
-                    filename = f"thumbnail_{message_id}.jpg"
-                    
-                    return FileResponse(
-                        path=message.media_path,
-                        media_type=mime_type,
-                        filename=filename
-                    )
-                except Exception as e:
-                    logger.error(f"提供图片缩略图失败: {str(e)}")
-                    raise HTTPException(
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                        detail=f"提供缩略图失败: {str(e)}"
-                    )
-        
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="缩略图不存在"
-        )
-    
-    if not os.path.exists(message.media_thumbnail_path):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="缩略图文件不存在"
-        )
-    
-    try:
-        # 获取MIME类型 - 缩略图通常是JPEG
-        mime_type = 'image/jpeg'
-        
-        # 设置文件名
-        filename = f"thumbnail_{message_id}.jpg"
-        
-        return FileResponse(
-            path=message.media_thumbnail_path,
-            media_type=mime_type,
-            filename=filename
-        )
-    except Exception as e:
-        logger.error(f"提供缩略图失败: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"提供缩略图失败: {str(e)}"
-        )
+    message = await _get_media_message(db, message_id)
+    return _serve_download(request, message, download)
+
 
-async def start_download_worker():
-    """启动下载工作进程，串行处理下载队列"""
-    logger.info("下载工作进程已启动")
+@router.api_route("/thumbnail/{message_id}", methods=["GET", "HEAD"])
+async def serve_media_thumbnail(
+    message_id: int,
+    request: Request,
+    size: Literal["small", "medium", "large"] = Query(DEFAULT_PRESET, description="预设尺寸"),
+    format: Optional[Literal["webp", "jpeg"]] = Query(None, description="图片格式，默认按Accept协商"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    提供媒体文件缩略图服务（兼容旧地址，新代码应使用带群组ID的地址）
+
+    Args:
+        message_id: 消息ID
+        size: 预设尺寸
+        format: 图片格式
+        db: 数据库会话
     
-    while True:
-        try:
-            # 从队列获取下载任务
-            message_id, force = await download_queue.get()
-            logger.info(f"处理下载任务: 消息 {message_id}")
-            
-            try:
-                # 检查是否已被取消
-                if message_id in cancelled_downloads:
-                    logger.info(f"下载任务已被取消，跳过执行: 消息 {message_id}")
-                    cancelled_downloads.discard(message_id)
-                else:
-                    # 执行下载
-                    await download_media_background(message_id, force)
-            finally:
-                # 无论成功失败，都从下载中集合移除
-                downloading_messages.discard(message_id)
-                # 清理取消标记
-                cancelled_downloads.discard(message_id)
-            
-            # 标记任务完成
-            download_queue.task_done()
-            
-        except Exception as e:
-            logger.error(f"下载工作进程异常: {str(e)}")
-            # 继续处理下一个任务
-            continue
+    Returns:
+        缩略图文件响应
+    """
+    message = await _get_media_message(db, message_id)
+    return await _serve_thumbnail(request, message, size, format)
 
-async def download_media_background(message_id: int, force: bool = False):
+async def download_media_background(message_id: int, force: bool = False, job_id: Optional[int] = None) -> bool:
     """
-    后台下载媒体文件任务（串行执行，无并发冲突）
+    后台下载媒体文件任务，由下载作业队列调度执行
     
     Args:
         message_id: 消息ID
-        force: 是否强制重新下载（当前未使用，因为force检查在队列前完成）
+        force: 是否强制重新下载（当前未使用，因为force检查在登记作业前完成）
+        job_id: 下载作业ID，作业重试或重启后恢复时沿用同一文件名以续传已下载的分片
+    
+    Returns:
+        是否下载成功
     """
     # Note: force parameter is currently unused as force checking is done before queueing
     _ = force  # Suppress unused parameter warning
-    from ..database import SessionLocal
     
     # 使用优化的数据库会话获取必要信息
     def get_message_info():
@@ -1430,7 +1123,7 @@ async def download_media_background(message_id: int, force: bool = False):
     try:
         message_info = get_message_info()
         if not message_info:
-            return
+            return False
         
         # 提取变量
         db_id = message_info['db_id']
@@ -1443,7 +1136,7 @@ async def download_media_background(message_id: int, force: bool = False):
         
     except Exception as e:
         logger.error(f"获取消息信息失败: {e}")
-        return
+        return False
     
     # 清除之前的错误信息（使用优化的数据库会话）
     def clear_previous_error():
@@ -1465,6 +1158,7 @@ async def download_media_background(message_id: int, force: bool = False):
     file_path = None
     download_error = None
     download_success = False
+    download_started = time.monotonic()
     
     try:
         # 构建文件保存路径
@@ -1486,7 +1180,8 @@ async def download_media_background(message_id: int, force: bool = False):
         elif media_type == "document":
             file_extension = ".bin"
         
-        unique_filename = f"{group_id}_{message_id_telegram}_{uuid.uuid4().hex[:8]}{file_extension}"
+        suffix = f"job{job_id}" if job_id is not None else uuid.uuid4().hex[:8]
+        unique_filename = f"{group_id}_{message_id_telegram}_{suffix}{file_extension}"
         file_path = os.path.join(media_dir, unique_filename)
         
         # 记录下载开始到数据库
@@ -1506,66 +1201,10 @@ async def download_media_background(message_id: int, force: bool = False):
         
         # 下载文件
         from ..services.media_downloader import get_media_downloader, TelegramMediaDownloader
-        import time
-        
-        # 创建进度回调函数
-        last_update_time = time.time()
-        last_downloaded_size = 0
         
+        # 创建进度回调函数：只更新进度服务的内存状态，推送和数据库检查点由进度服务合并完成
         def progress_callback(current_bytes, total_bytes, progress_percent):
-            nonlocal last_update_time, last_downloaded_size
-            
-            # 检查是否已被取消
-            if message_id in cancelled_downloads:
-                logger.info(f"下载已被取消，停止进度更新: 消息 {message_id}")
-                # 使用特定的异常类型而不是通用Exception，便于上层区分
-                class DownloadCancelledException(Exception):
-                    pass
-                raise DownloadCancelledException("下载已取消")
-            
-            try:
-                current_time = time.time()
-                time_diff = current_time - last_update_time
-                
-                # 每2秒更新一次数据库，减少数据库访问频率
-                if time_diff >= 2.0:
-                    # 计算下载速度
-                    size_diff = current_bytes - last_downloaded_size
-                    download_speed = size_diff / time_diff if time_diff > 0 else 0
-                    
-                    # 计算预计剩余时间
-                    remaining_bytes = total_bytes - current_bytes
-                    estimated_time = remaining_bytes / download_speed if download_speed > 0 else 0
-                    
-                    # 使用优化的数据库会话更新进度
-                    def update_progress():
-                        try:
-                            with optimized_db_session(autocommit=True, max_retries=3) as db_update:
-                                msg = db_update.query(TelegramMessage).filter(TelegramMessage.id == db_id).first()
-                                if msg:
-                                    msg.download_progress = progress_percent
-                                    msg.downloaded_size = current_bytes
-                                    msg.download_speed = int(download_speed)
-                                    msg.estimated_time_remaining = int(estimated_time)
-                                    if not msg.download_started_at:
-                                        from datetime import datetime, timezone
-                                        msg.download_started_at = datetime.now(timezone.utc)
-                        except Exception as e:
-                            logger.error(f"更新下载进度失败: {e}")
-                            raise
-                    
-                    try:
-                        update_progress()
-                    except Exception as e:
-                        logger.warning(f"进度更新重试失败，跳过此次更新: {e}")
-                    
-                    last_update_time = current_time
-                    last_downloaded_size = current_bytes
-                    
-                    logger.info(f"下载进度 {message_id}: {progress_percent}% ({current_bytes}/{total_bytes} bytes, {download_speed:.0f} B/s)")
-                    
-            except Exception as e:
-                logger.error(f"进度回调执行失败: {e}")
+            progress_service.report(None, db_id, current_bytes, total_bytes, persist=True)
         
         try:
             # 使用消息信息创建持久化的下载器实例
@@ -1604,7 +1243,8 @@ async def download_media_background(message_id: int, force: bool = False):
                         chat_id=group_telegram_id,
                         message_id=message_id_telegram
                     )
-                    await media_downloader.initialize()
+                    # 回收池化连接，基于最新的主session重建
+                    await media_downloader.reinitialize()
                     
                     logger.info(f"重新尝试下载媒体文件: 消息 {message_id}")
                     download_success = await media_downloader.download_file(
@@ -1627,22 +1267,21 @@ async def download_media_background(message_id: int, force: bool = False):
                 except Exception as retry_err:
                     download_error = f"重新初始化下载器失败: {str(retry_err)}"
                     logger.error(f"重新初始化下载器异常: {download_error}")
-            # 判断是否是取消下载导致的异常
-            elif "下载已取消" in str(download_err):
-                download_error = "下载已被用户取消"
-                logger.info(f"下载正常取消: {download_error}")
-                # 删除可能创建的部分文件
-                if file_path and os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                        logger.info(f"已删除取消下载的不完整文件: {file_path}")
-                    except Exception as del_err:
-                        logger.warning(f"删除不完整文件失败: {del_err}")
             
+    except asyncio.CancelledError:
+        # 作业被取消(用户取消或租约丢失)，数据库状态由取消方负责更新
+        logger.info(f"下载已取消: 消息 {message_id}")
+        progress_service.complete(None, db_id, success=False)
+        raise
     except Exception as e:
         download_error = f"下载过程中发生错误: {str(e)}"
         logger.error(f"下载任务异常: {download_error}")
     
+    progress_service.complete(None, db_id, success=download_success)
+    DOWNLOAD_DURATION.labels("manual", "success" if download_success else "failed").observe(
+        time.monotonic() - download_started
+    )
+    
     # 最后更新数据库状态（使用优化的数据库会话）
     def update_database_status():
         try:
@@ -1684,4 +1323,20 @@ async def download_media_background(message_id: int, force: bool = False):
     try:
         update_database_status()
     except Exception as e:
-        logger.error(f"数据库状态更新最终失败: {str(e)}")
\ No newline at end of file
+        logger.error(f"数据库状态更新最终失败: {str(e)}")
+
+    if download_success and file_path:
+        # 后台预生成常用尺寸的缩略图
+        thumbnail_service.prewarm(file_path, media_type)
+
+    return download_success
+
+
+async def run_media_job(job: dict) -> bool:
+    """下载作业队列中媒体作业的执行函数，批量下载按批量请求限速"""
+    lane = LANE_INTERACTIVE if job["priority"] > PRIORITY_BATCH else LANE_BULK
+    with rate_governor.lane(lane):
+        return await download_media_background(job["target_id"], job["force"], job_id=job["id"])
+
+
+download_job_queue.register_handler(JOB_KIND_MEDIA, run_media_job)
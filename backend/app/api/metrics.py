@@ -0,0 +1,224 @@
+"""Prometheus / OpenMetrics 指标端点
+
+GET /metrics 输出 app.core.metrics 注册表中的全部指标。热路径上的计数器和直方图
+(下载字节数、单文件下载耗时、提交耗时、锁重试、WebSocket发送延迟)在发生时更新；
+下列已由各组件维护的状态在抓取时读取:
+
+- 下载: 下载作业队列各状态作业数和并发上限、运行中的任务、流水线各阶段队列深度、进行中的文件数
+- 数据库: 单写线程队列深度和批次统计、连接池使用情况
+- WebSocket: 连接数、发送队列深度
+- Telegram RPC限速: 各类别的当前速率、剩余令牌、FloodWait停发剩余时间、排队数和等待时间
+- 缓存: Telegram查询缓存、全局内存缓存、缩略图缓存的命中/未命中次数和命中率
+- 批处理日志: 写入条目、字节数、溢出次数
+- 系统: 系统指标采样器的最新快照
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import logging
+from typing import List
+
+from fastapi import APIRouter, Request
+from fastapi.responses import Response
+
+from ..core.metrics import (
+    OPENMETRICS_CONTENT_TYPE,
+    PROMETHEUS_CONTENT_TYPE,
+    CollectedMetric,
+    counter_family,
+    gauge_family,
+    metrics_registry,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _collect_downloads() -> List[CollectedMetric]:
+    from ..config import settings
+    from ..models.download_job import JOB_KIND_MEDIA
+    from ..services.download_job_queue import download_job_queue
+    from ..services.progress_service import progress_service
+    from ..services.task_execution_service import task_execution_service
+
+    queue_depth = gauge_family(
+        "tggod_pipeline_queue_depth", "下载流水线各阶段队列中的消息数(所有运行中任务之和)", ("stage",)
+    )
+    depths = {}
+    for pipeline in list(task_execution_service._pipelines.values()):
+        for name, stage in pipeline.stages.items():
+            depths[name] = depths.get(name, 0) + stage.queue_depth
+    for name, depth in depths.items():
+        queue_depth.add(depth, name)
+
+    jobs = gauge_family("tggod_download_jobs", "下载作业队列中排队和执行中的作业数", ("kind", "state"))
+    for kind, states in download_job_queue.count_by_state().items():
+        for state, count in states.items():
+            jobs.add(count, kind, state)
+
+    running = download_job_queue.get_stats()["running"]
+    return [
+        gauge_family("tggod_manual_downloads_active", "本进程执行中的手动下载数")
+        .add(len(running.get(JOB_KIND_MEDIA, []))),
+        gauge_family("tggod_manual_downloads_limit", "手动下载的全局并发上限")
+        .add(settings.download_jobs_global_limit),
+        jobs,
+        gauge_family("tggod_tasks_running", "运行中的下载任务数")
+        .add(len(task_execution_service.running_tasks)),
+        gauge_family("tggod_downloads_in_progress", "进度服务中正在下载的文件数")
+        .add(len(progress_service.snapshot()["downloads"])),
+        queue_depth,
+    ]
+
+
+def _collect_database() -> List[CollectedMetric]:
+    from ..services.connection_pool_monitor import get_pool_monitor
+    from ..utils.db_writer import db_writer
+
+    stats = db_writer.stats
+    families = [
+        gauge_family("tggod_db_writer_queue_depth", "单写线程队列中等待的写命令数")
+        .add(db_writer._queue.qsize()),
+        counter_family("tggod_db_writer_batches", "单写线程提交的事务批次数")
+        .add(stats.batches),
+        gauge_family("tggod_db_writer_max_batch_size", "单个批次合并的最大命令数")
+        .add(stats.max_batch_size),
+    ]
+
+    status = get_pool_monitor().get_current_status()
+    if "error" not in status:
+        pool = gauge_family("tggod_db_pool_connections", "数据库连接池连接数", ("state",))
+        pool.add(status["checked_out"], "checked_out")
+        pool.add(status["checked_in"], "checked_in")
+        pool.add(status["overflow"], "overflow")
+        families.append(pool)
+        families.append(
+            gauge_family("tggod_db_pool_utilization", "连接池使用率").add(status["utilization"])
+        )
+    return families
+
+
+def _collect_websocket() -> List[CollectedMetric]:
+    from ..websocket.manager import websocket_manager
+
+    channels = list(websocket_manager.channels.values())
+    return [
+        gauge_family("tggod_websocket_connections", "WebSocket连接数")
+        .add(len(websocket_manager.active_connections)),
+        gauge_family("tggod_websocket_queue_depth", "所有客户端发送队列中的消息数")
+        .add(sum(len(channel.queue) for channel in channels)),
+        counter_family("tggod_websocket_slow_disconnects", "因积压过多被断开的客户端数")
+        .add(websocket_manager.disconnected_slow_clients),
+    ]
+
+
+def _collect_rpc() -> List[CollectedMetric]:
+    from ..core.rate_governor import rate_governor
+
+    rate = gauge_family("tggod_rpc_rate", "RPC限速器当前速率(次/秒)，遇到FloodWait后自动下调", ("rpc",))
+    ceiling = gauge_family("tggod_rpc_rate_ceiling", "从FloodWait学习到的速率上限(次/秒)", ("rpc",))
+    tokens = gauge_family("tggod_rpc_tokens", "令牌桶中剩余的令牌数", ("rpc",))
+    blocked = gauge_family("tggod_rpc_blocked_seconds", "因FloodWait停发的剩余秒数", ("rpc",))
+    waiting = gauge_family("tggod_rpc_waiting", "排队等待令牌的调用数", ("rpc", "lane"))
+    calls = counter_family("tggod_rpc_calls", "经限速器发出的调用数", ("rpc", "lane"))
+    wait = counter_family("tggod_rpc_wait_seconds", "等待令牌的累计秒数", ("rpc", "lane"))
+    floods = counter_family("tggod_rpc_flood_waits", "遇到的FloodWait次数", ("rpc",))
+    for rpc, stats in rate_governor.get_stats().items():
+        rate.add(stats["rate"], rpc)
+        ceiling.add(stats["ceiling"], rpc)
+        tokens.add(stats["tokens"], rpc)
+        blocked.add(stats["blocked_seconds"], rpc)
+        floods.add(stats["flood_waits"], rpc)
+        for lane, count in stats["waiting"].items():
+            waiting.add(count, rpc, lane)
+            calls.add(stats["calls"][lane], rpc, lane)
+            wait.add(stats["wait_seconds"][lane], rpc, lane)
+    return [rate, ceiling, tokens, blocked, waiting, calls, wait, floods]
+
+
+def _collect_caches() -> List[CollectedMetric]:
+    from ..core.memory_manager import memory_manager
+    from ..core.telegram_cache import telegram_cache
+    from ..services.thumbnail_service import thumbnail_service
+
+    caches = {
+        "telegram_query": (telegram_cache.memory_cache.hits, telegram_cache.memory_cache.misses),
+        "memory": (memory_manager.global_cache.hits, memory_manager.global_cache.misses),
+        "thumbnail": (thumbnail_service.stats.hits, thumbnail_service.stats.misses),
+    }
+    requests = counter_family("tggod_cache_requests", "缓存查询次数", ("cache", "result"))
+    ratio = gauge_family("tggod_cache_hit_ratio", "缓存命中率(自启动以来)", ("cache",))
+    for name, (hits, misses) in caches.items():
+        requests.add(hits, name, "hit")
+        requests.add(misses, name, "miss")
+        ratio.add(hits / (hits + misses) if hits + misses else 0.0, name)
+
+    entries = gauge_family("tggod_cache_entries", "缓存条目数", ("cache",))
+    entries.add(len(telegram_cache.memory_cache._cache), "telegram_query")
+    entries.add(len(memory_manager.global_cache.cache), "memory")
+    return [requests, ratio, entries]
+
+
+def _collect_batch_logging() -> List[CollectedMetric]:
+    from ..core.batch_logging import BatchLogHandler
+
+    processor = BatchLogHandler._global_processor
+    if processor is None:
+        return []
+    metrics = processor.metrics
+    return [
+        counter_family("tggod_log_entries", "批处理日志写入的条目数").add(metrics.total_entries),
+        counter_family("tggod_log_bytes", "批处理日志写入的字节数").add(metrics.total_bytes_written),
+        counter_family("tggod_log_buffer_overflows", "批处理日志缓冲区溢出次数").add(metrics.buffer_overflows),
+        counter_family("tggod_log_failed_writes", "批处理日志写入失败次数").add(metrics.failed_writes),
+    ]
+
+
+def _collect_system() -> List[CollectedMetric]:
+    from ..services.system_metrics_sampler import system_metrics_sampler
+
+    # 采样器未启动时不输出，避免抓取触发采样
+    if not system_metrics_sampler.running:
+        return []
+    snapshot = system_metrics_sampler.latest()
+    network = gauge_family("tggod_network_rate_bytes", "网络收发速率(字节/秒)", ("direction",))
+    network.add(snapshot.net_recv_rate, "recv")
+    network.add(snapshot.net_send_rate, "send")
+    families = [
+        gauge_family("tggod_system_cpu_percent", "系统CPU使用率").add(snapshot.cpu_percent),
+        gauge_family("tggod_system_memory_percent", "系统内存使用率").add(snapshot.memory_percent),
+        gauge_family("tggod_process_cpu_percent", "本进程CPU使用率").add(snapshot.process_cpu_percent),
+        gauge_family("tggod_process_resident_memory_bytes", "本进程常驻内存").add(snapshot.process_memory_rss),
+        gauge_family("tggod_process_threads", "本进程线程数").add(snapshot.process_threads),
+        network,
+    ]
+    disk = snapshot.media_disk
+    if disk:
+        families.append(gauge_family("tggod_media_disk_free_bytes", "媒体目录所在分区的可用空间").add(disk.free))
+    return families
+
+
+metrics_registry.register_collector("downloads", _collect_downloads)
+metrics_registry.register_collector("database", _collect_database)
+metrics_registry.register_collector("websocket", _collect_websocket)
+metrics_registry.register_collector("rpc", _collect_rpc)
+metrics_registry.register_collector("caches", _collect_caches)
+metrics_registry.register_collector("batch_logging", _collect_batch_logging)
+metrics_registry.register_collector("system", _collect_system)
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics(request: Request):
+    """Prometheus 抓取端点
+
+    请求头 Accept 包含 application/openmetrics-text 时输出 OpenMetrics 1.0.0，
+    否则输出 Prometheus 0.0.4 文本格式。下载作业统计等采集器会查询数据库，
+    因此定义为同步端点，由 FastAPI 在线程池中执行，不阻塞事件循环。
+    """
+    openmetrics = "application/openmetrics-text" in request.headers.get("accept", "")
+    body = metrics_registry.render(openmetrics=openmetrics)
+    content_type = OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE
+    # 直接设置完整的 content-type，避免 text/plain 被重复追加 charset
+    return Response(content=body, headers={"content-type": content_type})
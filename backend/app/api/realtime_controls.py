@@ -3,6 +3,7 @@ from pydantic import BaseModel
 import logging
 
 from ..core.auto_recovery_engine import get_auto_recovery_engine
+from ..websocket.manager import websocket_manager
 from ..websocket.production_status_manager import production_status_manager
 
 
@@ -59,3 +60,18 @@ async def set_maintenance_mode(payload: MaintenanceModeRequest):
     except Exception as e:
         logger.error(f"设置维护模式失败: {e}")
         raise HTTPException(status_code=500, detail=f"设置维护模式失败: {str(e)}")
+
+
+@router.get("/realtime/websocket/stats")
+async def get_websocket_stats():
+    """获取WebSocket连接、发送队列深度和发送延迟统计"""
+    try:
+        stats = websocket_manager.get_stats()
+        return {
+            "success": True,
+            "data": stats,
+            "message": f"当前 {stats['connection_count']} 个WebSocket连接",
+        }
+    except Exception as e:
+        logger.error(f"获取WebSocket统计失败: {e}")
+        raise HTTPException(status_code=500, detail=f"获取WebSocket统计失败: {str(e)}")
@@ -36,6 +36,8 @@ from ..database import get_db
 from ..models.rule import FilterRule, DownloadTask
 from ..models.telegram import TelegramGroup, TelegramMessage
 from ..services.rule_sync_service import rule_sync_service
+from ..services.rule_match_service import rule_match_service
+from ..models.rule_match import RuleMatchState, RuleMessageMatch
 from pydantic import BaseModel
 from datetime import datetime
 import logging
@@ -233,6 +235,7 @@ async def create_rule(
     db.add(new_rule)
     db.commit()
     db.refresh(new_rule)
+    rule_match_service.notify_rules_changed()
     
     return new_rule
 
@@ -280,6 +283,8 @@ async def update_rule(
     
     db.commit()
     db.refresh(rule)
+    # 条件变化后规则指纹改变，匹配结果由后台增量重建
+    rule_match_service.notify_rules_changed()
     return rule
 
 @router.delete("/rules/{rule_id}")
@@ -297,8 +302,12 @@ async def delete_rule(
     if task_count > 0:
         raise HTTPException(status_code=400, detail="规则关联的任务存在，无法删除")
     
+    # SQLite未启用外键级联，手动清理匹配结果
+    db.query(RuleMessageMatch).filter(RuleMessageMatch.rule_id == rule_id).delete(synchronize_session=False)
+    db.query(RuleMatchState).filter(RuleMatchState.rule_id == rule_id).delete(synchronize_session=False)
     db.delete(rule)
     db.commit()
+    rule_match_service.notify_rules_changed()
     return {"message": "规则删除成功"}
 
 @router.post("/rules/{rule_id}/test", response_model=RuleTestResponse)
@@ -428,7 +437,8 @@ async def get_rules_stats(
             "active_rules": active_rules,
             "inactive_rules": inactive_rules,
             "rules_with_tasks": rules_with_tasks,
-            "unused_rules": unused_rules
+            "unused_rules": unused_rules,
+            "match_index": rule_match_service.get_stats()
         }
         
     except Exception as e:
@@ -4,9 +4,11 @@
 """
 from fastapi import APIRouter, HTTPException
 from typing import Dict, Any
+import asyncio
 import logging
 
 from ..services.service_monitor import service_monitor
+from ..services.system_metrics_sampler import get_system_metrics_sampler
 from ..services.service_installer import service_installer
 
 logger = logging.getLogger(__name__)
@@ -227,12 +229,15 @@ async def get_system_resources():
         # 尝试使用psutil获取详细信息
         try:
             import psutil
-            
+
+            # CPU、内存、磁盘和网络计数来自系统指标采样器的最新快照
+            snapshot = get_system_metrics_sampler().latest()
+
             # CPU信息
             resources["cpu"] = {
-                "usage_percent": psutil.cpu_percent(interval=1),
-                "count": psutil.cpu_count(),
-                "count_logical": psutil.cpu_count(logical=True)
+                "usage_percent": snapshot.cpu_percent,
+                "count": snapshot.cpu_count_physical or snapshot.cpu_count,
+                "count_logical": snapshot.cpu_count
             }
             
             # 添加CPU频率信息
@@ -248,34 +253,30 @@ async def get_system_resources():
                 pass
             
             # 内存信息
-            memory = psutil.virtual_memory()
             resources["memory"] = {
-                "total": memory.total,
-                "available": memory.available,
-                "used": memory.used,
-                "percentage": memory.percent
+                "total": snapshot.memory_total,
+                "available": snapshot.memory_available,
+                "used": snapshot.memory_used,
+                "percentage": snapshot.memory_percent
             }
             
             # 磁盘信息
-            try:
-                disk = psutil.disk_usage('/')
+            disk = snapshot.disk
+            if disk:
                 resources["disk"] = {
                     "total": disk.total,
                     "used": disk.used,
                     "free": disk.free,
                     "percentage": (disk.used / disk.total) * 100
                 }
-            except:
-                pass
             
             # 网络信息
             try:
-                net_io = psutil.net_io_counters()
                 resources["network"] = {
-                    "bytes_sent": net_io.bytes_sent,
-                    "bytes_recv": net_io.bytes_recv,
-                    "packets_sent": net_io.packets_sent,
-                    "packets_recv": net_io.packets_recv
+                    "bytes_sent": snapshot.net_bytes_sent,
+                    "bytes_recv": snapshot.net_bytes_recv,
+                    "packets_sent": snapshot.net_packets_sent,
+                    "packets_recv": snapshot.net_packets_recv
                 }
                 
                 # 网络接口
@@ -312,7 +313,8 @@ async def get_system_resources():
         # 尝试获取CPU详细信息
         try:
             import cpuinfo
-            cpu_info = cpuinfo.get_cpu_info()
+            # get_cpu_info 会启动子进程探测，放到线程中执行
+            cpu_info = await asyncio.to_thread(cpuinfo.get_cpu_info)
             resources["cpu_detail"] = {
                 "brand": cpu_info.get('brand_raw', 'Unknown'),
                 "arch": cpu_info.get('arch', 'Unknown'),
@@ -347,11 +349,14 @@ async def get_system_performance():
         try:
             import psutil
             
+            # CPU、内存、网络和负载来自系统指标采样器的最新快照
+            snapshot = get_system_metrics_sampler().latest()
+
             # CPU性能
             cpu_times = psutil.cpu_times()
             performance["cpu"] = {
-                "usage_percent": psutil.cpu_percent(interval=1),
-                "per_cpu": psutil.cpu_percent(interval=1, percpu=True),
+                "usage_percent": snapshot.cpu_percent,
+                "per_cpu": list(snapshot.per_cpu_percent),
                 "times": {
                     "user": cpu_times.user,
                     "system": cpu_times.system,
@@ -360,20 +365,18 @@ async def get_system_performance():
             }
             
             # 内存性能
-            memory = psutil.virtual_memory()
-            swap = psutil.swap_memory()
             performance["memory"] = {
                 "virtual": {
-                    "total": memory.total,
-                    "used": memory.used,
-                    "available": memory.available,
-                    "percentage": memory.percent
+                    "total": snapshot.memory_total,
+                    "used": snapshot.memory_used,
+                    "available": snapshot.memory_available,
+                    "percentage": snapshot.memory_percent
                 },
                 "swap": {
-                    "total": swap.total,
-                    "used": swap.used,
-                    "free": swap.free,
-                    "percentage": swap.percent
+                    "total": snapshot.swap_total,
+                    "used": snapshot.swap_used,
+                    "free": snapshot.swap_total - snapshot.swap_used,
+                    "percentage": snapshot.swap_percent
                 }
             }
             
@@ -391,31 +394,16 @@ async def get_system_performance():
                 pass
             
             # 网络IO
-            try:
-                net_io = psutil.net_io_counters()
-                performance["network_io"] = {
-                    "bytes_sent": net_io.bytes_sent,
-                    "bytes_recv": net_io.bytes_recv,
-                    "packets_sent": net_io.packets_sent,
-                    "packets_recv": net_io.packets_recv,
-                    "errin": net_io.errin,
-                    "errout": net_io.errout,
-                    "dropin": net_io.dropin,
-                    "dropout": net_io.dropout
-                }
-            except:
-                pass
+            performance["network_io"] = snapshot.network_io
             
             # 系统负载 (Linux)
-            try:
-                load_avg = os.getloadavg()
+            load_avg = snapshot.load_average
+            if any(load_avg):
                 performance["load_average"] = {
                     "1min": load_avg[0],
                     "5min": load_avg[1],
                     "15min": load_avg[2]
                 }
-            except:
-                pass
             
         except ImportError:
             performance["error"] = "psutil未安装，无法获取性能指标"
@@ -13,6 +13,7 @@ API端点分类:
     CRUD操作: POST/GET/PUT/DELETE /tasks/* - 基本任务管理
     执行控制: POST /tasks/{id}/(start|pause|stop|restart) - 任务执行控制
     监控查询: GET /tasks/{id}/(status|progress|logs) - 监控和统计
+    链路追踪: GET /tasks/{id}/traces[/slowest] - 单文件分阶段耗时
     规则管理: POST/DELETE /tasks/{id}/rules - 任务规则关联
     调度管理: POST/PUT /tasks/{id}/schedule - 任务调度配置
 
@@ -30,6 +31,7 @@ Version: 1.0.0
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse
 import asyncio
 from sqlalchemy.orm import Session
 from typing import List, Optional
@@ -39,7 +41,9 @@ from ..models.telegram import TelegramGroup
 from ..models.rule import FilterRule
 from ..models.task_rule_association import TaskRuleAssociation
 from ..services.task_execution_service import task_execution_service
+from ..services.rule_match_service import rule_match_service
 from ..core.error_handler import global_error_handler, operation_context
+from ..core.tracing import tracer
 from ..services.service_monitor import ServiceMonitor
 from ..websocket.manager import websocket_manager
 from pydantic import BaseModel
@@ -167,7 +171,7 @@ class ProductionTaskExecutionManager:
 production_task_manager = ProductionTaskExecutionManager()
 
 # Pydantic数据模型
-class TaskRuleAssociation(BaseModel):
+class TaskRuleAssociationConfig(BaseModel):
     """任务-规则关联配置模型
 
     定义任务与过滤规则之间的关联关系配置。
@@ -412,8 +416,6 @@ async def get_tasks(
         task_responses = []
         for task in tasks:
             # 获取规则关联信息
-            from ..models.task_rule_association import TaskRuleAssociation
-            from ..models.rule import FilterRule
             
             rule_associations = db.query(TaskRuleAssociation).filter(
                 TaskRuleAssociation.task_id == task.id,
@@ -564,6 +566,7 @@ async def create_task(
     
     db.commit()
     db.refresh(new_task)
+    rule_match_service.notify_rules_changed()
     
     # 构建响应数据
     task_rules = []
@@ -645,6 +648,14 @@ async def get_task_stats(
             }
         raise HTTPException(status_code=500, detail=f"获取统计信息失败: {str(e)}")
 
+@router.get("/tasks/progress")
+async def get_tasks_progress(
+    task_id: Optional[int] = Query(None, description="只返回指定任务的进度")
+):
+    """获取运行中任务及文件下载的实时进度快照（内存状态，不查询数据库）"""
+    from ..services.progress_service import progress_service
+    return progress_service.snapshot(task_id)
+
 @router.get("/tasks/{task_id}", response_model=TaskResponse)
 async def get_task(
     task_id: int,
@@ -769,7 +780,6 @@ async def update_task(
         
         # 验证规则存在
         if rule_ids:
-            from ..models.rule import FilterRule
             existing_rules = db.query(FilterRule).filter(FilterRule.id.in_(rule_ids)).all()
             if len(existing_rules) != len(rule_ids):
                 raise HTTPException(status_code=400, detail="部分规则不存在")
@@ -787,7 +797,6 @@ async def update_task(
     
     # 更新规则关联
     if rule_ids is not None:
-        from ..models.task_rule_association import TaskRuleAssociation
         
         # 删除旧的规则关联
         db.query(TaskRuleAssociation).filter(TaskRuleAssociation.task_id == task_id).delete()
@@ -805,10 +814,10 @@ async def update_task(
     task.updated_at = datetime.now()
     db.commit()
     db.refresh(task)
+    if rule_ids is not None or 'group_id' in update_data:
+        rule_match_service.notify_rules_changed()
     
     # 构建响应数据（包含规则关联信息）
-    from ..models.task_rule_association import TaskRuleAssociation
-    from ..models.rule import FilterRule
     
     # 获取规则关联信息
     rule_associations = db.query(TaskRuleAssociation).filter(
@@ -1047,6 +1056,7 @@ async def delete_task(
     
     db.delete(task)
     db.commit()
+    rule_match_service.notify_rules_changed()
     
     if force:
         return {"message": "任务强制删除成功"}
@@ -1302,7 +1312,6 @@ async def get_task_status(
         raise HTTPException(status_code=404, detail="任务不存在")
     
     # 获取关联的规则和群组信息
-    from ..models.task_rule_association import TaskRuleAssociation
     rule_associations = db.query(TaskRuleAssociation).filter(
         TaskRuleAssociation.task_id == task_id,
         TaskRuleAssociation.is_active == True
@@ -1362,7 +1371,9 @@ async def get_task_status(
             "include_metadata": task.include_metadata,
             "download_thumbnails": task.download_thumbnails,
             "use_series_structure": task.use_series_structure
-        }
+        },
+        # 运行中任务的流水线阶段统计（吞吐量、队列深度、背压）
+        "pipeline": task_execution_service.get_pipeline_stats(task_id)
     }
     
     # 如果请求包含日志，添加最近的任务日志
@@ -1386,6 +1397,38 @@ async def get_task_status(
     
     return status_info
 
+@router.get("/tasks/{task_id}/traces/slowest")
+async def get_task_slowest_files(
+    task_id: int,
+    limit: int = Query(10, ge=1, le=200, description="返回的文件数")
+):
+    """获取任务中耗时最长的文件及其分阶段耗时
+
+    stages 中各阶段耗时单位为毫秒，父阶段(fetch、organize)包含其子阶段；
+    other 为阶段之间的排队等待时间。只统计仍在追踪缓冲区中的文件。
+    """
+    return {
+        "task_id": task_id,
+        "tracing": tracer.get_stats(),
+        "files": tracer.slowest(task_id, limit),
+    }
+
+@router.get("/tasks/{task_id}/traces")
+async def export_task_traces(
+    task_id: int,
+    format: str = Query("json", pattern="^(json|chrome)$", description="json 或 chrome(trace event格式)")
+):
+    """导出任务的下载链路追踪
+
+    format=chrome 时输出 Chrome trace event 格式，可用 chrome://tracing 或 Perfetto 打开。
+    """
+    if format == "chrome":
+        return JSONResponse(
+            tracer.export_chrome(task_id),
+            headers={"Content-Disposition": f'attachment; filename="task-{task_id}-trace.json"'},
+        )
+    return tracer.export_json(task_id)
+
 @router.get("/tasks/running")
 async def get_running_tasks(
     db: Session = Depends(get_db)
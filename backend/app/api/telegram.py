@@ -37,10 +37,9 @@ import logging
 import os
 import re
 import secrets
-import time
 import uuid
 from datetime import datetime, timedelta
-from typing import Dict, Any, Union, List, Optional
+from typing import Union, List, Optional
 
 # 第三方库导入
 from fastapi import (
@@ -58,8 +57,9 @@ from fastapi import (
 from ..config import settings
 from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-from sqlalchemy import func, desc, asc, and_, or_
+from sqlalchemy import func, desc, asc, and_, or_, select, literal_column
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from starlette.background import BackgroundTask
 from telethon import TelegramClient, errors
@@ -90,11 +90,14 @@ from telethon.tl.types import (
 )
 
 # 本地模块导入
-from ..database import get_db
+from ..database import get_db, get_async_db
 from ..models.telegram import TelegramGroup, TelegramMessage
 from ..services.telegram_service import telegram_service
 from ..utils.auth import get_current_active_user
+from ..utils.group_stats import group_stats_statement, stats_to_dict
+from ..utils.message_fts import ranked_search_statement, search_condition
 from ..core.telegram_cache import telegram_cache
+from ..core.rate_governor import RPC_ENTITY, rate_governor
 from ..core.session_store import set_auth_session, get_auth_session, delete_auth_session
 
 logger = logging.getLogger(__name__)
@@ -241,6 +244,52 @@ def convert_message_to_response_dict(message):
     return message_dict
 
 
+def build_message_filters(
+    group_id: int,
+    search: Optional[str] = None,
+    sender_username: Optional[str] = None,
+    media_type: Optional[str] = None,
+    has_media: Optional[bool] = None,
+    is_forwarded: Optional[bool] = None,
+    is_pinned: Optional[bool] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+) -> list:
+    """构建消息列表查询的过滤条件，供 select(TelegramMessage).where(*conditions) 使用"""
+    conditions = [TelegramMessage.group_id == group_id]
+
+    if search:
+        search_filter = search_condition(search)
+        if search_filter is not None:
+            conditions.append(search_filter)
+
+    if sender_username:
+        conditions.append(TelegramMessage.sender_username == sender_username)
+
+    if media_type:
+        conditions.append(TelegramMessage.media_type == media_type)
+
+    if has_media is not None:
+        if has_media:
+            conditions.append(TelegramMessage.media_type.isnot(None))
+        else:
+            conditions.append(TelegramMessage.media_type.is_(None))
+
+    if is_forwarded is not None:
+        conditions.append(TelegramMessage.is_forwarded == is_forwarded)
+
+    if is_pinned is not None:
+        conditions.append(TelegramMessage.is_pinned == is_pinned)
+
+    if start_date:
+        conditions.append(TelegramMessage.date >= start_date)
+
+    if end_date:
+        conditions.append(TelegramMessage.date <= end_date)
+
+    return conditions
+
+
 # Pydantic模型
 class GroupCreate(BaseModel):
     username: str
@@ -375,6 +424,114 @@ async def add_group(group: GroupCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/groups/unread-summary")
+async def get_all_groups_unread_summary(
+    last_read_times: Optional[str] = Query(
+        None, description="所有群组的最后读取时间，JSON格式: {group_id: iso_time}"
+    ),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    获取所有群组的未读消息摘要
+
+    Args:
+        last_read_times: JSON字符串，包含各群组的最后读取时间
+        db: 数据库会话
+
+    Returns:
+        所有群组的未读消息摘要
+    """
+    try:
+        # 解析最后读取时间
+        import json
+
+        group_read_times = {}
+        if last_read_times:
+            try:
+                group_read_times = json.loads(last_read_times)
+            except Exception as e:
+                logger.warning(f"解析群组读取时间失败: {e}")
+
+        # 获取所有群组
+        groups = (
+            await db.execute(select(TelegramGroup).where(TelegramGroup.is_active == True))
+        ).scalars().all()
+
+        summary = []
+        total_unread = 0
+
+        for group in groups:
+            # 确定该群组的未读消息时间界限
+            if str(group.id) in group_read_times:
+                try:
+                    time_str = group_read_times[str(group.id)]
+                    try:
+                        import dateutil.parser
+
+                        cutoff_time = dateutil.parser.isoparse(time_str)
+                    except ImportError:
+                        # 如果没有dateutil，使用fromisoformat (Python 3.7+)
+                        cutoff_time = datetime.fromisoformat(
+                            time_str.replace("Z", "+00:00")
+                        )
+                except:
+                    cutoff_time = datetime.now() - timedelta(hours=24)
+            else:
+                # 默认24小时前
+                cutoff_time = datetime.now() - timedelta(hours=24)
+
+            # 查询该群组的未读消息数量
+            unread_count = await db.scalar(
+                select(func.count(TelegramMessage.id)).where(
+                    TelegramMessage.group_id == group.id,
+                    TelegramMessage.date > cutoff_time,
+                )
+            )
+
+            # 获取最新消息
+            latest_message = (
+                await db.execute(
+                    select(TelegramMessage.date, TelegramMessage.text)
+                    .where(TelegramMessage.group_id == group.id)
+                    .order_by(desc(TelegramMessage.date))
+                    .limit(1)
+                )
+            ).first()
+
+            group_summary = {
+                "group_id": group.id,
+                "group_title": group.title,
+                "group_username": group.username,
+                "unread_count": unread_count,
+                "cutoff_time": cutoff_time.isoformat() if cutoff_time else None,
+                "latest_message_time": latest_message.date.isoformat()
+                if latest_message
+                else None,
+                "latest_message_text": latest_message.text[:50] + "..."
+                if latest_message
+                and latest_message.text
+                and len(latest_message.text) > 50
+                else (latest_message.text if latest_message else None),
+            }
+
+            summary.append(group_summary)
+            total_unread += unread_count
+
+        result = {
+            "total_unread": total_unread,
+            "groups_count": len(groups),
+            "groups_with_unread": len([g for g in summary if g["unread_count"] > 0]),
+            "groups": summary,
+        }
+
+        logger.info(f"所有群组未读消息摘要: 总计 {total_unread} 条未读消息")
+        return result
+
+    except Exception as e:
+        logger.error(f"获取所有群组未读消息摘要失败: {e}")
+        raise HTTPException(status_code=500, detail=f"获取未读消息摘要失败: {str(e)}")
+
+
 @router.get("/groups/{group_id}", response_model=GroupResponse)
 async def get_group(group_id: int, db: Session = Depends(get_db)):
     """获取单个群组信息"""
@@ -430,7 +587,7 @@ async def get_group_members(group_id: int, db: Session = Depends(get_db)):
         client = telegram_service.client
         assert client is not None
         tg_id: int = int(group.telegram_id)  # type: ignore[arg-type]
-        entity = await client.get_entity(tg_id)
+        entity = await rate_governor.call(RPC_ENTITY, client.get_entity, tg_id)
 
         members = []
         async for participant in client.iter_participants(entity, limit=200):  # type: ignore[arg-type]
@@ -477,7 +634,7 @@ async def get_group_messages(
     is_pinned: Optional[bool] = Query(None, description="是否为置顶消息"),
     start_date: Optional[datetime] = Query(None, description="开始日期"),
     end_date: Optional[datetime] = Query(None, description="结束日期"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_active_user),
 ):
     """获取群组消息列表（支持搜索和过滤）
@@ -496,7 +653,7 @@ async def get_group_messages(
         is_pinned (bool, optional): 是否为置顶消息
         start_date (datetime, optional): 开始日期过滤
         end_date (datetime, optional): 结束日期过滤
-        db (Session): 数据库会话依赖注入
+        db (AsyncSession): 异步数据库会话依赖注入
         current_user: 当前登录用户（依赖注入）
 
     Returns:
@@ -534,70 +691,39 @@ async def get_group_messages(
 
     try:
         # 检查群组是否存在
-        group = db.query(TelegramGroup).filter(TelegramGroup.id == group_id).first()
+        group = await db.get(TelegramGroup, group_id)
         if not group:
             raise HTTPException(status_code=404, detail="群组不存在")
 
         # 构建查询
-        query = db.query(TelegramMessage).filter(TelegramMessage.group_id == group_id)
-
-        # 应用过滤条件
-        if search:
-            query = query.filter(TelegramMessage.text.contains(search))
-
-        if sender_username:
-            query = query.filter(TelegramMessage.sender_username == sender_username)
-
-        if media_type:
-            query = query.filter(TelegramMessage.media_type == media_type)
-
-        if has_media is not None:
-            if has_media:
-                query = query.filter(TelegramMessage.media_type.isnot(None))
-            else:
-                query = query.filter(TelegramMessage.media_type.is_(None))
-
-        if is_forwarded is not None:
-            query = query.filter(TelegramMessage.is_forwarded == is_forwarded)
-
-        if is_pinned is not None:
-            query = query.filter(TelegramMessage.is_pinned == is_pinned)
-
-        if start_date:
-            query = query.filter(TelegramMessage.date >= start_date)
-
-        if end_date:
-            query = query.filter(TelegramMessage.date <= end_date)
-
-        # 排序和分页逻辑：
-        # 1. 对于Messages页面：最新消息应该排在前面（降序排列）
-        # 2. 对于聊天界面：最老消息在前，最新消息在后（正序排列）
-        # 3. 这里针对Messages页面的需求，统一使用降序排列
+        conditions = build_message_filters(
+            group_id,
+            search=search,
+            sender_username=sender_username,
+            media_type=media_type,
+            has_media=has_media,
+            is_forwarded=is_forwarded,
+            is_pinned=is_pinned,
+            start_date=start_date,
+            end_date=end_date,
+        )
 
         # 排序和分页逻辑：
         # 1. 如果是置顶消息，按照置顶时间排序（最新置顶的在前）
         # 2. 普通消息按照日期排序，先获取最新的消息（倒序），然后对结果进行正序排列
         # 3. 这样前端就不需要做任何排序操作
+        stmt = (
+            select(TelegramMessage)
+            .where(*conditions)
+            .order_by(TelegramMessage.date.desc())
+            .offset(skip)
+            .limit(limit)
+        )
+        messages = list((await db.execute(stmt)).scalars().all())
 
-        if is_pinned is True:
-            # 置顶消息按照消息日期降序排列（最新置顶的在前）
-            # 使用date字段而不是id，因为date更准确反映消息的时间
-            messages = (
-                query.order_by(TelegramMessage.date.desc())
-                .offset(skip)
-                .limit(limit)
-                .all()
-            )
-        else:
-            # 获取消息（降序获取最新的）
-            messages_desc = (
-                query.order_by(TelegramMessage.date.desc())
-                .offset(skip)
-                .limit(limit)
-                .all()
-            )
+        if is_pinned is not True:
             # 反转为正序（最老消息在前，最新消息在后）
-            messages = list(reversed(messages_desc))
+            messages.reverse()
 
         # 转换为响应字典格式
         result_messages = []
@@ -606,6 +732,8 @@ async def get_group_messages(
 
         return result_messages
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取群组 {group_id} 消息失败: {e}")
 
@@ -637,55 +765,44 @@ async def get_group_messages_paginated(
     is_pinned: Optional[bool] = Query(None, description="是否为置顶消息"),
     start_date: Optional[datetime] = Query(None, description="开始日期"),
     end_date: Optional[datetime] = Query(None, description="结束日期"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_active_user),
 ):
     """获取群组消息（支持搜索和过滤）- 专门用于Messages页面的分页版本"""
 
     try:
         # 检查群组是否存在
-        group = db.query(TelegramGroup).filter(TelegramGroup.id == group_id).first()
+        group = await db.get(TelegramGroup, group_id)
         if not group:
             raise HTTPException(status_code=404, detail="群组不存在")
 
         # 构建查询
-        query = db.query(TelegramMessage).filter(TelegramMessage.group_id == group_id)
-
-        # 应用过滤条件
-        if search:
-            query = query.filter(TelegramMessage.text.contains(search))
-
-        if sender_username:
-            query = query.filter(TelegramMessage.sender_username == sender_username)
-
-        if media_type:
-            query = query.filter(TelegramMessage.media_type == media_type)
-
-        if has_media is not None:
-            if has_media:
-                query = query.filter(TelegramMessage.media_type.isnot(None))
-            else:
-                query = query.filter(TelegramMessage.media_type.is_(None))
-
-        if is_forwarded is not None:
-            query = query.filter(TelegramMessage.is_forwarded == is_forwarded)
-
-        if is_pinned is not None:
-            query = query.filter(TelegramMessage.is_pinned == is_pinned)
-
-        if start_date:
-            query = query.filter(TelegramMessage.date >= start_date)
-
-        if end_date:
-            query = query.filter(TelegramMessage.date <= end_date)
+        conditions = build_message_filters(
+            group_id,
+            search=search,
+            sender_username=sender_username,
+            media_type=media_type,
+            has_media=has_media,
+            is_forwarded=is_forwarded,
+            is_pinned=is_pinned,
+            start_date=start_date,
+            end_date=end_date,
+        )
 
         # 获取总数（用于分页）
-        total_count = query.count()
+        total_count = await db.scalar(
+            select(func.count(TelegramMessage.id)).where(*conditions)
+        )
 
         # 消息按照日期降序排列（最新消息在前）- 适合Messages页面展示
-        messages = (
-            query.order_by(TelegramMessage.date.desc()).offset(skip).limit(limit).all()
+        stmt = (
+            select(TelegramMessage)
+            .where(*conditions)
+            .order_by(TelegramMessage.date.desc())
+            .offset(skip)
+            .limit(limit)
         )
+        messages = (await db.execute(stmt)).scalars().all()
 
         # 转换为响应字典格式
         result_messages = []
@@ -702,6 +819,8 @@ async def get_group_messages_paginated(
             },
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取群组 {group_id} 分页消息失败: {e}")
 
@@ -972,16 +1091,14 @@ async def sync_monthly_task(group_identifier, months_data, group_id):
         try:
             from ..websocket import websocket_manager
 
-            # 找到所有连接的客户端并发送完成消息
-            for client_id in websocket_manager.get_connected_clients():
-                await websocket_manager.send_message(
-                    client_id,
-                    {
-                        "type": "monthly_sync_complete",
-                        "data": result,
-                        "timestamp": datetime.now().isoformat(),
-                    },
-                )
+            await websocket_manager.broadcast(
+                {
+                    "type": "monthly_sync_complete",
+                    "data": result,
+                    "timestamp": datetime.now().isoformat(),
+                },
+                topic=f"group:{group_id}",
+            )
         except Exception as ws_e:
             logger.warning(f"WebSocket推送完成消息失败: {ws_e}")
 
@@ -991,22 +1108,21 @@ async def sync_monthly_task(group_identifier, months_data, group_id):
         try:
             from ..websocket import websocket_manager
 
-            for client_id in websocket_manager.get_connected_clients():
-                await websocket_manager.send_message(
-                    client_id,
-                    {
-                        "type": "monthly_sync_complete",
-                        "data": {
-                            "success": False,
-                            "error": str(e),
-                            "total_messages": 0,
-                            "months_synced": 0,
-                            "failed_months": [],
-                            "monthly_stats": [],
-                        },
-                        "timestamp": datetime.now().isoformat(),
+            await websocket_manager.broadcast(
+                {
+                    "type": "monthly_sync_complete",
+                    "data": {
+                        "success": False,
+                        "error": str(e),
+                        "total_messages": 0,
+                        "months_synced": 0,
+                        "failed_months": [],
+                        "monthly_stats": [],
                     },
-                )
+                    "timestamp": datetime.now().isoformat(),
+                },
+                topic=f"group:{group_id}",
+            )
         except Exception as ws_e:
             logger.warning(f"WebSocket推送错误消息失败: {ws_e}")
 
@@ -1299,125 +1415,38 @@ async def batch_sync_task(active_groups, months_data):
             logger.warning(f"WebSocket推送错误消息失败: {ws_e}")
 
 
-# 简单的内存缓存
-# 统计信息缓存，格式: {group_id: {"data": stats, "timestamp": time.time()}}
-_stats_cache: Dict[int, Dict[str, Any]] = {}
-CACHE_TTL = 300  # 5分钟缓存
-
-
 @router.get("/groups/{group_id}/stats")
 async def get_group_stats(
-    group_id: int, db: Session = Depends(get_db), force_refresh: bool = False
+    group_id: int,
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """获取群组统计信息（带缓存）"""
-    # 检查缓存
-    current_time = time.time()
-    if not force_refresh and group_id in _stats_cache:
-        cached_data = _stats_cache[group_id]
-        if current_time - cached_data["timestamp"] < CACHE_TTL:
-            logger.info(f"返回群组 {group_id} 的缓存统计数据")
-            return cached_data["data"]
+    """获取群组统计信息
 
+    计数由 group_stats 表随消息写入增量维护，这里只按主键读取一行，结果始终是最新的。
+    """
     # 检查群组是否存在
-    group = db.query(TelegramGroup).filter(TelegramGroup.id == group_id).first()
+    group = await db.get(TelegramGroup, group_id)
     if not group:
         raise HTTPException(status_code=404, detail="群组不存在")
 
-    # 统计消息数量
-    total_messages = (
-        db.query(TelegramMessage).filter(TelegramMessage.group_id == group_id).count()
-    )
-
-    # 统计媒体消息数量
-    media_messages = (
-        db.query(TelegramMessage)
-        .filter(
-            TelegramMessage.group_id == group_id, TelegramMessage.media_type.isnot(None)
-        )
-        .count()
-    )
-
-    # 统计各类型媒体消息数量
-    photo_messages = (
-        db.query(TelegramMessage)
-        .filter(
-            TelegramMessage.group_id == group_id, TelegramMessage.media_type == "photo"
-        )
-        .count()
-    )
-
-    video_messages = (
-        db.query(TelegramMessage)
-        .filter(
-            TelegramMessage.group_id == group_id, TelegramMessage.media_type == "video"
-        )
-        .count()
-    )
-
-    document_messages = (
-        db.query(TelegramMessage)
-        .filter(
-            TelegramMessage.group_id == group_id,
-            TelegramMessage.media_type == "document",
-        )
-        .count()
-    )
-
-    audio_messages = (
-        db.query(TelegramMessage)
-        .filter(
-            TelegramMessage.group_id == group_id,
-            TelegramMessage.media_type.in_(["audio", "voice"]),
-        )
-        .count()
-    )
-
-    # 统计转发消息数量
-    forwarded_messages = (
-        db.query(TelegramMessage)
-        .filter(
-            TelegramMessage.group_id == group_id, TelegramMessage.is_forwarded == True
-        )
-        .count()
-    )
-
-    # 统计置顶消息数量
-    pinned_messages = (
-        db.query(TelegramMessage)
-        .filter(TelegramMessage.group_id == group_id, TelegramMessage.is_pinned == True)
-        .count()
-    )
-
-    # 统计有反应的消息数量
-    messages_with_reactions = (
-        db.query(TelegramMessage)
-        .filter(
-            TelegramMessage.group_id == group_id, TelegramMessage.reactions.isnot(None)
-        )
-        .count()
+    stats = stats_to_dict(
+        (await db.execute(group_stats_statement(group_id))).mappings().first()
     )
 
-    # 构建统计结果
-    stats_result = {
-        "total_messages": total_messages,
-        "media_messages": media_messages,
-        "text_messages": total_messages - media_messages,
-        "photo_messages": photo_messages,
-        "video_messages": video_messages,
-        "document_messages": document_messages,
-        "audio_messages": audio_messages,
-        "forwarded_messages": forwarded_messages,
-        "pinned_messages": pinned_messages,
-        "messages_with_reactions": messages_with_reactions,
+    return {
+        "total_messages": stats["total_messages"],
+        "media_messages": stats["media_messages"],
+        "text_messages": stats["total_messages"] - stats["media_messages"],
+        "photo_messages": stats["photo_messages"],
+        "video_messages": stats["video_messages"],
+        "document_messages": stats["document_messages"],
+        "audio_messages": stats["audio_messages"] + stats["voice_messages"],
+        "forwarded_messages": stats["forwarded_messages"],
+        "pinned_messages": stats["pinned_messages"],
+        "messages_with_reactions": stats["reaction_messages"],
         "member_count": group.member_count,
     }
 
-    # 缓存结果
-    _stats_cache[group_id] = {"data": stats_result, "timestamp": current_time}
-
-    logger.info(f"已缓存群组 {group_id} 的统计数据")
-    return stats_result
-
 
 @router.post("/groups/{group_id}/send", response_model=dict)
 async def send_message_to_group(
@@ -1653,61 +1682,89 @@ async def search_messages(
     search_request: MessageSearchRequest,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_active_user),
 ):
-    """搜索群组消息"""
+    """搜索群组消息
+
+    有搜索词时按全文索引相关度排序，并在结果中附带 search_score 和高亮片段 search_snippet。
+    """
 
     # 检查群组是否存在
-    group = db.query(TelegramGroup).filter(TelegramGroup.id == group_id).first()
+    group = await db.get(TelegramGroup, group_id)
     if not group:
         raise HTTPException(status_code=404, detail="群组不存在")
 
-    # 构建查询
-    query = db.query(TelegramMessage).filter(TelegramMessage.group_id == group_id)
-
-    # 应用搜索条件
-    if search_request.query:
-        query = query.filter(TelegramMessage.text.contains(search_request.query))
-
-    if search_request.sender_username:
-        query = query.filter(
-            TelegramMessage.sender_username == search_request.sender_username
-        )
-
-    if search_request.media_type:
-        query = query.filter(TelegramMessage.media_type == search_request.media_type)
-
-    if search_request.has_media is not None:
-        if search_request.has_media:
-            query = query.filter(TelegramMessage.media_type.isnot(None))
-        else:
-            query = query.filter(TelegramMessage.media_type.is_(None))
-
-    if search_request.is_forwarded is not None:
-        query = query.filter(
-            TelegramMessage.is_forwarded == search_request.is_forwarded
-        )
+    # 其他过滤条件，搜索词由排序语句单独处理
+    conditions = build_message_filters(
+        group_id,
+        sender_username=search_request.sender_username,
+        media_type=search_request.media_type,
+        has_media=search_request.has_media,
+        is_forwarded=search_request.is_forwarded,
+        start_date=search_request.start_date,
+        end_date=search_request.end_date,
+    )
 
-    if search_request.start_date:
-        query = query.filter(TelegramMessage.date >= search_request.start_date)
+    if search_request.query and search_request.query.strip():
+        stmt = ranked_search_statement(search_request.query)
+    else:
+        stmt = select(
+            TelegramMessage,
+            literal_column("NULL").label("score"),
+            literal_column("NULL").label("snippet"),
+        ).order_by(TelegramMessage.date.desc())
 
-    if search_request.end_date:
-        query = query.filter(TelegramMessage.date <= search_request.end_date)
-
-    # 排序和分页
-    messages = (
-        query.order_by(TelegramMessage.date.desc()).offset(skip).limit(limit).all()
-    )
+    stmt = stmt.where(*conditions).offset(skip).limit(limit)
+    rows = (await db.execute(stmt)).all()
 
     # 转换为响应字典格式
     result_messages = []
-    for message in messages:
-        result_messages.append(convert_message_to_response_dict(message))
+    for message, score, snippet in rows:
+        message_dict = convert_message_to_response_dict(message)
+        message_dict["search_score"] = score
+        message_dict["search_snippet"] = snippet
+        result_messages.append(message_dict)
 
     return result_messages
 
 
+@router.get("/groups/{group_id}/messages/search")
+async def search_group_messages(
+    group_id: int,
+    q: str = Query(..., min_length=1, description="搜索词，多个词以空格分隔"),
+    sender_username: Optional[str] = Query(None, description="按发送者用户名过滤"),
+    media_type: Optional[str] = Query(None, description="按媒体类型过滤"),
+    has_media: Optional[bool] = Query(None, description="是否包含媒体"),
+    is_forwarded: Optional[bool] = Query(None, description="是否为转发消息"),
+    start_date: Optional[datetime] = Query(None, description="开始日期"),
+    end_date: Optional[datetime] = Query(None, description="结束日期"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_active_user),
+):
+    """全文搜索群组消息，按相关度排序并返回高亮片段"""
+    try:
+        search_request = MessageSearchRequest(
+            query=q,
+            sender_username=sender_username,
+            media_type=media_type,
+            has_media=has_media,
+            is_forwarded=is_forwarded,
+            start_date=start_date,
+            end_date=end_date,
+        )
+        return await search_messages(
+            group_id, search_request, skip=skip, limit=limit, db=db, current_user=current_user
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"搜索群组 {group_id} 消息失败: {e}")
+        raise HTTPException(status_code=500, detail=f"搜索消息失败: {str(e)}")
+
+
 # Telegram认证相关API
 class AuthStatusResponse(BaseModel):
     is_authorized: bool
@@ -1743,7 +1800,7 @@ async def get_auth_status():
             is_authorized = await telegram_service.client.is_user_authorized()
 
             if is_authorized:
-                me = await telegram_service.client.get_me()
+                me = await telegram_service.get_self_user()
                 user_info = {
                     "id": me.id,
                     "first_name": me.first_name,
@@ -1864,7 +1921,7 @@ async def login_with_code(request: AuthLoginRequest):
                 raise auth_error
 
         # 获取用户信息
-        me = await telegram_service.client.get_me()
+        me = await telegram_service.get_self_user(refresh=True)
         user_info = {
             "id": me.id,
             "first_name": me.first_name,
@@ -2056,7 +2113,7 @@ async def test_telegram_connection():
             }
 
         # 获取用户信息
-        me = await telegram_service.client.get_me()
+        me = await telegram_service.get_self_user(refresh=True)
 
         # 尝试获取对话列表
         dialogs = await telegram_service.client.get_dialogs()
@@ -2141,7 +2198,7 @@ async def get_current_telegram_user():
         await telegram_service.initialize()
 
         # 获取当前用户信息
-        me = await telegram_service.client.get_me()
+        me = await telegram_service.get_self_user()
 
         if me:
             full_name = ""
@@ -2205,7 +2262,7 @@ async def get_group_preview(username: str, db: Session = Depends(get_db)):
                 )
 
             # 通过用户名获取群组实体
-            entity = await telegram_service.client.get_entity(username)
+            entity = await rate_governor.call(RPC_ENTITY, telegram_service.client.get_entity, username)
 
             # 获取群组详细信息，需要根据类型使用不同的请求
             full_info = None
@@ -2375,7 +2432,7 @@ async def join_group(username: str, db: Session = Depends(get_db)):
 
         try:
             # 获取群组实体
-            entity = await telegram_service.client.get_entity(username)
+            entity = await rate_governor.call(RPC_ENTITY, telegram_service.client.get_entity, username)
 
             # 加入群组，根据类型使用不同的方法
             if isinstance(entity, Channel):
@@ -2529,7 +2586,7 @@ async def get_group_unread_count(
     last_read_time: Optional[str] = Query(
         None, description="用户最后读取时间 (ISO格式)"
     ),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     获取群组未读消息数量
@@ -2543,7 +2600,7 @@ async def get_group_unread_count(
         未读消息数量和相关信息
     """
     # 检查群组是否存在
-    group = db.query(TelegramGroup).filter(TelegramGroup.id == group_id).first()
+    group = await db.get(TelegramGroup, group_id)
     if not group:
         raise HTTPException(status_code=404, detail="群组不存在")
 
@@ -2552,8 +2609,6 @@ async def get_group_unread_count(
         if last_read_time:
             try:
                 # 解析ISO时间格式
-                from datetime import datetime
-
                 try:
                     import dateutil.parser
 
@@ -2572,34 +2627,36 @@ async def get_group_unread_count(
             cutoff_time = datetime.now() - timedelta(hours=24)
 
         # 查询未读消息数量（在cutoff_time之后的消息）
-        unread_count = (
-            db.query(TelegramMessage)
-            .filter(
+        unread_count = await db.scalar(
+            select(func.count(TelegramMessage.id)).where(
                 TelegramMessage.group_id == group_id, TelegramMessage.date > cutoff_time
             )
-            .count()
         )
 
         # 获取最新消息信息
         latest_message = (
-            db.query(TelegramMessage)
-            .filter(TelegramMessage.group_id == group_id)
-            .order_by(desc(TelegramMessage.date))
-            .first()
-        )
+            await db.execute(
+                select(TelegramMessage)
+                .where(TelegramMessage.group_id == group_id)
+                .order_by(desc(TelegramMessage.date))
+                .limit(1)
+            )
+        ).scalar_one_or_none()
 
         # 获取最新未读消息信息
         latest_unread_message = None
         if unread_count > 0:
             latest_unread_message = (
-                db.query(TelegramMessage)
-                .filter(
-                    TelegramMessage.group_id == group_id,
-                    TelegramMessage.date > cutoff_time,
+                await db.execute(
+                    select(TelegramMessage)
+                    .where(
+                        TelegramMessage.group_id == group_id,
+                        TelegramMessage.date > cutoff_time,
+                    )
+                    .order_by(desc(TelegramMessage.date))
+                    .limit(1)
                 )
-                .order_by(desc(TelegramMessage.date))
-                .first()
-            )
+            ).scalar_one_or_none()
 
         result = {
             "group_id": group_id,
@@ -2638,110 +2695,3 @@ async def get_group_unread_count(
     except Exception as e:
         logger.error(f"获取群组 {group_id} 未读消息数量失败: {e}")
         raise HTTPException(status_code=500, detail=f"获取未读消息数量失败: {str(e)}")
-
-
-@router.get("/groups/unread-summary")
-async def get_all_groups_unread_summary(
-    last_read_times: Optional[str] = Query(
-        None, description="所有群组的最后读取时间，JSON格式: {group_id: iso_time}"
-    ),
-    db: Session = Depends(get_db),
-):
-    """
-    获取所有群组的未读消息摘要
-
-    Args:
-        last_read_times: JSON字符串，包含各群组的最后读取时间
-        db: 数据库会话
-
-    Returns:
-        所有群组的未读消息摘要
-    """
-    try:
-        # 解析最后读取时间
-        import json
-        from datetime import datetime
-
-        group_read_times = {}
-        if last_read_times:
-            try:
-                group_read_times = json.loads(last_read_times)
-            except Exception as e:
-                logger.warning(f"解析群组读取时间失败: {e}")
-
-        # 获取所有群组
-        groups = db.query(TelegramGroup).filter(TelegramGroup.is_active == True).all()
-
-        summary = []
-        total_unread = 0
-
-        for group in groups:
-            # 确定该群组的未读消息时间界限
-            if str(group.id) in group_read_times:
-                try:
-                    time_str = group_read_times[str(group.id)]
-                    try:
-                        import dateutil.parser
-
-                        cutoff_time = dateutil.parser.isoparse(time_str)
-                    except ImportError:
-                        # 如果没有dateutil，使用fromisoformat (Python 3.7+)
-                        cutoff_time = datetime.fromisoformat(
-                            time_str.replace("Z", "+00:00")
-                        )
-                except:
-                    cutoff_time = datetime.now() - timedelta(hours=24)
-            else:
-                # 默认24小时前
-                cutoff_time = datetime.now() - timedelta(hours=24)
-
-            # 查询该群组的未读消息数量
-            unread_count = (
-                db.query(TelegramMessage)
-                .filter(
-                    TelegramMessage.group_id == group.id,
-                    TelegramMessage.date > cutoff_time,
-                )
-                .count()
-            )
-
-            # 获取最新消息
-            latest_message = (
-                db.query(TelegramMessage)
-                .filter(TelegramMessage.group_id == group.id)
-                .order_by(desc(TelegramMessage.date))
-                .first()
-            )
-
-            group_summary = {
-                "group_id": group.id,
-                "group_title": group.title,
-                "group_username": group.username,
-                "unread_count": unread_count,
-                "cutoff_time": cutoff_time.isoformat() if cutoff_time else None,
-                "latest_message_time": latest_message.date.isoformat()
-                if latest_message
-                else None,
-                "latest_message_text": latest_message.text[:50] + "..."
-                if latest_message
-                and latest_message.text
-                and len(latest_message.text) > 50
-                else (latest_message.text if latest_message else None),
-            }
-
-            summary.append(group_summary)
-            total_unread += unread_count
-
-        result = {
-            "total_unread": total_unread,
-            "groups_count": len(groups),
-            "groups_with_unread": len([g for g in summary if g["unread_count"] > 0]),
-            "groups": summary,
-        }
-
-        logger.info(f"所有群组未读消息摘要: 总计 {total_unread} 条未读消息")
-        return result
-
-    except Exception as e:
-        logger.error(f"获取所有群组未读消息摘要失败: {e}")
-        raise HTTPException(status_code=500, detail=f"获取未读消息摘要失败: {str(e)}")
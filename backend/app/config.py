@@ -305,6 +305,181 @@ class Settings:
         """日志最大内存使用量(MB)"""
         return self._get_int_config("log_max_memory_mb", 50)
     
+    @property
+    def download_pool_size(self) -> int:
+        """下载客户端池大小"""
+        return self._get_int_config("download_pool_size", 3)
+
+    @property
+    def download_pool_idle_timeout(self) -> float:
+        """下载客户端空闲断开时间(秒)"""
+        return self._get_float_config("download_pool_idle_timeout", 300.0)
+
+    @property
+    def download_pool_dc_affinity(self) -> bool:
+        """下载客户端是否按数据中心亲和分配"""
+        return str(self._get_config("download_pool_dc_affinity", "true")).lower() == "true"
+
+    @property
+    def parallel_download_threshold_mb(self) -> int:
+        """超过该大小(MB)的文档使用并行分片下载"""
+        return self._get_int_config("parallel_download_threshold_mb", 20)
+
+    @property
+    def parallel_download_parts(self) -> int:
+        """单个文件的并发分片数"""
+        return self._get_int_config("parallel_download_parts", 4)
+
+    @property
+    def download_min_throughput_kbps(self) -> int:
+        """计算下载超时时假定的最低吞吐量(KB/s)"""
+        return self._get_int_config("download_min_throughput_kbps", 256)
+
+    @property
+    def download_base_timeout(self) -> float:
+        """下载超时的基础时间(秒)"""
+        return self._get_float_config("download_base_timeout", 60.0)
+
+    @property
+    def download_jobs_global_limit(self) -> int:
+        """下载作业队列: 全局同时执行的手动下载作业数"""
+        return self._get_int_config("download_jobs_global_limit", 10)
+
+    @property
+    def download_jobs_user_limit(self) -> int:
+        """下载作业队列: 每个用户同时执行的作业数"""
+        return self._get_int_config("download_jobs_user_limit", 5)
+
+    @property
+    def download_jobs_group_limit(self) -> int:
+        """下载作业队列: 每个群组同时执行的作业数"""
+        return self._get_int_config("download_jobs_group_limit", 5)
+
+    @property
+    def download_job_lease_seconds(self) -> int:
+        """下载作业租约时长(秒)，执行中的作业按三分之一租约间隔续租"""
+        return self._get_int_config("download_job_lease_seconds", 60)
+
+    @property
+    def download_job_max_attempts(self) -> int:
+        """下载作业失败后的最大尝试次数"""
+        return self._get_int_config("download_job_max_attempts", 3)
+
+    @property
+    def rpc_rate_history(self) -> float:
+        """RPC限速: 消息历史请求的初始速率(次/秒)，遇到FloodWait后自动下调"""
+        return self._get_float_config("rpc_rate_history", 2.0)
+
+    @property
+    def rpc_rate_get_file(self) -> float:
+        """RPC限速: 文件下载请求(单次下载或单个分片)的初始速率(次/秒)"""
+        return self._get_float_config("rpc_rate_get_file", 20.0)
+
+    @property
+    def rpc_rate_entity(self) -> float:
+        """RPC限速: 实体解析请求的初始速率(次/秒)"""
+        return self._get_float_config("rpc_rate_entity", 5.0)
+
+    @property
+    def rpc_max_flood_wait(self) -> int:
+        """RPC限速: 自动等待重试的最长FloodWait(秒)，更长的直接返回错误"""
+        return self._get_int_config("rpc_max_flood_wait", 300)
+
+    @property
+    def realtime_batch_size(self) -> int:
+        """实时消息写入队列的单批最大条数"""
+        return self._get_int_config("realtime_batch_size", 200)
+
+    @property
+    def realtime_flush_interval(self) -> float:
+        """实时消息写入队列的最长攒批时间(秒)"""
+        return self._get_float_config("realtime_flush_interval", 0.5)
+
+    @property
+    def realtime_catch_up_limit(self) -> int:
+        """重连后每个群组补拉的最大消息数"""
+        return self._get_int_config("realtime_catch_up_limit", 1000)
+
+    @property
+    def content_index_reconcile_interval(self) -> float:
+        """文件内容索引后台对账间隔(秒)"""
+        return self._get_float_config("content_index_reconcile_interval", 21600.0)
+
+    @property
+    def progress_publish_hz(self) -> float:
+        """下载/任务进度推送频率(每秒次数)"""
+        return self._get_float_config("progress_publish_hz", 4.0)
+
+    @property
+    def progress_checkpoint_interval(self) -> float:
+        """下载进度写入数据库的最短间隔(秒)"""
+        return self._get_float_config("progress_checkpoint_interval", 5.0)
+
+    @property
+    def progress_checkpoint_mb(self) -> int:
+        """距上次写入数据库累计下载超过该大小(MB)时提前写入进度"""
+        return self._get_int_config("progress_checkpoint_mb", 32)
+
+    @property
+    def rule_rematch_interval(self) -> float:
+        """规则匹配结果后台对账间隔(秒)，规则或任务变更时会立即触发"""
+        return self._get_float_config("rule_rematch_interval", 60.0)
+
+    @property
+    def rule_rematch_batch_size(self) -> int:
+        """规则重新匹配时每批评估的消息数"""
+        return self._get_int_config("rule_rematch_batch_size", 2000)
+
+    @property
+    def media_cache_max_age(self) -> int:
+        """已下载媒体文件的浏览器缓存时长（秒），强制重新下载后内容可能变化，依赖ETag校验"""
+        return self._get_int_config("media_cache_max_age", 86400)
+
+    @property
+    def thumbnail_cache_max_age(self) -> int:
+        """缩略图的浏览器缓存时长（秒），缩略图可能重新生成，依赖ETag校验"""
+        return self._get_int_config("thumbnail_cache_max_age", 86400)
+
+    @property
+    def thumbnail_cache_dir(self) -> str:
+        """缩略图缓存目录，默认位于媒体目录下的隐藏目录"""
+        default_dir = os.path.join(self.media_root, ".thumbnails")
+        return self._get_config("thumbnail_cache_dir", default_dir)
+
+    @property
+    def thumbnail_cache_max_mb(self) -> int:
+        """缩略图缓存总大小上限（MB），超出后按最近访问时间淘汰"""
+        return self._get_int_config("thumbnail_cache_max_mb", 1024)
+
+    @property
+    def thumbnail_workers(self) -> int:
+        """缩略图生成进程数"""
+        return self._get_int_config("thumbnail_workers", 2)
+
+    @property
+    def system_metrics_interval(self) -> float:
+        """系统指标采样间隔（秒），所有监控组件共用同一采样结果"""
+        return self._get_float_config("system_metrics_interval", 5.0)
+
+    @property
+    def system_metrics_history(self) -> int:
+        """系统指标环形缓冲区保留的采样数量"""
+        return self._get_int_config("system_metrics_history", 720)
+
+    @property
+    def trace_buffer_size(self) -> int:
+        """下载链路追踪保留的最近文件数，0 表示关闭追踪"""
+        return self._get_int_config("trace_buffer_size", 2000)
+
+    @property
+    def media_accel_redirect(self) -> str:
+        """nginx X-Accel-Redirect 内部路径前缀，为空时由应用自行输出文件
+
+        设置后位于媒体目录内的文件交给 nginx 的 internal location 发送(sendfile)。
+        """
+        env_value = os.environ.get("MEDIA_ACCEL_REDIRECT", "")
+        return (self._get_config("media_accel_redirect", env_value) or "").strip()
+
     @property
     def smtp_host(self) -> str:
         return self._get_config("smtp_host", "smtp.gmail.com")
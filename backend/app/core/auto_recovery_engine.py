@@ -28,7 +28,7 @@ import threading
 import time
 import logging
 import json
-import psutil
+import os
 import weakref
 from abc import ABC, abstractmethod
 from collections import defaultdict, deque
@@ -728,18 +728,18 @@ class AutoRecoveryEngine(ServiceLoggerMixin):
         try:
             metrics = {}
 
-            # 系统指标
-            process = psutil.Process()
-            metrics['cpu_usage'] = process.cpu_percent() / 100.0
-            metrics['memory_usage'] = process.memory_percent() / 100.0
+            from ..services.system_metrics_sampler import get_system_metrics_sampler
+
+            # 系统指标 (来自系统指标采样器的最新快照)
+            snapshot = get_system_metrics_sampler().latest()
+            metrics['cpu_usage'] = snapshot.process_cpu_percent / 100.0
+            metrics['memory_usage'] = snapshot.process_memory_percent / 100.0
 
             # 网络指标
-            net_io = psutil.net_io_counters()
-            if hasattr(net_io, 'errin') and hasattr(net_io, 'packets_recv'):
-                if net_io.packets_recv > 0:
-                    metrics['error_rate'] = net_io.errin / net_io.packets_recv
-                else:
-                    metrics['error_rate'] = 0.0
+            if snapshot.net_packets_recv > 0:
+                metrics['error_rate'] = snapshot.net_errin / snapshot.net_packets_recv
+            else:
+                metrics['error_rate'] = 0.0
 
             # 服务特定指标
             service_metrics = await self._get_service_specific_metrics(service_name)
@@ -758,7 +758,7 @@ class AutoRecoveryEngine(ServiceLoggerMixin):
             'service_name': service_name,
             'timestamp': time.time(),
             'host': 'localhost',  # 可以从配置获取
-            'process_id': psutil.Process().pid
+            'process_id': os.getpid()
         }
 
     async def _check_service_health(self, service_name: str,
@@ -6,7 +6,6 @@
 import asyncio
 import time
 import traceback
-import psutil
 import logging
 from typing import Dict, Any, Optional, List, Callable, Set, Tuple, Union
 from datetime import datetime, timezone, timedelta
@@ -990,37 +989,32 @@ class CompleteErrorManager:
     async def _collect_system_metrics(self) -> SystemMetrics:
         """收集系统指标"""
         try:
-            # CPU和内存信息
-            cpu_percent = psutil.cpu_percent(interval=1)
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
+            from ..services.system_metrics_sampler import get_system_metrics_sampler
 
-            # 网络IO
-            net_io = psutil.net_io_counters()
+            # CPU、内存、磁盘、网络和进程信息来自系统指标采样器的最新快照
+            snapshot = get_system_metrics_sampler().latest()
+            disk = snapshot.disk
             network_io = {
-                "bytes_sent": net_io.bytes_sent,
-                "bytes_recv": net_io.bytes_recv,
-                "packets_sent": net_io.packets_sent,
-                "packets_recv": net_io.packets_recv
+                "bytes_sent": snapshot.net_bytes_sent,
+                "bytes_recv": snapshot.net_bytes_recv,
+                "packets_sent": snapshot.net_packets_sent,
+                "packets_recv": snapshot.net_packets_recv
             }
 
-            # 进程信息
-            process = psutil.Process()
-
             # 错误率和响应时间（从现有错误处理器获取）
             error_summary = global_error_handler.metrics.get_error_summary()
 
             return SystemMetrics(
                 timestamp=datetime.now(timezone.utc),
-                cpu_usage=cpu_percent,
-                memory_usage=memory.percent,
-                disk_usage=(disk.used / disk.total) * 100,
+                cpu_usage=snapshot.cpu_percent,
+                memory_usage=snapshot.memory_percent,
+                disk_usage=disk.percent if disk else 0.0,
                 network_io=network_io,
                 active_connections=len(websocket_manager.active_connections),
                 error_rate=len(error_summary.get("error_counts_by_type", {})),
                 response_time=0.0,  # 这里需要从其他地方获取
-                thread_count=process.num_threads(),
-                fd_count=process.num_fds() if hasattr(process, 'num_fds') else 0
+                thread_count=snapshot.process_threads,
+                fd_count=snapshot.process_fds or 0
             )
 
         except Exception as e:
@@ -100,16 +100,20 @@ class LRUCache:
         self.cache = {}
         self.access_order = []
         self.current_memory = 0
+        self.hits = 0
+        self.misses = 0
         self._lock = threading.Lock()
 
     def get(self, key: str) -> Optional[Any]:
         """获取缓存值"""
         with self._lock:
             if key in self.cache:
+                self.hits += 1
                 # 更新访问顺序
                 self.access_order.remove(key)
                 self.access_order.append(key)
                 return self.cache[key]['value']
+            self.misses += 1
             return None
 
     def set(self, key: str, value: Any):
@@ -172,7 +176,9 @@ class LRUCache:
                 'memory_usage_bytes': self.current_memory,
                 'memory_usage_mb': self.current_memory / 1024 / 1024,
                 'max_memory_mb': self.max_memory_bytes / 1024 / 1024,
-                'hit_ratio': getattr(self, '_hit_count', 0) / max(getattr(self, '_access_count', 1), 1)
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / max(self.hits + self.misses, 1)
             }
 
 
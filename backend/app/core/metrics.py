@@ -0,0 +1,401 @@
+"""应用指标注册表
+
+提供计数器、仪表和直方图三种指标，以 OpenMetrics / Prometheus 文本格式输出，
+供 /metrics 端点抓取。
+
+主要功能:
+- Counter / Gauge / Histogram，支持标签；每个标签组合的子指标持有独立的锁，
+  热路径上的一次更新只是一次加锁的加法
+- 直方图使用固定桶，observe() 用二分查找定位桶
+- 抓取时回调(collector): 队列深度、缓存命中率等已在各组件中维护的状态
+  在抓取时读取，不需要在热路径上同步更新
+- 同一份数据可输出 OpenMetrics 1.0.0 或 Prometheus 0.0.4 文本格式
+
+Example:
+    ```python
+    from app.core.metrics import DB_COMMIT_DURATION, DOWNLOAD_BYTES
+
+    DOWNLOAD_BYTES.labels("task").inc(len(chunk))
+    with DB_COMMIT_DURATION.time():
+        session.commit()
+    ```
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import bisect
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+# ----------------------------------------------------------------------
+# 子指标（单个标签组合）
+# ----------------------------------------------------------------------
+
+class _CounterChild:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        if amount < 0:
+            raise ValueError("计数器只能增加")
+        with self._lock:
+            self._value += amount
+
+    def get(self) -> float:
+        return self._value
+
+
+class _GaugeChild:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self._value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self._value -= amount
+
+    def get(self) -> float:
+        return self._value
+
+
+class _HistogramChild:
+    __slots__ = ("_upper_bounds", "_counts", "_sum", "_lock")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self._upper_bounds = upper_bounds
+        self._counts = [0] * (len(upper_bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self._counts), self._sum
+
+
+# ----------------------------------------------------------------------
+# 指标族
+# ----------------------------------------------------------------------
+
+class _MetricFamily:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str, **kwargs: str):
+        """获取标签组合对应的子指标，热路径上应缓存返回值"""
+        if kwargs:
+            values = tuple(str(kwargs[name]) for name in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._new_child()
+                    self._children[values] = child
+        return child
+
+    def _items(self) -> List[Tuple[LabelValues, object]]:
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self, openmetrics: bool) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_MetricFamily):
+    """单调递增计数器，输出时样本名带 _total 后缀"""
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def render(self, openmetrics: bool) -> List[str]:
+        family = self.name if openmetrics else f"{self.name}_total"
+        lines = _header(family, self.kind, self.documentation, openmetrics)
+        for values, child in self._items():
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_total{labels} {_format_value(child.get())}")
+        return lines
+
+
+class Gauge(_MetricFamily):
+    """可增可减的瞬时值"""
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def render(self, openmetrics: bool) -> List[str]:
+        lines = _header(self.name, self.kind, self.documentation, openmetrics)
+        for values, child in self._items():
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}{labels} {_format_value(child.get())}")
+        return lines
+
+
+class Histogram(_MetricFamily):
+    """固定桶直方图"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.upper_bounds = tuple(sorted(float(b) for b in buckets if b != math.inf))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def render(self, openmetrics: bool) -> List[str]:
+        lines = _header(self.name, self.kind, self.documentation, openmetrics)
+        bounds = self.upper_bounds + (math.inf,)
+        for values, child in self._items():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                labels = _format_labels(self.labelnames, values, le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        return lines
+
+
+def _header(name: str, kind: str, documentation: str, openmetrics: bool) -> List[str]:
+    doc = documentation.replace("\\", "\\\\").replace("\n", "\\n")
+    if openmetrics:
+        doc = doc.replace('"', '\\"')
+    return [f"# HELP {name} {doc}", f"# TYPE {name} {kind}"]
+
+
+# ----------------------------------------------------------------------
+# 抓取时采集
+# ----------------------------------------------------------------------
+
+@dataclass
+class CollectedMetric:
+    """抓取时回调返回的一个指标族（gauge 或 counter）"""
+    name: str
+    kind: str
+    documentation: str
+    labelnames: Tuple[str, ...] = ()
+    samples: List[Tuple[LabelValues, float]] = field(default_factory=list)
+
+    def add(self, value: Optional[float], *labels: str) -> "CollectedMetric":
+        if value is not None:
+            self.samples.append((tuple(str(v) for v in labels), float(value)))
+        return self
+
+    def render(self, openmetrics: bool) -> List[str]:
+        counter = self.kind == "counter"
+        family = self.name if openmetrics or not counter else f"{self.name}_total"
+        sample_name = f"{self.name}_total" if counter else self.name
+        lines = _header(family, self.kind, self.documentation, openmetrics)
+        for values, value in self.samples:
+            lines.append(f"{sample_name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+def gauge_family(name: str, documentation: str, labelnames: Sequence[str] = ()) -> CollectedMetric:
+    return CollectedMetric(name, "gauge", documentation, tuple(labelnames))
+
+
+def counter_family(name: str, documentation: str, labelnames: Sequence[str] = ()) -> CollectedMetric:
+    return CollectedMetric(name, "counter", documentation, tuple(labelnames))
+
+
+Collector = Callable[[], Iterable[CollectedMetric]]
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _MetricFamily] = {}
+        self._collectors: Dict[str, Collector] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _MetricFamily) -> _MetricFamily:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"指标 {metric.name} 已以不同定义注册")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, name: str, collector: Collector):
+        """注册抓取时回调，同名回调会被替换"""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def unregister_collector(self, name: str):
+        with self._lock:
+            self._collectors.pop(name, None)
+
+    def render(self, openmetrics: bool = True) -> str:
+        """输出全部指标；单个回调失败只跳过该回调"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render(openmetrics))
+        for name, collector in collectors:
+            try:
+                for family in collector():
+                    lines.extend(family.render(openmetrics))
+            except Exception as e:
+                logger.warning(f"指标采集回调 {name} 失败: {e}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """获取全局指标注册表"""
+    return metrics_registry
+
+
+# ----------------------------------------------------------------------
+# 热路径指标
+# ----------------------------------------------------------------------
+
+DOWNLOAD_BYTES = metrics_registry.counter(
+    "tggod_download_bytes", "已下载的媒体字节数", ("source",)
+)
+DOWNLOAD_DURATION = metrics_registry.histogram(
+    "tggod_download_duration_seconds", "单个文件的下载耗时", ("source", "result"),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0),
+)
+DB_COMMIT_DURATION = metrics_registry.histogram(
+    "tggod_db_commit_duration_seconds", "单写线程每个批次事务的提交耗时(含锁重试)",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+DB_WRITES = metrics_registry.counter(
+    "tggod_db_writes", "单写线程执行的写命令数", ("command", "result")
+)
+DB_LOCK_RETRIES = metrics_registry.counter(
+    "tggod_db_lock_retries", "数据库锁冲突导致的重试次数", ("source",)
+)
+WEBSOCKET_SEND_LATENCY = metrics_registry.histogram(
+    "tggod_websocket_send_latency_seconds", "WebSocket消息从入队到发送完成的耗时",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+WEBSOCKET_FRAMES = metrics_registry.counter(
+    "tggod_websocket_frames", "WebSocket消息帧数", ("result",)
+)
@@ -613,17 +613,17 @@ class PlatformManager:
     async def check_system_resources(self) -> Dict[str, Any]:
         """检查系统资源"""
         try:
-            import psutil
-            
-            cpu_percent = psutil.cpu_percent(interval=1)
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
-            
+            from ..services.system_metrics_sampler import get_system_metrics_sampler
+
+            # 读取系统指标采样器的最新快照，不在事件循环中阻塞采样
+            snapshot = get_system_metrics_sampler().latest()
+            disk = snapshot.disk
+
             return {
-                "cpu_percent": cpu_percent,
-                "memory_total": memory.total,
-                "memory_available": memory.available,
-                "memory_percent": memory.percent,
+                "cpu_percent": snapshot.cpu_percent,
+                "memory_total": snapshot.memory_total,
+                "memory_available": snapshot.memory_available,
+                "memory_percent": snapshot.memory_percent,
                 "disk_total": disk.total,
                 "disk_used": disk.used,
                 "disk_free": disk.free,
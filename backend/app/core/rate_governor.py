@@ -0,0 +1,337 @@
+"""Telegram RPC 限速器
+
+所有调用 Telegram API 的代码共用一组按 RPC 类别划分的令牌桶，取代各处分散的
+FloodWait 重试循环和固定的翻页间隔，一个调用方触发的 FloodWait 会让同类别的
+其他调用方一起等待，而不是各自撞上限制。
+
+RPC 类别:
+- history: 消息历史和按ID取消息 (messages.GetHistory / channels.GetMessages)
+- get_file: 文件下载 (upload.GetFile，以单次下载调用或单个分片为一个请求)
+- entity: 实体解析和群组完整信息 (contacts.ResolveUsername / GetFullChannel 等)
+
+主要功能:
+- 令牌桶按配置速率补充，桶容量允许短时突发
+- 从 FloodWait 学习安全速率: 遇到 FloodWait 后该类别停发 e.seconds 秒，速率减半，
+  并把触发时速率的八成记为上限；之后持续无 FloodWait 时逐步加速(AIMD)，
+  长时间无 FloodWait 后上限恢复为配置值
+- 交互请求(界面上的接口调用)和批量任务(下载任务、批量下载、消息同步)分道排队，
+  令牌按 3:1 交替分配，交互请求优先但批量任务不会饿死
+- 调用方通过 call() 自动等待和重试 FloodWait，或用 throttled() 包裹迭代器类调用
+- 各类别的当前速率、剩余令牌、停发剩余时间、排队数和等待时间通过 /metrics 输出
+
+Example:
+    ```python
+    from app.core.rate_governor import LANE_BULK, RPC_ENTITY, rate_governor
+
+    entity = await rate_governor.call(RPC_ENTITY, client.get_entity, chat_id)
+
+    with rate_governor.lane(LANE_BULK):
+        task = asyncio.create_task(sync_group(group_id))
+    ```
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from telethon.errors import FloodWaitError
+
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+RPC_HISTORY = "history"
+RPC_GET_FILE = "get_file"
+RPC_ENTITY = "entity"
+
+LANE_INTERACTIVE = "interactive"
+LANE_BULK = "bulk"
+LANES = (LANE_INTERACTIVE, LANE_BULK)
+
+# 两道都有排队时，每连续分配给交互请求的令牌数后分配一个给批量任务
+INTERACTIVE_WEIGHT = 3
+# 单次调用最多重试的 FloodWait 次数
+MAX_FLOOD_RETRIES = 3
+# 无 FloodWait 持续多久(秒)后速率加速一步，每步为配置速率的十分之一
+RECOVERY_INTERVAL = 60.0
+RECOVERY_STEP = 0.1
+# 无 FloodWait 持续多久(秒)后学习到的上限恢复为配置值
+CEILING_RESET_INTERVAL = 1800.0
+# 学习到的速率下限为配置速率的比例
+MIN_RATE_RATIO = 0.05
+
+_current_lane: ContextVar[str] = ContextVar("tggod_rpc_lane", default=LANE_INTERACTIVE)
+
+
+class RpcBucket:
+    """单个 RPC 类别的令牌桶"""
+
+    def __init__(self, name: str, rate: float, burst: Optional[float] = None):
+        self.name = name
+        self.configured_rate = max(0.01, rate)
+        self.rate = self.configured_rate
+        self.ceiling = self.configured_rate
+        self.burst = max(1.0, burst if burst is not None else self.configured_rate)
+        self.tokens = self.burst
+        self.blocked_until = 0.0
+        self.last_flood_wait = 0.0
+        self._last_refill = time.monotonic()
+        self._last_increase = self._last_refill
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._interactive_streak = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.calls: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.wait_seconds: Dict[str, float] = {lane: 0.0 for lane in LANES}
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0
+
+    # ---------------------------------------------------------------- 令牌
+
+    def _refill(self, now: float):
+        start = max(self._last_refill, self.blocked_until)
+        if now > start:
+            self.tokens = min(self.burst, self.tokens + (now - start) * self.rate)
+        self._last_refill = now
+
+    def _delay(self, now: float) -> float:
+        """距离下一个令牌可用的秒数"""
+        blocked = max(0.0, self.blocked_until - now)
+        return blocked + max(0.0, (1.0 - self.tokens) / self.rate)
+
+    def _has_waiters(self, lane: str) -> bool:
+        waiters = self._waiters[lane]
+        while waiters and waiters[0].done():
+            # 等待中被取消的调用
+            waiters.popleft()
+        return bool(waiters)
+
+    def _next_lane(self) -> Optional[str]:
+        interactive = self._has_waiters(LANE_INTERACTIVE)
+        bulk = self._has_waiters(LANE_BULK)
+        if interactive and bulk:
+            if self._interactive_streak < INTERACTIVE_WEIGHT:
+                self._interactive_streak += 1
+                return LANE_INTERACTIVE
+            self._interactive_streak = 0
+            return LANE_BULK
+        if interactive:
+            return LANE_INTERACTIVE
+        if bulk:
+            self._interactive_streak = 0
+            return LANE_BULK
+        return None
+
+    def _release(self):
+        """按令牌数放行排队的调用，仍有排队时定时再次放行"""
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        while now >= self.blocked_until and self.tokens >= 1.0:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            self.tokens -= 1.0
+            self._waiters[lane].popleft().set_result(None)
+        if self._pending():
+            self._timer = asyncio.get_running_loop().call_later(self._delay(now), self._release)
+
+    def _pending(self) -> bool:
+        return any(self._has_waiters(lane) for lane in LANES)
+
+    def try_acquire(self, lane: str) -> bool:
+        """有可用令牌且无人排队时直接取得令牌"""
+        now = time.monotonic()
+        self._refill(now)
+        self.calls[lane] += 1
+        if now >= self.blocked_until and self.tokens >= 1.0 and not self._pending():
+            self.tokens -= 1.0
+            return True
+        return False
+
+    async def wait(self, lane: str):
+        """排队等待令牌"""
+        now = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(future)
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._delay(now), self._release)
+        try:
+            await future
+        finally:
+            self.wait_seconds[lane] += time.monotonic() - now
+
+    def reschedule(self):
+        """停发时间或速率变化后重新计算放行时间"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending():
+            self._timer = asyncio.get_running_loop().call_later(
+                self._delay(time.monotonic()), self._release
+            )
+
+    # ---------------------------------------------------------------- 学习
+
+    def on_flood_wait(self, seconds: int):
+        now = time.monotonic()
+        self._refill(now)
+        self.flood_waits += 1
+        self.flood_wait_seconds += seconds
+        self.last_flood_wait = now
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.ceiling = max(self.configured_rate * MIN_RATE_RATIO, min(self.ceiling, self.rate * 0.8))
+        self.rate = max(self.configured_rate * MIN_RATE_RATIO, self.rate / 2)
+        self._last_increase = now
+
+    def on_success(self):
+        now = time.monotonic()
+        if self.last_flood_wait and now - self.last_flood_wait >= CEILING_RESET_INTERVAL:
+            self.ceiling = self.configured_rate
+        if self.rate < self.ceiling and now - self._last_increase >= RECOVERY_INTERVAL:
+            self._refill(now)
+            self.rate = min(self.ceiling, self.rate + self.configured_rate * RECOVERY_STEP)
+            self._last_increase = now
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._refill(now)
+        return {
+            "rate": round(self.rate, 3),
+            "configured_rate": self.configured_rate,
+            "ceiling": round(self.ceiling, 3),
+            "burst": self.burst,
+            "tokens": round(self.tokens, 3),
+            "blocked_seconds": round(max(0.0, self.blocked_until - now), 3),
+            "waiting": {lane: len(self._waiters[lane]) for lane in LANES},
+            "calls": dict(self.calls),
+            "wait_seconds": {lane: round(value, 3) for lane, value in self.wait_seconds.items()},
+            "flood_waits": self.flood_waits,
+            "flood_wait_seconds": self.flood_wait_seconds,
+        }
+
+
+class RateGovernor:
+    """按 RPC 类别限速的全局调度器
+
+    令牌桶在首次使用时按配置创建，避免导入模块时访问数据库。
+    所有桶只在主事件循环中使用。
+    """
+
+    def __init__(self):
+        self._buckets: Dict[str, RpcBucket] = {}
+        self._max_flood_wait: Optional[int] = None
+
+    def _configured_rates(self) -> Dict[str, float]:
+        from ..config import settings
+        return {
+            RPC_HISTORY: settings.rpc_rate_history,
+            RPC_GET_FILE: settings.rpc_rate_get_file,
+            RPC_ENTITY: settings.rpc_rate_entity,
+        }
+
+    def bucket(self, rpc: str) -> RpcBucket:
+        bucket = self._buckets.get(rpc)
+        if bucket is None:
+            rate = self._configured_rates().get(rpc, 1.0)
+            bucket = self._buckets.setdefault(rpc, RpcBucket(rpc, rate))
+        return bucket
+
+    @property
+    def max_flood_wait(self) -> int:
+        """超过该秒数的 FloodWait 不再等待重试，直接抛给调用方"""
+        if self._max_flood_wait is None:
+            from ..config import settings
+            self._max_flood_wait = max(0, settings.rpc_max_flood_wait)
+        return self._max_flood_wait
+
+    # ---------------------------------------------------------------- 分道
+
+    @contextmanager
+    def lane(self, lane: str):
+        """在上下文内(含其中创建的 asyncio 任务)以指定分道调用 RPC"""
+        token = _current_lane.set(lane)
+        try:
+            yield
+        finally:
+            _current_lane.reset(token)
+
+    def current_lane(self) -> str:
+        return _current_lane.get()
+
+    # ---------------------------------------------------------------- 调用
+
+    async def acquire(self, rpc: str):
+        """等待该类别的一个令牌"""
+        bucket = self.bucket(rpc)
+        lane = _current_lane.get()
+        if bucket.try_acquire(lane):
+            return
+        with tracer.span("rate_wait", rpc=rpc, lane=lane):
+            await bucket.wait(lane)
+
+    def record_flood_wait(self, rpc: str, seconds: int):
+        """记录 FloodWait: 该类别停发并降低速率，排队中的调用顺延"""
+        bucket = self.bucket(rpc)
+        bucket.on_flood_wait(seconds)
+        logger.warning(
+            f"RPC {rpc} 遇到Flood Wait {seconds}秒，速率降至 {bucket.rate:.2f}/秒"
+        )
+        try:
+            bucket.reschedule()
+        except RuntimeError:
+            # 不在事件循环中(同步调用方)，下一次 acquire 时重新计算
+            pass
+
+    def record_success(self, rpc: str):
+        self.bucket(rpc).on_success()
+
+    async def call(self, rpc: str, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """限速执行一次 RPC 调用
+
+        遇到 FloodWait 时记录并重新排队，最多重试 MAX_FLOOD_RETRIES 次；
+        等待时间超过 max_flood_wait 的 FloodWait 直接抛出。
+        """
+        for attempt in range(MAX_FLOOD_RETRIES + 1):
+            await self.acquire(rpc)
+            try:
+                result = await func(*args, **kwargs)
+            except FloodWaitError as e:
+                self.record_flood_wait(rpc, e.seconds)
+                if attempt >= MAX_FLOOD_RETRIES or e.seconds > self.max_flood_wait:
+                    raise
+                continue
+            self.record_success(rpc)
+            return result
+
+    @asynccontextmanager
+    async def throttled(self, rpc: str):
+        """限速包裹一段 RPC 调用(如 iter_download / iter_messages)，FloodWait 记录后抛出由调用方重试"""
+        await self.acquire(rpc)
+        try:
+            yield
+        except FloodWaitError as e:
+            self.record_flood_wait(rpc, e.seconds)
+            raise
+        self.record_success(rpc)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        for rpc in (RPC_HISTORY, RPC_GET_FILE, RPC_ENTITY):
+            self.bucket(rpc)
+        return {rpc: bucket.to_dict() for rpc, bucket in self._buckets.items()}
+
+
+rate_governor = RateGovernor()
+
+
+def get_rate_governor() -> RateGovernor:
+    """获取 RPC 限速器实例"""
+    return rate_governor
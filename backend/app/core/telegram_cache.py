@@ -549,9 +549,10 @@ class TelegramQueryCache:
         try:
             from telethon.tl.functions.channels import GetParticipantRequest
             from ..services.telegram_service import telegram_service
+            from .rate_governor import RPC_ENTITY, rate_governor
 
             await telegram_service.initialize()
-            entity = await telegram_service.client.get_entity(chat_id)
+            entity = await rate_governor.call(RPC_ENTITY, telegram_service.client.get_entity, chat_id)
             participant_result = await telegram_service.client(
                 GetParticipantRequest(channel=entity, participant=user_id)
             )
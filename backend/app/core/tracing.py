@@ -0,0 +1,318 @@
+"""下载链路追踪
+
+为每个文件的下载过程记录分阶段耗时(span)，用于定位慢任务的时间花在哪个环节:
+实体查询、get_messages、MTProto传输、文件检查、整理、NFO/图片生成、下载记录写入。
+
+主要功能:
+- 当前 span 通过 contextvars 传递: 同一协程内嵌套的 span，以及经 asyncio.to_thread
+  在工作线程中创建的 span，都会自动挂到调用方的 span 下
+- 计时使用单调时钟(time.perf_counter)，不受系统时间调整影响
+- 没有活动的追踪时 span() 不做任何记录，手动下载等未追踪的路径几乎没有开销
+- 已完成的追踪(每个文件一条)保存在定长环形缓冲区中
+- 导出为 JSON 或 Chrome trace 格式(可直接用 chrome://tracing 或 Perfetto 打开)
+- 按任务查询耗时最长的 N 个文件及其分阶段耗时
+
+Example:
+    ```python
+    from app.core.tracing import tracer
+
+    trace = tracer.start_trace("file", task_id=1, message_id=42)
+    with tracer.activate(trace):
+        with tracer.span("entity_lookup"):
+            chat = await client.get_entity(chat_id)
+    tracer.finish(trace)
+    ```
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("tggod_current_span", default=None)
+
+
+class Span:
+    """一个计时区间，start/end 为 time.perf_counter() 读数"""
+
+    __slots__ = ("name", "start", "end", "attrs", "children", "thread_id")
+
+    def __init__(self, name: str, start: float, attrs: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.start = start
+        self.end: Optional[float] = None
+        self.attrs: Dict[str, Any] = attrs or {}
+        # 子 span 可能由工作线程追加，list.append 在GIL下是原子操作
+        self.children: List["Span"] = []
+        self.thread_id = threading.get_ident()
+
+    @property
+    def duration(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    def set(self, **attrs):
+        """补充属性(文件大小、重试次数等)"""
+        self.attrs.update(attrs)
+
+    def walk(self) -> Iterator["Span"]:
+        yield self
+        for child in list(self.children):
+            yield from child.walk()
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "attrs": self.attrs,
+            "children": [child.to_dict(origin) for child in list(self.children)],
+        }
+
+
+class Trace:
+    """单个文件的完整追踪，根 span 覆盖从进入下载阶段到记录写入完成"""
+
+    __slots__ = ("trace_id", "task_id", "root", "started_at")
+
+    def __init__(self, trace_id: int, name: str, task_id: Optional[int], attrs: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.task_id = task_id
+        self.root = Span(name, time.perf_counter(), attrs)
+        self.started_at = time.time()
+
+    @property
+    def duration(self) -> float:
+        return self.root.duration
+
+    def stage_breakdown(self) -> Dict[str, float]:
+        """按 span 名称汇总耗时(毫秒)
+
+        同名 span(如重试产生的多次 transfer)累加；父阶段的耗时包含其子阶段。
+        other 为根 span 中未被直接子阶段覆盖的时间，主要是阶段之间的排队等待。
+        """
+        stages: Dict[str, float] = {}
+        for span in self.root.walk():
+            if span is self.root:
+                continue
+            stages[span.name] = stages.get(span.name, 0.0) + span.duration * 1000
+        covered = sum(child.duration for child in list(self.root.children))
+        stages["other"] = max(0.0, self.duration - covered) * 1000
+        return {name: round(ms, 3) for name, ms in stages.items()}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "task_id": self.task_id,
+            "name": self.root.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attrs": self.root.attrs,
+            "stages": self.stage_breakdown(),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = self.summary()
+        data["spans"] = self.root.to_dict(self.root.start)
+        return data
+
+
+class Tracer:
+    """追踪器
+
+    start_trace() 创建追踪但不绑定上下文，由 activate() 在各阶段的协程中重新进入，
+    这样同一文件跨下载、整理、写记录三个流水线阶段的 span 都挂在同一条追踪下。
+    finish() 之后追踪进入环形缓冲区，缓冲区满时淘汰最早的追踪。
+    """
+
+    def __init__(self, capacity: Optional[int] = None):
+        # 容量在首次使用时才从配置读取，避免导入模块时访问数据库
+        self.capacity = capacity
+        self._traces: Optional[Deque[Trace]] = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.started = 0
+        self.finished = 0
+
+    @property
+    def enabled(self) -> bool:
+        if self.capacity is None:
+            from ..config import settings
+            self.capacity = max(0, settings.trace_buffer_size)
+        return self.capacity > 0
+
+    def _buffer(self) -> Deque[Trace]:
+        if self._traces is None:
+            with self._lock:
+                if self._traces is None:
+                    self._traces = deque(maxlen=max(1, self.capacity or 1))
+        return self._traces
+
+    # ------------------------------------------------------------------ 记录
+
+    def start_trace(self, name: str, task_id: Optional[int] = None, **attrs) -> Optional[Trace]:
+        """开始一条追踪，追踪关闭时返回 None(后续调用均接受 None)"""
+        if not self.enabled:
+            return None
+        self.started += 1
+        return Trace(next(self._ids), name, task_id, attrs)
+
+    def finish(self, trace: Optional[Trace], **attrs):
+        """结束追踪并放入环形缓冲区"""
+        if trace is None or trace.root.end is not None:
+            return
+        trace.root.end = time.perf_counter()
+        trace.root.attrs.update(attrs)
+        buffer = self._buffer()
+        with self._lock:
+            buffer.append(trace)
+            self.finished += 1
+
+    @contextmanager
+    def activate(self, trace: Optional[Trace]):
+        """将追踪的根 span 设为当前 span"""
+        if trace is None:
+            yield None
+            return
+        token = _current_span.set(trace.root)
+        try:
+            yield trace
+        finally:
+            _current_span.reset(token)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """在当前 span 下记录一个子阶段，没有活动追踪时不做记录"""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+        span = Span(name, time.perf_counter(), attrs)
+        parent.children.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            span.end = time.perf_counter()
+            _current_span.reset(token)
+
+    def add_span(self, name: str, start: float, end: float, trace: Optional[Trace] = None, **attrs):
+        """补记一个已计时的阶段(如多个文件共享的批量写库)
+
+        start/end 为 time.perf_counter() 读数；未指定 trace 时挂到当前 span 下。
+        """
+        parent = trace.root if trace is not None else _current_span.get()
+        if parent is None:
+            return
+        span = Span(name, start, attrs)
+        span.end = end
+        parent.children.append(span)
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    # ------------------------------------------------------------------ 查询
+
+    def traces(self, task_id: Optional[int] = None) -> List[Trace]:
+        """按完成顺序返回缓冲区中的追踪，可按任务过滤"""
+        if self._traces is None:
+            return []
+        with self._lock:
+            traces = list(self._traces)
+        if task_id is not None:
+            traces = [t for t in traces if t.task_id == task_id]
+        return traces
+
+    def get_trace(self, trace_id: int) -> Optional[Trace]:
+        for trace in self.traces():
+            if trace.trace_id == trace_id:
+                return trace
+        return None
+
+    def slowest(self, task_id: Optional[int] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """耗时最长的 limit 个文件及其分阶段耗时"""
+        traces = sorted(self.traces(task_id), key=lambda t: t.duration, reverse=True)
+        return [trace.to_dict() for trace in traces[:max(0, limit)]]
+
+    def export_json(self, task_id: Optional[int] = None) -> Dict[str, Any]:
+        return {"traces": [trace.to_dict() for trace in self.traces(task_id)]}
+
+    def export_chrome(self, task_id: Optional[int] = None) -> Dict[str, Any]:
+        """Chrome trace event 格式
+
+        每个任务一个进程(pid=任务ID)，每个文件一行(tid=追踪ID)，
+        各阶段为完整事件(ph=X)，时间单位为微秒。
+        """
+        traces = self.traces(task_id)
+        events: List[Dict[str, Any]] = []
+        if not traces:
+            return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+        origin = min(trace.root.start for trace in traces)
+        named_processes = set()
+        for trace in traces:
+            pid = trace.task_id or 0
+            if pid not in named_processes:
+                named_processes.add(pid)
+                events.append({
+                    "name": "process_name", "ph": "M", "pid": pid,
+                    "args": {"name": f"task {pid}" if pid else "untracked"},
+                })
+            message_id = trace.root.attrs.get("message_id")
+            events.append({
+                "name": "thread_name", "ph": "M", "pid": pid, "tid": trace.trace_id,
+                "args": {"name": f"message {message_id}" if message_id is not None else trace.root.name},
+            })
+            for span in trace.root.walk():
+                events.append({
+                    "name": span.name,
+                    "cat": trace.root.name,
+                    "ph": "X",
+                    "ts": round((span.start - origin) * 1_000_000, 1),
+                    "dur": round(span.duration * 1_000_000, 1),
+                    "pid": pid,
+                    "tid": trace.trace_id,
+                    "args": span.attrs,
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "capacity": self.capacity,
+            "buffered": len(self._traces) if self._traces is not None else 0,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+    def clear(self, task_id: Optional[int] = None):
+        """清空缓冲区，指定任务时只清除该任务的追踪"""
+        if self._traces is None:
+            return
+        with self._lock:
+            if task_id is None:
+                self._traces.clear()
+            else:
+                kept = [t for t in self._traces if t.task_id != task_id]
+                self._traces.clear()
+                self._traces.extend(kept)
+
+
+tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """获取追踪器实例"""
+    return tracer
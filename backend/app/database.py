@@ -18,10 +18,11 @@ Author: TgGod Team
 Version: 1.0.0
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
 
 # 基础模型类先创建，避免循环导入
@@ -100,11 +101,44 @@ if "sqlite" in database_url:
 else:
     async_database_url = database_url
 
-async_engine = create_async_engine(
-    async_database_url,
-    echo=True,
-    connect_args={"check_same_thread": False} if "sqlite" in async_database_url else {}
-)
+if "sqlite" in async_database_url:
+    # 异步读路径: 每个连接独立的aiosqlite线程，WAL模式下读者互不阻塞，
+    # 连接池只需覆盖并发请求数，过大反而增加文件句柄和缓存占用
+    async_engine = create_async_engine(
+        async_database_url,
+        echo=False,
+        connect_args={"check_same_thread": False, "timeout": 30},
+        # aiosqlite 方言默认使用 NullPool，不接受连接池大小参数，需显式指定队列池
+        poolclass=AsyncAdaptedQueuePool,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=30,
+        pool_logging_name="tggod_async_pool"
+    )
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _configure_async_sqlite_connection(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.execute("PRAGMA cache_size=-20000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
+else:
+    async_engine = create_async_engine(
+        async_database_url,
+        echo=False,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=30,
+        pool_logging_name="tggod_async_pool"
+    )
 AsyncSessionLocal = sessionmaker(
     async_engine, class_=AsyncSession, expire_on_commit=False
 )
@@ -41,6 +41,7 @@ from .api import (
     services,
 )
 from .tasks.message_sync import message_sync_task
+import asyncio
 import logging
 import os
 import json
@@ -143,6 +144,13 @@ async def _run_dependency_stage() -> None:
         logger.error(f"服务安装检查过程异常: {e}")
         logger.warning("系统将继续启动，但建议检查服务依赖")
 
+    try:
+        from .services.system_metrics_sampler import system_metrics_sampler
+
+        system_metrics_sampler.start()
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"系统指标采样器启动失败: {e}")
+
     try:
         from .services.service_monitor import service_monitor
 
@@ -339,6 +347,24 @@ async def _run_database_stage() -> None:
         logger.error(f"运行数据库字段修复脚本失败: {e}")
         logger.warning("将继续启动，但可能出现字段访问错误")
 
+    try:
+        from .utils.message_fts import ensure_message_fts
+
+        if ensure_message_fts():
+            logger.info("✅ 消息全文索引检查完成")
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"消息全文索引检查失败: {e}")
+        logger.warning("消息搜索和规则关键词匹配将回退为LIKE查询")
+
+    try:
+        from .utils.group_stats import ensure_group_stats
+
+        if ensure_group_stats():
+            logger.info("✅ 群组统计触发器检查完成")
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"群组统计触发器检查失败: {e}")
+        logger.warning("群组统计接口将回退为实时聚合查询")
+
     try:
         logger.info("🏥 执行数据库健康检查...")
         from pathlib import Path
@@ -364,6 +390,7 @@ async def _run_database_stage() -> None:
     try:
         logger.info("🔧 开始重置异常任务状态...")
         from .database import get_db
+        from .models.download_job import ACTIVE_JOB_STATES, JOB_KIND_TASK, DownloadJob
         from .models.rule import DownloadTask
         from sqlalchemy.orm import Session
 
@@ -371,9 +398,20 @@ async def _run_database_stage() -> None:
         db: Session = next(db_gen)
 
         try:
+            # 有活动任务作业的任务由下载作业队列恢复执行，不重置
+            resumable = (
+                db.query(DownloadJob.target_id)
+                .filter(
+                    DownloadJob.kind == JOB_KIND_TASK,
+                    DownloadJob.state.in_(ACTIVE_JOB_STATES),
+                )
+            )
             running_tasks = (
                 db.query(DownloadTask)
-                .filter(DownloadTask.status.in_(["running", "paused"]))
+                .filter(
+                    DownloadTask.status.in_(["running", "paused"]),
+                    DownloadTask.id.notin_(resumable),
+                )
                 .all()
             )
 
@@ -468,6 +506,14 @@ async def _run_service_stage() -> None:
             logger.error(f"Failed to register services: {e}")
             logger.warning("Service registration failed, some features may not work")
 
+        try:
+            from .services.download_job_queue import download_job_queue
+
+            await download_job_queue.start()
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Failed to start download job queue: {e}")
+            logger.warning("Queued downloads will not run until the job queue starts")
+
         try:
             from .services.task_scheduler import task_scheduler
 
@@ -483,6 +529,27 @@ async def _run_service_stage() -> None:
         message_sync_task.start()
         logger.info("Message sync task started")
 
+        try:
+            from .services.file_content_index import file_content_index
+
+            file_content_index.start_reconciler()
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Failed to start content index reconciler: {e}")
+
+        try:
+            from .services.progress_service import progress_service
+
+            progress_service.start()
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Failed to start progress service: {e}")
+
+        try:
+            from .services.rule_match_service import rule_match_service
+
+            rule_match_service.start()
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Failed to start rule match service: {e}")
+
         try:
             from .services.user_service import user_service
             from .database import SessionLocal
@@ -529,12 +596,36 @@ async def _shutdown_runtime() -> None:
     except Exception as e:  # noqa: BLE001
         logger.error("停止任务调度器失败", error=str(e), component="task_scheduler")
 
+    try:
+        from .services.download_job_queue import download_job_queue
+
+        await download_job_queue.stop()
+        logger.info("下载作业队列停止成功", component="download_job_queue")
+    except Exception as e:  # noqa: BLE001
+        logger.error("停止下载作业队列失败", error=str(e), component="download_job_queue")
+
     try:
         message_sync_task.stop()
         logger.info("消息同步任务停止成功", component="message_sync")
     except Exception as e:  # noqa: BLE001
         logger.error("停止消息同步任务失败", error=str(e), component="message_sync")
 
+    try:
+        from .services.file_content_index import file_content_index
+
+        file_content_index.stop_reconciler()
+        logger.info("文件内容索引对账任务停止成功", component="content_index")
+    except Exception as e:  # noqa: BLE001
+        logger.error("停止文件内容索引对账任务失败", error=str(e), component="content_index")
+
+    try:
+        from .services.download_client_pool import download_client_pool
+
+        await download_client_pool.close()
+        logger.info("下载客户端池关闭成功", component="download_client_pool")
+    except Exception as e:  # noqa: BLE001
+        logger.error("关闭下载客户端池失败", error=str(e), component="download_client_pool")
+
     try:
         from .core.session_store import close_session_store
 
@@ -575,6 +666,14 @@ async def _shutdown_runtime() -> None:
     except Exception as e:  # noqa: BLE001
         logger.error("停止服务监控器失败", error=str(e), component="service_monitor")
 
+    try:
+        from .services.system_metrics_sampler import system_metrics_sampler
+
+        system_metrics_sampler.stop()
+        logger.info("系统指标采样器停止成功", component="system_metrics")
+    except Exception as e:  # noqa: BLE001
+        logger.error("停止系统指标采样器失败", error=str(e), component="system_metrics")
+
     try:
         from .api.real_data_api import cleanup_real_data_provider
 
@@ -585,6 +684,40 @@ async def _shutdown_runtime() -> None:
             "清理真实数据提供者失败", error=str(e), component="real_data_provider"
         )
 
+    try:
+        from .services.rule_match_service import rule_match_service
+
+        await rule_match_service.stop()
+        logger.info("规则匹配结果对账任务停止成功", component="rule_match")
+    except Exception as e:  # noqa: BLE001
+        logger.error("停止规则匹配结果对账任务失败", error=str(e), component="rule_match")
+
+    try:
+        from .services.thumbnail_service import thumbnail_service
+
+        await thumbnail_service.shutdown()
+        logger.info("缩略图服务停止成功", component="thumbnail")
+    except Exception as e:  # noqa: BLE001
+        logger.error("停止缩略图服务失败", error=str(e), component="thumbnail")
+
+    try:
+        from .services.progress_service import progress_service
+
+        # 在写线程关闭前写出最后一次进度检查点
+        await progress_service.stop()
+        logger.info("进度聚合服务停止成功", component="progress_service")
+    except Exception as e:  # noqa: BLE001
+        logger.error("停止进度聚合服务失败", error=str(e), component="progress_service")
+
+    try:
+        from .utils.db_writer import db_writer
+
+        # 先处理完写队列中剩余的命令再关闭写线程
+        await asyncio.to_thread(db_writer.stop)
+        logger.info("数据库写线程停止成功", component="db_writer")
+    except Exception as e:  # noqa: BLE001
+        logger.error("停止数据库写线程失败", error=str(e), component="db_writer")
+
     try:
         from .core.temp_file_manager import temp_file_manager
 
@@ -901,6 +1034,11 @@ from .api import batch_logging_metrics
 
 app.include_router(batch_logging_metrics.router, prefix="/api", tags=["batch_logging"])
 
+# Prometheus/OpenMetrics 指标抓取端点
+from .api import metrics
+
+app.include_router(metrics.router, tags=["metrics"])
+
 # 完整真实数据提供者API
 app.include_router(real_data_api.router, tags=["real_data"])
 
@@ -971,6 +1109,7 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
     Message Types:
         - subscribe_group: 订阅群组消息更新
         - unsubscribe_group: 取消订阅群组消息
+        - subscribe / unsubscribe: 订阅或取消主题(system、logs、task:<id>、group:<id>、downloads)
         - ping: 心跳检测消息
 
     Response Types:
@@ -995,6 +1134,13 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
     """
     await websocket_manager.connect(websocket, client_id)
 
+    # 新连接的客户端先收到当前进度快照，之后只接收增量推送
+    from .services.progress_service import progress_service
+
+    await websocket_manager.send_personal_message(
+        {"type": "progress_snapshot", "data": progress_service.snapshot()}, client_id
+    )
+
     # 存储客户端订阅的群组
     client_subscriptions = set()
 
@@ -1012,6 +1158,9 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                     group_id = message.get("group_id")
                     if group_id:
                         client_subscriptions.add(group_id)
+                        websocket_manager.subscribe(
+                            client_id, [f"group:{group_id}"], exclusive=False
+                        )
                         logger.info(
                             f"Client {client_id} subscribed to group {group_id}"
                         )
@@ -1033,6 +1182,7 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                     group_id = message.get("group_id")
                     if group_id and group_id in client_subscriptions:
                         client_subscriptions.remove(group_id)
+                        websocket_manager.unsubscribe(client_id, [f"group:{group_id}"])
                         logger.info(
                             f"Client {client_id} unsubscribed from group {group_id}"
                         )
@@ -1046,6 +1196,18 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                             client_id,
                         )
 
+                elif message_type in ("subscribe", "unsubscribe"):
+                    # 主题订阅: {"type": "subscribe", "topics": ["task:12", "logs"]}
+                    topics = message.get("topics") or []
+                    if message_type == "subscribe":
+                        current = websocket_manager.subscribe(client_id, topics)
+                    else:
+                        current = websocket_manager.unsubscribe(client_id, topics)
+                    await websocket_manager.send_personal_message(
+                        {"type": f"{message_type}_confirmed", "data": {"topics": current}},
+                        client_id,
+                    )
+
                 elif message_type == "ping":
                     # 心跳检测
                     await websocket_manager.send_personal_message(
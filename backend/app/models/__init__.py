@@ -10,4 +10,8 @@ from .rule import *
 from .task_rule_association import TaskRuleAssociation
 from .log import *
 from .telegram import *
-from .config import *
\ No newline at end of file
+from .config import *
+from .file_index import *
+from .rule_match import *
+from .group_stats import *
+from .download_job import *
\ No newline at end of file
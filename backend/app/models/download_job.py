@@ -0,0 +1,62 @@
+"""TgGod 下载作业队列模型
+
+- DownloadJob: 持久化的下载作业，手动下载(单个/批量)和下载任务的执行都登记为作业
+
+作业状态流转:
+    queued -> leased -> succeeded / failed / cancelled
+    leased --(失败且未达最大尝试次数)--> queued(available_at 推迟重试)
+    leased --(租约过期，执行进程已退出)--> queued
+
+执行进程通过一条 UPDATE ... RETURNING 批量认领作业并写入 worker_id 和租约到期时间，
+执行期间定期续租。进程重启后，过期租约的作业回到队列继续执行，不会丢失。
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, String, Text
+from sqlalchemy.sql import func
+from ..database import Base
+
+JOB_KIND_MEDIA = "media"  # 手动下载单个消息的媒体，target_id 为 Telegram 消息ID
+JOB_KIND_TASK = "task"    # 执行一次下载任务，target_id 为 download_tasks.id
+
+JOB_QUEUED = "queued"
+JOB_LEASED = "leased"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+ACTIVE_JOB_STATES = (JOB_QUEUED, JOB_LEASED)
+
+
+class DownloadJob(Base):
+    __tablename__ = "download_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(20), nullable=False, default=JOB_KIND_MEDIA)
+    target_id = Column(Integer, nullable=False)
+    group_id = Column(Integer, nullable=True)  # telegram_groups.id，用于按群组限制并发
+    user_id = Column(Integer, nullable=True)  # 发起用户，为空时视为同一个匿名用户
+    batch_id = Column(String(32), nullable=True)
+    force = Column(Boolean, nullable=False, default=False)
+    state = Column(String(20), nullable=False, default=JOB_QUEUED)
+    priority = Column(Integer, nullable=False, default=0)  # 数值越大越先执行
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    worker_id = Column(String(64), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    available_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())  # 失败重试的退避时间
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # 认领: 按状态取出排队作业后按优先级排序
+        Index("ix_download_jobs_claim", "state", "kind", "priority", "id"),
+        Index("ix_download_jobs_target", "kind", "target_id", "state"),
+        Index("ix_download_jobs_lease", "state", "lease_expires_at"),
+        Index("ix_download_jobs_batch", "batch_id"),
+    )
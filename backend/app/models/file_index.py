@@ -0,0 +1,34 @@
+"""TgGod 文件内容索引模型
+
+- FileContentIndex: 已整理文件的内容指纹，用于下载去重
+
+每个文件按 大小 -> 局部哈希 -> 完整哈希 三级指纹索引。去重时先按大小命中候选，
+再比较局部哈希，只有局部哈希也相同时才需要完整哈希(惰性计算并回写)。
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+from sqlalchemy import Column, Integer, String, DateTime, BigInteger, Float, Index
+from sqlalchemy.sql import func
+from ..database import Base
+
+
+class FileContentIndex(Base):
+    __tablename__ = "file_content_index"
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_path = Column(String(1000), nullable=False, unique=True)
+    file_size = Column(BigInteger, nullable=False)
+    mtime = Column(Float, nullable=False)  # 建立索引时的修改时间，用于判断文件是否被外部改动
+    partial_hash = Column(String(64), nullable=False)  # 文件大小 + 头尾各64KB的SHA256
+    full_hash = Column(String(64), nullable=True)  # 完整SHA256，首次发生局部哈希冲突时计算
+    verified_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_file_content_index_size_partial", "file_size", "partial_hash"),
+        Index("ix_file_content_index_full_hash", "full_hash"),
+    )
+
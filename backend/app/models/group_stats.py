@@ -0,0 +1,46 @@
+"""TgGod 群组统计模型
+
+- GroupStats: 每个群组的消息分类计数，由 telegram_messages 上的触发器增量维护
+- GroupActivityHourly: 按小时汇总的新消息数和新下载数，用于最近24小时统计
+
+统计接口只需按主键读取一行，不再对消息表做 COUNT 扫描。
+计数可通过 app.utils.group_stats.rebuild_group_stats() 从消息表全量重建。
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from ..database import Base
+
+
+class GroupStats(Base):
+    __tablename__ = "group_stats"
+
+    group_id = Column(Integer, ForeignKey("telegram_groups.id", ondelete="CASCADE"), primary_key=True)
+    total_messages = Column(Integer, nullable=False, default=0)
+    media_messages = Column(Integer, nullable=False, default=0)
+    photo_messages = Column(Integer, nullable=False, default=0)
+    video_messages = Column(Integer, nullable=False, default=0)
+    document_messages = Column(Integer, nullable=False, default=0)
+    audio_messages = Column(Integer, nullable=False, default=0)
+    voice_messages = Column(Integer, nullable=False, default=0)
+    sticker_messages = Column(Integer, nullable=False, default=0)
+    video_note_messages = Column(Integer, nullable=False, default=0)
+    forwarded_messages = Column(Integer, nullable=False, default=0)
+    pinned_messages = Column(Integer, nullable=False, default=0)
+    reaction_messages = Column(Integer, nullable=False, default=0)
+    downloaded_messages = Column(Integer, nullable=False, default=0)
+    downloaded_media_size = Column(BigInteger, nullable=False, default=0)  # 已下载媒体总大小（字节）
+    last_message_date = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class GroupActivityHourly(Base):
+    __tablename__ = "group_activity_hourly"
+
+    group_id = Column(Integer, ForeignKey("telegram_groups.id", ondelete="CASCADE"), primary_key=True)
+    hour_start = Column(String(19), primary_key=True)  # UTC 'YYYY-MM-DD HH:00:00'
+    new_messages = Column(Integer, nullable=False, default=0)
+    new_downloads = Column(Integer, nullable=False, default=0)
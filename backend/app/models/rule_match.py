@@ -0,0 +1,47 @@
+"""TgGod 规则匹配结果模型
+
+- RuleMessageMatch: 消息入库时由规则引擎写入的 (规则, 消息) 匹配结果
+- RuleMatchState: 每个 (规则, 群组) 的匹配结果是否完整可用
+
+任务开始时只需按 (group_id, rule_id, message_date) 覆盖索引做一次范围读取，
+不再重新扫描整个群组。规则条件变化后指纹改变，对应结果由后台任务增量重建。
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from ..database import Base
+
+
+class RuleMessageMatch(Base):
+    __tablename__ = "rule_message_matches"
+
+    rule_id = Column(Integer, ForeignKey("filter_rules.id", ondelete="CASCADE"), primary_key=True)
+    message_id = Column(Integer, ForeignKey("telegram_messages.id", ondelete="CASCADE"), primary_key=True)  # telegram_messages.id
+    group_id = Column(Integer, nullable=False)
+    message_date = Column(DateTime(timezone=True), nullable=False)  # 冗余消息时间，范围读取无需回表
+    matched_keyword = Column(String(255), nullable=True)
+    matched_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # 覆盖索引: 任务开始时的范围读取只访问索引
+        Index(
+            "ix_rule_message_matches_lookup",
+            "group_id", "rule_id", "message_date", "message_id", "matched_keyword",
+        ),
+        Index("ix_rule_message_matches_message", "message_id"),
+    )
+
+
+class RuleMatchState(Base):
+    __tablename__ = "rule_match_state"
+
+    rule_id = Column(Integer, ForeignKey("filter_rules.id", ondelete="CASCADE"), primary_key=True)
+    group_id = Column(Integer, primary_key=True)
+    fingerprint = Column(String(64), nullable=False)  # 规则筛选条件的哈希
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, ready
+    scanned_through_id = Column(Integer, nullable=False, default=0)  # 已回填到的消息主键
+    high_water_id = Column(Integer, nullable=True)  # 开始回填时的最大消息主键，之后的消息由入库匹配覆盖
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
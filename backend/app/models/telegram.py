@@ -23,11 +23,15 @@ Author: TgGod Team
 Version: 1.0.0
 """
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, BigInteger, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, BigInteger, ForeignKey, JSON, Index
+from sqlalchemy import text as sql_text  # 避免与 TelegramMessage.text 列重名
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
 
+# 媒体消息的部分索引条件。查询中需以字面量形式出现相同条件，SQLite才会选用该部分索引
+MEDIA_ROWS_CONDITION = "media_type IS NOT NULL AND media_type != 'text'"
+
 class TelegramGroup(Base):
     """Telegram群组数据模型
 
@@ -157,11 +161,10 @@ class TelegramMessage(Base):
         group: 所属的Telegram群组对象
 
     Indexes:
-        - group_id: 群组内消息查询
-        - message_id: Telegram消息ID查询
-        - date: 时间范围查询
-        - media_type: 媒体类型过滤
-        - sender_username: 发送者查询
+        - (group_id, message_id): 唯一索引，消息去重和按Telegram消息ID查询
+        - (group_id, date DESC): 群组内按时间倒序分页
+        - (group_id, media_type, date): 部分索引，仅包含媒体消息，用于规则筛选
+        - media_downloaded / is_downloading: 下载状态过滤
 
     Constraints:
         - group_id: 必须关联到存在的群组
@@ -253,5 +256,15 @@ class TelegramMessage(Base):
     
     # 创建复合索引
     __table_args__ = (
+        Index("uq_telegram_messages_group_message", "group_id", "message_id", unique=True),
+        Index("ix_telegram_messages_group_date", "group_id", date.desc()),
+        Index(
+            "ix_telegram_messages_group_media_date",
+            "group_id", "media_type", "date",
+            sqlite_where=sql_text(MEDIA_ROWS_CONDITION),
+            postgresql_where=sql_text(MEDIA_ROWS_CONDITION),
+        ),
+        Index("ix_telegram_messages_media_downloaded", "media_downloaded"),
+        Index("ix_telegram_messages_is_downloading", "is_downloading"),
         {"mysql_engine": "InnoDB"},
     )
\ No newline at end of file
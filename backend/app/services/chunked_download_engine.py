@@ -0,0 +1,342 @@
+"""Telegram大文件并行分片下载引擎
+
+基于Telethon底层的分片文件请求(upload.GetFile / iter_download)，
+对同一个文档的多个字节区间并发下载，并通过pwrite直接写入预分配的文件。
+
+主要功能:
+- 多个分片并发拉取，单文件吞吐不再受限于一条请求流
+- 预分配目标文件，按偏移量写入，无需在内存中拼接
+- 分片位图检查点，进程崩溃或超时后从已完成分片继续
+- 按文件大小动态计算超时时间
+
+File Layout:
+    - <file_path>.part: 预分配的下载中文件
+    - <file_path>.parts: 分片位图检查点(JSON)
+    下载完成后 .part 原子重命名为目标文件，检查点被删除。
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from telethon.errors import FloodWaitError
+
+from ..config import settings
+from ..core.rate_governor import RPC_GET_FILE, rate_governor
+
+logger = logging.getLogger(__name__)
+
+# upload.GetFile 要求 limit 整除 1MB 且 offset 按 4KB 对齐，1MB 分片同时满足两者
+DEFAULT_PART_SIZE = 1024 * 1024
+PART_ALIGNMENT = 4096
+CHECKPOINT_VERSION = 1
+
+
+def compute_download_timeout(file_size: Optional[int]) -> float:
+    """根据文件大小计算整体下载超时时间(秒)
+
+    超时 = 基础超时 + 文件大小 / 最低可接受吞吐量，
+    避免多GB视频因固定超时而失败，同时小文件仍能快速失败。
+    """
+    base_timeout = settings.download_base_timeout
+    min_throughput = max(1, settings.download_min_throughput_kbps) * 1024
+    if not file_size:
+        return base_timeout
+    return base_timeout + file_size / min_throughput
+
+
+class PartBitmap:
+    """分片完成位图"""
+
+    def __init__(self, total_parts: int, data: Optional[bytes] = None):
+        self.total_parts = total_parts
+        size = (total_parts + 7) // 8
+        self._bits = bytearray(data) if data is not None and len(data) == size else bytearray(size)
+
+    def set(self, index: int):
+        self._bits[index >> 3] |= 1 << (index & 7)
+
+    def is_set(self, index: int) -> bool:
+        return bool(self._bits[index >> 3] & (1 << (index & 7)))
+
+    def missing(self) -> List[int]:
+        return [i for i in range(self.total_parts) if not self.is_set(i)]
+
+    def count(self) -> int:
+        return sum(bin(b).count("1") for b in self._bits)
+
+    def to_hex(self) -> str:
+        return self._bits.hex()
+
+    @classmethod
+    def from_hex(cls, total_parts: int, value: str) -> "PartBitmap":
+        return cls(total_parts, bytes.fromhex(value))
+
+
+class ChunkedDownloadEngine:
+    """并行分片下载器
+
+    Args:
+        client: 已连接的Telethon客户端
+        media: 消息媒体对象(MessageMediaDocument/Document)
+        file_path: 目标文件路径
+        file_size: 文件总大小(字节)
+        media_id: 媒体ID，用于校验检查点是否属于同一文件
+        part_size: 分片大小，必须按4KB对齐
+        concurrency: 并发分片数
+        progress_callback: 进度回调 (current, total)
+
+    Example:
+        ```python
+        engine = ChunkedDownloadEngine(client, message.media, path, doc.size, media_id=doc.id)
+        await engine.download()
+        ```
+    """
+
+    def __init__(self, client, media, file_path: str, file_size: int,
+                 media_id: Optional[int] = None, part_size: int = DEFAULT_PART_SIZE,
+                 concurrency: Optional[int] = None,
+                 progress_callback: Optional[Callable[[int, int], Any]] = None,
+                 checkpoint_interval: float = 2.0, max_part_retries: int = 3):
+        if part_size % PART_ALIGNMENT != 0:
+            raise ValueError(f"分片大小必须按{PART_ALIGNMENT}字节对齐: {part_size}")
+
+        self.client = client
+        self.media = media
+        self.file_path = file_path
+        self.file_size = file_size
+        self.media_id = media_id
+        self.part_size = part_size
+        self.concurrency = max(1, concurrency or settings.parallel_download_parts)
+        self.progress_callback = progress_callback
+        self.checkpoint_interval = checkpoint_interval
+        self.max_part_retries = max_part_retries
+
+        self.temp_path = f"{file_path}.part"
+        self.state_path = f"{file_path}.parts"
+        self.total_parts = (file_size + part_size - 1) // part_size
+
+        self.bitmap = PartBitmap(self.total_parts)
+        self.bytes_done = 0
+        self.resumed_parts = 0
+
+        self._fd: Optional[int] = None
+        self._write_lock = threading.Lock()  # 仅用于不支持pwrite的平台
+        self._last_checkpoint = 0.0
+        self._dirty_parts = 0
+        self._checkpoint_lock = asyncio.Lock()
+
+    def _part_length(self, index: int) -> int:
+        offset = index * self.part_size
+        return min(self.part_size, self.file_size - offset)
+
+    def _load_checkpoint(self) -> bool:
+        """加载检查点，仅当文件大小、分片大小和媒体ID都一致时才复用"""
+        if not (os.path.exists(self.state_path) and os.path.exists(self.temp_path)):
+            return False
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if (state.get("version") != CHECKPOINT_VERSION
+                    or state.get("file_size") != self.file_size
+                    or state.get("part_size") != self.part_size
+                    or state.get("media_id") != self.media_id
+                    or os.path.getsize(self.temp_path) != self.file_size):
+                return False
+            self.bitmap = PartBitmap.from_hex(self.total_parts, state["bitmap"])
+            self.resumed_parts = self.bitmap.count()
+            self.bytes_done = sum(self._part_length(i) for i in range(self.total_parts) if self.bitmap.is_set(i))
+            return True
+        except Exception as e:
+            logger.warning(f"读取分片检查点失败，重新下载: {self.state_path}: {e}")
+            return False
+
+    def _write_checkpoint(self, state: Dict[str, Any]):
+        """在工作线程中落盘检查点(先fsync数据，再原子替换检查点文件)"""
+        if self._fd is not None:
+            os.fsync(self._fd)
+        tmp_state = f"{self.state_path}.tmp"
+        with open(tmp_state, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_state, self.state_path)
+
+    async def _save_checkpoint(self, force: bool = False):
+        """落盘分片位图
+
+        位图快照在事件循环中生成，fsync和文件写入放到工作线程执行；
+        已有检查点正在写入时，非强制保存直接跳过。
+        """
+        now = time.monotonic()
+        if not force and (self._dirty_parts == 0 or now - self._last_checkpoint < self.checkpoint_interval
+                          or self._checkpoint_lock.locked()):
+            return
+        async with self._checkpoint_lock:
+            dirty = self._dirty_parts
+            state = {
+                "version": CHECKPOINT_VERSION,
+                "file_size": self.file_size,
+                "part_size": self.part_size,
+                "media_id": self.media_id,
+                "bitmap": self.bitmap.to_hex(),
+                "completed_parts": self.bitmap.count(),
+                "total_parts": self.total_parts,
+                "updated_at": time.time(),
+            }
+            try:
+                await asyncio.to_thread(self._write_checkpoint, state)
+                self._last_checkpoint = now
+                # 写入期间完成的分片不在快照中，保留到下次保存
+                self._dirty_parts -= dirty
+            except Exception as e:
+                logger.warning(f"保存分片检查点失败: {e}")
+
+    def _prepare_file(self):
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+        if not self._load_checkpoint():
+            self.bitmap = PartBitmap(self.total_parts)
+            self.bytes_done = 0
+            self.resumed_parts = 0
+            with open(self.temp_path, "wb") as f:
+                if hasattr(os, "posix_fallocate") and self.file_size > 0:
+                    try:
+                        os.posix_fallocate(f.fileno(), 0, self.file_size)
+                    except OSError:
+                        f.truncate(self.file_size)
+                else:
+                    f.truncate(self.file_size)
+        self._fd = os.open(self.temp_path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+
+    def _write_part(self, offset: int, data: bytes):
+        if hasattr(os, "pwrite"):
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(self._fd, view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            with self._write_lock:
+                os.lseek(self._fd, offset, os.SEEK_SET)
+                os.write(self._fd, data)
+
+    async def _fetch_part(self, index: int) -> bytes:
+        offset = index * self.part_size
+        expected = self._part_length(index)
+        chunks = []
+        async for chunk in self.client.iter_download(
+            self.media,
+            offset=offset,
+            request_size=self.part_size,
+            limit=1,
+            file_size=self.file_size,
+        ):
+            chunks.append(chunk)
+        data = b"".join(chunks)[:expected]
+        if len(data) != expected:
+            raise IOError(f"分片 {index} 数据不完整: {len(data)}/{expected}")
+        return data
+
+    async def _download_part(self, index: int):
+        part_timeout = compute_download_timeout(self._part_length(index))
+        for attempt in range(self.max_part_retries):
+            try:
+                async with rate_governor.throttled(RPC_GET_FILE):
+                    data = await asyncio.wait_for(self._fetch_part(index), timeout=part_timeout)
+                await asyncio.to_thread(self._write_part, index * self.part_size, data)
+                return len(data)
+            except FloodWaitError as e:
+                # 限速器已让所有分片和其他下载一起停发，重试时在获取令牌处等待
+                if attempt == self.max_part_retries - 1 or e.seconds > rate_governor.max_flood_wait:
+                    raise
+                logger.warning(f"分片 {index} 遇到Flood Wait {e.seconds}秒，限速后重试")
+            except (asyncio.TimeoutError, IOError, ConnectionError) as e:
+                if attempt == self.max_part_retries - 1:
+                    raise
+                logger.warning(f"分片 {index} 下载失败 (尝试 {attempt + 1}/{self.max_part_retries}): {e}")
+                await asyncio.sleep(1 + attempt)
+
+    def _report_progress(self):
+        if not self.progress_callback:
+            return
+        try:
+            self.progress_callback(self.bytes_done, self.file_size)
+        except Exception as e:
+            logger.warning(f"分片下载进度回调失败: {e}")
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            try:
+                index = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            written = await self._download_part(index)
+            self.bitmap.set(index)
+            self.bytes_done += written
+            self._dirty_parts += 1
+            self._report_progress()
+            await self._save_checkpoint()
+
+    async def download(self) -> bool:
+        """执行分片下载
+
+        Returns:
+            bool: 下载成功返回True
+
+        Raises:
+            Exception: 任一分片重试耗尽后抛出，已完成的分片保留在检查点中
+        """
+        self._prepare_file()
+        try:
+            missing = self.bitmap.missing()
+            if self.resumed_parts:
+                logger.info(f"从检查点恢复下载: {self.resumed_parts}/{self.total_parts} 个分片已完成 - {self.file_path}")
+            self._report_progress()
+
+            queue: asyncio.Queue = asyncio.Queue()
+            for index in missing:
+                queue.put_nowait(index)
+
+            workers = [
+                asyncio.create_task(self._worker(queue))
+                for _ in range(min(self.concurrency, len(missing)))
+            ]
+            try:
+                await asyncio.gather(*workers)
+            except BaseException:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                raise
+            finally:
+                await self._save_checkpoint(force=True)
+
+            await asyncio.to_thread(os.fsync, self._fd)
+        finally:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+        os.replace(self.temp_path, self.file_path)
+        try:
+            os.remove(self.state_path)
+        except OSError:
+            pass
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "file_path": self.file_path,
+            "file_size": self.file_size,
+            "part_size": self.part_size,
+            "total_parts": self.total_parts,
+            "completed_parts": self.bitmap.count(),
+            "resumed_parts": self.resumed_parts,
+            "bytes_done": self.bytes_done,
+            "concurrency": self.concurrency,
+        }
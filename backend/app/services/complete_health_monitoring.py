@@ -30,7 +30,6 @@ import threading
 import time
 import logging
 import json
-import psutil
 import sqlite3
 from collections import defaultdict, deque
 from contextlib import asynccontextmanager
@@ -57,6 +56,7 @@ from ..core.batch_logging import HighPerformanceLogger, get_batch_handler
 from .service_monitor import service_monitor
 from .connection_pool_monitor import get_pool_monitor
 from .memory_monitoring_service import memory_monitoring_service
+from .system_metrics_sampler import get_system_metrics_sampler
 
 
 class MonitoringLevel(Enum):
@@ -167,7 +167,6 @@ class SystemHealthProvider(HealthCheckProvider):
 
     def __init__(self):
         super().__init__("system", priority=100)
-        self.process = psutil.Process()
 
     async def check_health(self) -> ServiceHealth:
         """检查系统健康状况"""
@@ -177,8 +176,11 @@ class SystemHealthProvider(HealthCheckProvider):
         recommendations = []
 
         try:
+            # 指标来自系统指标采样器的最新快照，不在事件循环中阻塞采样
+            snapshot = get_system_metrics_sampler().latest()
+
             # CPU指标
-            cpu_percent = self.process.cpu_percent(interval=0.1)
+            cpu_percent = snapshot.process_cpu_percent
             metrics.append(HealthMetric(
                 name="cpu_usage",
                 value=cpu_percent,
@@ -193,8 +195,7 @@ class SystemHealthProvider(HealthCheckProvider):
                 recommendations.append("检查高CPU进程并优化")
 
             # 内存指标
-            memory_info = self.process.memory_info()
-            memory_percent = self.process.memory_percent()
+            memory_percent = snapshot.process_memory_percent
             metrics.append(HealthMetric(
                 name="memory_usage",
                 value=memory_percent,
@@ -209,7 +210,7 @@ class SystemHealthProvider(HealthCheckProvider):
                 recommendations.append("释放内存或增加内存容量")
 
             # 磁盘指标
-            disk_usage = psutil.disk_usage('/').percent
+            disk_usage = snapshot.disk.percent if snapshot.disk else 0.0
             metrics.append(HealthMetric(
                 name="disk_usage",
                 value=disk_usage,
@@ -224,12 +225,10 @@ class SystemHealthProvider(HealthCheckProvider):
                 recommendations.append("清理磁盘空间或扩容")
 
             # 网络指标
-            net_io = psutil.net_io_counters()
-            if hasattr(net_io, 'errin') and net_io.packets_recv > 0:
-                error_rate = (net_io.errin + net_io.errout) / (net_io.packets_recv + net_io.packets_sent)
+            if snapshot.net_packets_recv > 0:
                 metrics.append(HealthMetric(
                     name="network_error_rate",
-                    value=error_rate,
+                    value=snapshot.network_error_rate,
                     unit="ratio",
                     timestamp=time.time(),
                     threshold_warning=0.01,
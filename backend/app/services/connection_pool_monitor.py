@@ -16,7 +16,6 @@ Version: 1.0.0
 import time
 import logging
 import threading
-import psutil
 from typing import Dict, List, Optional, Any
 from datetime import datetime, timedelta
 from sqlalchemy import create_engine, text
@@ -0,0 +1,449 @@
+"""Telegram下载客户端池
+
+为媒体下载维护一组长连接的已授权Telethon客户端，避免每个文件都复制
+session、建立MTProto握手并在下载完成后断开。
+
+主要功能:
+- 固定大小的客户端池，按需懒加载连接
+- 租约式借出/归还，归还时检查客户端健康状态
+- 空闲超时自动断开，下次租用时透明重连
+- 按数据中心(DC)亲和性优先分配客户端，复用已导出的DC授权
+- 租约次数、等待延迟、持有时长等指标统计
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+from telethon import TelegramClient
+from telethon.errors import AuthKeyUnregisteredError
+
+from ..config import settings
+from ..core.temp_file_manager import temp_file
+
+logger = logging.getLogger(__name__)
+
+SESSION_DIR = "./telegram_sessions"
+MAIN_SESSION_NAME = "tggod_session"
+
+
+@dataclass
+class PooledClient:
+    """池中的单个客户端槽位"""
+    index: int
+    session_name: str
+    client: Optional[TelegramClient] = None
+    leased: bool = False
+    healthy: bool = True
+    last_used: float = field(default_factory=time.time)
+    lease_count: int = 0
+    error_count: int = 0
+    connect_count: int = 0
+    served_dcs: Dict[int, int] = field(default_factory=dict)
+
+    @property
+    def connected(self) -> bool:
+        try:
+            return self.client is not None and self.client.is_connected()
+        except Exception:
+            return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "connected": self.connected,
+            "leased": self.leased,
+            "healthy": self.healthy,
+            "idle_seconds": round(time.time() - self.last_used, 1),
+            "lease_count": self.lease_count,
+            "error_count": self.error_count,
+            "connect_count": self.connect_count,
+            "served_dcs": dict(self.served_dcs),
+        }
+
+
+class DownloadClientPool:
+    """长连接下载客户端池
+
+    Attributes:
+        size (int): 池中最大客户端数量
+        idle_timeout (float): 客户端空闲多久后断开(秒)
+        dc_affinity (bool): 是否启用DC亲和性分配
+
+    Example:
+        ```python
+        async with download_client_pool.lease(chat_id=chat_id) as client:
+            message = await client.get_messages(chat_id, ids=message_id)
+            download_client_pool.record_dc(chat_id, client, dc_id)
+        ```
+
+    Note:
+        - 每个槽位只在首次连接(或主session更新后)复制一次主session
+        - 连接建立受信号量限制，避免与主服务争用session数据库
+    """
+
+    def __init__(self, size: Optional[int] = None, idle_timeout: Optional[float] = None,
+                 dc_affinity: Optional[bool] = None, max_history: int = 1000):
+        self._size = size
+        self._idle_timeout = idle_timeout
+        self._dc_affinity = dc_affinity
+
+        self._slots: List[PooledClient] = []
+        self._condition: Optional[asyncio.Condition] = None
+        self._connect_semaphore: Optional[asyncio.Semaphore] = None
+        self._reaper_task: Optional[asyncio.Task] = None
+        self._start_lock = asyncio.Lock()
+        self._started = False
+
+        # DC亲和性: dc_id -> 槽位索引, chat_id -> dc_id
+        self._dc_slot: Dict[int, int] = {}
+        self._chat_dc: Dict[int, int] = {}
+
+        # 指标
+        self._wait_times: Deque[float] = deque(maxlen=max_history)
+        self._lease_durations: Deque[float] = deque(maxlen=max_history)
+        self._total_leases = 0
+        self._affinity_hits = 0
+        self._affinity_misses = 0
+        self._lease_errors = 0
+        self._waiting = 0
+        self._peak_waiting = 0
+
+    @property
+    def size(self) -> int:
+        if self._size is None:
+            self._size = max(1, settings.download_pool_size)
+        return self._size
+
+    @property
+    def idle_timeout(self) -> float:
+        if self._idle_timeout is None:
+            self._idle_timeout = settings.download_pool_idle_timeout
+        return self._idle_timeout
+
+    @property
+    def dc_affinity(self) -> bool:
+        if self._dc_affinity is None:
+            self._dc_affinity = settings.download_pool_dc_affinity
+        return self._dc_affinity
+
+    async def start(self):
+        """启动客户端池并预热一个连接以校验授权状态
+
+        Raises:
+            ValueError: 主session不存在或API配置不完整
+            AuthKeyUnregisteredError: 主session未授权
+        """
+        if self._started:
+            return
+
+        async with self._start_lock:
+            if self._started:
+                return
+
+            self._condition = asyncio.Condition()
+            self._connect_semaphore = asyncio.Semaphore(2)
+            self._slots = [
+                PooledClient(index=i, session_name=os.path.join(SESSION_DIR, f"download_pool_{i}"))
+                for i in range(self.size)
+            ]
+
+            # 预热第一个槽位，尽早暴露认证问题
+            await self._connect_slot(self._slots[0])
+
+            self._started = True
+            if self.idle_timeout > 0:
+                self._reaper_task = asyncio.create_task(self._idle_reaper_loop())
+
+            logger.info(f"下载客户端池已启动: size={self.size}, idle_timeout={self.idle_timeout}s, "
+                        f"dc_affinity={self.dc_affinity}")
+
+    @asynccontextmanager
+    async def lease(self, chat_id: Optional[int] = None, dc_id: Optional[int] = None):
+        """租用一个已连接且已授权的客户端
+
+        Args:
+            chat_id: 目标聊天ID，用于查找该聊天媒体所在的DC
+            dc_id: 已知的媒体DC，优先于chat_id推断
+
+        Yields:
+            TelegramClient: 已连接的客户端，离开上下文后自动归还
+        """
+        await self.start()
+
+        if dc_id is None and chat_id is not None:
+            dc_id = self._chat_dc.get(chat_id)
+
+        wait_start = time.perf_counter()
+        slot = await self._acquire(dc_id)
+        self._wait_times.append(time.perf_counter() - wait_start)
+
+        lease_start = time.perf_counter()
+        try:
+            if not slot.connected or not slot.healthy:
+                await self._connect_slot(slot)
+            yield slot.client
+        except Exception:
+            slot.error_count += 1
+            self._lease_errors += 1
+            raise
+        finally:
+            self._lease_durations.append(time.perf_counter() - lease_start)
+            await self._release(slot)
+
+    def record_dc(self, chat_id: Optional[int], client: TelegramClient, dc_id: Optional[int]):
+        """记录某次下载实际使用的DC，用于后续亲和性分配"""
+        if not dc_id:
+            return
+        if chat_id is not None:
+            self._chat_dc[chat_id] = dc_id
+        for slot in self._slots:
+            if slot.client is client:
+                slot.served_dcs[dc_id] = slot.served_dcs.get(dc_id, 0) + 1
+                self._dc_slot.setdefault(dc_id, slot.index)
+                break
+
+    def mark_unhealthy(self, client: TelegramClient):
+        """标记客户端不健康，归还时将断开并在下次租用时重建"""
+        for slot in self._slots:
+            if slot.client is client:
+                slot.healthy = False
+                break
+
+    async def rebuild(self, client: TelegramClient) -> TelegramClient:
+        """在租用期内就地重建客户端(重新复制session副本并重连)，返回新的客户端
+
+        用于session副本损坏(如只读数据库错误)后的重试，只能由持有该客户端租约的调用方使用。
+        重建失败时异常向上抛出，槽位在归还后的下次租用时重新连接。
+        """
+        for slot in self._slots:
+            if slot.client is client and slot.leased:
+                await self._connect_slot(slot, refresh_session=True)
+                logger.info(f"下载客户端 #{slot.index} 已重建")
+                return slot.client
+        raise ValueError("客户端不属于当前租约，无法重建")
+
+    async def _acquire(self, dc_id: Optional[int]) -> PooledClient:
+        async with self._condition:
+            self._waiting += 1
+            self._peak_waiting = max(self._peak_waiting, self._waiting)
+            try:
+                while True:
+                    slot = self._pick_slot(dc_id)
+                    if slot is not None:
+                        slot.leased = True
+                        slot.lease_count += 1
+                        self._total_leases += 1
+                        return slot
+                    await self._condition.wait()
+            finally:
+                self._waiting -= 1
+
+    def _pick_slot(self, dc_id: Optional[int]) -> Optional[PooledClient]:
+        free = [slot for slot in self._slots if not slot.leased]
+        if not free:
+            return None
+
+        if self.dc_affinity and dc_id is not None:
+            preferred = self._dc_slot.get(dc_id)
+            for slot in free:
+                if slot.index == preferred:
+                    self._affinity_hits += 1
+                    return slot
+            self._affinity_misses += 1
+
+        # 优先复用已连接的客户端，其次最近最少使用的
+        connected = [slot for slot in free if slot.connected and slot.healthy]
+        candidates = connected or free
+        return min(candidates, key=lambda s: s.last_used)
+
+    async def _release(self, slot: PooledClient):
+        if not slot.healthy:
+            await self._disconnect_slot(slot)
+            slot.healthy = True
+        slot.last_used = time.time()
+        async with self._condition:
+            slot.leased = False
+            self._condition.notify()
+
+    async def _connect_slot(self, slot: PooledClient, refresh_session: bool = False):
+        """为槽位建立连接(必要时刷新session副本，refresh_session为True时强制重新复制)"""
+        await self._disconnect_slot(slot)
+
+        api_id = settings.telegram_api_id
+        api_hash = settings.telegram_api_hash
+        if not api_id or not api_hash:
+            raise ValueError(f"Telegram API配置不完整: API ID={api_id}, API Hash={'已设置' if api_hash else '未设置'}")
+
+        self._refresh_session_copy(slot.session_name, force=refresh_session)
+
+        client = TelegramClient(
+            slot.session_name,
+            api_id,
+            api_hash,
+            connection_retries=3,
+            retry_delay=2,
+            timeout=30,
+            use_ipv6=False
+        )
+
+        try:
+            async with self._connect_semaphore:
+                await client.connect()
+            authorized = await client.is_user_authorized()
+        except BaseException:
+            # 连接或授权检查失败时关闭半开的客户端，避免泄漏连接和session文件句柄
+            await self._close_client(client)
+            raise
+
+        if not authorized:
+            await self._close_client(client)
+            raise AuthKeyUnregisteredError("主session未授权，请重新认证Telegram服务")
+
+        slot.client = client
+        slot.healthy = True
+        slot.connect_count += 1
+        slot.last_used = time.time()
+        logger.info(f"下载客户端 #{slot.index} 已连接")
+
+    @staticmethod
+    async def _close_client(client: TelegramClient):
+        try:
+            await client.disconnect()
+        except Exception:
+            pass
+
+    def _refresh_session_copy(self, session_name: str, force: bool = False):
+        """仅在副本缺失或主session更新时复制主session(force为True时总是复制)"""
+        main_session_file = os.path.join(SESSION_DIR, f"{MAIN_SESSION_NAME}.session")
+        target_file = f"{session_name}.session"
+
+        if not os.path.exists(main_session_file):
+            raise ValueError("主session文件不存在，请确保主服务已完成认证")
+
+        if (not force and os.path.exists(target_file)
+                and os.path.getmtime(target_file) >= os.path.getmtime(main_session_file)):
+            return
+
+        os.makedirs(SESSION_DIR, exist_ok=True)
+        with temp_file(suffix='.session', purpose='session_copy') as temp_path:
+            with open(main_session_file, 'rb') as src, open(temp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            shutil.move(temp_path, target_file)
+        os.chmod(target_file, 0o666)
+        logger.info(f"已刷新下载客户端session副本: {target_file}")
+
+    async def _disconnect_slot(self, slot: PooledClient):
+        if slot.client is None:
+            return
+        try:
+            await slot.client.disconnect()
+        except Exception as e:
+            # SQLite只读错误不影响断开
+            logger.warning(f"断开下载客户端 #{slot.index} 时出错: {e}")
+        finally:
+            slot.client = None
+            for dc_id, index in list(self._dc_slot.items()):
+                if index == slot.index:
+                    del self._dc_slot[dc_id]
+
+    async def _idle_reaper_loop(self):
+        """定期断开空闲超时的客户端(保留至少一个热连接)"""
+        interval = max(5.0, min(60.0, self.idle_timeout / 2))
+        while self._started:
+            try:
+                await asyncio.sleep(interval)
+                now = time.time()
+                connected = [s for s in self._slots if s.connected]
+                for slot in connected[1:]:
+                    if not slot.leased and now - slot.last_used > self.idle_timeout:
+                        await self._disconnect_slot(slot)
+                        logger.info(f"下载客户端 #{slot.index} 空闲超时，已断开")
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"下载客户端池空闲回收失败: {e}")
+
+    async def recycle(self):
+        """断开所有空闲客户端，下次租用时使用最新的主session重建"""
+        if not self._started:
+            return
+        for slot in self._slots:
+            if slot.leased:
+                slot.healthy = False
+            else:
+                await self._disconnect_slot(slot)
+                for suffix in (".session", ".session-journal"):
+                    path = f"{slot.session_name}{suffix}"
+                    if os.path.exists(path):
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+        self._chat_dc.clear()
+        logger.info("下载客户端池已回收")
+
+    async def close(self):
+        """关闭客户端池"""
+        self._started = False
+        if self._reaper_task:
+            self._reaper_task.cancel()
+            try:
+                await self._reaper_task
+            except asyncio.CancelledError:
+                pass
+            self._reaper_task = None
+        for slot in self._slots:
+            await self._disconnect_slot(slot)
+        logger.info("下载客户端池已关闭")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取客户端池租约与延迟指标"""
+        def _percentile(values, pct):
+            if not values:
+                return 0.0
+            ordered = sorted(values)
+            return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] * 1000
+
+        wait_times = list(self._wait_times)
+        durations = list(self._lease_durations)
+        affinity_total = self._affinity_hits + self._affinity_misses
+
+        return {
+            "started": self._started,
+            "pool_size": self.size,
+            "idle_timeout": self.idle_timeout,
+            "dc_affinity": self.dc_affinity,
+            "connected": sum(1 for s in self._slots if s.connected),
+            "leased": sum(1 for s in self._slots if s.leased),
+            "waiting": self._waiting,
+            "peak_waiting": self._peak_waiting,
+            "total_leases": self._total_leases,
+            "lease_errors": self._lease_errors,
+            "total_connects": sum(s.connect_count for s in self._slots),
+            "avg_wait_ms": (sum(wait_times) / len(wait_times) * 1000) if wait_times else 0.0,
+            "p95_wait_ms": _percentile(wait_times, 0.95),
+            "avg_lease_ms": (sum(durations) / len(durations) * 1000) if durations else 0.0,
+            "p95_lease_ms": _percentile(durations, 0.95),
+            "affinity_hit_rate": (self._affinity_hits / affinity_total) if affinity_total else 0.0,
+            "dc_slots": dict(self._dc_slot),
+            "clients": [slot.to_dict() for slot in self._slots],
+        }
+
+
+# 全局下载客户端池实例
+download_client_pool = DownloadClientPool()
+
+
+def get_download_client_pool() -> DownloadClientPool:
+    """获取下载客户端池实例"""
+    return download_client_pool
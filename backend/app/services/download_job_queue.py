@@ -0,0 +1,762 @@
+"""持久化下载作业队列
+
+手动下载(单个/批量)和下载任务的执行都登记为 download_jobs 表中的作业，
+进程重启不再丢失排队中的下载，也不会遗留 is_downloading=True 的消息。
+
+主要功能:
+- 作业带优先级、尝试次数、租约到期时间和执行进程ID(worker_id)
+- 分发器通过一条 UPDATE ... RETURNING 批量认领作业；认领语句按优先级排序，
+  同时满足全局、每用户、每群组的并发上限(窗口函数按用户/群组排名，加上
+  各自正在执行的作业数后不超过上限)
+- 所有写操作经单写线程(db_writer)执行，认领和并发计数在同一事务中完成
+- 执行期间按三分之一租约间隔续租；续租失败(作业已被取消)的本地执行被取消
+- 启动时回收过期租约，被中断的作业重新排队；下载目标路径由作业ID确定，
+  分片下载引擎的检查点得以复用，从已完成的分片继续而不是从零开始
+- 正常关闭时释放本进程的租约，作业立即回到队列
+
+作业类型的执行函数由使用方注册:
+    download_job_queue.register_handler(JOB_KIND_MEDIA, run_media_job)
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models.download_job import (
+    ACTIVE_JOB_STATES,
+    JOB_CANCELLED,
+    JOB_FAILED,
+    JOB_KIND_MEDIA,
+    JOB_KIND_TASK,
+    JOB_LEASED,
+    JOB_QUEUED,
+    JOB_SUCCEEDED,
+    DownloadJob,
+)
+from ..utils.db_writer import WriteCommand, db_writer, read_only_session
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 10  # 用户在界面上点击的单个下载
+PRIORITY_BATCH = 0
+
+# 失败重试的退避基数(秒)，第 n 次失败后等待 n 倍
+RETRY_BACKOFF_SECONDS = 30
+# 没有唤醒时的认领轮询间隔(秒)，用于拾取退避结束的重试作业
+POLL_INTERVAL = 5.0
+
+_jobs = DownloadJob.__table__
+
+_JOB_COLUMNS = (
+    _jobs.c.id, _jobs.c.kind, _jobs.c.target_id, _jobs.c.group_id, _jobs.c.user_id,
+    _jobs.c.batch_id, _jobs.c.force, _jobs.c.priority, _jobs.c.attempts, _jobs.c.max_attempts,
+)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _supports_returning(session: Session) -> bool:
+    return bool(getattr(session.get_bind().dialect, "update_returning", False))
+
+
+class JobCancelled(Exception):
+    """作业被取消(执行函数抛出后作业记为 cancelled，不再重试)"""
+
+
+# ----------------------------------------------------------------------
+# 写命令
+# ----------------------------------------------------------------------
+
+@dataclass
+class EnqueueDownloadJobs(WriteCommand):
+    """登记作业，同一目标已有排队中/执行中的作业时不重复登记
+
+    leased_by 不为空时作业直接以该进程的租约登记(已在本进程开始执行的作业)。
+    返回 [{"target_id", "job_id", "created", "state"}]。
+    """
+    kind: str
+    jobs: List[Dict[str, Any]]
+    leased_by: Optional[str] = None
+    lease_seconds: int = 60
+    name: str = "enqueue_jobs"
+
+    def apply(self, session: Session) -> List[Dict[str, Any]]:
+        targets = [job["target_id"] for job in self.jobs]
+        existing = {
+            row.target_id: row
+            for row in session.execute(
+                select(_jobs.c.id, _jobs.c.target_id, _jobs.c.state, _jobs.c.priority).where(
+                    _jobs.c.kind == self.kind,
+                    _jobs.c.target_id.in_(targets),
+                    _jobs.c.state.in_(ACTIVE_JOB_STATES),
+                )
+            )
+        }
+
+        now = _utcnow()
+        results = []
+        created = []
+        seen = set()
+        for job in self.jobs:
+            if job["target_id"] in seen:
+                continue
+            seen.add(job["target_id"])
+            row = existing.get(job["target_id"])
+            if row is not None:
+                # 重复请求只提升排队中作业的优先级
+                priority = job.get("priority", PRIORITY_BATCH)
+                if row.state == JOB_QUEUED and priority > row.priority:
+                    session.execute(
+                        update(_jobs).where(_jobs.c.id == row.id).values(priority=priority, updated_at=now)
+                    )
+                results.append({"target_id": row.target_id, "job_id": row.id, "created": False, "state": row.state})
+                continue
+
+            record = DownloadJob(
+                kind=self.kind,
+                target_id=job["target_id"],
+                group_id=job.get("group_id"),
+                user_id=job.get("user_id"),
+                batch_id=job.get("batch_id"),
+                force=bool(job.get("force", False)),
+                priority=job.get("priority", PRIORITY_BATCH),
+                max_attempts=job.get("max_attempts") or settings.download_job_max_attempts,
+                available_at=now,
+                created_at=now,
+                updated_at=now,
+            )
+            if self.leased_by:
+                record.state = JOB_LEASED
+                record.worker_id = self.leased_by
+                record.lease_expires_at = now + timedelta(seconds=self.lease_seconds)
+                record.attempts = 1
+                record.started_at = now
+            else:
+                record.state = JOB_QUEUED
+            session.add(record)
+            created.append(record)
+
+        if created:
+            session.flush()
+        for record in created:
+            results.append({"target_id": record.target_id, "job_id": record.id, "created": True, "state": record.state})
+        return results
+
+
+@dataclass
+class ClaimDownloadJobs(WriteCommand):
+    """认领一批排队中的作业并写入租约
+
+    一条 UPDATE ... RETURNING 完成: 候选作业依次按群组、用户分区编号(优先级降序, ID)，
+    编号加上该群组/用户正在执行的作业数不超过上限，再按全局剩余名额截取。
+    返回认领到的作业字典列表。
+    """
+    worker_id: str
+    kind: str
+    limit: int
+    lease_seconds: int
+    global_limit: Optional[int] = None
+    user_limit: Optional[int] = None
+    group_limit: Optional[int] = None
+    name: str = "claim_jobs"
+
+    def apply(self, session: Session) -> List[Dict[str, Any]]:
+        now = _utcnow()
+        slots = self.limit
+        if self.global_limit:
+            leased = session.execute(
+                select(func.count()).select_from(_jobs).where(
+                    _jobs.c.kind == self.kind, _jobs.c.state == JOB_LEASED
+                )
+            ).scalar() or 0
+            slots = min(slots, self.global_limit - leased)
+        if slots <= 0:
+            return []
+
+        # 候选集: 排队中且退避已结束的作业
+        candidates = (
+            select(
+                _jobs.c.id,
+                _jobs.c.priority,
+                func.coalesce(_jobs.c.user_id, 0).label("user_key"),
+                func.coalesce(_jobs.c.group_id, 0).label("group_key"),
+            )
+            .where(
+                _jobs.c.kind == self.kind,
+                _jobs.c.state == JOB_QUEUED,
+                _jobs.c.available_at <= now,
+            )
+            .subquery("candidates")
+        )
+        # 依次按群组、用户限流: 每一层在上一层保留下来的作业中按优先级编号，
+        # 被群组上限排除的作业不占用该用户的名额
+        for limit, column, key in (
+            (self.group_limit, _jobs.c.group_id, "group_key"),
+            (self.user_limit, _jobs.c.user_id, "user_key"),
+        ):
+            if not limit:
+                continue
+            running = (
+                select(func.coalesce(column, 0).label("key"), func.count().label("running"))
+                .where(_jobs.c.kind == self.kind, _jobs.c.state == JOB_LEASED)
+                .group_by(func.coalesce(column, 0))
+                .subquery()
+            )
+            rank = func.row_number().over(
+                partition_by=candidates.c[key],
+                order_by=(candidates.c.priority.desc(), candidates.c.id),
+            )
+            ranked = (
+                select(candidates, (rank + func.coalesce(running.c.running, 0)).label("slot"))
+                .select_from(candidates.outerjoin(running, running.c.key == candidates.c[key]))
+                .subquery()
+            )
+            candidates = (
+                select(ranked.c.id, ranked.c.priority, ranked.c.user_key, ranked.c.group_key)
+                .where(ranked.c.slot <= limit)
+                .subquery()
+            )
+
+        chosen = (
+            select(candidates.c.id)
+            .order_by(candidates.c.priority.desc(), candidates.c.id)
+            .limit(slots)
+        )
+        values = {
+            "state": JOB_LEASED,
+            "worker_id": self.worker_id,
+            "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+            "attempts": _jobs.c.attempts + 1,
+            "started_at": func.coalesce(_jobs.c.started_at, now),
+            "updated_at": now,
+        }
+
+        if _supports_returning(session):
+            rows = session.execute(
+                update(_jobs).where(_jobs.c.id.in_(chosen)).values(**values).returning(*_JOB_COLUMNS)
+            ).mappings().all()
+        else:
+            # 不支持 RETURNING 的数据库: 写线程串行执行，先选后改不会与其他认领交错
+            ids = session.execute(chosen).scalars().all()
+            if not ids:
+                return []
+            session.execute(update(_jobs).where(_jobs.c.id.in_(ids)).values(**values))
+            rows = session.execute(select(*_JOB_COLUMNS).where(_jobs.c.id.in_(ids))).mappings().all()
+
+        jobs = [dict(row) for row in rows]
+        jobs.sort(key=lambda job: (-job["priority"], job["id"]))
+        return jobs
+
+
+@dataclass
+class RenewJobLeases(WriteCommand):
+    """续租本进程仍在执行的作业，返回续租成功的作业ID"""
+    worker_id: str
+    job_ids: List[int]
+    lease_seconds: int
+    name: str = "renew_leases"
+
+    def apply(self, session: Session) -> List[int]:
+        if not self.job_ids:
+            return []
+        now = _utcnow()
+        condition = (
+            _jobs.c.id.in_(self.job_ids),
+            _jobs.c.worker_id == self.worker_id,
+            _jobs.c.state == JOB_LEASED,
+        )
+        values = {"lease_expires_at": now + timedelta(seconds=self.lease_seconds), "updated_at": now}
+        if _supports_returning(session):
+            return list(session.execute(
+                update(_jobs).where(*condition).values(**values).returning(_jobs.c.id)
+            ).scalars())
+        ids = list(session.execute(select(_jobs.c.id).where(*condition)).scalars())
+        if ids:
+            session.execute(update(_jobs).where(_jobs.c.id.in_(ids)).values(**values))
+        return ids
+
+
+@dataclass
+class FinishDownloadJob(WriteCommand):
+    """结束本进程租用的作业
+
+    失败且未达最大尝试次数时重新排队，按尝试次数线性退避；返回作业的新状态，
+    作业已不属于本进程(被取消或租约被回收)时返回 None。
+    """
+    job_id: int
+    worker_id: str
+    outcome: str  # succeeded / failed / cancelled
+    error: Optional[str] = None
+    retry: bool = True
+    name: str = "finish_job"
+
+    def apply(self, session: Session) -> Optional[str]:
+        row = session.execute(
+            select(_jobs.c.attempts, _jobs.c.max_attempts).where(
+                _jobs.c.id == self.job_id,
+                _jobs.c.worker_id == self.worker_id,
+                _jobs.c.state == JOB_LEASED,
+            )
+        ).first()
+        if row is None:
+            return None
+
+        now = _utcnow()
+        values: Dict[str, Any] = {
+            "worker_id": None,
+            "lease_expires_at": None,
+            "last_error": self.error,
+            "updated_at": now,
+        }
+        if self.outcome == JOB_FAILED and self.retry and row.attempts < row.max_attempts:
+            values["state"] = JOB_QUEUED
+            values["available_at"] = now + timedelta(seconds=RETRY_BACKOFF_SECONDS * row.attempts)
+        else:
+            values["state"] = self.outcome
+            values["finished_at"] = now
+        session.execute(update(_jobs).where(_jobs.c.id == self.job_id).values(**values))
+        return values["state"]
+
+
+@dataclass
+class CancelDownloadJobs(WriteCommand):
+    """取消排队中和执行中的作业，返回被取消的 [{"job_id", "target_id", "state"}]"""
+    kind: str
+    target_ids: Optional[List[int]] = None
+    batch_id: Optional[str] = None
+    name: str = "cancel_jobs"
+
+    def apply(self, session: Session) -> List[Dict[str, Any]]:
+        conditions = [_jobs.c.kind == self.kind, _jobs.c.state.in_(ACTIVE_JOB_STATES)]
+        if self.target_ids is not None:
+            conditions.append(_jobs.c.target_id.in_(self.target_ids))
+        if self.batch_id is not None:
+            conditions.append(_jobs.c.batch_id == self.batch_id)
+        rows = session.execute(
+            select(_jobs.c.id, _jobs.c.target_id, _jobs.c.state).where(*conditions)
+        ).all()
+        if rows:
+            now = _utcnow()
+            session.execute(
+                update(_jobs).where(_jobs.c.id.in_([row.id for row in rows])).values(
+                    state=JOB_CANCELLED, worker_id=None, lease_expires_at=None,
+                    last_error="下载已取消", finished_at=now, updated_at=now,
+                )
+            )
+        return [{"job_id": row.id, "target_id": row.target_id, "state": row.state} for row in rows]
+
+
+@dataclass
+class ReleaseJobLeases(WriteCommand):
+    """回收租约，作业重新排队
+
+    指定 worker_id 时释放该进程的全部租约(正常关闭)，中断不计入尝试次数；
+    否则回收所有已过期的租约(执行进程已退出)，已达最大尝试次数的作业标记为失败，
+    避免反复导致进程退出的作业无限重试。返回回收的作业数。
+    """
+    worker_id: Optional[str] = None
+    name: str = "release_leases"
+
+    def apply(self, session: Session) -> int:
+        now = _utcnow()
+        values: Dict[str, Any] = {
+            "state": JOB_QUEUED,
+            "worker_id": None,
+            "lease_expires_at": None,
+            "available_at": now,
+            "updated_at": now,
+        }
+        if self.worker_id is not None:
+            condition = _jobs.c.worker_id == self.worker_id
+            values["attempts"] = case((_jobs.c.attempts > 0, _jobs.c.attempts - 1), else_=0)
+            result = session.execute(
+                update(_jobs).where(_jobs.c.state == JOB_LEASED, condition).values(**values)
+            )
+            return result.rowcount or 0
+
+        expired = [_jobs.c.state == JOB_LEASED, _jobs.c.lease_expires_at < now]
+        failed = session.execute(
+            update(_jobs).where(*expired, _jobs.c.attempts >= _jobs.c.max_attempts).values(
+                state=JOB_FAILED, worker_id=None, lease_expires_at=None,
+                last_error="租约过期且已达最大尝试次数", finished_at=now, updated_at=now,
+            )
+        )
+        requeued = session.execute(update(_jobs).where(*expired).values(**values))
+        return (failed.rowcount or 0) + (requeued.rowcount or 0)
+
+
+@dataclass
+class ResetStaleDownloadFlags(WriteCommand):
+    """清除没有对应活动作业的消息下载中标记(上次进程退出时遗留)"""
+    name: str = "reset_download_flags"
+
+    def apply(self, session: Session) -> int:
+        from ..models.telegram import TelegramMessage
+        active = select(_jobs.c.target_id).where(
+            _jobs.c.kind == JOB_KIND_MEDIA, _jobs.c.state.in_(ACTIVE_JOB_STATES)
+        )
+        result = session.execute(
+            update(TelegramMessage.__table__)
+            .where(TelegramMessage.is_downloading.is_(True), TelegramMessage.message_id.not_in(active))
+            .values(is_downloading=False)
+        )
+        return result.rowcount or 0
+
+
+# ----------------------------------------------------------------------
+# 分发器
+# ----------------------------------------------------------------------
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[bool]]
+
+
+@dataclass
+class JobQueueStats:
+    """分发器统计"""
+    claimed: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    retried: int = 0
+    cancelled: int = 0
+    reclaimed: int = 0
+    lost_leases: int = 0
+    claim_batches: int = 0
+    by_kind: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "claimed": self.claimed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "cancelled": self.cancelled,
+            "reclaimed": self.reclaimed,
+            "lost_leases": self.lost_leases,
+            "claim_batches": self.claim_batches,
+            "by_kind": dict(self.by_kind),
+        }
+
+
+@dataclass
+class _RunningJob:
+    job: Dict[str, Any]
+    task: asyncio.Task
+
+
+class DownloadJobQueue:
+    """下载作业分发器
+
+    认领受并发上限约束的 media 作业；task 作业(下载任务)不设上限，任务内部的
+    文件并发由任务执行服务控制。本进程直接开始执行的任务通过 adopt() 以已租用
+    状态登记，同样续租，进程异常退出后由下一次启动恢复执行。
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._handlers: Dict[str, JobHandler] = {}
+        self._running: Dict[int, _RunningJob] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._dispatch_task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.stats = JobQueueStats()
+
+    def register_handler(self, kind: str, handler: JobHandler):
+        """注册作业类型的执行函数，返回 False 或抛出异常视为失败，抛出 JobCancelled 视为取消"""
+        self._handlers[kind] = handler
+
+    @property
+    def lease_seconds(self) -> int:
+        return max(15, settings.download_job_lease_seconds)
+
+    # ---------------------------------------------------------------- 生命周期
+
+    async def start(self):
+        """回收过期租约并启动分发和续租循环"""
+        if self._dispatch_task and not self._dispatch_task.done():
+            return
+        try:
+            reclaimed = await db_writer.execute(ReleaseJobLeases())
+            reset = await db_writer.execute(ResetStaleDownloadFlags())
+            self.stats.reclaimed += reclaimed
+            if reclaimed or reset:
+                logger.info(f"下载作业队列: 回收 {reclaimed} 个过期租约，清除 {reset} 个遗留的下载中标记")
+        except Exception as e:
+            logger.error(f"回收下载作业租约失败: {e}")
+
+        self._wake = asyncio.Event()
+        self._dispatch_task = asyncio.create_task(self._dispatch_loop())
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        logger.info(f"下载作业分发器已启动: {self.worker_id}")
+
+    async def stop(self):
+        """停止分发，取消本进程执行中的作业并释放租约，作业在下次启动时继续"""
+        for task in (self._dispatch_task, self._heartbeat_task):
+            if task:
+                task.cancel()
+        running = [entry.task for entry in self._running.values()]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(
+            *(t for t in (self._dispatch_task, self._heartbeat_task) if t), *running,
+            return_exceptions=True,
+        )
+        self._dispatch_task = self._heartbeat_task = None
+        try:
+            released = await db_writer.execute(ReleaseJobLeases(worker_id=self.worker_id))
+            if released:
+                logger.info(f"下载作业分发器已释放 {released} 个租约")
+        except Exception as e:
+            logger.warning(f"释放下载作业租约失败，将在租约过期后回收: {e}")
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    # ------------------------------------------------------------------ 入队
+
+    async def enqueue(self, kind: str, jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """登记作业并唤醒分发器
+
+        每个作业字典包含 target_id，可选 group_id、user_id、batch_id、force、priority。
+        """
+        if not jobs:
+            return []
+        results = await db_writer.execute(EnqueueDownloadJobs(kind, jobs))
+        self.wake()
+        return results
+
+    async def adopt(self, kind: str, target_id: int, **fields) -> Optional[int]:
+        """登记一个已在本进程开始执行的作业，并由分发器续租和结束
+
+        执行函数被调用时应直接等待已开始的执行完成。目标已有活动作业时
+        (例如正由本进程恢复执行)不重复登记，返回 None。
+        """
+        results = await db_writer.execute(EnqueueDownloadJobs(
+            kind, [{"target_id": target_id, **fields}],
+            leased_by=self.worker_id, lease_seconds=self.lease_seconds,
+        ))
+        result = results[0]
+        if not result["created"]:
+            return None
+        job = {
+            "id": result["job_id"], "kind": kind, "target_id": target_id,
+            "group_id": fields.get("group_id"), "user_id": fields.get("user_id"),
+            "batch_id": fields.get("batch_id"), "force": bool(fields.get("force", False)),
+            "priority": fields.get("priority", PRIORITY_BATCH), "attempts": 1,
+            "max_attempts": fields.get("max_attempts") or settings.download_job_max_attempts,
+        }
+        self._spawn(job)
+        return job["id"]
+
+    async def cancel(self, kind: str = JOB_KIND_MEDIA, target_ids: Optional[List[int]] = None,
+                     batch_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """取消作业，本进程中正在执行的同时取消其执行"""
+        cancelled = await db_writer.execute(CancelDownloadJobs(kind, target_ids, batch_id))
+        for item in cancelled:
+            entry = self._running.get(item["job_id"])
+            if entry and not entry.task.done():
+                entry.task.cancel()
+        self.stats.cancelled += len(cancelled)
+        return cancelled
+
+    # ------------------------------------------------------------------ 分发
+
+    async def _dispatch_loop(self):
+        while True:
+            try:
+                await self._dispatch_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"下载作业分发失败: {e}")
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _dispatch_once(self):
+        for kind in list(self._handlers):
+            if kind == JOB_KIND_MEDIA:
+                global_limit = max(1, settings.download_jobs_global_limit)
+                local = sum(1 for entry in self._running.values() if entry.job["kind"] == kind)
+                command = ClaimDownloadJobs(
+                    self.worker_id, kind,
+                    limit=global_limit - local,
+                    lease_seconds=self.lease_seconds,
+                    global_limit=global_limit,
+                    user_limit=settings.download_jobs_user_limit,
+                    group_limit=settings.download_jobs_group_limit,
+                )
+            else:
+                command = ClaimDownloadJobs(self.worker_id, kind, limit=10, lease_seconds=self.lease_seconds)
+            if command.limit <= 0:
+                continue
+
+            jobs = await db_writer.execute(command)
+            if not jobs:
+                continue
+            self.stats.claim_batches += 1
+            self.stats.claimed += len(jobs)
+            self.stats.by_kind[kind] = self.stats.by_kind.get(kind, 0) + len(jobs)
+            for job in jobs:
+                self._spawn(job)
+            logger.info(f"认领 {len(jobs)} 个{kind}下载作业")
+
+    def _spawn(self, job: Dict[str, Any]):
+        task = asyncio.create_task(self._run_job(job))
+        self._running[job["id"]] = _RunningJob(job, task)
+
+    async def _run_job(self, job: Dict[str, Any]):
+        handler = self._handlers.get(job["kind"])
+        outcome, error = JOB_FAILED, None
+        try:
+            if handler is None:
+                error = f"未注册的作业类型: {job['kind']}"
+            elif await handler(job):
+                outcome = JOB_SUCCEEDED
+            else:
+                error = "下载失败"
+        except JobCancelled as e:
+            outcome, error = JOB_CANCELLED, str(e) or "下载已取消"
+        except asyncio.CancelledError:
+            # 被取消(用户取消或进程关闭): 作业状态已由取消方/释放租约处理
+            self._running.pop(job["id"], None)
+            raise
+        except Exception as e:
+            error = str(e)
+            logger.error(f"下载作业 {job['id']} 执行异常: {e}")
+        self._running.pop(job["id"], None)
+
+        try:
+            state = await db_writer.execute(FinishDownloadJob(
+                job["id"], self.worker_id, outcome, error, retry=job["kind"] != JOB_KIND_TASK,
+            ))
+        except Exception as e:
+            logger.error(f"更新下载作业 {job['id']} 状态失败: {e}")
+            return
+        if state == JOB_SUCCEEDED:
+            self.stats.succeeded += 1
+        elif state == JOB_QUEUED:
+            self.stats.retried += 1
+            logger.info(f"下载作业 {job['id']} 失败，第 {job['attempts']} 次尝试，稍后重试: {error}")
+        elif state == JOB_FAILED:
+            self.stats.failed += 1
+        elif state == JOB_CANCELLED:
+            self.stats.cancelled += 1
+        # 释放的名额立即用于认领下一批
+        self.wake()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            job_ids = list(self._running)
+            try:
+                if job_ids:
+                    renewed = set(await db_writer.execute(
+                        RenewJobLeases(self.worker_id, job_ids, self.lease_seconds)
+                    ))
+                    for job_id in job_ids:
+                        entry = self._running.get(job_id)
+                        if job_id not in renewed and entry and not entry.task.done():
+                            # 作业已被取消或租约已被回收，停止本地执行避免重复下载
+                            self.stats.lost_leases += 1
+                            logger.warning(f"下载作业 {job_id} 租约已失效，停止执行")
+                            entry.task.cancel()
+                # 其他进程异常退出遗留的过期租约
+                reclaimed = await db_writer.execute(ReleaseJobLeases())
+                if reclaimed:
+                    self.stats.reclaimed += reclaimed
+                    # 达到最大尝试次数而失败的作业不会再执行，清除其消息的下载中标记
+                    await db_writer.execute(ResetStaleDownloadFlags())
+                    self.wake()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"下载作业续租失败: {e}")
+
+    # ------------------------------------------------------------------ 查询
+
+    def is_running(self, kind: str, target_id: int) -> bool:
+        """目标是否正在本进程中执行"""
+        return any(
+            entry.job["kind"] == kind and entry.job["target_id"] == target_id
+            for entry in self._running.values()
+        )
+
+    def active_jobs(self, kind: str, target_ids: List[int]) -> Dict[int, str]:
+        """目标的活动作业状态 {target_id: queued/leased}"""
+        if not target_ids:
+            return {}
+        with read_only_session() as session:
+            rows = session.execute(
+                select(_jobs.c.target_id, _jobs.c.state).where(
+                    _jobs.c.kind == kind,
+                    _jobs.c.target_id.in_(target_ids),
+                    _jobs.c.state.in_(ACTIVE_JOB_STATES),
+                )
+            ).all()
+        return {row.target_id: row.state for row in rows}
+
+    def get_batch(self, batch_id: str) -> List[Dict[str, Any]]:
+        """批量下载的全部作业"""
+        with read_only_session() as session:
+            rows = session.execute(
+                select(*_JOB_COLUMNS, _jobs.c.state, _jobs.c.last_error, _jobs.c.created_at)
+                .where(_jobs.c.batch_id == batch_id)
+                .order_by(_jobs.c.id)
+            ).mappings().all()
+        return [dict(row) for row in rows]
+
+    def count_by_state(self) -> Dict[str, Dict[str, int]]:
+        """按类型和状态统计作业数 {kind: {state: count}}"""
+        counts: Dict[str, Dict[str, int]] = {}
+        with read_only_session() as session:
+            rows = session.execute(
+                select(_jobs.c.kind, _jobs.c.state, func.count())
+                .where(_jobs.c.state.in_(ACTIVE_JOB_STATES))
+                .group_by(_jobs.c.kind, _jobs.c.state)
+            ).all()
+        for kind, state, count in rows:
+            counts.setdefault(kind, {})[state] = count
+        return counts
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats.to_dict()
+        running: Dict[str, List[int]] = {}
+        for entry in self._running.values():
+            running.setdefault(entry.job["kind"], []).append(entry.job["target_id"])
+        stats.update({
+            "worker_id": self.worker_id,
+            "running": running,
+            "limits": {
+                "global": settings.download_jobs_global_limit,
+                "per_user": settings.download_jobs_user_limit,
+                "per_group": settings.download_jobs_group_limit,
+            },
+            "lease_seconds": self.lease_seconds,
+        })
+        return stats
+
+
+download_job_queue = DownloadJobQueue()
+
+
+def get_download_job_queue() -> DownloadJobQueue:
+    """获取下载作业队列实例"""
+    return download_job_queue
@@ -0,0 +1,380 @@
+"""下载任务流水线
+
+将单个下载任务拆分为有界的生产者/消费者流水线，替代逐条串行执行:
+
+    消息生产 -> [fetch队列] -> 下载阶段(N并发, 受全局信号量约束)
+             -> [organize队列] -> 整理/元数据阶段(工作线程池)
+             -> [record队列] -> 记录写入阶段(批量写库、批量推送进度)
+
+主要功能:
+- 每个任务和全局两级下载并发控制
+- 阶段之间使用有界队列，下游变慢时上游自动阻塞(背压)
+- 下载记录和任务进度按批次写入，减少数据库会话次数
+- 每个阶段独立的吞吐量、耗时、队列深度和阻塞次数统计
+- 每个文件一条链路追踪，跨三个阶段记录各环节耗时(见 app.core.tracing)
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from ..core.metrics import DOWNLOAD_DURATION
+from ..core.tracing import Trace, tracer
+from .thumbnail_service import thumbnail_service
+
+if TYPE_CHECKING:
+    from .task_execution_service import TaskExecutionService
+
+logger = logging.getLogger(__name__)
+
+_DOWNLOAD_SUCCESS = DOWNLOAD_DURATION.labels("task", "success")
+_DOWNLOAD_FAILED = DOWNLOAD_DURATION.labels("task", "failed")
+
+
+@dataclass
+class StageMetrics:
+    """流水线阶段统计"""
+    name: str
+    workers: int = 1
+    processed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    busy_seconds: float = 0.0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    backpressure_waits: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def observe_queue(self, queue: asyncio.Queue):
+        self.queue_depth = queue.qsize()
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    @property
+    def throughput(self) -> float:
+        """每秒处理条数"""
+        elapsed = time.monotonic() - self.started_at
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        handled = self.processed + self.failed
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "throughput_per_second": round(self.throughput, 3),
+            "avg_item_ms": round(self.busy_seconds / handled * 1000, 2) if handled else 0.0,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "backpressure_waits": self.backpressure_waits,
+        }
+
+
+@dataclass
+class PipelineItem:
+    """流水线中流转的单条消息"""
+    index: int
+    message: Any
+    task_data: Dict[str, Any]
+    has_media: bool = True
+    success: bool = False
+    file_path: Optional[str] = None
+    final_path: Optional[str] = None
+    needs_organize: bool = False
+    needs_record: bool = False
+    completed: bool = False
+    trace: Optional[Trace] = None
+
+
+_STOP = object()
+
+
+class TaskDownloadPipeline:
+    """单个下载任务的执行流水线
+
+    Args:
+        service: 任务执行服务，提供下载/整理/写库的具体实现
+        task_id: 任务ID
+        task_data: 任务数据字典
+        messages: 待处理消息的异步迭代器（键集分页流式读取）
+        total: 消息总数，用于计算进度
+        all_rules_data: 任务关联的规则数据
+        global_semaphore: 跨任务共享的下载并发信号量
+    """
+
+    def __init__(self, service: "TaskExecutionService", task_id: int, task_data: Dict[str, Any],
+                 messages: AsyncIterable[Any], total: int, all_rules_data: List[Dict[str, Any]],
+                 global_semaphore: asyncio.Semaphore, download_concurrency: int = 3,
+                 organize_workers: int = 2, queue_size: int = 32,
+                 record_batch_size: int = 20, record_flush_interval: float = 2.0):
+        self.service = service
+        self.task_id = task_id
+        self.task_data = task_data
+        self.messages = messages
+        self.all_rules_data = all_rules_data
+        self.global_semaphore = global_semaphore
+        self.download_concurrency = max(1, download_concurrency)
+        self.organize_workers = max(1, organize_workers)
+        self.record_batch_size = max(1, record_batch_size)
+        self.record_flush_interval = record_flush_interval
+
+        self.total = total
+        self.downloaded_count = 0
+        self.failed_count = 0
+        self.completed_count = 0
+        self.cancelled = False
+
+        self._fetch_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._organize_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._record_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size * 2)
+
+        self.stages = {
+            "fetch": StageMetrics("fetch", workers=self.download_concurrency),
+            "organize": StageMetrics("organize", workers=self.organize_workers),
+            "record": StageMetrics("record"),
+        }
+        self.started_at = time.monotonic()
+
+    def _is_cancelled(self) -> bool:
+        if self.task_id not in self.service.running_tasks:
+            self.cancelled = True
+        return self.cancelled
+
+    async def _put(self, queue: asyncio.Queue, item, stage: StageMetrics):
+        """写入下游队列，队列满时记录一次背压等待"""
+        if queue.full():
+            stage.backpressure_waits += 1
+        await queue.put(item)
+        stage.observe_queue(queue)
+
+    async def run(self) -> Tuple[int, int]:
+        """运行流水线直到所有消息处理完毕或任务被取消
+
+        Returns:
+            (成功下载数, 失败数)
+        """
+        producer = asyncio.create_task(self._produce())
+        fetchers = [asyncio.create_task(self._fetch_worker()) for _ in range(self.download_concurrency)]
+        organizers = [asyncio.create_task(self._organize_worker()) for _ in range(self.organize_workers)]
+        writer = asyncio.create_task(self._record_writer())
+        all_tasks = [producer, *fetchers, *organizers, writer]
+
+        try:
+            await producer
+            await asyncio.gather(*fetchers)
+            for _ in organizers:
+                await self._organize_queue.put(_STOP)
+            await asyncio.gather(*organizers)
+            await self._record_queue.put(_STOP)
+            await writer
+        except BaseException:
+            for task in all_tasks:
+                task.cancel()
+            await asyncio.gather(*all_tasks, return_exceptions=True)
+            raise
+
+        return self.downloaded_count, self.failed_count
+
+    async def _produce(self):
+        stage = self.stages["fetch"]
+        primary_rule = self.all_rules_data[0] if self.all_rules_data else {}
+        index = 0
+        async for message in self.messages:
+            if self._is_cancelled():
+                break
+            index += 1
+            has_media = bool(message.media_type and message.media_type != 'text')
+            if not has_media:
+                # 无媒体消息直接计入进度
+                await self._put(self._record_queue, PipelineItem(index, message, self.task_data, has_media=False), stage)
+                continue
+
+            item_task_data = self.task_data.copy()
+            # 规则引擎筛选时已附带命中的关键词；命中的规则没有关键词时使用规则名
+            matched_keyword = getattr(message, 'matched_keyword', None) or getattr(message, 'matched_rule_name', None)
+            item_task_data['matched_keyword'] = matched_keyword or self.service._get_matched_keyword(message, primary_rule)
+            await self._put(self._fetch_queue, PipelineItem(index, message, item_task_data), stage)
+
+        # 开始时统计的总数可能不准(执行期间有新消息同步，或规则引擎回退时只统计了候选消息)，
+        # 完整读取后以实际产出数为准
+        self.total = max(self.total, index) if self._is_cancelled() else index
+        for _ in range(self.download_concurrency):
+            await self._fetch_queue.put(_STOP)
+
+    async def _fetch_worker(self):
+        stage = self.stages["fetch"]
+        while True:
+            item = await self._fetch_queue.get()
+            stage.observe_queue(self._fetch_queue)
+            if item is _STOP:
+                return
+            if self._is_cancelled():
+                continue
+
+            item.trace = tracer.start_trace(
+                "file",
+                task_id=self.task_id,
+                message_id=getattr(item.message, "message_id", None),
+                media_type=getattr(item.message, "media_type", None),
+            )
+            started = time.monotonic()
+            try:
+                with tracer.activate(item.trace):
+                    waited = time.perf_counter()
+                    async with self.global_semaphore:
+                        tracer.add_span("slot_wait", waited, time.perf_counter())
+                        with tracer.span("fetch"):
+                            item.success, item.file_path, item.needs_organize = await self.service._fetch_message_media(
+                                item.message, item.task_data, self.task_id
+                            )
+            except Exception as e:
+                logger.error(f"下载消息 {item.message.id} 失败: {e}")
+                await self.service._log_task_event(self.task_id, "ERROR", f"下载消息 {item.message.id} 失败: {str(e)}")
+                item.success = False
+            elapsed = time.monotonic() - started
+            stage.busy_seconds += elapsed
+            (_DOWNLOAD_SUCCESS if item.success else _DOWNLOAD_FAILED).observe(elapsed)
+
+            if item.success:
+                stage.processed += 1
+            else:
+                stage.failed += 1
+
+            if item.success and item.needs_organize:
+                await self._put(self._organize_queue, item, stage)
+            else:
+                await self._put(self._record_queue, item, stage)
+
+    async def _organize_worker(self):
+        stage = self.stages["organize"]
+        while True:
+            item = await self._organize_queue.get()
+            stage.observe_queue(self._organize_queue)
+            if item is _STOP:
+                return
+
+            started = time.monotonic()
+            organized_path = None
+            try:
+                with tracer.activate(item.trace), tracer.span("organize"):
+                    organized_path = await self.service._organize_downloaded_file(
+                        item.file_path, item.message, item.task_data, self.task_id
+                    )
+            except Exception as e:
+                # 单个文件整理异常不能终止整理协程，否则流水线会停在整理队列上
+                logger.error(f"整理消息 {item.message.id} 的文件失败: {e}")
+            stage.busy_seconds += time.monotonic() - started
+            if organized_path:
+                stage.processed += 1
+            else:
+                stage.failed += 1
+
+            # 整理失败时仍以原始路径记录下载结果
+            item.final_path = organized_path or item.file_path
+            item.needs_record = True
+            await self._put(self._record_queue, item, stage)
+
+    async def _record_writer(self):
+        stage = self.stages["record"]
+        batch: List[PipelineItem] = []
+        batch_started = time.monotonic()
+
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(0.0, self.record_flush_interval - (time.monotonic() - batch_started))
+            try:
+                item = await asyncio.wait_for(self._record_queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                item = None
+
+            if item is not None and item is not _STOP:
+                if not batch:
+                    batch_started = time.monotonic()
+                batch.append(item)
+                stage.observe_queue(self._record_queue)
+
+            if batch and (item is None or item is _STOP or len(batch) >= self.record_batch_size):
+                try:
+                    await self._flush_batch(batch)
+                except Exception as e:
+                    # 写库异常不能终止写库协程，否则记录队列写满后上游各阶段都会阻塞
+                    logger.error(f"写入下载记录失败，本批 {len(batch)} 条计为失败: {e}")
+                    self._fail_batch(batch)
+                batch = []
+
+            if item is _STOP:
+                return
+
+    async def _flush_batch(self, batch: List[PipelineItem]):
+        stage = self.stages["record"]
+        started = time.monotonic()
+
+        to_record = [item for item in batch if item.needs_record]
+        if to_record:
+            record_started = time.perf_counter()
+            written = await self.service._create_download_records(
+                [(item.message, item.final_path) for item in to_record], self.task_data, self.task_id
+            )
+            record_ended = time.perf_counter()
+            stage.processed += written
+            stage.failed += len(to_record) - written
+            # 一个批次共用一次写库，各文件记录同一段耗时
+            for item in to_record:
+                tracer.add_span("record", record_started, record_ended, trace=item.trace, batch_size=len(to_record))
+
+        for item in batch:
+            item.completed = True
+            self.completed_count += 1
+            tracer.finish(item.trace, success=item.success, file_path=item.final_path or item.file_path)
+            if not item.has_media:
+                stage.skipped += 1
+            elif item.success:
+                self.downloaded_count += 1
+                # 后台预生成常用尺寸的缩略图
+                thumbnail_service.prewarm(
+                    item.final_path or item.file_path,
+                    getattr(item.message, "media_type", None),
+                    getattr(item.message, "media_duration", None),
+                )
+            else:
+                self.failed_count += 1
+
+        progress = int(self.completed_count / self.total * 100) if self.total else 100
+        await self.service._update_task_progress(self.task_id, progress, self.downloaded_count, self.total)
+        stage.busy_seconds += time.monotonic() - started
+
+    def _fail_batch(self, batch: List[PipelineItem]):
+        """批次写库失败时，将尚未计入进度的消息计为失败"""
+        stage = self.stages["record"]
+        for item in batch:
+            if item.completed:
+                continue
+            item.completed = True
+            self.completed_count += 1
+            if item.has_media:
+                stage.failed += 1
+                self.failed_count += 1
+            else:
+                stage.skipped += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取流水线各阶段统计"""
+        return {
+            "task_id": self.task_id,
+            "total": self.total,
+            "completed": self.completed_count,
+            "downloaded": self.downloaded_count,
+            "failed": self.failed_count,
+            "cancelled": self.cancelled,
+            "elapsed_seconds": round(time.monotonic() - self.started_at, 2),
+            "download_concurrency": self.download_concurrency,
+            "organize_workers": self.organize_workers,
+            "stages": {name: metrics.to_dict() for name, metrics in self.stages.items()},
+        }
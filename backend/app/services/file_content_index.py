@@ -0,0 +1,345 @@
+"""文件内容索引服务
+
+为已整理的媒体文件维护持久化的内容指纹，替代每次去重时遍历目标目录并对
+所有已有文件计算完整SHA256。
+
+主要功能:
+- 三级指纹: 文件大小 -> 局部哈希(大小+头尾各64KB) -> 完整哈希(惰性计算)
+- 文件写入/移动后增量登记，去重变为一次按 (file_size, partial_hash) 的索引查询
+- 候选文件在使用前校验大小和修改时间，被外部改动的文件跳过，由对账刷新指纹
+- 后台对账: 清理已删除文件、刷新被修改的文件、登记应用之外新增的文件
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from ..config import settings
+from ..models.file_index import FileContentIndex
+from ..utils.db_optimization import optimized_db_session
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_HASH_BYTES = 64 * 1024
+FULL_HASH_CHUNK_SIZE = 1024 * 1024
+RECONCILE_BATCH_SIZE = 500
+
+
+def compute_partial_hash(file_path: str, file_size: int) -> str:
+    """计算局部哈希: 文件大小 + 头部和尾部各64KB"""
+    digest = hashlib.sha256(str(file_size).encode())
+    with open(file_path, "rb") as f:
+        digest.update(f.read(PARTIAL_HASH_BYTES))
+        if file_size > PARTIAL_HASH_BYTES * 2:
+            f.seek(-PARTIAL_HASH_BYTES, os.SEEK_END)
+            digest.update(f.read(PARTIAL_HASH_BYTES))
+        elif file_size > PARTIAL_HASH_BYTES:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def compute_full_hash(file_path: str) -> str:
+    """计算完整SHA256"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(FULL_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _normalize(path: str) -> str:
+    return os.path.abspath(path)
+
+
+def _is_under(path: str, directory: Optional[str]) -> bool:
+    if not directory:
+        return True
+    directory = _normalize(directory)
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+@dataclass
+class ContentIndexStats:
+    """内容索引统计"""
+    lookups: int = 0
+    size_misses: int = 0
+    partial_hashes: int = 0
+    full_hashes: int = 0
+    duplicates_found: int = 0
+    stale_entries: int = 0
+    reconcile_runs: int = 0
+    last_reconcile_at: Optional[float] = None
+    last_reconcile_seconds: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "lookups": self.lookups,
+            "size_misses": self.size_misses,
+            "partial_hashes": self.partial_hashes,
+            "full_hashes": self.full_hashes,
+            "duplicates_found": self.duplicates_found,
+            "stale_entries": self.stale_entries,
+            "reconcile_runs": self.reconcile_runs,
+            "last_reconcile_at": (
+                datetime.fromtimestamp(self.last_reconcile_at).isoformat()
+                if self.last_reconcile_at else None
+            ),
+            "last_reconcile_seconds": round(self.last_reconcile_seconds, 2),
+        }
+
+
+class FileContentIndexService:
+    """文件内容索引
+
+    所有方法都是同步的，供文件整理(运行在工作线程中)直接调用；
+    后台对账通过 asyncio.to_thread 执行。
+    """
+
+    def __init__(self):
+        self.stats = ContentIndexStats()
+        self._reconcile_task: Optional[asyncio.Task] = None
+
+    # ------------------------------------------------------------------
+    # 登记
+    # ------------------------------------------------------------------
+
+    def record_file(self, file_path: str, full_hash: Optional[str] = None,
+                    partial_hash: Optional[str] = None) -> bool:
+        """登记或刷新文件指纹
+
+        Args:
+            file_path: 文件路径
+            full_hash: 已知的完整哈希(例如去重时刚算过)，可省去重复计算
+            partial_hash: 已知的局部哈希
+        """
+        try:
+            path = _normalize(file_path)
+            stat = os.stat(path)
+            if partial_hash is None:
+                partial_hash = compute_partial_hash(path, stat.st_size)
+                self.stats.partial_hashes += 1
+
+            with optimized_db_session(autocommit=False, max_retries=3) as db:
+                entry = db.query(FileContentIndex).filter(FileContentIndex.file_path == path).first()
+                if entry is None:
+                    entry = FileContentIndex(file_path=path)
+                    db.add(entry)
+                elif entry.file_size != stat.st_size or entry.partial_hash != partial_hash:
+                    entry.full_hash = None
+                entry.file_size = stat.st_size
+                entry.mtime = stat.st_mtime
+                entry.partial_hash = partial_hash
+                if full_hash:
+                    entry.full_hash = full_hash
+                entry.verified_at = datetime.now(timezone.utc)
+                db.commit()
+                return True
+        except FileNotFoundError:
+            self.forget(file_path)
+        except Exception as e:
+            logger.warning(f"登记文件指纹失败 {file_path}: {e}")
+        return False
+
+    def forget(self, file_path: str):
+        """从索引中移除文件"""
+        try:
+            with optimized_db_session(autocommit=False, max_retries=3) as db:
+                db.query(FileContentIndex).filter(
+                    FileContentIndex.file_path == _normalize(file_path)
+                ).delete(synchronize_session=False)
+                db.commit()
+        except Exception as e:
+            logger.warning(f"移除文件指纹失败 {file_path}: {e}")
+
+    # ------------------------------------------------------------------
+    # 去重查询
+    # ------------------------------------------------------------------
+
+    def find_duplicate(self, file_path: str, target_dir: Optional[str] = None) -> Optional[str]:
+        """查找与给定文件内容相同的已登记文件
+
+        Args:
+            file_path: 待检查的文件
+            target_dir: 只在该目录下查找，None表示不限目录
+
+        Returns:
+            重复文件路径，未找到返回None
+        """
+        self.stats.lookups += 1
+        path = _normalize(file_path)
+        file_size = os.path.getsize(path)
+
+        with optimized_db_session(autocommit=False, max_retries=3) as db:
+            candidates = (
+                db.query(FileContentIndex)
+                .filter(FileContentIndex.file_size == file_size, FileContentIndex.file_path != path)
+                .all()
+            )
+            candidates = [c for c in candidates if _is_under(c.file_path, target_dir)]
+            if not candidates:
+                # 绝大多数情况在这里返回，新文件无需读取任何内容
+                self.stats.size_misses += 1
+                return None
+
+            partial_hash = compute_partial_hash(path, file_size)
+            self.stats.partial_hashes += 1
+            candidates = [c for c in candidates if c.partial_hash == partial_hash]
+            if not candidates:
+                return None
+
+            full_hash = compute_full_hash(path)
+            self.stats.full_hashes += 1
+            dirty = False
+            duplicate = None
+            for candidate in candidates:
+                if not self._is_fresh(candidate):
+                    # 文件已被外部删除或修改，交给对账处理，这里直接跳过
+                    self.stats.stale_entries += 1
+                    continue
+                if candidate.full_hash is None:
+                    candidate.full_hash = compute_full_hash(candidate.file_path)
+                    self.stats.full_hashes += 1
+                    dirty = True
+                if candidate.full_hash == full_hash:
+                    duplicate = candidate.file_path
+                    break
+            if dirty:
+                db.commit()
+
+        if duplicate:
+            self.stats.duplicates_found += 1
+            logger.info(f"发现重复文件: {file_path} <-> {duplicate}")
+        return duplicate
+
+    @staticmethod
+    def _is_fresh(entry: FileContentIndex) -> bool:
+        try:
+            stat = os.stat(entry.file_path)
+        except OSError:
+            return False
+        return stat.st_size == entry.file_size and stat.st_mtime == entry.mtime
+
+    # ------------------------------------------------------------------
+    # 后台对账
+    # ------------------------------------------------------------------
+
+    def reconcile(self, roots: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """对账索引与磁盘
+
+        1. 分批检查已登记文件: 已删除的移除，大小或修改时间变化的重新计算局部哈希
+        2. 遍历 roots 下的文件，登记尚未入索引的文件(只计算局部哈希)
+        """
+        started = time.monotonic()
+        result = {"checked": 0, "removed": 0, "refreshed": 0, "added": 0}
+        known_paths = set()
+
+        last_id = 0
+        while True:
+            with optimized_db_session(autocommit=False, max_retries=3) as db:
+                entries = (
+                    db.query(FileContentIndex)
+                    .filter(FileContentIndex.id > last_id)
+                    .order_by(FileContentIndex.id)
+                    .limit(RECONCILE_BATCH_SIZE)
+                    .all()
+                )
+                if not entries:
+                    break
+                last_id = entries[-1].id
+                for entry in entries:
+                    result["checked"] += 1
+                    try:
+                        stat = os.stat(entry.file_path)
+                    except OSError:
+                        db.delete(entry)
+                        result["removed"] += 1
+                        continue
+                    known_paths.add(entry.file_path)
+                    if stat.st_size != entry.file_size or stat.st_mtime != entry.mtime:
+                        try:
+                            entry.partial_hash = compute_partial_hash(entry.file_path, stat.st_size)
+                        except OSError as e:
+                            logger.warning(f"重新计算文件指纹失败 {entry.file_path}: {e}")
+                            continue
+                        entry.file_size = stat.st_size
+                        entry.mtime = stat.st_mtime
+                        entry.full_hash = None
+                        result["refreshed"] += 1
+                    entry.verified_at = datetime.now(timezone.utc)
+                db.commit()
+
+        thumbnail_dir = _normalize(settings.thumbnail_cache_dir)
+        for root in roots or []:
+            if not root or not os.path.isdir(root):
+                continue
+            for dirpath, dirnames, filenames in os.walk(root):
+                # 缩略图缓存不是媒体文件
+                dirnames[:] = [
+                    name for name in dirnames
+                    if _normalize(os.path.join(dirpath, name)) != thumbnail_dir
+                ]
+                for filename in filenames:
+                    if filename.endswith((".part", ".parts", ".tmp")):
+                        continue
+                    path = _normalize(os.path.join(dirpath, filename))
+                    if path in known_paths:
+                        continue
+                    if self.record_file(path):
+                        known_paths.add(path)
+                        result["added"] += 1
+
+        self.stats.reconcile_runs += 1
+        self.stats.last_reconcile_at = time.time()
+        self.stats.last_reconcile_seconds = time.monotonic() - started
+        logger.info(f"文件内容索引对账完成: {result}, 耗时 {self.stats.last_reconcile_seconds:.1f}秒")
+        return result
+
+    def _reconcile_roots(self) -> List[str]:
+        return [settings.media_root]
+
+    async def _reconcile_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.reconcile, self._reconcile_roots())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"文件内容索引对账失败: {e}")
+            await asyncio.sleep(max(60.0, settings.content_index_reconcile_interval))
+
+    def start_reconciler(self):
+        """启动后台对账任务"""
+        if self._reconcile_task is None or self._reconcile_task.done():
+            self._reconcile_task = asyncio.create_task(self._reconcile_loop())
+            logger.info("文件内容索引对账任务已启动")
+
+    def stop_reconciler(self):
+        """停止后台对账任务"""
+        if self._reconcile_task:
+            self._reconcile_task.cancel()
+            self._reconcile_task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats.to_dict()
+        try:
+            with optimized_db_session(autocommit=False, max_retries=1) as db:
+                stats["indexed_files"] = db.query(FileContentIndex).count()
+        except Exception as e:
+            logger.debug(f"统计索引文件数失败: {e}")
+        return stats
+
+
+file_content_index = FileContentIndexService()
+
+
+def get_file_content_index() -> FileContentIndexService:
+    """获取文件内容索引服务实例"""
+    return file_content_index
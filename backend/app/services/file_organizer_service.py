@@ -16,6 +16,9 @@ import subprocess
 import tempfile
 from PIL import Image, ImageDraw, ImageFont
 
+from ..core.tracing import tracer
+from .file_content_index import file_content_index
+
 logger = logging.getLogger(__name__)
 
 
@@ -72,7 +75,10 @@ class FileOrganizerService:
     
     def check_duplicate_by_hash(self, file_path: str, target_dir: str) -> Optional[str]:
         """
-        通过哈希值检查文件是否重复
+        通过内容索引检查文件是否重复
+        
+        先按文件大小查询索引，大小相同再比较局部哈希，局部哈希也相同时才计算完整哈希，
+        不再遍历目标目录。
         
         Args:
             file_path: 待检查的文件路径
@@ -85,23 +91,7 @@ class FileOrganizerService:
             if not os.path.exists(file_path):
                 return None
             
-            file_hash = self.calculate_file_hash(file_path)
-            if not file_hash:
-                return None
-            
-            # 遍历目标目录查找相同哈希的文件
-            for root, dirs, files in os.walk(target_dir):
-                for file in files:
-                    existing_file_path = os.path.join(root, file)
-                    if existing_file_path == file_path:
-                        continue
-                    
-                    existing_hash = self.calculate_file_hash(existing_file_path)
-                    if existing_hash == file_hash:
-                        logger.info(f"发现重复文件: {file_path} <-> {existing_file_path}")
-                        return existing_file_path
-            
-            return None
+            return file_content_index.find_duplicate(file_path, target_dir)
             
         except Exception as e:
             logger.error(f"检查重复文件失败 {file_path}: {e}")
@@ -571,12 +561,14 @@ class FileOrganizerService:
             logger.info(f"开始为视频文件生成附加媒体文件: {video_path}")
             
             # 生成NFO元数据文件
-            nfo_path = self.generate_nfo_file(video_path, message, task_data)
+            with tracer.span("nfo"):
+                nfo_path = self.generate_nfo_file(video_path, message, task_data)
             if nfo_path:
                 logger.info(f"NFO文件生成成功: {nfo_path}")
             
             # 生成图片文件（封面、背景图、缩略图）
-            image_results = self.generate_media_images(video_path, message, task_data)
+            with tracer.span("images"):
+                image_results = self.generate_media_images(video_path, message, task_data)
             
             for image_type, image_path in image_results.items():
                 if image_path:
@@ -640,7 +632,8 @@ class FileOrganizerService:
             
             # 检查是否有重复文件
             target_dir = os.path.dirname(target_path)
-            duplicate_path = self.check_duplicate_by_hash(source_path, target_dir)
+            with tracer.span("dedupe_check"):
+                duplicate_path = self.check_duplicate_by_hash(source_path, target_dir)
             
             if duplicate_path:
                 # 发现重复文件，删除源文件
@@ -659,6 +652,7 @@ class FileOrganizerService:
             # 移动文件到目标位置
             shutil.move(source_path, target_path)
             logger.info(f"文件已整理: {source_path} -> {target_path}")
+            file_content_index.record_file(target_path)
             
             # 生成附加的媒体文件（NFO、封面图等）
             self._generate_additional_media_files(target_path, message, task_data)
@@ -679,6 +673,7 @@ class FileOrganizerService:
         """
         return {
             "hash_cache_size": len(self.hash_cache),
+            "content_index": file_content_index.get_stats(),
             "duplicate_files_count": len(self.duplicate_files),
             "duplicate_files": self.duplicate_files.copy()
         }
@@ -13,6 +13,7 @@ from sqlalchemy.orm import Session
 from ..models.rule import DownloadRecord, DownloadTask
 from ..models.telegram import TelegramGroup
 from .file_organizer_service import FileOrganizerService
+from .file_content_index import file_content_index
 
 logger = logging.getLogger(__name__)
 
@@ -82,6 +83,8 @@ class HistoryOrganizerService:
             
             # 检查目标路径是否已存在文件
             if os.path.exists(organized_path):
+                # 确保冲突的已有文件已登记到内容索引
+                file_content_index.record_file(organized_path)
                 # 检查是否为重复文件
                 duplicate_path = self.file_organizer.check_duplicate_by_hash(source_path, os.path.dirname(organized_path))
                 if duplicate_path and duplicate_path == organized_path:
@@ -108,6 +111,8 @@ class HistoryOrganizerService:
             # 移动文件
             shutil.move(source_path, organized_path)
             logger.info(f"文件已重新整理: {source_path} -> {organized_path}")
+            file_content_index.forget(source_path)
+            file_content_index.record_file(organized_path)
             
             # 更新数据库记录
             record.local_file_path = organized_path
@@ -30,24 +30,24 @@ Version: 1.0.0
 """
 
 import os
-import logging
 import shutil
-import tempfile
+import logging
+import time
 from typing import Optional, Dict, Any
 from telethon import TelegramClient
 from telethon.errors import AuthKeyUnregisteredError, FloodWaitError
 from ..config import settings
 import asyncio
-from datetime import datetime
 from ..core.logging_config import get_logger
-from ..core.temp_file_manager import temp_file_manager, temp_file
+from ..core.rate_governor import RPC_ENTITY, RPC_GET_FILE, RPC_HISTORY, rate_governor
+from ..core.tracing import tracer
+from .download_client_pool import download_client_pool
+from .chunked_download_engine import ChunkedDownloadEngine, compute_download_timeout
+from .thumbnail_service import thumbnail_service
 
 # 使用高性能批处理日志记录器
 logger = get_logger(__name__, use_batch=True)
 
-# 全局信号量控制并发连接数，避免数据库锁定
-_connection_semaphore = asyncio.Semaphore(2)
-
 class TelegramMediaDownloader:
     """Telegram媒体文件下载器
 
@@ -55,15 +55,14 @@ class TelegramMediaDownloader:
     断点续传和并发控制。每个下载器实例可以处理特定聊天的媒体下载任务。
 
     Attributes:
-        client (Optional[TelegramClient]): Telethon客户端实例
+        client (Optional[TelegramClient]): 兼容字段，实际连接由下载客户端池持有
         chat_id (Optional[int]): 目标聊天室ID
         message_id (Optional[int]): 目标消息ID
-        session_name (str): 会话文件路径
-        progress_file (str): 进度文件路径
+        session_name (str): 日志中使用的下载会话标识
 
     Features:
-        - 自动会话管理和持久化
-        - 基于消息的唯一会话标识
+        - 共享的长连接客户端池，避免每个文件重复握手
+        - 基于消息的唯一进度标识
         - 断点续传支持
         - 下载进度实时跟踪
         - 并发下载控制
@@ -91,18 +90,17 @@ class TelegramMediaDownloader:
             message_id (Optional[int]): 目标消息ID，用于会话标识
 
         Note:
-            如果提供chat_id和message_id，将创建基于消息的持久化会话；
-            否则使用进程和线程ID创建临时会话。
+            如果提供chat_id和message_id，将生成基于消息的稳定会话标识；
+            否则使用进程和线程ID。断点续传状态由分片下载引擎保存在目标文件旁。
         """
-        self.client: Optional[TelegramClient] = None
+        self.client: Optional[TelegramClient] = None  # 兼容字段，连接由客户端池统一持有
         self._initialized = False
-        self._shared_client = None  # 共享的客户端实例
         self.chat_id = chat_id
         self.message_id = message_id
 
-        # 使用消息ID创建持久化session，这样可以保持下载进度
+        # 使用消息ID生成稳定的会话标识，便于日志关联
         if chat_id and message_id:
-            # 基于聊天ID和消息ID创建唯一但持久的session名称
+            # 基于聊天ID和消息ID创建唯一但持久的名称
             import hashlib
             session_key = f"{chat_id}_{message_id}"
             session_hash = hashlib.md5(session_key.encode()).hexdigest()[:12]
@@ -114,230 +112,38 @@ class TelegramMediaDownloader:
 
         self.session_name = os.path.join("./telegram_sessions", session_id)
 
-        # 下载进度文件路径
-        self.progress_file = f"{self.session_name}.progress"
-    
-    def _save_progress(self, file_path: str, current: int, total: int):
-        """保存下载进度到文件
-
-        将当前下载进度保存到JSON文件中，用于断点续传功能。
-        包含文件路径、下载字节数、总大小和时间戳等信息。
+    async def initialize(self):
+        """初始化下载器
 
-        Args:
-            file_path (str): 目标文件的完整路径
-            current (int): 已下载的字节数
-            total (int): 文件总大小(字节)
+        启动共享的下载客户端池(首次调用时预热一个已授权连接)。
+        下载器本身不再持有独立的session副本和连接。
 
-        Note:
-            - 进度文件以JSON格式存储，便于读取和调试
-            - 包含时间戳用于进度监控和性能分析
-            - 自动创建进度文件目录
-            - 写入失败不会影响下载过程
+        Raises:
+            ValueError: API配置不完整或主session不存在
+            AuthKeyUnregisteredError: 主session未授权
         """
-        try:
-            import json
-            progress_data = {
-                "file_path": file_path,
-                "current": current,
-                "total": total,
-                "timestamp": str(datetime.now()),
-                "chat_id": self.chat_id,
-                "message_id": self.message_id
-            }
-            
-            os.makedirs(os.path.dirname(self.progress_file), exist_ok=True)
-            with open(self.progress_file, 'w', encoding='utf-8') as f:
-                json.dump(progress_data, f, indent=2)
-                
-        except Exception as e:
-            logger.warning("保存下载进度失败", error=str(e), session=self.session_name)
-    
-    def _load_progress(self, file_path: str) -> Optional[Dict[str, Any]]:
-        """从文件加载下载进度"""
-        try:
-            if not os.path.exists(self.progress_file):
-                return None
-                
-            import json
-            with open(self.progress_file, 'r', encoding='utf-8') as f:
-                progress_data = json.load(f)
-            
-            # 验证进度数据是否匹配当前下载任务
-            if progress_data.get("file_path") == file_path:
-                return progress_data
-                
-        except Exception as e:
-            logger.warning("加载下载进度失败", error=str(e), session=self.session_name)
-        
-        return None
-    
-    def _clear_progress(self):
-        """清理进度文件"""
-        try:
-            if os.path.exists(self.progress_file):
-                os.remove(self.progress_file)
-        except Exception as e:
-            logger.warning("清理进度文件失败", error=str(e), progress_file=self.progress_file)
-    
-    async def initialize(self):
-        """初始化Telegram客户端"""
-        if self._initialized and self.client and self.client.is_connected():
+        if self._initialized:
             return
-        
+
         try:
-            # 如果已有客户端实例，先断开
-            if self.client:
-                try:
-                    await self.client.disconnect()
-                except:
-                    pass
-                self.client = None
-            
-            # 获取Telegram配置 - 使用缓存避免重复数据库访问
-            api_id = settings.telegram_api_id
-            api_hash = settings.telegram_api_hash
-            
-            logger.info("媒体下载器初始化", api_id=api_id, api_hash_masked=bool(api_hash), session=self.session_name)
-            
-            if not api_id or not api_hash:
-                raise ValueError(f"Telegram API配置不完整: API ID={api_id}, API Hash={'已设置' if api_hash else '未设置'}")
-            
-            # 确保session目录存在并有正确权限
-            session_dir = os.path.dirname(self.session_name)
-            os.makedirs(session_dir, exist_ok=True)
-            # 设置目录权限，确保可读写
-            os.chmod(session_dir, 0o755)
-            
-            # 使用独立session文件避免数据库锁定问题
-            main_session_path = os.path.join("./telegram_sessions", "tggod_session")
-            
-            # 检查主session是否存在
-            if not os.path.exists(f"{main_session_path}.session"):
-                raise ValueError("主session文件不存在，请确保主服务已完成认证")
-            
-            # 检查并修复主session文件权限
-            try:
-                main_session_file = f"{main_session_path}.session"
-                current_stat = os.stat(main_session_file)
-                if oct(current_stat.st_mode)[-3:] != '666':
-                    logger.info("修复主session文件权限", session_file=main_session_file)
-                    os.chmod(main_session_file, 0o666)
-            except Exception as perm_error:
-                logger.warning("无法修复主session文件权限", error=str(perm_error), session_file=main_session_file)
-            
-            logger.info("复制主session到独立文件", target_session=self.session_name, source_session=main_session_file)
-            
-            # 使用临时文件安全地复制session文件
-            
-            try:
-                # 复制session文件到独立路径，避免并发访问
-                if os.path.exists(f"{main_session_path}.session"):
-                    # 使用临时文件管理器确保原子性复制
-                    with temp_file(suffix='.session', purpose='session_copy') as temp_path:
-                        with open(f"{main_session_path}.session", 'rb') as src:
-                            with open(temp_path, 'wb') as dst:
-                                shutil.copyfileobj(src, dst)
-
-                        # 原子性移动到目标位置
-                        shutil.move(temp_path, f"{self.session_name}.session")
-                    
-                    # 设置文件权限为可读写，解决只读数据库问题
-                    os.chmod(f"{self.session_name}.session", 0o666)
-                    logger.info("Session文件复制完成", session=self.session_name, permissions="rw")
-                
-                # 使用独立的session文件
-                self.client = TelegramClient(
-                    self.session_name,
-                    api_id,
-                    api_hash,
-                    connection_retries=3,
-                    retry_delay=2,
-                    timeout=30,
-                    use_ipv6=False
-                )
-                
-            except Exception as e:
-                logger.error("Session文件复制失败", error=str(e), session=self.session_name)
-                # 回退到内存session
-                logger.info("回退到内存session模式", session=self.session_name)
-                self.client = TelegramClient(
-                    f":memory:",
-                    api_id,
-                    api_hash,
-                    connection_retries=3,
-                    retry_delay=2,
-                    timeout=30,
-                    use_ipv6=False
-                )
-            
-            # 使用信号量控制并发连接，避免数据库锁定
-            async with _connection_semaphore:
-                # 连接前稍作延迟，避免与主服务冲突
-                await asyncio.sleep(0.5)
-                
-                # 连接客户端
-                logger.info("正在连接媒体下载器客户端", session=self.session_name, api_id=api_id)
-                await self.client.connect()
-            
-            # 检查认证状态
-            is_authorized = await self.client.is_user_authorized()
-            if not is_authorized:
-                raise AuthKeyUnregisteredError("主session未授权，请重新认证Telegram服务")
-            
+            await download_client_pool.start()
             self._initialized = True
-            logger.info("Telegram媒体下载器初始化成功", session=self.session_name, client_id=id(self.client))
-            
+            logger.info("Telegram媒体下载器初始化成功", session=self.session_name,
+                        pool_size=download_client_pool.size)
         except AuthKeyUnregisteredError as e:
             logger.error("媒体下载器认证失败", error=str(e), session=self.session_name)
             logger.error("请确保主Telegram服务已完成认证", session=self.session_name)
-            await self._cleanup()
             raise
         except Exception as e:
             logger.error("Telegram媒体下载器初始化失败", error=str(e), session=self.session_name)
-            await self._cleanup()
             raise
-    
-    async def _cleanup(self, force_remove_session: bool = False):
-        """清理资源和临时文件"""
-        try:
-            # 断开客户端连接
-            if self.client:
-                try:
-                    await self.client.disconnect()
-                except Exception as e:
-                    # 处理SQLite只读错误，避免影响清理过程
-                    if "attempt to write a readonly database" in str(e):
-                        logger.warning("断开下载器连接时遇到只读数据库错误", error=str(e), ignored=True, session=self.session_name)
-                    else:
-                        logger.warning("断开下载器连接时出错", error=str(e), session=self.session_name)
-                finally:
-                    self.client = None
-            
-            # 根据参数决定是否清理session文件
-            if force_remove_session and hasattr(self, 'session_name') and self.session_name:
-                session_file = f"{self.session_name}.session"
-                if os.path.exists(session_file):
-                    try:
-                        os.remove(session_file)
-                        logger.info("已清理session文件", session_file=session_file)
-                    except Exception as e:
-                        logger.warning("清理session文件失败", error=str(e), session_file=session_file)
-            
-            self._initialized = False
-            
-        except Exception as e:
-            logger.error("资源清理失败", error=str(e), session=self.session_name)
-    
-    def __del__(self):
-        """析构函数，确保资源被清理"""
-        if hasattr(self, 'session_name') and self.session_name:
-            session_file = f"{self.session_name}.session"
-            if os.path.exists(session_file):
-                try:
-                    os.remove(session_file)
-                except:
-                    pass  # 忽略析构函数中的错误
-    
+
+    async def reinitialize(self):
+        """重新初始化下载器，回收客户端池中的所有连接"""
+        await download_client_pool.recycle()
+        self._initialized = False
+        await self.initialize()
+
     async def download_file(
         self, 
         file_id: str, 
@@ -360,22 +166,20 @@ class TelegramMediaDownloader:
             下载是否成功
         """
         try:
-            # 重新初始化确保连接正常
             await self.initialize()
-            
-            if not self.client or not self.client.is_connected():
-                logger.error("Telegram客户端未连接")
+
+            if not (chat_id and message_id):
+                logger.warning(f"缺少chat_id或message_id，无法下载文件: {file_id}")
                 return False
-            
+
             # 确保目标目录存在
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            
-            if chat_id and message_id:
-                # 通过聊天和消息ID获取文件
-                return await self._download_by_message(chat_id, message_id, file_path, progress_callback)
-            else:
-                logger.warning(f"缺少chat_id或message_id，无法下载文件: {file_id}")
-                return False
+
+            # 从客户端池租用长连接，下载完成后归还而不是断开
+            leased = time.perf_counter()
+            async with download_client_pool.lease(chat_id=chat_id) as client:
+                tracer.add_span("client_lease", leased, time.perf_counter())
+                return await self._download_by_message(client, chat_id, message_id, file_path, progress_callback)
                 
         except Exception as e:
             logger.error(f"下载文件失败 {file_id}: {str(e)}")
@@ -386,22 +190,21 @@ class TelegramMediaDownloader:
                 except:
                     pass
             return False
-        finally:
-            # 下载完成后断开连接释放资源
-            await self.cleanup()
     
-    async def _download_by_message(self, chat_id: int, message_id: int, file_path: str, progress_callback: Optional[callable] = None) -> bool:
-        """通过消息ID下载文件"""
+    async def _download_by_message(self, client: TelegramClient, chat_id: int, message_id: int, file_path: str, progress_callback: Optional[callable] = None) -> bool:
+        """通过消息ID使用租用的池化客户端下载文件"""
         max_retries = 3
         logger.info(f"媒体下载器 - 接收到参数: chat_id={chat_id}, message_id={message_id}, file_path={file_path}")
         for attempt in range(max_retries):
             try:
                 # 获取聊天实体
                 logger.info(f"媒体下载器 - 尝试获取实体: chat_id={chat_id}")
-                chat = await self.client.get_entity(chat_id)
+                with tracer.span("entity_lookup", attempt=attempt + 1):
+                    chat = await rate_governor.call(RPC_ENTITY, client.get_entity, chat_id)
                 
                 # 获取消息
-                messages = await self.client.get_messages(chat, ids=message_id)
+                with tracer.span("get_messages", attempt=attempt + 1):
+                    messages = await rate_governor.call(RPC_HISTORY, client.get_messages, chat, ids=message_id)
                 
                 # 处理返回的消息，可能是单个消息或消息列表
                 if messages:
@@ -422,94 +225,107 @@ class TelegramMediaDownloader:
                     logger.warning(f"消息 {message_id} 无媒体内容")
                     return False
                 
+                # 记录媒体所在DC，后续同一聊天的下载优先使用同一客户端
+                download_client_pool.record_dc(chat_id, client, self._get_media_dc_id(message.media))
+
                 # 获取媒体信息用于日志描述
                 media_info = self._get_media_description(message.media)
                 logger.info(f"准备下载媒体: {media_info}")
                 
-                if progress_callback:
-                    # 检查是否有之前的下载进度
-                    saved_progress = self._load_progress(file_path)
-                    if saved_progress:
-                        current_progress = saved_progress.get('current', 0)
-                        total_size = saved_progress.get('total', 0)
-                        if total_size > 0:
-                            logger.info(f"发现之前的下载进度: {current_progress}/{total_size} ({current_progress/total_size*100:.1f}%)")
-                    
-                    # 增强的进度处理包装器 - 包含进度保存功能
-                    last_logged_percent = [-1]  # 使用列表以便在嵌套函数中修改
-                    
-                    def progress_wrapper(current, total):
-                        try:
-                            if total > 0:
-                                # 保存下载进度到文件
-                                self._save_progress(file_path, current, total)
-                                
-                                # 使用简化的进度报告，避免异步回调问题
-                                progress_percent = (current / total) * 100
-                                
-                                # 每10%或下载完成时才打印日志，减少频繁输出
-                                current_ten_percent = int(progress_percent // 10) * 10
-                                if (current_ten_percent != last_logged_percent[0] and current_ten_percent % 10 == 0) or current == total:
-                                    last_logged_percent[0] = current_ten_percent
-                                    # 格式化文件大小显示
-                                    current_mb = current / (1024 * 1024)
-                                    total_mb = total / (1024 * 1024)
-                                    logger.info(f"下载进度 [{media_info}]: {current_mb:.1f}MB/{total_mb:.1f}MB ({progress_percent:.1f}%)")
-                                
-                                # 尝试调用回调，但不要让回调错误中断下载
-                                try:
-                                    if asyncio.iscoroutinefunction(progress_callback):
-                                        # 对于异步回调，使用 call_soon_threadsafe 来避免死锁
-                                        loop = asyncio.get_event_loop()
-                                        if loop.is_running():
-                                            # 在这里我们不等待异步回调完成，避免死锁
-                                            asyncio.create_task(progress_callback(current, total, progress_percent))
-                                    else:
-                                        # 直接调用同步回调
-                                        progress_callback(current, total, progress_percent)
-                                except Exception as callback_error:
-                                    # 进度回调错误不应该中断下载
-                                    logger.warning(f"进度回调警告: {callback_error}")
-                        except Exception as e:
-                            # 包装器本身的错误也不应该中断下载
-                            logger.warning(f"进度包装器警告: {e}")
-                    
+                # 进度处理包装器 - 断点续传状态由分片引擎维护，这里只负责日志和回调
+                last_logged_percent = [-1]  # 使用列表以便在嵌套函数中修改
+                # 异步回调同一时间只保留一个在途任务，期间的中间进度直接合并为最新值
+                pending_callback = [None]
+                latest_progress = [None]
+
+                async def drain_async_callback():
                     try:
-                        logger.info(f"开始下载文件: {file_path}")
-                        # 添加下载超时，防止卡住（10分钟超时）
-                        await asyncio.wait_for(
-                            self.client.download_media(message.media, file_path, progress_callback=progress_wrapper),
-                            timeout=600
-                        )
-                        
-                        logger.info(f"通过消息下载文件成功: {file_path}")
-                        # 下载成功后清理进度文件
-                        self._clear_progress()
-                        return True
-                    except asyncio.TimeoutError:
-                        logger.error(f"下载超时 (10分钟): {file_path}")
-                        raise
+                        while latest_progress[0] is not None:
+                            args, latest_progress[0] = latest_progress[0], None
+                            await progress_callback(*args)
+                    except Exception as callback_error:
+                        logger.warning(f"进度回调警告: {callback_error}")
+                    finally:
+                        pending_callback[0] = None
+
+                def progress_wrapper(current, total):
+                    try:
+                        if total > 0:
+                            # 使用简化的进度报告，避免异步回调问题
+                            progress_percent = (current / total) * 100
+
+                            # 每10%或下载完成时才打印日志，减少频繁输出
+                            current_ten_percent = int(progress_percent // 10) * 10
+                            if (current_ten_percent != last_logged_percent[0] and current_ten_percent % 10 == 0) or current == total:
+                                last_logged_percent[0] = current_ten_percent
+                                # 格式化文件大小显示
+                                current_mb = current / (1024 * 1024)
+                                total_mb = total / (1024 * 1024)
+                                logger.info(f"下载进度 [{media_info}]: {current_mb:.1f}MB/{total_mb:.1f}MB ({progress_percent:.1f}%)")
+
+                            if not progress_callback:
+                                return
+
+                            # 尝试调用回调，但不要让回调错误中断下载
+                            try:
+                                if asyncio.iscoroutinefunction(progress_callback):
+                                    latest_progress[0] = (current, total, progress_percent)
+                                    if pending_callback[0] is None:
+                                        # 不等待异步回调完成，避免阻塞下载；已有在途任务时由其取走最新值
+                                        pending_callback[0] = asyncio.get_running_loop().create_task(
+                                            drain_async_callback()
+                                        )
+                                else:
+                                    # 直接调用同步回调
+                                    progress_callback(current, total, progress_percent)
+                            except Exception as callback_error:
+                                # 进度回调错误不应该中断下载
+                                logger.warning(f"进度回调警告: {callback_error}")
                     except Exception as e:
-                        logger.error(f"下载失败: {e}")
-                        raise
+                        # 包装器本身的错误也不应该中断下载
+                        logger.warning(f"进度包装器警告: {e}")
+
+                document = getattr(message.media, 'document', None)
+                file_size = getattr(document, 'size', None) or getattr(getattr(message, 'file', None), 'size', None)
+                # 超时按文件大小计算，大视频不再因固定的10分钟超时失败
+                download_timeout = compute_download_timeout(file_size)
+                threshold = settings.parallel_download_threshold_mb * 1024 * 1024
+
+                if document is not None and file_size and file_size >= threshold:
+                    # 大文档: 多分片并行下载，支持按分片断点续传
+                    engine = ChunkedDownloadEngine(
+                        client,
+                        document,
+                        file_path,
+                        file_size,
+                        media_id=document.id,
+                        progress_callback=progress_wrapper,
+                    )
+                    logger.info(f"开始并行分片下载 [{media_info}]: {file_path}",
+                                parts=engine.total_parts, concurrency=engine.concurrency)
+                    with tracer.span("transfer", bytes=file_size, chunked=True, parts=engine.total_parts,
+                                     attempt=attempt + 1):
+                        await engine.download()
                 else:
                     logger.info(f"开始下载 [{media_info}]: {file_path}")
-                    # 添加下载超时，即使没有进度回调
-                    await asyncio.wait_for(
-                        self.client.download_media(message.media, file_path),
-                        timeout=600
-                    )
-                    
-                    logger.info(f"下载完成 [{media_info}]: {file_path}")
-                    # 下载成功后清理进度文件
-                    self._clear_progress()
-                    return True
+                    try:
+                        with tracer.span("transfer", bytes=file_size, chunked=False, attempt=attempt + 1):
+                            async with rate_governor.throttled(RPC_GET_FILE):
+                                await asyncio.wait_for(
+                                    client.download_media(message.media, file_path, progress_callback=progress_wrapper),
+                                    timeout=download_timeout
+                                )
+                    except asyncio.TimeoutError:
+                        logger.error(f"下载超时 ({download_timeout:.0f}秒): {file_path}")
+                        raise
+
+                logger.info(f"下载完成 [{media_info}]: {file_path}")
+                return True
                 
             except FloodWaitError as e:
-                if attempt < max_retries - 1:
-                    wait_time = min(e.seconds, 300)  # 最多等待5分钟
-                    logger.warning(f"媒体下载遇到Flood Wait，等待{wait_time}秒后重试 (尝试 {attempt + 1}/{max_retries})")
-                    await asyncio.sleep(wait_time)
+                # 限速器已记录该 FloodWait 并顺延同类请求，下一次尝试在获取令牌时等待
+                if attempt < max_retries - 1 and e.seconds <= rate_governor.max_flood_wait:
+                    logger.warning(f"媒体下载遇到Flood Wait {e.seconds}秒，限速后重试 (尝试 {attempt + 1}/{max_retries})")
                 else:
                     logger.error(f"媒体下载达到最大重试次数，Flood Wait错误: {e}")
                     raise
@@ -518,13 +334,18 @@ class TelegramMediaDownloader:
                 # 特殊处理SQLite只读数据库错误
                 if "attempt to write a readonly database" in error_msg:
                     if attempt < max_retries - 1:
-                        logger.warning(f"下载尝试 {attempt + 1} 遇到只读数据库错误，尝试重新初始化连接后重试...")
-                        # 强制重新初始化客户端
-                        await self._cleanup(force_remove_session=True)
-                        self._initialized = False
-                        await asyncio.sleep(2)  # 等待更长时间确保清理完成
-                        await self.initialize()
+                        # 同一租约内的客户端不会被池重建，重试前就地重新复制session副本并重连
+                        logger.warning(f"下载尝试 {attempt + 1} 遇到只读数据库错误，重建客户端后重试...")
+                        await asyncio.sleep(1)
+                        try:
+                            client = await download_client_pool.rebuild(client)
+                        except Exception as rebuild_error:
+                            # 槽位已断开，归还后下次租用时重新连接
+                            logger.error(f"重建下载客户端失败，放弃重试: {rebuild_error}")
+                            raise
                     else:
+                        # 归还时断开该池化客户端，下次租用时重新连接
+                        download_client_pool.mark_unhealthy(client)
                         logger.error(f"通过消息ID下载失败（只读数据库错误）: {e}")
                         raise
                 else:
@@ -537,6 +358,14 @@ class TelegramMediaDownloader:
         
         return False
     
+    def _get_media_dc_id(self, media) -> Optional[int]:
+        """获取媒体文件所在的数据中心ID"""
+        for attr in ('document', 'photo'):
+            item = getattr(media, attr, None)
+            if item is not None and getattr(item, 'dc_id', None):
+                return item.dc_id
+        return None
+
     def _get_media_description(self, media) -> str:
         """获取媒体文件的描述信息"""
         try:
@@ -615,15 +444,13 @@ class TelegramMediaDownloader:
         if not self._initialized:
             await self.initialize()
         
-        if not self.client:
-            return None
-        
         try:
             # 实际的Telegram API调用获取文件信息
             from telethon.tl.types import Document, Photo
             
             # 通过消息ID获取消息
-            message = await self.client.get_messages(entity=None, ids=int(file_id))
+            async with download_client_pool.lease() as client:
+                message = await rate_governor.call(RPC_HISTORY, client.get_messages, entity=None, ids=int(file_id))
             if not message or not message.media:
                 return None
                 
@@ -661,6 +488,8 @@ class TelegramMediaDownloader:
     ) -> bool:
         """
         生成媒体文件缩略图
+
+        由缩略图服务在进程池中生成（结果进入内容寻址缓存），再复制到指定路径。
         
         Args:
             media_path: 原媒体文件路径
@@ -671,221 +500,30 @@ class TelegramMediaDownloader:
             生成是否成功
         """
         try:
-            if media_type == "photo":
-                # 图片缩略图
-                from PIL import Image
-                
-                with Image.open(media_path) as img:
-                    # 生成缩略图 (200x200)
-                    img.thumbnail((200, 200), Image.Resampling.LANCZOS)
-                    
-                    # 确保目标目录存在
-                    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
-                    
-                    # 保存缩略图
-                    img.save(thumbnail_path, format='JPEG', quality=85)
-                    
-                logger.info(f"图片缩略图生成成功: {thumbnail_path}")
-                return True
-                
-            elif media_type == "video":
-                # 视频缩略图生成
-                return await self._generate_video_thumbnail(media_path, thumbnail_path)
-            
-            else:
-                # 其他类型不生成缩略图
+            cached_path = await thumbnail_service.render_file(media_path, media_type, fmt="jpeg")
+            if not cached_path:
                 return False
-                
-        except Exception as e:
-            logger.error(f"生成缩略图失败: {str(e)}")
-            return False
-
-    async def _generate_video_thumbnail(self, video_path: str, thumbnail_path: str) -> bool:
-        """
-        生成视频缩略图
-
-        使用ffmpeg-python从视频文件提取关键帧并生成320x180缩略图
-
-        Args:
-            video_path: 视频文件路径
-            thumbnail_path: 缩略图保存路径
 
-        Returns:
-            bool: 生成是否成功
-        """
-        try:
-            import ffmpeg
-            import asyncio
-            from concurrent.futures import ThreadPoolExecutor
-
-            # 确保目标目录存在
-            os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+            def _copy():
+                os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+                shutil.copyfile(cached_path, thumbnail_path)
 
-            # 在线程池中执行ffmpeg操作以避免阻塞
-            def _extract_thumbnail():
-                try:
-                    # 获取视频信息
-                    probe = ffmpeg.probe(video_path)
-                    video_stream = next((stream for stream in probe['streams']
-                                       if stream['codec_type'] == 'video'), None)
-
-                    if not video_stream:
-                        logger.error(f"视频文件中未找到视频流: {video_path}")
-                        return False
-
-                    # 获取视频时长
-                    try:
-                        duration = float(video_stream.get('duration', 0))
-                        if duration <= 0:
-                            # 如果流中没有duration，尝试从格式信息获取
-                            format_info = probe.get('format', {})
-                            duration = float(format_info.get('duration', 0))
-                    except (ValueError, TypeError):
-                        duration = 0
-
-                    if duration <= 0:
-                        logger.warning(f"无法获取视频时长，使用10秒作为提取时间点: {video_path}")
-                        seek_time = 10
-                    else:
-                        # 在视频1/3处提取关键帧
-                        seek_time = duration / 3
-                        # 确保不超过视频长度
-                        if seek_time > duration - 1:
-                            seek_time = max(1, duration / 2)
-
-                    logger.debug(f"视频时长: {duration:.2f}秒, 提取时间点: {seek_time:.2f}秒")
-
-                    # 检查视频文件格式支持
-                    supported_formats = ['mp4', 'avi', 'mkv', 'mov', 'wmv', 'flv', 'webm', 'm4v']
-                    file_ext = os.path.splitext(video_path)[1].lower().lstrip('.')
-
-                    if file_ext not in supported_formats:
-                        logger.warning(f"视频格式可能不支持: {file_ext}")
-
-                    # 构建ffmpeg命令
-                    input_stream = ffmpeg.input(video_path, ss=seek_time)
-
-                    # 输出配置：320x180缩略图，JPEG格式，高质量
-                    output_stream = ffmpeg.output(
-                        input_stream,
-                        thumbnail_path,
-                        vframes=1,  # 只提取一帧
-                        format='image2',
-                        vcodec='mjpeg',
-                        s='320x180',  # 设置输出尺寸
-                        q=2,  # 高质量 (1-31, 1最高质量)
-                        update=1,  # 覆盖已存在的文件
-                        loglevel='error'  # 减少日志输出
-                    )
-
-                    # 执行ffmpeg命令
-                    ffmpeg.run(output_stream, overwrite_output=True, quiet=True)
-
-                    # 验证生成的缩略图文件
-                    if os.path.exists(thumbnail_path) and os.path.getsize(thumbnail_path) > 0:
-                        logger.info(f"视频缩略图生成成功: {thumbnail_path}")
-                        return True
-                    else:
-                        logger.error(f"生成的缩略图文件为空或不存在: {thumbnail_path}")
-                        return False
-
-                except ffmpeg.Error as e:
-                    logger.error(f"FFmpeg错误: {e.stderr.decode() if e.stderr else str(e)}")
-                    return False
-                except Exception as e:
-                    logger.error(f"提取视频缩略图时发生错误: {str(e)}")
-                    return False
-
-            # 使用线程池执行ffmpeg操作
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                loop = asyncio.get_event_loop()
-                result = await loop.run_in_executor(executor, _extract_thumbnail)
-                return result
-
-        except ImportError:
-            logger.warning("ffmpeg-python库未安装，尝试使用系统ffmpeg命令")
-            return await self._generate_video_thumbnail_fallback(video_path, thumbnail_path)
-        except FileNotFoundError:
-            logger.error("未找到视频文件，无法生成缩略图")
-            return False
+            await asyncio.to_thread(_copy)
+            logger.info(f"缩略图生成成功: {thumbnail_path}")
+            return True
         except Exception as e:
-            logger.error(f"生成视频缩略图时发生未知错误: {str(e)}")
-            # 尝试备用方案
-            logger.info("尝试使用备用方案生成视频缩略图")
-            return await self._generate_video_thumbnail_fallback(video_path, thumbnail_path)
-
-    async def _generate_video_thumbnail_fallback(self, video_path: str, thumbnail_path: str) -> bool:
-        """
-        备用视频缩略图生成方法（使用系统ffmpeg命令）
-
-        当ffmpeg-python库不可用时使用此方法
-
-        Args:
-            video_path: 视频文件路径
-            thumbnail_path: 缩略图保存路径
-
-        Returns:
-            bool: 生成是否成功
-        """
-        try:
-            import subprocess
-            import shutil
-
-            # 检查系统是否安装了ffmpeg
-            if not shutil.which('ffmpeg'):
-                logger.error("系统未安装ffmpeg，无法生成视频缩略图")
-                return False
-
-            # 确保目标目录存在
-            os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
-
-            # 构建ffmpeg命令
-            cmd = [
-                'ffmpeg',
-                '-i', video_path,
-                '-ss', '00:00:10',  # 从10秒处开始
-                '-vframes', '1',  # 只提取一帧
-                '-vf', 'scale=320:180',  # 缩放到320x180
-                '-q:v', '2',  # 高质量
-                '-y',  # 覆盖输出文件
-                thumbnail_path
-            ]
-
-            # 执行命令
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30  # 30秒超时
-            )
-
-            if result.returncode == 0 and os.path.exists(thumbnail_path):
-                logger.info(f"视频缩略图生成成功（备用方法）: {thumbnail_path}")
-                return True
-            else:
-                logger.error(f"FFmpeg命令执行失败: {result.stderr}")
-                return False
-
-        except subprocess.TimeoutExpired:
-            logger.error("视频缩略图生成超时")
-            return False
-        except Exception as e:
-            logger.error(f"备用方法生成视频缩略图失败: {str(e)}")
+            logger.error(f"生成缩略图失败: {str(e)}")
             return False
 
     async def cleanup(self):
-        """清理资源，下载完成后调用"""
-        try:
-            if self.client and self.client.is_connected():
-                await self.client.disconnect()
-                logger.info("媒体下载器连接已断开")
-        except Exception as e:
-            logger.warning(f"断开下载器连接时出错: {e}")
-        finally:
-            self._initialized = False
+        """清理资源，下载完成后调用
+
+        池化客户端由客户端池统一管理生命周期，这里只释放下载器自身的引用。
+        """
+        self.client = None
     
     async def close(self):
-        """关闭客户端连接"""
+        """关闭下载器（不会断开共享的池化连接）"""
         await self.cleanup()
         logger.info("Telegram媒体下载器已关闭")
 
@@ -951,6 +589,8 @@ async def invalidate_session_cache():
     global _session_status_cache, _last_session_check
     _session_status_cache.clear()
     _last_session_check = 0
+    # 主session可能已变更，池化客户端需基于新的session重建
+    await download_client_pool.recycle()
     logger.info("已清除session状态缓存")
 
 async def get_media_downloader(chat_id: Optional[int] = None, message_id: Optional[int] = None) -> TelegramMediaDownloader:
@@ -18,6 +18,7 @@ import weakref
 
 from ..core.memory_manager import memory_manager, MemoryTracker
 from ..websocket.manager import websocket_manager
+from .system_metrics_sampler import get_system_metrics_sampler
 
 logger = logging.getLogger(__name__)
 
@@ -210,21 +211,19 @@ class MemoryMonitoringService:
 
     def _get_detailed_memory_info(self) -> Dict[str, Any]:
         """获取详细的内存信息"""
-        process = psutil.Process()
-        process_memory = process.memory_info()
-        system_memory = psutil.virtual_memory()
+        # 进程和系统内存来自系统指标采样器的最新快照
+        snapshot = get_system_metrics_sampler().latest()
 
         # 获取Python内存信息
-        import sys
         python_objects = len(gc.get_objects())
 
         return {
             'timestamp': datetime.now().isoformat(),
-            'process_memory_mb': process_memory.rss / 1024 / 1024,
-            'process_memory_percent': process.memory_percent(),
-            'system_memory_percent': system_memory.percent,
-            'system_available_mb': system_memory.available / 1024 / 1024,
-            'system_total_mb': system_memory.total / 1024 / 1024,
+            'process_memory_mb': snapshot.process_memory_rss / 1024 / 1024,
+            'process_memory_percent': snapshot.process_memory_percent,
+            'system_memory_percent': snapshot.memory_percent,
+            'system_available_mb': snapshot.memory_available / 1024 / 1024,
+            'system_total_mb': snapshot.memory_total / 1024 / 1024,
             'python_objects_count': python_objects,
             'tracked_objects': len(memory_manager.tracker.tracked_objects),
             'cache_usage': memory_manager.global_cache.get_stats()
@@ -0,0 +1,293 @@
+"""Telegram消息批量入库
+
+将 `_process_message` 产出的消息字典批量写入 telegram_messages 表。
+
+主要功能:
+- 预编译的列映射: 每列一个类型转换函数和默认值，替代逐字段的类型判断
+- 分块集合查询判断已有消息，替代逐条 SELECT
+- SQLite/PostgreSQL 使用 INSERT ... ON CONFLICT(group_id, message_id) DO UPDATE，
+  同步编辑内容、浏览数、反应等可变字段
+- 分块 executemany，全部分块在同一个事务内提交
+- 返回新增、更新、跳过数量
+- 新增和更新的消息在同一事务内交给规则匹配服务评估，写入 rule_message_matches
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import JSON, DateTime, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from ..models.telegram import TelegramMessage
+
+logger = logging.getLogger(__name__)
+
+# 已有消息再次同步时允许更新的字段(编辑、浏览数、反应、置顶等)
+UPDATABLE_COLUMNS = (
+    "text",
+    "edit_date",
+    "view_count",
+    "is_pinned",
+    "reactions",
+    "mentions",
+    "hashtags",
+    "urls",
+)
+
+DEFAULT_CHUNK_SIZE = 500
+
+_SKIP = object()
+
+
+@dataclass
+class MessageIngestResult:
+    """批量入库结果"""
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    inserted_message_ids: List[int] = field(default_factory=list)
+    updated_message_ids: List[int] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return self.inserted + self.updated + self.skipped
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "total": self.total,
+        }
+
+
+def _is_telethon_object(value: Any) -> bool:
+    type_str = str(type(value)).lower()
+    return "telethon" in type_str or "peer" in type_str
+
+
+def _convert_json(value: Any) -> Any:
+    if isinstance(value, (list, dict)):
+        try:
+            return json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"JSON序列化失败: {e}")
+            return str(value)
+    return str(value)
+
+
+def _convert_datetime(value: Any) -> Any:
+    if hasattr(value, "isoformat") or isinstance(value, str):
+        return value
+    logger.warning(f"日期字段格式异常: {type(value)}")
+    return None
+
+
+def _convert_scalar(value: Any) -> Any:
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    if _is_telethon_object(value):
+        return _SKIP
+    logger.warning(f"字段类型异常: {type(value)}, 转换为字符串")
+    return str(value)
+
+
+def _build_column_mapping() -> Dict[str, Tuple[Callable[[Any], Any], Any]]:
+    """根据 TelegramMessage 表结构生成 列名 -> (转换函数, 默认值)"""
+    mapping = {}
+    for column in TelegramMessage.__table__.columns:
+        if column.name in ("id", "group_id", "created_at", "updated_at"):
+            continue
+        if isinstance(column.type, JSON):
+            converter = _convert_json
+        elif isinstance(column.type, DateTime):
+            converter = _convert_datetime
+        else:
+            converter = _convert_scalar
+        default = None
+        if column.default is not None and column.default.is_scalar:
+            default = column.default.arg
+        mapping[column.name] = (converter, default)
+    return mapping
+
+
+COLUMN_MAPPING = _build_column_mapping()
+
+
+def map_message_row(group_id: int, message_data: Dict[str, Any]) -> Dict[str, Any]:
+    """将消息字典转换为可直接 executemany 的行
+
+    每行都包含全部列，保证同一批次的参数键一致；缺失字段使用列默认值。
+    """
+    row = {"group_id": group_id}
+    for name, (converter, default) in COLUMN_MAPPING.items():
+        value = message_data.get(name)
+        if value is None:
+            row[name] = default
+            continue
+        if _is_telethon_object(value):
+            row[name] = default
+            continue
+        converted = converter(value)
+        row[name] = default if converted is _SKIP else converted
+    return row
+
+
+def _comparable(value: Any) -> Any:
+    """统一比较口径: 时间转为无时区UTC，其余原样"""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _has_changes(row: Dict[str, Any], existing: Dict[str, Any]) -> bool:
+    return any(
+        _comparable(row[name]) != _comparable(existing.get(name))
+        for name in UPDATABLE_COLUMNS
+    )
+
+
+def _chunks(items: List[Any], size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+_upsert_support: Dict[str, bool] = {}
+
+
+def _supports_upsert(db: Session) -> bool:
+    """ON CONFLICT 需要 (group_id, message_id) 上存在唯一索引"""
+    bind = db.get_bind()
+    dialect = bind.dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        return False
+    cache_key = str(bind.url)
+    if cache_key not in _upsert_support:
+        try:
+            indexes = inspect(bind).get_indexes(TelegramMessage.__tablename__)
+            constraints = inspect(bind).get_unique_constraints(TelegramMessage.__tablename__)
+            unique_sets = [set(idx["column_names"]) for idx in indexes if idx.get("unique")]
+            unique_sets += [set(c["column_names"]) for c in constraints]
+            _upsert_support[cache_key] = {"group_id", "message_id"} in unique_sets
+        except Exception as e:
+            logger.warning(f"检查消息唯一索引失败，使用普通插入: {e}")
+            _upsert_support[cache_key] = False
+        if not _upsert_support[cache_key]:
+            logger.warning("telegram_messages 缺少 (group_id, message_id) 唯一索引，批量入库回退为普通插入")
+    return _upsert_support[cache_key]
+
+
+def _build_upsert_statement(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+
+    stmt = dialect_insert(TelegramMessage.__table__)
+    set_ = {name: stmt.excluded[name] for name in UPDATABLE_COLUMNS}
+    set_["updated_at"] = func.now()
+    return stmt.on_conflict_do_update(index_elements=["group_id", "message_id"], set_=set_)
+
+
+def bulk_upsert_messages(
+    db: Session,
+    group_id: int,
+    messages: List[Dict[str, Any]],
+    update_existing: bool = True,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    match_rules: bool = True,
+) -> MessageIngestResult:
+    """批量写入消息(不提交事务，由调用方统一 commit)
+
+    Args:
+        db: 数据库会话
+        group_id: 数据库中的群组ID
+        messages: `_process_message` 产出的消息字典列表
+        update_existing: 已存在的消息是否同步可变字段
+        chunk_size: 每个 executemany 批次的行数
+        match_rules: 是否对新增/更新的消息执行入库时规则匹配
+
+    Returns:
+        MessageIngestResult: 新增/更新/跳过数量
+    """
+    result = MessageIngestResult()
+
+    # 批次内按 message_id 去重，保留最后一次出现(最新的编辑)
+    rows_by_id: Dict[int, Dict[str, Any]] = {}
+    source_by_id: Dict[int, Dict[str, Any]] = {}
+    for message_data in messages:
+        message_id = message_data.get("message_id")
+        if message_id is None:
+            result.skipped += 1
+            continue
+        if message_id in rows_by_id:
+            result.skipped += 1
+        rows_by_id[message_id] = map_message_row(group_id, message_data)
+        source_by_id[message_id] = message_data
+
+    if not rows_by_id:
+        return result
+
+    upsert_stmt = _build_upsert_statement(db) if _supports_upsert(db) else None
+    compare_columns = [getattr(TelegramMessage, name) for name in UPDATABLE_COLUMNS]
+
+    for chunk_ids in _chunks(list(rows_by_id.keys()), chunk_size):
+        # 一次集合查询取出本块中已存在的消息
+        existing = {
+            row.message_id: row._asdict()
+            for row in db.execute(
+                select(TelegramMessage.id, TelegramMessage.message_id, *compare_columns).where(
+                    TelegramMessage.group_id == group_id,
+                    TelegramMessage.message_id.in_(chunk_ids),
+                )
+            )
+        }
+
+        new_rows = []
+        changed_rows = []
+        for message_id in chunk_ids:
+            row = rows_by_id[message_id]
+            current = existing.get(message_id)
+            if current is None:
+                new_rows.append(row)
+            elif update_existing and _has_changes(row, current):
+                changed_rows.append((current["id"], row))
+            else:
+                result.skipped += 1
+
+        if upsert_stmt is not None:
+            batch = new_rows + [row for _, row in changed_rows]
+            if batch:
+                db.execute(upsert_stmt, batch)
+        else:
+            if new_rows:
+                db.execute(insert(TelegramMessage.__table__), new_rows)
+            if changed_rows:
+                db.execute(
+                    update(TelegramMessage),
+                    [
+                        {"id": pk, **{name: row[name] for name in UPDATABLE_COLUMNS}}
+                        for pk, row in changed_rows
+                    ],
+                )
+
+        result.inserted += len(new_rows)
+        result.updated += len(changed_rows)
+        result.inserted_message_ids.extend(row["message_id"] for row in new_rows)
+        result.updated_message_ids.extend(row["message_id"] for _, row in changed_rows)
+
+    if match_rules:
+        from .rule_match_service import rule_match_service
+
+        # 规则在原始消息字典上评估(JSON字段仍为列表)
+        changed_ids = result.inserted_message_ids + result.updated_message_ids
+        rule_match_service.match_ingested(db, group_id, [source_by_id[mid] for mid in changed_ids])
+
+    return result
@@ -0,0 +1,402 @@
+"""下载与任务进度聚合服务
+
+下载回调(Telethon每个分块触发一次)和任务流水线只更新内存中的最新值，
+由后台循环按固定频率合并推送和落库，避免高速链路下每秒数千次的
+WebSocket帧和数据库写入。
+
+主要功能:
+- 按 (task_id, message_id) 保存单个文件的最新进度，按 task_id 保存任务进度
+- 按配置频率(progress_publish_hz)批量推送有变化的进度，两次推送之间的中间值被合并
+- 进度检查点: 距上次落库超过 progress_checkpoint_interval 秒或 progress_checkpoint_mb 时
+  才通过单写线程写库，开始/完成时强制写入
+- 快照接口: 新连接的客户端直接获取当前进度，无需查询数据库
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..core.metrics import DOWNLOAD_BYTES
+from ..utils.db_writer import db_writer, UpdateMessageDownloadState, UpdateTaskState
+
+logger = logging.getLogger(__name__)
+
+# 已完成的文件进度在快照中保留的时间(秒)，便于界面显示最终状态
+FINISHED_RETENTION_SECONDS = 10.0
+# 下载速度的指数平滑系数
+SPEED_SMOOTHING = 0.3
+
+ProgressKey = Tuple[Optional[int], int]
+
+_TASK_BYTES = DOWNLOAD_BYTES.labels("task")
+_MANUAL_BYTES = DOWNLOAD_BYTES.labels("manual")
+
+
+@dataclass
+class FileProgress:
+    """单个文件的下载进度"""
+    task_id: Optional[int]
+    message_id: int
+    current: int = 0
+    total: int = 0
+    speed: float = 0.0
+    status: str = "downloading"
+    persist: bool = False
+    started_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    dirty: bool = True
+    checkpoint_at: float = 0.0
+    checkpoint_bytes: int = 0
+    checkpoint_pending: bool = True
+    _speed_sample_at: float = field(default_factory=time.monotonic)
+    _speed_sample_bytes: int = 0
+
+    @property
+    def percent(self) -> float:
+        return round(self.current / self.total * 100, 1) if self.total > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> Optional[int]:
+        if self.speed <= 0 or self.total <= 0:
+            return None
+        return int(max(0, self.total - self.current) / self.speed)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task_id": self.task_id,
+            "message_id": self.message_id,
+            "current": self.current,
+            "total": self.total,
+            "percent": self.percent,
+            "speed": int(self.speed),
+            "eta_seconds": self.eta_seconds,
+            "status": self.status,
+            "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+            "updated_at": datetime.fromtimestamp(self.updated_at, timezone.utc).isoformat(),
+        }
+
+
+@dataclass
+class TaskProgress:
+    """任务整体进度"""
+    task_id: int
+    progress: int = 0
+    downloaded: int = 0
+    total: int = 0
+    updated_at: float = field(default_factory=time.time)
+    dirty: bool = True
+    checkpoint_at: float = 0.0
+    checkpoint_pending: bool = True
+
+    def to_message(self) -> Dict[str, Any]:
+        return {
+            "type": "task_progress",
+            "task_id": self.task_id,
+            "progress": self.progress,
+            "downloaded": self.downloaded,
+            "total": self.total,
+            "timestamp": datetime.fromtimestamp(self.updated_at, timezone.utc).isoformat(),
+        }
+
+
+@dataclass
+class ProgressStats:
+    """进度服务统计"""
+    updates_received: int = 0
+    updates_coalesced: int = 0
+    frames_published: int = 0
+    checkpoints_written: int = 0
+    publish_errors: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "updates_received": self.updates_received,
+            "updates_coalesced": self.updates_coalesced,
+            "frames_published": self.frames_published,
+            "checkpoints_written": self.checkpoints_written,
+            "publish_errors": self.publish_errors,
+        }
+
+
+class ProgressService:
+    """进度聚合服务
+
+    report()/update_task() 只做内存赋值，可以直接在Telethon的同步进度回调中调用；
+    推送和落库都在后台循环中完成。
+    """
+
+    def __init__(self):
+        self._files: Dict[ProgressKey, FileProgress] = {}
+        self._tasks: Dict[int, TaskProgress] = {}
+        self._lock = threading.Lock()
+        self._publisher_task: Optional[asyncio.Task] = None
+        self.stats = ProgressStats()
+
+    # ------------------------------------------------------------------
+    # 上报
+    # ------------------------------------------------------------------
+
+    def report(self, task_id: Optional[int], message_id: int, current: int, total: int,
+               persist: bool = False):
+        """上报单个文件的下载进度
+
+        Args:
+            task_id: 所属任务ID，手动下载为None
+            message_id: 消息数据库ID
+            current: 已下载字节数
+            total: 文件总字节数
+            persist: 是否将进度检查点写入消息表(手动下载需要)
+        """
+        now = time.time()
+        key = (task_id, message_id)
+        with self._lock:
+            self.stats.updates_received += 1
+            entry = self._files.get(key)
+            if entry is None or entry.finished_at is not None:
+                entry = FileProgress(task_id=task_id, message_id=message_id, persist=persist)
+                self._files[key] = entry
+            elif entry.dirty:
+                self.stats.updates_coalesced += 1
+
+            sample_elapsed = time.monotonic() - entry._speed_sample_at
+            if sample_elapsed >= 0.5:
+                instant = (current - entry._speed_sample_bytes) / sample_elapsed
+                entry.speed = instant if entry.speed <= 0 else (
+                    SPEED_SMOOTHING * instant + (1 - SPEED_SMOOTHING) * entry.speed
+                )
+                entry._speed_sample_at = time.monotonic()
+                entry._speed_sample_bytes = current
+
+            if current > entry.current:
+                (_TASK_BYTES if task_id is not None else _MANUAL_BYTES).inc(current - entry.current)
+            entry.current = current
+            entry.total = total
+            entry.updated_at = now
+            entry.dirty = True
+
+            if current - entry.checkpoint_bytes >= settings.progress_checkpoint_mb * 1024 * 1024:
+                entry.checkpoint_pending = True
+
+    def complete(self, task_id: Optional[int], message_id: int, success: bool = True):
+        """标记文件下载结束，最终状态会在下一次推送中发出"""
+        with self._lock:
+            entry = self._files.get((task_id, message_id))
+            if entry is None:
+                return
+            entry.status = "completed" if success else "failed"
+            if success and entry.total:
+                entry.current = entry.total
+            entry.finished_at = time.time()
+            entry.updated_at = entry.finished_at
+            entry.dirty = True
+            # 最终状态由调用方写入数据库，这里不再落检查点
+            entry.checkpoint_pending = False
+
+    def update_task(self, task_id: int, progress: int, downloaded: int, total: int):
+        """上报任务整体进度"""
+        with self._lock:
+            self.stats.updates_received += 1
+            entry = self._tasks.get(task_id)
+            if entry is None:
+                entry = TaskProgress(task_id=task_id)
+                self._tasks[task_id] = entry
+            elif entry.dirty:
+                self.stats.updates_coalesced += 1
+            if progress != entry.progress and progress in (0, 100):
+                entry.checkpoint_pending = True
+            entry.progress = progress
+            entry.downloaded = downloaded
+            entry.total = total
+            entry.updated_at = time.time()
+            entry.dirty = True
+
+    async def finish_task(self, task_id: int):
+        """任务结束: 立即推送并落库最后的进度，然后清理该任务的所有状态"""
+        with self._lock:
+            entry = self._tasks.pop(task_id, None)
+            for key in [k for k in self._files if k[0] == task_id]:
+                del self._files[key]
+        if entry is None:
+            return
+        self._write_task_checkpoint(entry)
+        await self._broadcast(entry.to_message())
+
+    # ------------------------------------------------------------------
+    # 快照
+    # ------------------------------------------------------------------
+
+    def snapshot(self, task_id: Optional[int] = None) -> Dict[str, Any]:
+        """获取当前进度快照
+
+        Args:
+            task_id: 只返回指定任务的进度，None返回全部
+        """
+        with self._lock:
+            tasks = [
+                entry.to_message() for entry in self._tasks.values()
+                if task_id is None or entry.task_id == task_id
+            ]
+            files = [
+                entry.to_dict() for entry in self._files.values()
+                if task_id is None or entry.task_id == task_id
+            ]
+        for task in tasks:
+            task.pop("type", None)
+        return {
+            "tasks": tasks,
+            "downloads": files,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def get_download(self, task_id: Optional[int], message_id: int) -> Optional[Dict[str, Any]]:
+        """获取单个文件的当前进度，未在下载返回None"""
+        with self._lock:
+            entry = self._files.get((task_id, message_id))
+            return entry.to_dict() if entry else None
+
+    # ------------------------------------------------------------------
+    # 推送与检查点
+    # ------------------------------------------------------------------
+
+    def _collect(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[FileProgress], List[TaskProgress]]:
+        now = time.time()
+        checkpoint_interval = settings.progress_checkpoint_interval
+        files, tasks, file_checkpoints, task_checkpoints = [], [], [], []
+        with self._lock:
+            for key, entry in list(self._files.items()):
+                if entry.dirty:
+                    files.append(entry.to_dict())
+                    entry.dirty = False
+                if entry.persist and entry.finished_at is None and (
+                    entry.checkpoint_pending
+                    or (entry.current != entry.checkpoint_bytes and now - entry.checkpoint_at >= checkpoint_interval)
+                ):
+                    file_checkpoints.append(replace(entry))
+                    entry.checkpoint_at = now
+                    entry.checkpoint_bytes = entry.current
+                    entry.checkpoint_pending = False
+                if entry.finished_at is not None and now - entry.finished_at >= FINISHED_RETENTION_SECONDS:
+                    del self._files[key]
+
+            for entry in self._tasks.values():
+                if entry.dirty:
+                    tasks.append(entry.to_message())
+                    entry.dirty = False
+                if entry.checkpoint_pending or (
+                    entry.updated_at > entry.checkpoint_at and now - entry.checkpoint_at >= checkpoint_interval
+                ):
+                    task_checkpoints.append(replace(entry))
+                    entry.checkpoint_at = now
+                    entry.checkpoint_pending = False
+        return files, tasks, file_checkpoints, task_checkpoints
+
+    def _write_file_checkpoint(self, entry: FileProgress):
+        try:
+            db_writer.submit(UpdateMessageDownloadState(
+                entry.message_id,
+                {
+                    "download_progress": int(entry.percent),
+                    "downloaded_size": entry.current,
+                    "download_speed": int(entry.speed),
+                    "estimated_time_remaining": entry.eta_seconds or 0,
+                },
+                mark_started=True,
+            ))
+            self.stats.checkpoints_written += 1
+        except Exception as e:
+            logger.warning(f"提交下载进度检查点失败: {e}")
+
+    def _write_task_checkpoint(self, entry: TaskProgress):
+        try:
+            db_writer.submit(UpdateTaskState(entry.task_id, {
+                "progress": entry.progress,
+                "downloaded_messages": entry.downloaded,
+            }))
+            self.stats.checkpoints_written += 1
+        except Exception as e:
+            logger.warning(f"提交任务进度检查点失败: {e}")
+
+    async def _broadcast(self, message: Dict[str, Any], topic: Optional[str] = None):
+        from ..websocket.manager import websocket_manager
+        try:
+            await websocket_manager.broadcast(message, topic)
+            self.stats.frames_published += 1
+        except Exception as e:
+            self.stats.publish_errors += 1
+            logger.debug(f"推送进度失败: {e}")
+
+    async def publish_once(self):
+        """推送一次有变化的进度并写入到期的检查点"""
+        files, tasks, file_checkpoints, task_checkpoints = self._collect()
+
+        for entry in file_checkpoints:
+            self._write_file_checkpoint(entry)
+        for entry in task_checkpoints:
+            self._write_task_checkpoint(entry)
+
+        # 文件进度按任务分组推送到各自的主题，手动下载推送到downloads主题
+        by_task: Dict[Optional[int], List[Dict[str, Any]]] = {}
+        for item in files:
+            by_task.setdefault(item["task_id"], []).append(item)
+        for task_id, items in by_task.items():
+            await self._broadcast({
+                "type": "download_progress",
+                "task_id": task_id,
+                "data": items,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+            }, f"task:{task_id}" if task_id is not None else "downloads")
+        for message in tasks:
+            await self._broadcast(message)
+
+    async def _publisher_loop(self):
+        while True:
+            interval = 1.0 / max(0.1, settings.progress_publish_hz)
+            try:
+                await self.publish_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"进度推送循环异常: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self):
+        """启动后台推送循环"""
+        if self._publisher_task is None or self._publisher_task.done():
+            self._publisher_task = asyncio.create_task(self._publisher_loop())
+            logger.info(f"进度聚合服务已启动，推送频率 {settings.progress_publish_hz}Hz")
+
+    async def stop(self):
+        """停止推送循环，并写出最后一次检查点"""
+        if self._publisher_task:
+            self._publisher_task.cancel()
+            try:
+                await self._publisher_task
+            except asyncio.CancelledError:
+                pass
+            self._publisher_task = None
+        await self.publish_once()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats.to_dict()
+        with self._lock:
+            stats["active_downloads"] = sum(1 for e in self._files.values() if e.finished_at is None)
+            stats["active_tasks"] = len(self._tasks)
+        stats["publish_hz"] = settings.progress_publish_hz
+        return stats
+
+
+progress_service = ProgressService()
+
+
+def get_progress_service() -> ProgressService:
+    """获取进度聚合服务实例"""
+    return progress_service
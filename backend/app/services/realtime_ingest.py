@@ -0,0 +1,502 @@
+"""Telegram实时消息入库服务
+
+基于Telethon更新事件(NewMessage / MessageEdited / MessageDeleted)接收群组消息，
+替代每30秒对每个群组 get_messages(limit=50) 的轮询。
+
+主要功能:
+- 在主 TelegramService 客户端上注册事件处理器，只处理已订阅的群组
+- 事件进入有界写入队列，按条数或时间攒批后经单写线程批量写入 telegram_messages
+- 写入完成后通过WebSocket推送新消息、编辑和删除通知
+- 客户端重连或队列溢出后，先用 catch_up 补齐更新状态(pts)，
+  再按每个群组最后一条已入库的 message_id 补拉缺口
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+from telethon import events, utils as telethon_utils
+
+from ..config import settings
+from ..core.rate_governor import LANE_BULK, RPC_HISTORY, rate_governor
+from ..models.telegram import TelegramGroup, TelegramMessage
+from ..utils.db_writer import DeleteMessages, IngestMessages, db_writer, read_only_session
+from ..websocket.manager import websocket_manager
+from .telegram_service import telegram_service
+
+logger = logging.getLogger(__name__)
+
+# 写入队列中的操作类型
+OP_UPSERT = "upsert"
+OP_DELETE = "delete"
+
+
+@dataclass
+class RealtimeGroup:
+    """已订阅实时入库的群组"""
+    group_id: int
+    telegram_id: int
+    identifier: Any
+    last_message_id: int = 0
+
+
+@dataclass
+class RealtimeIngestStats:
+    """实时入库统计"""
+    new_events: int = 0
+    edited_events: int = 0
+    deleted_events: int = 0
+    ignored_events: int = 0
+    dropped_events: int = 0
+    batches: int = 0
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    catch_up_runs: int = 0
+    catch_up_messages: int = 0
+    max_queue_depth: int = 0
+    last_event_at: Optional[float] = None
+    last_flush_ms: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "new_events": self.new_events,
+            "edited_events": self.edited_events,
+            "deleted_events": self.deleted_events,
+            "ignored_events": self.ignored_events,
+            "dropped_events": self.dropped_events,
+            "batches": self.batches,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "deleted": self.deleted,
+            "catch_up_runs": self.catch_up_runs,
+            "catch_up_messages": self.catch_up_messages,
+            "max_queue_depth": self.max_queue_depth,
+            "last_event_at": (
+                datetime.fromtimestamp(self.last_event_at).isoformat()
+                if self.last_event_at else None
+            ),
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
+
+
+class RealtimeIngestService:
+    """事件驱动的实时消息入库
+
+    Args:
+        queue_size: 写入队列容量，队满时丢弃事件并在下一次补拉中恢复
+        supervise_interval: 检查客户端连接/重连的间隔(秒)
+    """
+
+    def __init__(self, queue_size: int = 5000, supervise_interval: float = 10.0):
+        self.queue_size = queue_size
+        self.supervise_interval = supervise_interval
+        self.is_running = False
+        self.stats = RealtimeIngestStats()
+
+        self.groups: Dict[int, RealtimeGroup] = {}
+        self._by_telegram_id: Dict[int, int] = {}
+        self._pending_groups: Set[int] = set()
+        self._catch_up_groups: Set[int] = set()
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._supervisor_task: Optional[asyncio.Task] = None
+
+        self._attached_client = None
+        self._handlers: List[Tuple[Any, Any]] = []
+        self._needs_catch_up = False
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """启动写入队列和连接监督任务"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._wakeup = asyncio.Event()
+        self._writer_task = asyncio.create_task(self._writer())
+        # 补拉属于后台批量请求，与界面上的请求分道限速
+        with rate_governor.lane(LANE_BULK):
+            self._supervisor_task = asyncio.create_task(self._supervise())
+        logger.info("实时消息入库服务已启动")
+
+    def stop(self):
+        """停止服务并移除事件处理器(队列中未写入的事件会在下次启动时通过补拉恢复)"""
+        self.is_running = False
+        for task in (self._supervisor_task, self._writer_task):
+            if task:
+                task.cancel()
+        self._supervisor_task = None
+        self._writer_task = None
+        self._detach()
+        logger.info("实时消息入库服务已停止")
+
+    def add_group(self, group_id: int):
+        """订阅群组的实时消息"""
+        if group_id in self.groups:
+            return
+        self._pending_groups.add(group_id)
+        if self._wakeup:
+            self._wakeup.set()
+        logger.info(f"群组 {group_id} 已加入实时入库")
+
+    def remove_group(self, group_id: int):
+        """取消订阅群组的实时消息"""
+        self._pending_groups.discard(group_id)
+        self._catch_up_groups.discard(group_id)
+        group = self.groups.pop(group_id, None)
+        if group:
+            self._by_telegram_id.pop(group.telegram_id, None)
+        logger.info(f"群组 {group_id} 已移出实时入库")
+
+    def get_active_groups(self) -> Set[int]:
+        return set(self.groups) | set(self._pending_groups)
+
+    # ------------------------------------------------------------------
+    # 连接监督与补拉
+    # ------------------------------------------------------------------
+
+    def _register_pending(self):
+        """从数据库加载待订阅群组的 telegram_id 和最后一条已入库的 message_id"""
+        pending = list(self._pending_groups)
+        if not pending:
+            return
+
+        with read_only_session() as db:
+            rows = (
+                db.query(TelegramGroup.id, TelegramGroup.telegram_id, TelegramGroup.username,
+                         TelegramGroup.is_active)
+                .filter(TelegramGroup.id.in_(pending))
+                .all()
+            )
+            last_ids = dict(
+                db.query(TelegramMessage.group_id, func.max(TelegramMessage.message_id))
+                .filter(TelegramMessage.group_id.in_(pending))
+                .group_by(TelegramMessage.group_id)
+                .all()
+            )
+
+        found = set()
+        for row in rows:
+            found.add(row.id)
+            if not row.is_active:
+                logger.warning(f"群组 {row.id} 未激活，跳过实时入库")
+                continue
+            group = RealtimeGroup(
+                group_id=row.id,
+                telegram_id=int(row.telegram_id),
+                identifier=row.username or row.telegram_id,
+                last_message_id=int(last_ids.get(row.id) or 0),
+            )
+            self.groups[row.id] = group
+            self._by_telegram_id[group.telegram_id] = row.id
+            self._catch_up_groups.add(row.id)
+
+        for group_id in set(pending) - found:
+            logger.warning(f"群组 {group_id} 不存在，跳过实时入库")
+        self._pending_groups.difference_update(pending)
+
+    async def _supervise(self):
+        """维护事件处理器绑定：客户端替换或断线重连后重新绑定并补拉缺口"""
+        was_connected = False
+        while self.is_running:
+            try:
+                self._wakeup.clear()
+                if self._pending_groups:
+                    self._register_pending()
+
+                client = telegram_service.client
+                if client is None and self.groups:
+                    await telegram_service.initialize()
+                    client = telegram_service.client
+
+                if client is not None and client is not self._attached_client:
+                    self._detach()
+                    self._attach(client)
+                    self._needs_catch_up = True
+
+                connected = bool(client and client.is_connected())
+                if not connected:
+                    self._needs_catch_up = self._needs_catch_up or was_connected
+                elif self._needs_catch_up:
+                    await self._catch_up(list(self.groups), update_state=True)
+                    self._needs_catch_up = False
+                    self._catch_up_groups.clear()
+                elif self._catch_up_groups:
+                    group_ids = list(self._catch_up_groups)
+                    self._catch_up_groups.difference_update(group_ids)
+                    await self._catch_up(group_ids)
+                was_connected = connected
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"实时入库监督任务出错: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.supervise_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _attach(self, client):
+        self._handlers = [
+            (self._on_new_message, events.NewMessage()),
+            (self._on_message_edited, events.MessageEdited()),
+            (self._on_message_deleted, events.MessageDeleted()),
+        ]
+        for callback, event in self._handlers:
+            client.add_event_handler(callback, event)
+        self._attached_client = client
+        logger.info("实时消息事件处理器已绑定")
+
+    def _detach(self):
+        client = self._attached_client
+        if client is not None:
+            for callback, event in self._handlers:
+                try:
+                    client.remove_event_handler(callback, event)
+                except Exception as e:
+                    logger.debug(f"移除事件处理器失败: {e}")
+        self._handlers = []
+        self._attached_client = None
+
+    async def _catch_up(self, group_ids: List[int], update_state: bool = False):
+        """补拉缺口
+
+        Args:
+            group_ids: 需要补拉的群组
+            update_state: 是否先按更新状态(pts)拉取断线期间的差量更新
+        """
+        client = telegram_service.client
+        if client is None or not group_ids:
+            return
+        self.stats.catch_up_runs += 1
+
+        if update_state:
+            try:
+                # 差量更新会重新派发给已注册的事件处理器
+                await client.catch_up()
+            except Exception as e:
+                logger.warning(f"按更新状态补拉失败，改为按消息ID补拉: {e}")
+
+        limit = settings.realtime_catch_up_limit
+        for group_id in group_ids:
+            group = self.groups.get(group_id)
+            if group is None or not group.last_message_id:
+                # 尚无入库消息的群组由完整同步负责，这里不做全量回填
+                continue
+            try:
+                fetched = 0
+                await rate_governor.acquire(RPC_HISTORY)
+                async for message in client.iter_messages(
+                    group.identifier, min_id=group.last_message_id, limit=limit
+                ):
+                    message_data = await telegram_service._process_message(message)
+                    if message_data:
+                        await self._queue.put((OP_UPSERT, group_id, message_data))
+                        fetched += 1
+                    group.last_message_id = max(group.last_message_id, message.id)
+                self.stats.catch_up_messages += fetched
+                if fetched:
+                    logger.info(f"群组 {group_id} 补拉 {fetched} 条消息")
+                if fetched >= limit:
+                    logger.warning(f"群组 {group_id} 缺口超过补拉上限 {limit}，请执行完整同步")
+            except Exception as e:
+                logger.error(f"群组 {group_id} 补拉失败: {e}")
+
+    # ------------------------------------------------------------------
+    # 事件处理
+    # ------------------------------------------------------------------
+
+    def _group_for_chat(self, chat_id: Optional[int]) -> Optional[RealtimeGroup]:
+        if chat_id is None:
+            return None
+        bare_id, _ = telethon_utils.resolve_id(chat_id)
+        group_id = self._by_telegram_id.get(bare_id)
+        return self.groups.get(group_id) if group_id is not None else None
+
+    def _enqueue(self, item, group: RealtimeGroup) -> bool:
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # 丢弃的事件由下一次补拉恢复
+            self.stats.dropped_events += 1
+            self._catch_up_groups.add(group.group_id)
+            return False
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self._queue.qsize())
+        self.stats.last_event_at = time.time()
+        return True
+
+    async def _handle_message_event(self, event):
+        group = self._group_for_chat(event.chat_id)
+        if group is None:
+            self.stats.ignored_events += 1
+            return None
+        message_data = await telegram_service._process_message(event.message)
+        if not message_data:
+            return None
+        if self._enqueue((OP_UPSERT, group.group_id, message_data), group):
+            group.last_message_id = max(group.last_message_id, event.message.id)
+        return group
+
+    async def _on_new_message(self, event):
+        try:
+            if await self._handle_message_event(event):
+                self.stats.new_events += 1
+        except Exception as e:
+            logger.error(f"处理新消息事件失败: {e}")
+
+    async def _on_message_edited(self, event):
+        try:
+            if await self._handle_message_event(event):
+                self.stats.edited_events += 1
+        except Exception as e:
+            logger.error(f"处理消息编辑事件失败: {e}")
+
+    async def _on_message_deleted(self, event):
+        try:
+            # 普通群组的删除事件不带 chat_id，无法确定归属，忽略
+            group = self._group_for_chat(event.chat_id)
+            if group is None:
+                self.stats.ignored_events += 1
+                return
+            if self._enqueue((OP_DELETE, group.group_id, list(event.deleted_ids)), group):
+                self.stats.deleted_events += 1
+        except Exception as e:
+            logger.error(f"处理消息删除事件失败: {e}")
+
+    # ------------------------------------------------------------------
+    # 批量写入
+    # ------------------------------------------------------------------
+
+    async def _writer(self):
+        while True:
+            item = await self._queue.get()
+            batch = [item]
+            batch_size = settings.realtime_batch_size
+            deadline = time.monotonic() + settings.realtime_flush_interval
+            while len(batch) < batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._flush(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"实时消息批量写入失败: {e}")
+                # 写入失败的群组在下一次监督周期补拉
+                self._catch_up_groups.update(group_id for _, group_id, _ in batch)
+
+    async def _flush(self, batch: List[Tuple[str, int, Any]]):
+        started = time.monotonic()
+        upserts: Dict[int, List[Dict[str, Any]]] = {}
+        deletes: Dict[int, Set[int]] = {}
+        for op, group_id, payload in batch:
+            if op == OP_UPSERT:
+                upserts.setdefault(group_id, []).append(payload)
+                deletes.get(group_id, set()).discard(payload.get("message_id"))
+            else:
+                deletes.setdefault(group_id, set()).update(payload)
+
+        pushes = []
+        # 所有群组的写入和删除作为同一批命令提交，由写线程合并到一个事务
+        group_ids = list(upserts)
+        delete_items = [(group_id, ids) for group_id, ids in deletes.items() if ids]
+        results = await asyncio.gather(
+            *(db_writer.execute(IngestMessages(group_id, upserts[group_id])) for group_id in group_ids),
+            *(
+                db_writer.execute(DeleteMessages(group_id, list(ids)))
+                for group_id, ids in delete_items
+            ),
+        )
+
+        for group_id, result in zip(group_ids, results[:len(group_ids)]):
+            messages = upserts[group_id]
+            self.stats.inserted += result.inserted
+            self.stats.updated += result.updated
+            by_id = {m.get("message_id"): m for m in messages}
+            pushes.append((group_id, "new", [by_id[i] for i in result.inserted_message_ids]))
+            pushes.append((group_id, "edited", [by_id[i] for i in result.updated_message_ids]))
+
+        for (group_id, message_ids), deleted in zip(delete_items, results[len(group_ids):]):
+            # 已下载媒体的消息保留记录，避免本地文件失去索引
+            self.stats.deleted += deleted
+            pushes.append((group_id, "deleted", [{"message_id": i} for i in sorted(message_ids)]))
+
+        self.stats.batches += 1
+        self.stats.last_flush_ms = (time.monotonic() - started) * 1000
+        await self._push(pushes)
+
+    async def _push(self, pushes: List[Tuple[int, str, List[Dict[str, Any]]]]):
+        """推送本批次的消息变更和统计"""
+        new_counts: Dict[int, int] = {}
+        try:
+            for group_id, action, messages in pushes:
+                for message_data in messages:
+                    await websocket_manager.send_realtime_message({
+                        "action": action,
+                        "chat_id": group_id,
+                        "message_id": message_data.get("message_id"),
+                        "text": message_data.get("text"),
+                        "sender_name": message_data.get("sender_name"),
+                        "sender_username": message_data.get("sender_username"),
+                        "date": message_data.get("date"),
+                        "is_own_message": message_data.get("is_own_message", False),
+                        "media_type": message_data.get("media_type"),
+                        "reply_to_message_id": message_data.get("reply_to_message_id"),
+                    })
+                if action == "new" and messages:
+                    new_counts[group_id] = new_counts.get(group_id, 0) + len(messages)
+
+            for group_id, count in new_counts.items():
+                await websocket_manager.send_message_stats({
+                    "group_id": group_id,
+                    "new_messages": count,
+                    "sync_time": datetime.now().isoformat(),
+                    "auto_sync": True,
+                    "realtime": True,
+                })
+        except Exception as e:
+            logger.error(f"WebSocket推送失败: {e}")
+
+    def get_status(self) -> Dict[str, Any]:
+        client = self._attached_client
+        return {
+            "is_running": self.is_running,
+            "mode": "realtime",
+            "attached": client is not None,
+            "connected": bool(client and client.is_connected()),
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "groups": {
+                group_id: {"telegram_id": g.telegram_id, "last_message_id": g.last_message_id}
+                for group_id, g in self.groups.items()
+            },
+            "pending_groups": list(self._pending_groups),
+            "stats": self.stats.to_dict(),
+        }
+
+
+realtime_ingest_service = RealtimeIngestService()
+
+
+def get_realtime_ingest_service() -> RealtimeIngestService:
+    """获取实时入库服务实例"""
+    return realtime_ingest_service
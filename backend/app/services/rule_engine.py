@@ -0,0 +1,488 @@
+"""编译型过滤规则引擎
+
+把 FilterRule 编译为内存中的谓词序列，在一次遍历中对消息流评估任务的全部规则:
+
+- KeywordAutomaton: 所有规则的包含/排除关键词合并为一个 Aho-Corasick 自动机，
+  每条消息的正文、发送者、文件名只扫描一次
+- CompiledRule: 单条规则的谓词闭包(按开销从低到高排列)，补齐了 SQL 筛选中
+  未生效的时长、尺寸、文本特征、消息年龄、周末和每日时间段等条件
+- CompiledRuleSet: 按优先级评估规则，返回命中的规则和关键词(RuleMatch)，
+  并提供可下推到数据库的宽松预筛条件(结果是精确匹配的超集)
+
+消息既可以是 ORM 对象/查询行，也可以是入库前的字段字典，
+同一套规则可用于入库时匹配和批量重新评估。
+
+Example:
+    ```python
+    rule_set = CompiledRuleSet.compile(rules)
+    for message, match in rule_set.evaluate(messages):
+        print(match.rule_id, match.keyword)
+    ```
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import logging
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, time as dt_time, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import text as sql_text
+
+from ..models.telegram import TelegramMessage, MEDIA_ROWS_CONDITION
+from ..utils.message_fts import keyword_match_condition
+
+logger = logging.getLogger(__name__)
+
+# 关键词数量不超过该值时逐个使用 str.__contains__(C实现)更快，超过后使用自动机
+AUTOMATON_MIN_KEYWORDS = 16
+
+# 规则评估需要的消息字段（批量评估时只查询这些列）
+RULE_MESSAGE_FIELDS = (
+    "id",
+    "date",
+    "text",
+    "sender_name",
+    "sender_username",
+    "media_type",
+    "media_size",
+    "media_filename",
+    "media_duration",
+    "media_width",
+    "media_height",
+    "view_count",
+    "is_forwarded",
+    "reply_to_message_id",
+    "edit_date",
+    "is_pinned",
+    "urls",
+    "mentions",
+    "hashtags",
+)
+
+RULE_FIELDS = (
+    "id", "name", "keywords", "exclude_keywords", "media_types", "sender_filter",
+    "date_from", "date_to", "min_views", "max_views", "min_file_size", "max_file_size",
+    "min_duration", "max_duration", "min_width", "max_width", "min_height", "max_height",
+    "min_text_length", "max_text_length", "has_urls", "has_mentions", "has_hashtags",
+    "is_reply", "is_edited", "is_pinned", "message_age_days", "exclude_weekends",
+    "time_range_start", "time_range_end", "include_forwarded",
+)
+
+_URL_PATTERN = re.compile(r"(https?://|www\.|t\.me/)", re.IGNORECASE)
+_MENTION_PATTERN = re.compile(r"(?<!\w)@\w+")
+_HASHTAG_PATTERN = re.compile(r"(?<!\w)#\w+")
+
+
+def _field(message: Any, name: str) -> Any:
+    if isinstance(message, dict):
+        return message.get(name)
+    return getattr(message, name, None)
+
+
+def _rule_value(rule: Any, name: str) -> Any:
+    if isinstance(rule, dict):
+        return rule.get(name)
+    return getattr(rule, name, None)
+
+
+def rule_to_dict(rule: Any) -> Dict[str, Any]:
+    """提取规则字段为字典，避免跨会话访问ORM对象"""
+    return {name: _rule_value(rule, name) for name in RULE_FIELDS}
+
+
+def as_datetime(value: Any) -> Optional[datetime]:
+    """消息字典中的时间可能是ISO字符串，统一转换为datetime"""
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _to_utc(value: Any) -> Optional[datetime]:
+    """统一为不带时区的UTC时间（SQLite读出的时间不带时区）"""
+    value = as_datetime(value)
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _to_local(value: Any) -> datetime:
+    """UTC时间转换为服务器本地时间，用于周末和每日时间段判断"""
+    value = as_datetime(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone()
+
+
+def _parse_clock(value: Optional[str]) -> Optional[dt_time]:
+    if not value:
+        return None
+    try:
+        hour, minute = value.strip().split(":")[:2]
+        return dt_time(int(hour), int(minute))
+    except (ValueError, AttributeError):
+        logger.warning(f"无法解析规则时间段: {value}")
+        return None
+
+
+def _normalize_keywords(keywords: Optional[Iterable[str]]) -> List[str]:
+    if not keywords:
+        return []
+    if isinstance(keywords, str):
+        keywords = keywords.split(",")
+    return [kw.strip() for kw in keywords if isinstance(kw, str) and kw.strip()]
+
+
+class KeywordAutomaton:
+    """多模式关键词匹配自动机(Aho-Corasick)，大小写不敏感
+
+    find() 返回文本中出现的关键词编号集合，扫描一次文本即可得到全部规则的命中情况。
+    """
+
+    def __init__(self, keywords: Sequence[str]):
+        # 报告命中时使用规则中的原始写法，匹配使用小写形式
+        self.originals = list(keywords)
+        self.keywords = [kw.lower() for kw in keywords]
+        self._use_automaton = len(self.keywords) > AUTOMATON_MIN_KEYWORDS
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[int]] = [set()]
+        if self._use_automaton:
+            self._build()
+
+    def _build(self):
+        for index, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(set())
+                state = next_state
+            self._output[state].add(index)
+
+        # 广度优先计算失败指针，并合并后缀状态的输出
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                candidate = self._goto[fail].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def find(self, haystack: str) -> Set[int]:
+        if not self.keywords or not haystack:
+            return set()
+
+        haystack = haystack.lower()
+        if not self._use_automaton:
+            return {index for index, keyword in enumerate(self.keywords) if keyword in haystack}
+
+        found: Set[int] = set()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in haystack:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+
+@dataclass
+class RuleMatch:
+    """规则命中结果"""
+    rule_id: Optional[int]
+    rule_name: Optional[str]
+    keyword: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"rule_id": self.rule_id, "rule_name": self.rule_name, "keyword": self.keyword}
+
+
+@dataclass
+class CompiledRule:
+    """编译后的单条规则"""
+    rule_id: Optional[int]
+    name: Optional[str]
+    keyword_ids: List[int]
+    exclude_ids: Set[int]
+    predicates: List[Callable[[Any], bool]] = field(default_factory=list)
+    source: Dict[str, Any] = field(default_factory=dict)
+
+    def check(self, message: Any) -> bool:
+        for predicate in self.predicates:
+            if not predicate(message):
+                return False
+        return True
+
+
+def _range_predicate(name: str, minimum: Optional[int], maximum: Optional[int]) -> Optional[Callable[[Any], bool]]:
+    # 与SQL比较一致: 设置了范围时，字段为空的消息不匹配
+    if minimum is None and maximum is None:
+        return None
+
+    def predicate(message, _name=name, _min=minimum, _max=maximum):
+        value = _field(message, _name)
+        if value is None:
+            return False
+        if _min is not None and value < _min:
+            return False
+        if _max is not None and value > _max:
+            return False
+        return True
+
+    return predicate
+
+
+def _feature_predicate(expected: Optional[bool], detector: Callable[[Any], bool]) -> Optional[Callable[[Any], bool]]:
+    if expected is None:
+        return None
+    return lambda message: detector(message) == expected
+
+
+def _has_urls(message) -> bool:
+    return bool(_field(message, "urls")) or bool(_URL_PATTERN.search(_field(message, "text") or ""))
+
+
+def _has_mentions(message) -> bool:
+    return bool(_field(message, "mentions")) or bool(_MENTION_PATTERN.search(_field(message, "text") or ""))
+
+
+def _has_hashtags(message) -> bool:
+    return bool(_field(message, "hashtags")) or bool(_HASHTAG_PATTERN.search(_field(message, "text") or ""))
+
+
+def _has_media(message) -> bool:
+    media_type = _field(message, "media_type")
+    return bool(media_type) and media_type != "text"
+
+
+def _compile_predicates(rule: Dict[str, Any], now: Callable[[], datetime]) -> List[Callable[[Any], bool]]:
+    predicates: List[Optional[Callable[[Any], bool]]] = [_has_media]
+
+    media_types = rule.get("media_types")
+    if media_types:
+        allowed_types = frozenset(media_types)
+        predicates.append(lambda m: _field(m, "media_type") in allowed_types)
+
+    sender_filter = rule.get("sender_filter")
+    if sender_filter:
+        allowed_senders = frozenset(sender_filter)
+        predicates.append(lambda m: _field(m, "sender_username") in allowed_senders)
+
+    # 与原筛选逻辑一致: 未设置该字段时包含转发消息，显式为假值(含None)时排除
+    if not rule.get("include_forwarded", True):
+        predicates.append(lambda m: not _field(m, "is_forwarded"))
+
+    predicates.append(_range_predicate("media_size", rule.get("min_file_size"), rule.get("max_file_size")))
+    predicates.append(_range_predicate("view_count", rule.get("min_views"), rule.get("max_views")))
+    predicates.append(_range_predicate("media_duration", rule.get("min_duration"), rule.get("max_duration")))
+    predicates.append(_range_predicate("media_width", rule.get("min_width"), rule.get("max_width")))
+    predicates.append(_range_predicate("media_height", rule.get("min_height"), rule.get("max_height")))
+
+    min_text, max_text = rule.get("min_text_length"), rule.get("max_text_length")
+    if min_text is not None or max_text is not None:
+        def text_length(m, _min=min_text, _max=max_text):
+            length = len(_field(m, "text") or "")
+            return (_min is None or length >= _min) and (_max is None or length <= _max)
+        predicates.append(text_length)
+
+    date_from, date_to = _to_utc(rule.get("date_from")), _to_utc(rule.get("date_to"))
+    if date_from or date_to:
+        def date_range(m, _from=date_from, _to=date_to):
+            value = _to_utc(_field(m, "date"))
+            if value is None:
+                return False
+            return (_from is None or value >= _from) and (_to is None or value <= _to)
+        predicates.append(date_range)
+
+    age_days = rule.get("message_age_days")
+    if age_days:
+        def message_age(m, _days=age_days):
+            value = _to_utc(_field(m, "date"))
+            return value is not None and value >= _to_utc(now()) - timedelta(days=_days)
+        predicates.append(message_age)
+
+    if rule.get("exclude_weekends"):
+        def not_weekend(m):
+            value = as_datetime(_field(m, "date"))
+            return value is not None and _to_local(value).weekday() < 5
+        predicates.append(not_weekend)
+
+    range_start, range_end = _parse_clock(rule.get("time_range_start")), _parse_clock(rule.get("time_range_end"))
+    if range_start or range_end:
+        start = range_start or dt_time(0, 0)
+        end = range_end or dt_time(23, 59, 59, 999999)
+
+        def time_of_day(m, _start=start, _end=end):
+            value = as_datetime(_field(m, "date"))
+            if value is None:
+                return False
+            clock = _to_local(value).time()
+            if _start <= _end:
+                return _start <= clock <= _end
+            # 跨午夜的时间段，如 22:00-06:00
+            return clock >= _start or clock <= _end
+        predicates.append(time_of_day)
+
+    predicates.append(_feature_predicate(rule.get("has_urls"), _has_urls))
+    predicates.append(_feature_predicate(rule.get("has_mentions"), _has_mentions))
+    predicates.append(_feature_predicate(rule.get("has_hashtags"), _has_hashtags))
+    predicates.append(_feature_predicate(rule.get("is_reply"), lambda m: _field(m, "reply_to_message_id") is not None))
+    predicates.append(_feature_predicate(rule.get("is_edited"), lambda m: _field(m, "edit_date") is not None))
+    predicates.append(_feature_predicate(rule.get("is_pinned"), lambda m: bool(_field(m, "is_pinned"))))
+
+    return [predicate for predicate in predicates if predicate is not None]
+
+
+class CompiledRuleSet:
+    """编译后的规则集合
+
+    规则按传入顺序(即任务关联的优先级)评估，第一个命中的规则作为消息的匹配结果。
+    """
+
+    def __init__(self, rules: List[CompiledRule], automaton: KeywordAutomaton,
+                 now: Callable[[], datetime] = lambda: datetime.now(timezone.utc)):
+        self.rules = rules
+        self.automaton = automaton
+        self._now = now
+
+    @classmethod
+    def compile(cls, rules: Iterable[Any],
+                now: Callable[[], datetime] = lambda: datetime.now(timezone.utc)) -> "CompiledRuleSet":
+        """编译规则（FilterRule对象或规则字段字典）"""
+        keyword_index: Dict[str, int] = {}
+        keywords: List[str] = []
+
+        def intern(keyword: str) -> int:
+            key = keyword.lower()
+            if key not in keyword_index:
+                keyword_index[key] = len(keywords)
+                keywords.append(keyword)
+            return keyword_index[key]
+
+        compiled = []
+        for rule in rules:
+            rule_data = rule_to_dict(rule)
+            compiled.append(CompiledRule(
+                rule_id=rule_data.get("id"),
+                name=rule_data.get("name"),
+                keyword_ids=[intern(kw) for kw in _normalize_keywords(rule_data.get("keywords"))],
+                exclude_ids={intern(kw) for kw in _normalize_keywords(rule_data.get("exclude_keywords"))},
+                predicates=_compile_predicates(rule_data, now),
+                source=rule_data,
+            ))
+
+        rule_set = cls(compiled, KeywordAutomaton(keywords), now)
+        logger.debug(f"编译规则 {len(compiled)} 条，关键词 {len(keywords)} 个")
+        return rule_set
+
+    def _scan_keywords(self, message: Any) -> Set[int]:
+        if not len(self.automaton):
+            return set()
+        # 用不会出现在关键词中的分隔符拼接，避免跨字段误匹配
+        haystack = "\x00".join(
+            value for value in (
+                _field(message, "text"),
+                _field(message, "sender_name"),
+                _field(message, "media_filename"),
+            ) if value
+        )
+        return self.automaton.find(haystack)
+
+    def _match_rule(self, rule: CompiledRule, found: Set[int], message: Any) -> Optional[RuleMatch]:
+        if rule.exclude_ids and not rule.exclude_ids.isdisjoint(found):
+            return None
+
+        keyword = None
+        if rule.keyword_ids:
+            # 按规则中关键词的顺序报告第一个命中的关键词
+            keyword_id = next((kid for kid in rule.keyword_ids if kid in found), None)
+            if keyword_id is None:
+                return None
+            keyword = self.automaton.originals[keyword_id]
+
+        if not rule.check(message):
+            return None
+        return RuleMatch(rule.rule_id, rule.name, keyword)
+
+    def match(self, message: Any) -> Optional[RuleMatch]:
+        """返回第一个命中的规则，没有命中时返回None"""
+        found = self._scan_keywords(message)
+        for rule in self.rules:
+            result = self._match_rule(rule, found, message)
+            if result is not None:
+                return result
+        return None
+
+    def match_all(self, message: Any) -> List[RuleMatch]:
+        """返回全部命中的规则"""
+        found = self._scan_keywords(message)
+        results = []
+        for rule in self.rules:
+            result = self._match_rule(rule, found, message)
+            if result is not None:
+                results.append(result)
+        return results
+
+    def evaluate(self, messages: Iterable[Any]) -> Iterator[Tuple[Any, RuleMatch]]:
+        """一次遍历消息流，产出命中任一规则的 (消息, 匹配结果)"""
+        for message in messages:
+            result = self.match(message)
+            if result is not None:
+                yield message, result
+
+    def prefilter_conditions(self) -> list:
+        """可下推到数据库的宽松预筛条件
+
+        只取所有规则共同约束的部分(关键词并集、媒体类型并集、最小文件大小、最早日期)，
+        结果是精确匹配的超集，精确判断仍由 match() 完成。
+        """
+        conditions = [sql_text(MEDIA_ROWS_CONDITION)]
+        if not self.rules:
+            return conditions
+
+        sources = [rule.source for rule in self.rules]
+
+        if all(rule.keyword_ids for rule in self.rules):
+            all_keywords = []
+            for source in sources:
+                all_keywords.extend(_normalize_keywords(source.get("keywords")))
+            keyword_condition = keyword_match_condition(all_keywords)
+            if keyword_condition is not None:
+                conditions.append(keyword_condition)
+
+        if all(source.get("media_types") for source in sources):
+            media_types = sorted({mt for source in sources for mt in source["media_types"]})
+            conditions.append(TelegramMessage.media_type.in_(media_types))
+
+        if all(source.get("min_file_size") is not None for source in sources):
+            conditions.append(TelegramMessage.media_size >= min(s["min_file_size"] for s in sources))
+
+        if all(source.get("date_from") is not None for source in sources):
+            conditions.append(TelegramMessage.date >= min(_to_utc(s["date_from"]) for s in sources))
+
+        return conditions
+
+    def __len__(self) -> int:
+        return len(self.rules)
@@ -0,0 +1,539 @@
+"""规则匹配结果服务
+
+消息入库时立即用编译后的规则评估，把命中结果写入 rule_message_matches，
+任务开始/恢复时直接按覆盖索引范围读取，不再重新扫描整个群组。
+
+主要功能:
+- match_ingested(): 在入库事务中评估该群组所有任务关联的规则，写入/刷新匹配结果
+  (save_messages_to_db、按月同步、实时同步都经由 bulk_upsert_messages 调用)
+- is_ready() / count_pending_matches() / read_pending_matches(): 任务统计并分页读取匹配结果，
+  结果不完整时由调用方回退为规则引擎扫描
+- 后台对账: 规则条件变化(指纹改变)或新关联到群组时，按消息主键分批增量重建该
+  (规则, 群组)的结果；不再被任何任务使用的结果被清理
+- notify_rules_changed(): 规则/任务编辑后清空规则缓存并立即唤醒对账
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models.rule import DownloadTask, FilterRule
+from ..models.rule_match import RuleMatchState, RuleMessageMatch
+from ..models.task_rule_association import TaskRuleAssociation
+from ..models.telegram import TelegramMessage
+from ..utils.db_writer import CallableWrite, db_writer, read_only_session
+from .rule_engine import CompiledRuleSet, RuleMatch, RULE_FIELDS, RULE_MESSAGE_FIELDS, as_datetime, rule_to_dict
+
+logger = logging.getLogger(__name__)
+
+# 参与指纹计算的规则字段（名称变化不影响匹配结果）
+FINGERPRINT_FIELDS = tuple(name for name in RULE_FIELDS if name not in ("id", "name"))
+
+CHUNK_SIZE = 500
+
+
+def rule_fingerprint(rule: Any) -> str:
+    """规则筛选条件的哈希，条件不变时匹配结果可以复用"""
+    data = rule if isinstance(rule, dict) else rule_to_dict(rule)
+    payload = json.dumps({name: data.get(name) for name in FINGERPRINT_FIELDS}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _chunks(items: List[Any], size: int = CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _upsert_matches(db: Session, rows: List[Dict[str, Any]]):
+    """写入匹配结果，已存在的 (rule_id, message_id) 更新关键词和时间"""
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(RuleMessageMatch.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["rule_id", "message_id"],
+            set_={
+                "message_date": stmt.excluded.message_date,
+                "matched_keyword": stmt.excluded.matched_keyword,
+                "matched_at": func.now(),
+            },
+        )
+        for chunk in _chunks(rows):
+            db.execute(stmt, chunk)
+        return
+
+    for chunk in _chunks(rows):
+        db.execute(delete(RuleMessageMatch).where(or_(*(
+            and_(RuleMessageMatch.rule_id == row["rule_id"], RuleMessageMatch.message_id == row["message_id"])
+            for row in chunk
+        ))))
+        db.execute(insert(RuleMessageMatch.__table__), chunk)
+
+
+@dataclass
+class RuleMatchStats:
+    """规则匹配统计"""
+    ingested_messages: int = 0
+    ingest_matches: int = 0
+    ingest_errors: int = 0
+    rematch_runs: int = 0
+    rematched_messages: int = 0
+    rematch_matches: int = 0
+    pruned_pairs: int = 0
+    task_reads: int = 0
+    task_fallbacks: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ingested_messages": self.ingested_messages,
+            "ingest_matches": self.ingest_matches,
+            "ingest_errors": self.ingest_errors,
+            "rematch_runs": self.rematch_runs,
+            "rematched_messages": self.rematched_messages,
+            "rematch_matches": self.rematch_matches,
+            "pruned_pairs": self.pruned_pairs,
+            "task_reads": self.task_reads,
+            "task_fallbacks": self.task_fallbacks,
+        }
+
+
+class RuleMatchService:
+    """规则匹配结果的维护与读取"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._group_rules: Dict[int, CompiledRuleSet] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._rematch_task: Optional[asyncio.Task] = None
+        self.stats = RuleMatchStats()
+
+    # ------------------------------------------------------------------
+    # 规则缓存
+    # ------------------------------------------------------------------
+
+    def _load_group_rules(self, db: Session, group_id: int) -> CompiledRuleSet:
+        rules = (
+            db.query(FilterRule)
+            .join(TaskRuleAssociation, TaskRuleAssociation.rule_id == FilterRule.id)
+            .join(DownloadTask, DownloadTask.id == TaskRuleAssociation.task_id)
+            .filter(
+                DownloadTask.group_id == group_id,
+                TaskRuleAssociation.is_active == True,
+                FilterRule.is_active.isnot(False),
+            )
+            .distinct()
+            .all()
+        )
+        return CompiledRuleSet.compile([rule_to_dict(rule) for rule in rules])
+
+    def _rules_for_group(self, db: Session, group_id: int) -> CompiledRuleSet:
+        with self._lock:
+            rule_set = self._group_rules.get(group_id)
+        if rule_set is None:
+            rule_set = self._load_group_rules(db, group_id)
+            with self._lock:
+                self._group_rules[group_id] = rule_set
+        return rule_set
+
+    def notify_rules_changed(self):
+        """规则或任务的规则关联变更后调用: 清空规则缓存并唤醒后台对账"""
+        with self._lock:
+            self._group_rules.clear()
+        self.wake()
+
+    def wake(self):
+        """立即执行一次后台对账（可在任意线程调用）"""
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    # ------------------------------------------------------------------
+    # 入库时匹配
+    # ------------------------------------------------------------------
+
+    def match_ingested(self, db: Session, group_id: int, messages: List[Dict[str, Any]]) -> int:
+        """在入库事务中评估新增/更新的消息，返回写入的匹配数
+
+        更新的消息先删除旧结果再重新评估，编辑后不再匹配的消息会被移出。
+        匹配失败只回滚本次匹配(SAVEPOINT)，不影响消息入库。
+        """
+        if not messages:
+            return 0
+
+        try:
+            rule_set = self._rules_for_group(db, group_id)
+            if not len(rule_set):
+                return 0
+
+            with db.begin_nested():
+                pk_by_message_id: Dict[int, int] = {}
+                for chunk in _chunks([m["message_id"] for m in messages]):
+                    for pk, message_id in db.execute(
+                        select(TelegramMessage.id, TelegramMessage.message_id).where(
+                            TelegramMessage.group_id == group_id,
+                            TelegramMessage.message_id.in_(chunk),
+                        )
+                    ):
+                        pk_by_message_id[message_id] = pk
+
+                rule_ids = [rule.rule_id for rule in rule_set.rules]
+                for chunk in _chunks(list(pk_by_message_id.values())):
+                    db.execute(delete(RuleMessageMatch).where(
+                        RuleMessageMatch.rule_id.in_(rule_ids),
+                        RuleMessageMatch.message_id.in_(chunk),
+                    ))
+
+                rows = []
+                for message in messages:
+                    pk = pk_by_message_id.get(message["message_id"])
+                    message_date = as_datetime(message.get("date"))
+                    if pk is None or message_date is None:
+                        continue
+                    for match in rule_set.match_all(message):
+                        rows.append({
+                            "rule_id": match.rule_id,
+                            "message_id": pk,
+                            "group_id": group_id,
+                            "message_date": message_date,
+                            "matched_keyword": match.keyword,
+                        })
+                _upsert_matches(db, rows)
+
+            self.stats.ingested_messages += len(messages)
+            self.stats.ingest_matches += len(rows)
+            return len(rows)
+        except Exception as e:
+            self.stats.ingest_errors += 1
+            logger.warning(f"群组 {group_id} 入库规则匹配失败，将由后台对账补齐: {e}")
+            return 0
+
+    # ------------------------------------------------------------------
+    # 任务读取
+    # ------------------------------------------------------------------
+
+    def is_ready(self, db: Session, group_id: int, rule_set: CompiledRuleSet) -> bool:
+        """任务的全部规则在该群组上的匹配结果是否完整且与当前条件一致"""
+        rule_ids = [rule.rule_id for rule in rule_set.rules]
+        if not rule_ids:
+            return False
+        states = {
+            state.rule_id: state
+            for state in db.query(RuleMatchState).filter(
+                RuleMatchState.group_id == group_id,
+                RuleMatchState.rule_id.in_(rule_ids),
+            )
+        }
+        for rule in rule_set.rules:
+            state = states.get(rule.rule_id)
+            if state is None or state.status != "ready" or state.fingerprint != rule_fingerprint(rule.source):
+                return False
+        return True
+
+    def _pending_conditions(
+        self,
+        group_id: int,
+        rule_set: CompiledRuleSet,
+        since: Optional[datetime] = None,
+    ) -> List[Any]:
+        """任务待处理匹配结果的查询条件"""
+        # 消息年龄条件依赖当前时间，读取时按规则追加日期下限
+        now = datetime.now(timezone.utc)
+        rule_conditions = []
+        for rule in rule_set.rules:
+            condition = RuleMessageMatch.rule_id == rule.rule_id
+            age_days = rule.source.get("message_age_days")
+            if age_days:
+                condition = and_(condition, RuleMessageMatch.message_date >= now - timedelta(days=age_days))
+            rule_conditions.append(condition)
+
+        conditions = [RuleMessageMatch.group_id == group_id, or_(*rule_conditions)]
+        if since is not None:
+            conditions.append(RuleMessageMatch.message_date > since)
+        return conditions
+
+    def count_pending_matches(
+        self,
+        db: Session,
+        group_id: int,
+        rule_set: CompiledRuleSet,
+        since: Optional[datetime] = None,
+    ) -> int:
+        """任务待处理的消息数(同一消息命中多条规则只计一次)"""
+        conditions = self._pending_conditions(group_id, rule_set, since)
+        return db.scalar(
+            select(func.count(func.distinct(RuleMessageMatch.message_id))).where(*conditions)
+        ) or 0
+
+    def read_pending_matches(
+        self,
+        db: Session,
+        group_id: int,
+        rule_set: CompiledRuleSet,
+        since: Optional[datetime] = None,
+        after: Optional[Tuple[datetime, int]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, datetime, RuleMatch]]:
+        """范围读取任务待处理的匹配结果
+
+        Args:
+            since: 增量任务的最后处理时间，只读取之后的消息
+            after: 分页游标 (消息时间, 消息主键)，只读取排在其后的消息
+            limit: 本页最多读取的消息数，为空时读取全部
+
+        Returns:
+            按 (message_date, message_id) 倒序的 (消息主键, 消息时间, RuleMatch) 列表，
+            同一消息命中多条规则时取优先级最高的规则
+        """
+        priority = {rule.rule_id: index for index, rule in enumerate(rule_set.rules)}
+        names = {rule.rule_id: rule.name for rule in rule_set.rules}
+        order = (RuleMessageMatch.message_date.desc(), RuleMessageMatch.message_id.desc())
+
+        conditions = self._pending_conditions(group_id, rule_set, since)
+        if after is not None:
+            after_date, after_pk = after
+            conditions.append(or_(
+                RuleMessageMatch.message_date < after_date,
+                and_(RuleMessageMatch.message_date == after_date, RuleMessageMatch.message_id < after_pk),
+            ))
+        if limit is not None:
+            # 先按消息分页，同一消息命中的多条规则不会被拆到两页
+            page = db.execute(
+                select(RuleMessageMatch.message_id)
+                .where(*conditions)
+                .group_by(RuleMessageMatch.message_id, RuleMessageMatch.message_date)
+                .order_by(*order)
+                .limit(limit)
+            ).scalars().all()
+            if not page:
+                return []
+            conditions.append(RuleMessageMatch.message_id.in_(page))
+
+        stmt = select(
+            RuleMessageMatch.message_id,
+            RuleMessageMatch.message_date,
+            RuleMessageMatch.rule_id,
+            RuleMessageMatch.matched_keyword,
+        ).where(*conditions).order_by(*order)
+
+        selected: Dict[int, Tuple[int, datetime, RuleMatch]] = {}
+        for message_pk, message_date, rule_id, keyword in db.execute(stmt):
+            current = selected.get(message_pk)
+            if current is None or priority[rule_id] < priority[current[2].rule_id]:
+                selected[message_pk] = (message_pk, message_date, RuleMatch(rule_id, names.get(rule_id), keyword))
+
+        self.stats.task_reads += 1
+        # 字典保持首次出现的顺序，即时间倒序
+        return list(selected.values())
+
+    # ------------------------------------------------------------------
+    # 后台对账与增量重建
+    # ------------------------------------------------------------------
+
+    def _desired_pairs(self) -> Dict[Tuple[int, int], Dict[str, Any]]:
+        """当前所有活跃任务关联的 (规则ID, 群组ID) -> 规则数据"""
+        with read_only_session() as db:
+            rows = (
+                db.query(FilterRule, DownloadTask.group_id)
+                .join(TaskRuleAssociation, TaskRuleAssociation.rule_id == FilterRule.id)
+                .join(DownloadTask, DownloadTask.id == TaskRuleAssociation.task_id)
+                .filter(TaskRuleAssociation.is_active == True, FilterRule.is_active.isnot(False))
+                .all()
+            )
+            return {(rule.id, group_id): rule_to_dict(rule) for rule, group_id in rows}
+
+    def _current_states(self) -> Dict[Tuple[int, int], Tuple[str, str]]:
+        with read_only_session() as db:
+            return {
+                (state.rule_id, state.group_id): (state.fingerprint, state.status)
+                for state in db.query(RuleMatchState).all()
+            }
+
+    async def reconcile(self) -> Dict[str, int]:
+        """对比期望的 (规则, 群组) 与已有结果，重建过期结果并清理无用结果"""
+        desired = await asyncio.to_thread(self._desired_pairs)
+        states = await asyncio.to_thread(self._current_states)
+
+        stale = [
+            (key, rule_data) for key, rule_data in desired.items()
+            if states.get(key) != (rule_fingerprint(rule_data), "ready")
+        ]
+        orphaned = [key for key in states if key not in desired]
+
+        for rule_id, group_id in orphaned:
+            await db_writer.execute(CallableWrite(
+                lambda db, r=rule_id, g=group_id: self._drop_pair(db, r, g), name="rule_match_prune"
+            ))
+            self.stats.pruned_pairs += 1
+
+        for (rule_id, group_id), rule_data in stale:
+            await self.rematch(rule_data, group_id)
+
+        return {"rematched": len(stale), "pruned": len(orphaned)}
+
+    @staticmethod
+    def _drop_pair(db: Session, rule_id: int, group_id: int):
+        db.execute(delete(RuleMessageMatch).where(
+            RuleMessageMatch.rule_id == rule_id, RuleMessageMatch.group_id == group_id
+        ))
+        db.execute(delete(RuleMatchState).where(
+            RuleMatchState.rule_id == rule_id, RuleMatchState.group_id == group_id
+        ))
+
+    @staticmethod
+    def _reset_pair(db: Session, rule_id: int, group_id: int, fingerprint: str) -> int:
+        """清空旧结果并记录高水位，之后入库的消息由入库匹配覆盖"""
+        RuleMatchService._drop_pair(db, rule_id, group_id)
+        high_water_id = db.execute(
+            select(func.max(TelegramMessage.id)).where(TelegramMessage.group_id == group_id)
+        ).scalar() or 0
+        db.add(RuleMatchState(
+            rule_id=rule_id,
+            group_id=group_id,
+            fingerprint=fingerprint,
+            status="running",
+            scanned_through_id=0,
+            high_water_id=high_water_id,
+        ))
+        return high_water_id
+
+    @staticmethod
+    def _write_batch(db: Session, rule_id: int, group_id: int, rows: List[Dict[str, Any]],
+                     scanned_through_id: int, done: bool):
+        _upsert_matches(db, rows)
+        state = db.get(RuleMatchState, (rule_id, group_id))
+        if state is not None:
+            state.scanned_through_id = scanned_through_id
+            if done:
+                state.status = "ready"
+
+    async def rematch(self, rule_data: Dict[str, Any], group_id: int) -> int:
+        """按消息主键分批重建单条规则在一个群组上的匹配结果，返回匹配数"""
+        rule_id = rule_data["id"]
+        rule_set = CompiledRuleSet.compile([rule_data])
+        batch_size = settings.rule_rematch_batch_size
+        fingerprint = rule_fingerprint(rule_data)
+
+        # 先清空缓存，保证重置之后入库的消息使用当前规则条件
+        with self._lock:
+            self._group_rules.pop(group_id, None)
+
+        high_water_id = await db_writer.execute(CallableWrite(
+            lambda db: self._reset_pair(db, rule_id, group_id, fingerprint), name="rule_match_reset"
+        ))
+        logger.info(f"开始重建规则 {rule_id} 在群组 {group_id} 上的匹配结果，消息主键上限 {high_water_id}")
+
+        columns = [getattr(TelegramMessage, name) for name in RULE_MESSAGE_FIELDS]
+        prefilter = rule_set.prefilter_conditions()
+
+        def read_batch(cursor: int):
+            with read_only_session() as db:
+                return (
+                    db.query(*columns)
+                    .filter(
+                        TelegramMessage.group_id == group_id,
+                        TelegramMessage.id > cursor,
+                        TelegramMessage.id <= high_water_id,
+                        *prefilter,
+                    )
+                    .order_by(TelegramMessage.id)
+                    .limit(batch_size)
+                    .all()
+                )
+
+        cursor = 0
+        total_matches = 0
+        while True:
+            batch = await asyncio.to_thread(read_batch, cursor)
+            done = len(batch) < batch_size
+            rows = []
+            for row in batch:
+                match = rule_set.match(row)
+                if match is not None:
+                    rows.append({
+                        "rule_id": rule_id,
+                        "message_id": row.id,
+                        "group_id": group_id,
+                        "message_date": row.date,
+                        "matched_keyword": match.keyword,
+                    })
+            if batch:
+                cursor = batch[-1].id
+
+            await db_writer.execute(CallableWrite(
+                lambda db, r=rows, c=cursor, d=done: self._write_batch(db, rule_id, group_id, r, c, d),
+                name="rule_match_batch",
+            ))
+            self.stats.rematched_messages += len(batch)
+            self.stats.rematch_matches += len(rows)
+            total_matches += len(rows)
+            if done:
+                break
+
+        self.stats.rematch_runs += 1
+        logger.info(f"规则 {rule_id} 在群组 {group_id} 上的匹配结果重建完成，共 {total_matches} 条")
+        return total_matches
+
+    async def _rematch_loop(self):
+        while True:
+            try:
+                await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"规则匹配结果对账失败: {e}")
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.rule_rematch_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self):
+        """启动后台对账任务"""
+        if self._rematch_task is None or self._rematch_task.done():
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._rematch_task = asyncio.create_task(self._rematch_loop())
+            logger.info("规则匹配结果对账任务已启动")
+
+    async def stop(self):
+        """停止后台对账任务，未完成的重建在下次启动时重新开始"""
+        if self._rematch_task:
+            self._rematch_task.cancel()
+            try:
+                await self._rematch_task
+            except asyncio.CancelledError:
+                pass
+            self._rematch_task = None
+        self._loop = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats.to_dict()
+        with self._lock:
+            stats["cached_groups"] = len(self._group_rules)
+        return stats
+
+
+rule_match_service = RuleMatchService()
+
+
+def get_rule_match_service() -> RuleMatchService:
+    """获取规则匹配结果服务实例"""
+    return rule_match_service
@@ -15,6 +15,7 @@ from ..core import (
     performance_monitor, ServiceLoggerMixin, create_error_context,
     operation_context, robust_service_method, RetryConfig
 )
+from .system_metrics_sampler import get_system_metrics_sampler
 
 
 class ServiceMonitor(ServiceLoggerMixin):
@@ -304,15 +305,10 @@ class ServiceMonitor(ServiceLoggerMixin):
             "GPUtil": False
         }
 
-        # 检查psutil
+        # 检查psutil（采样器模块导入时已依赖psutil，这里读取其快照验证采样正常，不在事件循环中阻塞采样）
         try:
-            import psutil
+            get_system_metrics_sampler().latest()
             monitoring_status["psutil"] = True
-            # 测试psutil基本功能
-            cpu_percent = psutil.cpu_percent(interval=0.1)
-            memory = psutil.virtual_memory()
-        except ImportError:
-            pass
         except Exception as e:
             self.log_operation_warning("check_system_monitoring", f"psutil功能测试异常: {e}")
 
@@ -320,8 +316,8 @@ class ServiceMonitor(ServiceLoggerMixin):
         try:
             import cpuinfo
             monitoring_status["cpuinfo"] = True
-            # 测试cpuinfo基本功能
-            cpu_info = cpuinfo.get_cpu_info()
+            # 测试cpuinfo基本功能（get_cpu_info 会启动子进程探测，放到线程中执行）
+            cpu_info = await asyncio.to_thread(cpuinfo.get_cpu_info)
         except ImportError:
             pass
         except Exception as e:
@@ -363,12 +359,14 @@ class ServiceMonitor(ServiceLoggerMixin):
     async def _check_disk_space(self) -> ServiceResult[HealthCheckResult]:
         """检查磁盘空间"""
         try:
-            # 检查当前工作目录所在磁盘的空间
-            statvfs = os.statvfs('.')
+            # 媒体目录所在磁盘的空间 (来自系统指标采样器)
+            disk = get_system_metrics_sampler().latest().media_disk
+            if disk is None:
+                raise OSError("无法获取磁盘使用信息")
 
             # 计算空间 (字节)
-            total = statvfs.f_frsize * statvfs.f_blocks
-            available = statvfs.f_frsize * statvfs.f_available
+            total = disk.total
+            available = disk.free
             used = total - available
 
             # 转换为GB
@@ -407,31 +405,11 @@ class ServiceMonitor(ServiceLoggerMixin):
     @handle_service_errors("ServiceMonitor", "check_memory")
     async def _check_memory(self) -> ServiceResult[HealthCheckResult]:
         """检查内存使用情况"""
-        # 读取内存信息 (Linux)
-        if not os.path.exists('/proc/meminfo'):
-            return ServiceResult.success_result(HealthCheckResult(
-                service_name="memory",
-                is_healthy=True,
-                status_message="无法获取内存信息 (非Linux系统)"
-            ))
-
-        with open('/proc/meminfo', 'r') as f:
-            meminfo = f.read()
-
-        # 解析内存信息
-        memory_data = {}
-        for line in meminfo.split('\n'):
-            if ':' in line:
-                key, value = line.split(':', 1)
-                memory_data[key.strip()] = value.strip()
-
-        # 提取关键数据 (KB)
-        total_kb = int(memory_data['MemTotal'].split()[0])
-        available_kb = int(memory_data.get('MemAvailable', memory_data.get('MemFree', '0')).split()[0])
+        snapshot = get_system_metrics_sampler().latest()
 
         # 转换为MB
-        total_mb = total_kb / 1024
-        available_mb = available_kb / 1024
+        total_mb = snapshot.memory_total / (1024 * 1024)
+        available_mb = snapshot.memory_available / (1024 * 1024)
         used_mb = total_mb - available_mb
 
         # 计算使用百分比
@@ -459,33 +437,14 @@ class ServiceMonitor(ServiceLoggerMixin):
 
     @handle_service_errors("ServiceMonitor", "check_cpu")
     async def _check_cpu(self) -> ServiceResult[HealthCheckResult]:
-        """检查CPU使用情况 (使用psutil)"""
-        try:
-            import psutil
-        except ImportError:
-            return ServiceResult.success_result(HealthCheckResult(
-                service_name="cpu",
-                is_healthy=True,
-                status_message="psutil未安装，无法获取CPU信息"
-            ))
+        """检查CPU使用情况 (读取系统指标采样器的最新快照)"""
+        snapshot = get_system_metrics_sampler().latest()
 
-        # 获取CPU使用率
-        cpu_percent = psutil.cpu_percent(interval=1)
-        cpu_count = psutil.cpu_count()
-        cpu_count_logical = psutil.cpu_count(logical=True)
-
-        # 获取CPU频率
-        try:
-            cpu_freq = psutil.cpu_freq()
-            current_freq = cpu_freq.current if cpu_freq else None
-        except:
-            current_freq = None
-
-        # 获取负载平均值 (Linux)
-        try:
-            load_avg = os.getloadavg()
-        except:
-            load_avg = None
+        cpu_percent = snapshot.cpu_percent
+        cpu_count = snapshot.cpu_count_physical or snapshot.cpu_count
+        cpu_count_logical = snapshot.cpu_count
+        current_freq = snapshot.cpu_freq_mhz
+        load_avg = snapshot.load_average if any(snapshot.load_average) else None
 
         # 评估CPU状态
         is_healthy = cpu_percent < 90
@@ -527,9 +486,9 @@ class ServiceMonitor(ServiceLoggerMixin):
                 status_message="psutil未安装，无法获取网络信息"
             ))
 
-        # 获取网络接口统计
-        net_io = psutil.net_io_counters()
-        net_connections = len(psutil.net_connections())
+        # 网络统计来自系统指标采样器
+        snapshot = get_system_metrics_sampler().latest()
+        net_connections = snapshot.net_connections or 0
 
         # 获取网络接口信息
         net_if_addrs = psutil.net_if_addrs()
@@ -559,10 +518,10 @@ class ServiceMonitor(ServiceLoggerMixin):
             is_healthy=is_healthy,
             status_message=status_message,
             details={
-                "bytes_sent": net_io.bytes_sent,
-                "bytes_recv": net_io.bytes_recv,
-                "packets_sent": net_io.packets_sent,
-                "packets_recv": net_io.packets_recv,
+                "bytes_sent": snapshot.net_bytes_sent,
+                "bytes_recv": snapshot.net_bytes_recv,
+                "packets_sent": snapshot.net_packets_sent,
+                "packets_recv": snapshot.net_packets_recv,
                 "connections": net_connections,
                 "active_interfaces": active_interfaces
             }
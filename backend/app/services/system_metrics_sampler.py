@@ -0,0 +1,375 @@
+"""系统指标采样服务
+
+由一个后台线程按固定间隔统一采集 CPU、内存、磁盘、网络、负载和本进程指标，
+写入定长环形缓冲区；各监控组件只读取最新快照，不再各自调用 psutil。
+
+主要功能:
+- 每个采样周期只调用一次 psutil，CPU使用率按两次采样之间的差值计算
+  (cpu_percent(interval=None))，不会在事件循环中阻塞等待
+- 定长环形缓冲区: 单写线程写入槽位后替换最新快照引用，读取方无需加锁
+- 快照为不可变对象，网络收发速率由相邻两次采样的计数差计算
+- 历史查询: 按时间窗口返回最近的快照序列，供趋势图和告警使用
+- 开销较大的指标(网络连接数)按较低频率采集
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import psutil
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# 网络连接数每隔多少个采样周期采集一次(遍历 /proc 开销较大)
+CONNECTIONS_EVERY_TICKS = 6
+
+
+@dataclass(frozen=True)
+class DiskSample:
+    """单个挂载点的磁盘使用情况"""
+    path: str
+    total: int
+    used: int
+    free: int
+    percent: float
+
+
+@dataclass(frozen=True)
+class MetricsSnapshot:
+    """一次采样的系统指标（不可变）"""
+    timestamp: float
+    # CPU
+    cpu_percent: float
+    per_cpu_percent: Tuple[float, ...]
+    cpu_count: int
+    cpu_count_physical: Optional[int]
+    cpu_freq_mhz: Optional[float]
+    load_average: Tuple[float, float, float]
+    # 内存
+    memory_total: int
+    memory_available: int
+    memory_used: int
+    memory_percent: float
+    swap_total: int
+    swap_used: int
+    swap_percent: float
+    # 磁盘
+    disks: Dict[str, DiskSample]
+    disk_read_bytes: int
+    disk_write_bytes: int
+    # 网络
+    net_bytes_sent: int
+    net_bytes_recv: int
+    net_packets_sent: int
+    net_packets_recv: int
+    net_errin: int
+    net_errout: int
+    net_dropin: int
+    net_dropout: int
+    net_send_rate: float
+    net_recv_rate: float
+    net_connections: Optional[int]
+    # 本进程
+    process_pid: int
+    process_cpu_percent: float
+    process_memory_rss: int
+    process_memory_vms: int
+    process_memory_percent: float
+    process_threads: int
+    process_fds: Optional[int]
+    boot_time: float
+
+    @property
+    def uptime(self) -> float:
+        return self.timestamp - self.boot_time
+
+    @property
+    def disk(self) -> Optional[DiskSample]:
+        """根分区的磁盘使用情况"""
+        return self.disks.get("root")
+
+    @property
+    def media_disk(self) -> Optional[DiskSample]:
+        """媒体目录所在分区的磁盘使用情况"""
+        return self.disks.get("media") or self.disks.get("root")
+
+    @property
+    def network_io(self) -> Dict[str, int]:
+        """与 psutil.net_io_counters()._asdict() 相同结构的网络计数"""
+        return {
+            "bytes_sent": self.net_bytes_sent,
+            "bytes_recv": self.net_bytes_recv,
+            "packets_sent": self.net_packets_sent,
+            "packets_recv": self.net_packets_recv,
+            "errin": self.net_errin,
+            "errout": self.net_errout,
+            "dropin": self.net_dropin,
+            "dropout": self.net_dropout,
+        }
+
+    @property
+    def network_error_rate(self) -> float:
+        packets = self.net_packets_recv + self.net_packets_sent
+        return (self.net_errin + self.net_errout) / packets if packets > 0 else 0.0
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.timestamp
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["uptime"] = self.uptime
+        return data
+
+
+@dataclass
+class SamplerStats:
+    """采样器运行统计"""
+    samples: int = 0
+    errors: int = 0
+    last_sample_at: float = 0.0
+    last_sample_seconds: float = 0.0
+    max_sample_seconds: float = 0.0
+    last_error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class SystemMetricsSampler:
+    """系统指标采样器
+
+    只有采样线程写入缓冲区；读取方通过 latest()/history() 获取快照。
+    槽位写入和最新引用替换在GIL下都是原子操作，读取方无需加锁。
+    """
+
+    def __init__(self, interval: Optional[float] = None, capacity: Optional[int] = None):
+        # 间隔和容量在启动时才从配置读取，避免导入模块时访问数据库
+        self.interval = interval
+        self.capacity = capacity
+        self._buffer: List[Optional[MetricsSnapshot]] = []
+        self._next_index = 0
+        self._latest: Optional[MetricsSnapshot] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._start_lock = threading.Lock()
+        self._process = psutil.Process()
+        self._cpu_count = psutil.cpu_count() or 1
+        self._cpu_count_physical = psutil.cpu_count(logical=False)
+        self._boot_time = psutil.boot_time()
+        self._tick = 0
+        self._net_connections: Optional[int] = None
+        self.stats = SamplerStats()
+        # cpu_percent(interval=None) 返回与上次调用之间的使用率，先建立基准
+        psutil.cpu_percent(interval=None, percpu=True)
+        self._process.cpu_percent(interval=None)
+
+    # ---------------------------------------------------------------- 生命周期
+
+    def start(self):
+        """启动采样线程，启动前同步完成首次采样"""
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            if not self._buffer:
+                self.interval = self.interval or max(1.0, settings.system_metrics_interval)
+                self.capacity = self.capacity or max(2, settings.system_metrics_history)
+                self._buffer = [None] * self.capacity
+            if self._latest is None:
+                self._sample_once()
+
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="system-metrics-sampler", daemon=True
+            )
+            self._thread.start()
+            logger.info(f"系统指标采样器已启动，间隔: {self.interval}秒，保留 {self.capacity} 个采样")
+
+    def stop(self, timeout: float = 5.0):
+        """停止采样线程"""
+        self._stop_event.set()
+        thread = self._thread
+        if thread and thread.is_alive():
+            thread.join(timeout)
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._sample_once()
+
+    # ------------------------------------------------------------------ 采样
+
+    def _sample_once(self):
+        started = time.monotonic()
+        try:
+            snapshot = self._collect(self._latest)
+        except Exception as e:
+            self.stats.errors += 1
+            self.stats.last_error = str(e)
+            logger.warning(f"系统指标采样失败: {e}")
+            return
+
+        index = self._next_index
+        self._buffer[index] = snapshot
+        self._next_index = (index + 1) % self.capacity
+        self._latest = snapshot
+
+        elapsed = time.monotonic() - started
+        self.stats.samples += 1
+        self.stats.last_sample_at = snapshot.timestamp
+        self.stats.last_sample_seconds = elapsed
+        self.stats.max_sample_seconds = max(self.stats.max_sample_seconds, elapsed)
+
+    def _disk_paths(self) -> Dict[str, str]:
+        paths = {"root": os.path.abspath(os.sep)}
+        media_root = settings.media_root
+        if media_root and os.path.isdir(media_root):
+            paths["media"] = media_root
+        return paths
+
+    def _collect(self, previous: Optional[MetricsSnapshot]) -> MetricsSnapshot:
+        now = time.time()
+
+        per_cpu = tuple(psutil.cpu_percent(interval=None, percpu=True))
+        cpu_percent = round(sum(per_cpu) / len(per_cpu), 1) if per_cpu else 0.0
+        try:
+            freq = psutil.cpu_freq()
+            cpu_freq = freq.current if freq else None
+        except Exception:
+            cpu_freq = None
+        try:
+            load_average = tuple(os.getloadavg())
+        except (AttributeError, OSError):
+            load_average = (0.0, 0.0, 0.0)
+
+        memory = psutil.virtual_memory()
+        swap = psutil.swap_memory()
+
+        disks: Dict[str, DiskSample] = {}
+        for name, path in self._disk_paths().items():
+            try:
+                usage = psutil.disk_usage(path)
+                disks[name] = DiskSample(path, usage.total, usage.used, usage.free, usage.percent)
+            except OSError:
+                continue
+        try:
+            disk_io = psutil.disk_io_counters()
+        except Exception:
+            disk_io = None
+
+        net = psutil.net_io_counters()
+        if previous is not None and now > previous.timestamp:
+            elapsed = now - previous.timestamp
+            send_rate = max(0.0, (net.bytes_sent - previous.net_bytes_sent) / elapsed)
+            recv_rate = max(0.0, (net.bytes_recv - previous.net_bytes_recv) / elapsed)
+        else:
+            send_rate = recv_rate = 0.0
+
+        if self._tick % CONNECTIONS_EVERY_TICKS == 0:
+            try:
+                self._net_connections = len(psutil.net_connections())
+            except (psutil.AccessDenied, OSError):
+                self._net_connections = None
+        self._tick += 1
+
+        process = self._process
+        with process.oneshot():
+            process_cpu = process.cpu_percent(interval=None)
+            process_memory = process.memory_info()
+            process_memory_percent = process.memory_percent()
+            process_threads = process.num_threads()
+            try:
+                process_fds = process.num_fds()
+            except (AttributeError, psutil.Error):
+                process_fds = None
+
+        return MetricsSnapshot(
+            timestamp=now,
+            cpu_percent=cpu_percent,
+            per_cpu_percent=per_cpu,
+            cpu_count=self._cpu_count,
+            cpu_count_physical=self._cpu_count_physical,
+            cpu_freq_mhz=cpu_freq,
+            load_average=load_average,
+            memory_total=memory.total,
+            memory_available=memory.available,
+            memory_used=memory.used,
+            memory_percent=memory.percent,
+            swap_total=swap.total,
+            swap_used=swap.used,
+            swap_percent=swap.percent,
+            disks=disks,
+            disk_read_bytes=disk_io.read_bytes if disk_io else 0,
+            disk_write_bytes=disk_io.write_bytes if disk_io else 0,
+            net_bytes_sent=net.bytes_sent,
+            net_bytes_recv=net.bytes_recv,
+            net_packets_sent=net.packets_sent,
+            net_packets_recv=net.packets_recv,
+            net_errin=net.errin,
+            net_errout=net.errout,
+            net_dropin=net.dropin,
+            net_dropout=net.dropout,
+            net_send_rate=send_rate,
+            net_recv_rate=recv_rate,
+            net_connections=self._net_connections,
+            process_pid=process.pid,
+            process_cpu_percent=process_cpu,
+            process_memory_rss=process_memory.rss,
+            process_memory_vms=process_memory.vms,
+            process_memory_percent=process_memory_percent,
+            process_threads=process_threads,
+            process_fds=process_fds,
+            boot_time=self._boot_time,
+        )
+
+    # ------------------------------------------------------------------ 读取
+
+    def latest(self) -> MetricsSnapshot:
+        """获取最新快照，采样器未启动时先启动(首次采样为同步执行)"""
+        snapshot = self._latest
+        if snapshot is None:
+            self.start()
+            snapshot = self._latest
+            if snapshot is None:
+                raise RuntimeError(f"系统指标采样失败: {self.stats.last_error}")
+        return snapshot
+
+    def history(self, seconds: Optional[float] = None) -> List[MetricsSnapshot]:
+        """按时间顺序返回缓冲区中的快照，可限定最近 seconds 秒"""
+        start = self._next_index
+        buffer = self._buffer
+        snapshots = [s for s in buffer[start:] + buffer[:start] if s is not None]
+        if seconds is not None:
+            cutoff = time.time() - seconds
+            snapshots = [s for s in snapshots if s.timestamp >= cutoff]
+        return snapshots
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats.to_dict()
+        stats.update({
+            "running": self.running,
+            "interval": self.interval,
+            "capacity": self.capacity,
+            "buffered": sum(1 for s in self._buffer if s is not None),
+        })
+        return stats
+
+
+system_metrics_sampler = SystemMetricsSampler()
+
+
+def get_system_metrics_sampler() -> SystemMetricsSampler:
+    """获取系统指标采样器实例"""
+    return system_metrics_sampler
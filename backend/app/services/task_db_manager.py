@@ -10,8 +10,10 @@ from typing import Any, Callable, Optional, Dict, List
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import OperationalError
 from sqlalchemy import text
+from ..core.metrics import DB_LOCK_RETRIES
 from ..database import SessionLocal
 from ..utils.db_optimization import optimized_db_session
+from ..utils.db_writer import db_writer, UpdateTaskState
 
 logger = logging.getLogger(__name__)
 
@@ -103,6 +105,7 @@ class TaskDatabaseManager:
                                     del self.active_sessions[session_key]
                     
                     if retry_count <= max_retries:
+                        DB_LOCK_RETRIES.labels("task_session").inc()
                         delay = self.retry_delays[min(retry_count - 1, len(self.retry_delays) - 1)]
                         logger.warning(f"任务{task_id} {operation_type}操作数据库锁定，{delay:.1f}秒后重试 (尝试 {retry_count}/{max_retries})")
                         await asyncio.sleep(delay)
@@ -147,32 +150,28 @@ class TaskDatabaseManager:
         return retry_config.get(operation_type, 10)
     
     async def batch_progress_update(self, updates: List[Dict[str, Any]]):
-        """批量更新进度，减少数据库访问次数"""
+        """批量更新进度，经单写线程合并到同一事务提交"""
         if not updates:
             logger.debug("批量进度更新: 没有需要更新的项目")
             return
         
         logger.info(f"批量进度更新: 开始处理 {len(updates)} 个更新项目")
         try:
-            async with self.get_task_session(0, "progress") as session:
-                from ..models.rule import DownloadTask
-                
-                for update in updates:
-                    task_id = update.get('task_id')
-                    if not task_id:
-                        continue
-                        
-                    task = session.query(DownloadTask).filter(DownloadTask.id == task_id).first()
-                    if task:
-                        if 'progress' in update:
-                            task.progress = update['progress']
-                        if 'downloaded_messages' in update:
-                            task.downloaded_messages = update['downloaded_messages']
-                        if 'status' in update:
-                            task.status = update['status']
-                
-                session.commit()
-                logger.info(f"批量进度更新: 成功更新了 {len(updates)} 个任务的进度")
+            commands = []
+            for update in updates:
+                task_id = update.get('task_id')
+                if not task_id:
+                    continue
+                fields = {
+                    key: update[key]
+                    for key in ('progress', 'downloaded_messages', 'status')
+                    if key in update
+                }
+                if fields:
+                    commands.append(db_writer.execute(UpdateTaskState(task_id, fields)))
+            
+            await asyncio.gather(*commands)
+            logger.info(f"批量进度更新: 成功更新了 {len(commands)} 个任务的进度")
                 
         except Exception as e:
             logger.error(f"批量进度更新失败: {e}", exc_info=True)
@@ -181,21 +180,17 @@ class TaskDatabaseManager:
         """快速状态更新，用于任务完成或失败"""
         logger.info(f"快速状态更新: 任务{task_id} 状态更新为 {status}" + (f" (错误: {error_message})" if error_message else ""))
         try:
-            async with self.get_task_session(task_id, "completion") as session:
-                from ..models.rule import DownloadTask
-                from datetime import datetime, timezone
-                
-                task = session.query(DownloadTask).filter(DownloadTask.id == task_id).first()
-                if task:
-                    task.status = status
-                    if status == "completed":
-                        task.progress = 100
-                        task.completed_at = datetime.now(timezone.utc)
-                    elif status == "failed" and error_message:
-                        task.error_message = error_message
-                
-                session.commit()
-                logger.info(f"快速状态更新: 任务 {task_id} 状态成功更新为 {status}")
+            from datetime import datetime, timezone
+            
+            fields = {"status": status}
+            if status == "completed":
+                fields["progress"] = 100
+                fields["completed_at"] = datetime.now(timezone.utc)
+            elif status == "failed" and error_message:
+                fields["error_message"] = error_message
+            
+            await db_writer.execute(UpdateTaskState(task_id, fields))
+            logger.info(f"快速状态更新: 任务 {task_id} 状态成功更新为 {status}")
                 
         except Exception as e:
             logger.error(f"快速状态更新失败: 任务{task_id} 状态{status}: {e}", exc_info=True)
@@ -6,7 +6,7 @@ import shutil
 import time
 import traceback
 from datetime import datetime, timezone
-from typing import Optional, List, Dict, Callable, Any, Union
+from typing import Optional, List, Dict, Callable, Any, Union, AsyncIterator, Tuple
 from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
 
@@ -16,20 +16,57 @@ from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError, OperationalError, DisconnectionError
 
 # 本地模块导入
-from ..models.log import TaskLog
+from ..models.download_job import JOB_KIND_TASK
 from ..models.rule import DownloadTask, FilterRule
 from ..models.telegram import TelegramMessage, TelegramGroup
 from ..utils.db_optimization import optimized_db_session
+from ..utils.db_writer import db_writer, read_only_session, InsertTaskLogs, UpdateTaskState, UpsertDownloadRecords
+from ..utils.message_fts import keyword_match_condition
 from ..websocket.manager import websocket_manager
 from ..core.batch_logging import HighPerformanceLogger, get_batch_handler
 from ..core.memory_manager import memory_manager, memory_tracking, MemoryLimitedBuffer
+from ..core.rate_governor import LANE_BULK, rate_governor
+from ..core.tracing import tracer
+from .download_job_queue import JobCancelled, download_job_queue
+from .download_pipeline import TaskDownloadPipeline
 from .file_organizer_service import FileOrganizerService
 from .media_downloader import TelegramMediaDownloader
+from .progress_service import progress_service
+from .rule_engine import CompiledRuleSet, RULE_MESSAGE_FIELDS, rule_to_dict
+from .rule_match_service import rule_match_service
 from .rule_sync_service import rule_sync_service
 from .task_db_manager import task_db_manager
 
 logger = logging.getLogger(__name__)
 
+# 下载流水线需要的消息列（筛选、命名、整理、写下载记录），其余大字段不加载
+DOWNLOAD_MESSAGE_COLUMNS = (
+    TelegramMessage.id,
+    TelegramMessage.group_id,
+    TelegramMessage.message_id,
+    TelegramMessage.sender_id,
+    TelegramMessage.sender_username,
+    TelegramMessage.sender_name,
+    TelegramMessage.text,
+    TelegramMessage.media_type,
+    TelegramMessage.media_size,
+    TelegramMessage.media_filename,
+    TelegramMessage.media_file_id,
+    TelegramMessage.media_duration,
+    TelegramMessage.media_width,
+    TelegramMessage.media_height,
+    TelegramMessage.media_title,
+    TelegramMessage.media_thumbnail_path,
+    TelegramMessage.is_forwarded,
+    TelegramMessage.forwarded_from,
+    TelegramMessage.forwarded_date,
+    TelegramMessage.date,
+)
+
+# 任务筛选来源: 入库时写入的匹配结果 / 规则引擎扫描候选消息
+SELECTION_MATCHES = "matches"
+SELECTION_SCAN = "scan"
+
 # 高性能日志记录器
 high_perf_logger = HighPerformanceLogger('task_execution_service')
 
@@ -215,8 +252,8 @@ class LogRingBuffer:
 class AsyncLogWriter:
     """异步日志写入器 - 后台批量写入数据库"""
 
-    def __init__(self, db_session_factory, batch_size: int = 50, flush_interval: float = 5.0, max_retries: int = 3):
-        self.db_session_factory = db_session_factory
+    def __init__(self, db_writer, batch_size: int = 50, flush_interval: float = 5.0, max_retries: int = 3):
+        self.db_writer = db_writer
         self.batch_size = batch_size
         self.flush_interval = flush_interval
         self.max_retries = max_retries
@@ -327,22 +364,15 @@ class AsyncLogWriter:
         retry_count = 0
         while retry_count < self.max_retries:
             try:
-                async with self.db_session_factory(max_retries=3) as db:
-                    for log in actual_logs:
-                        if log.get("level") in ["ERROR", "WARNING", "INFO"]:
-                            db_log = TaskLog(
-                                task_id=log["task_id"],
-                                level=log["level"],
-                                message=log["message"],
-                                details=log.get("details"),
-                                created_at=log["created_at"]
-                            )
-                            db.add(db_log)
-
-                    # 统计
-                    self.total_processed += len(actual_logs)
-                    self.total_batches += 1
-                    break
+                # 日志经单写线程写入，与其他写操作合并提交
+                await self.db_writer.execute(InsertTaskLogs([
+                    log for log in actual_logs if log.get("level") in ["ERROR", "WARNING", "INFO"]
+                ]))
+
+                # 统计
+                self.total_processed += len(actual_logs)
+                self.total_batches += 1
+                break
 
             except Exception as e:
                 retry_count += 1
@@ -463,6 +493,15 @@ class TaskExecutionConfig:
     health_check_interval: float = 30.0
     auto_recovery_enabled: bool = True
     graceful_shutdown_timeout: float = 60.0
+    # 下载流水线
+    download_concurrency_per_task: int = 3
+    global_download_concurrency: int = 6
+    organize_workers: int = 2
+    pipeline_queue_size: int = 32
+    record_batch_size: int = 20
+    record_flush_interval: float = 2.0
+    selection_page_size: int = 500
+    rule_scan_page_size: int = 2000
 
 @dataclass
 class ServiceHealthMetrics:
@@ -538,7 +577,7 @@ class TaskExecutionService:
 
         # 异步日志写入器
         self.async_log_writer = AsyncLogWriter(
-            db_session_factory=optimized_db_session,
+            db_writer=db_writer,
             batch_size=self.log_batch_size,
             flush_interval=5.0,  # 5秒自动刷新
             max_retries=3
@@ -551,6 +590,8 @@ class TaskExecutionService:
 
         # 并发控制
         self._task_semaphore = asyncio.Semaphore(self.config.max_concurrent_tasks)
+        self._global_download_semaphore = asyncio.Semaphore(self.config.global_download_concurrency)
+        self._pipelines: Dict[int, TaskDownloadPipeline] = {}
 
         # 注册清理回调
         memory_manager.add_cleanup_callback(self._memory_cleanup)
@@ -710,13 +751,46 @@ class TaskExecutionService:
                 logger.critical(f"服务重新初始化失败: {reinit_error}")
                 return False
         
-        # 创建异步任务
-        task = asyncio.create_task(self._execute_task(task_id))
+        # 创建异步任务，任务内的Telegram请求按批量请求限速
+        with rate_governor.lane(LANE_BULK):
+            task = asyncio.create_task(self._execute_task(task_id))
         self.running_tasks[task_id] = task
         
+        # 登记为已租用的任务作业，进程异常退出后由下载作业队列恢复执行
+        try:
+            await download_job_queue.adopt(JOB_KIND_TASK, task_id, max_attempts=1)
+        except Exception as e:
+            logger.warning(f"登记任务作业失败，任务 {task_id} 在重启后不会自动恢复: {e}")
+        
         logger.info(f"任务 {task_id} 已启动")
         return True
     
+    async def run_task_job(self, job: Dict[str, Any]) -> bool:
+        """下载作业队列中任务作业的执行函数
+        
+        等待本进程已启动的任务执行完成；重启后认领到的作业则重新开始执行，
+        已下载的文件由文件检查跳过。
+        """
+        task_id = job["target_id"]
+        task = self.running_tasks.get(task_id)
+        if task is None:
+            await self.initialize()
+            await self._log_task_event(task_id, "INFO", "任务在应用重启后恢复执行")
+            with rate_governor.lane(LANE_BULK):
+                task = asyncio.create_task(self._execute_task(task_id))
+            self.running_tasks[task_id] = task
+            logger.info(f"任务 {task_id} 已恢复执行")
+        
+        await asyncio.wait({task})
+        if task.cancelled():
+            raise JobCancelled("任务已暂停或停止")
+        
+        def read_status() -> Optional[str]:
+            with read_only_session() as db:
+                return db.query(DownloadTask.status).filter(DownloadTask.id == task_id).scalar()
+        
+        return await asyncio.to_thread(read_status) == "completed"
+    
     async def pause_task(self, task_id: int) -> bool:
         """暂停任务执行"""
         if task_id not in self.running_tasks:
@@ -772,8 +846,7 @@ class TaskExecutionService:
             if not task_info:
                 return
             
-            task_data, messages, all_rules_data = task_info
-            total_messages = len(messages)
+            task_data, messages, total_messages, all_rules_data = task_info
             
             await self._log_task_event(task_id, "INFO", f"开始执行任务: {task_data['task_name']}")
             await self._log_task_event(task_id, "INFO", f"找到 {total_messages} 条符合条件的消息")
@@ -782,47 +855,38 @@ class TaskExecutionService:
             download_dir = os.path.join(task_data['download_path'])
             os.makedirs(download_dir, exist_ok=True)
             
-            # 第二阶段：执行下载循环（无数据库会话持有）
-            downloaded_count = 0
-            failed_count = 0
-            
-            for i, message in enumerate(messages):
-                try:
-                    # 检查任务是否被取消
-                    if task_id not in self.running_tasks:
-                        logger.info(f"任务 {task_id} 已被取消")
-                        return
-                    
-                    # 下载媒体文件
-                    if message.media_type and message.media_type != 'text':
-                        # 检测匹配的关键字
-                        matched_keyword = self._get_matched_keyword(message, all_rules_data[0] if all_rules_data else {})
-                        
-                        # 创建带有匹配关键字的临时任务数据
-                        temp_task_data = task_data.copy()
-                        temp_task_data['matched_keyword'] = matched_keyword
-                        
-                        success = await self._download_message_media(message, temp_task_data, task_id)
-                        if success:
-                            downloaded_count += 1
-                        else:
-                            failed_count += 1
-                    
-                    # 更新进度（短时间数据库操作）
-                    progress = int((i + 1) / total_messages * 100)
-                    await self._update_task_progress(task_id, progress, downloaded_count)
-                    
-                    # 发送进度更新
-                    await self._send_progress_update(task_id, progress, downloaded_count, total_messages)
-                    
-                    # 避免过于频繁的下载，同时让其他任务有机会访问数据库
-                    await asyncio.sleep(0.2)  # 减少延迟，提高效率
-                    
-                except Exception as e:
-                    logger.error(f"下载消息 {message.id} 失败: {e}")
-                    failed_count += 1
-                    await self._log_task_event(task_id, "ERROR", f"下载消息 {message.id} 失败: {str(e)}")
-            
+            # 第二阶段：下载/整理/写库流水线（无数据库会话持有）
+            pipeline = TaskDownloadPipeline(
+                self,
+                task_id,
+                task_data,
+                messages,
+                total_messages,
+                all_rules_data,
+                global_semaphore=self._global_download_semaphore,
+                download_concurrency=self.config.download_concurrency_per_task,
+                organize_workers=self.config.organize_workers,
+                queue_size=self.config.pipeline_queue_size,
+                record_batch_size=self.config.record_batch_size,
+                record_flush_interval=self.config.record_flush_interval,
+            )
+            self._pipelines[task_id] = pipeline
+            downloaded_count, failed_count = await pipeline.run()
+            # 先落库流水线最后的进度，再由完成处理写入最终状态
+            await progress_service.finish_task(task_id)
+
+            if pipeline.cancelled:
+                logger.info(f"任务 {task_id} 已被取消")
+                return
+
+            stage_stats = pipeline.get_stats()["stages"]
+            logger.info(
+                f"任务 {task_id} 流水线统计: " + ", ".join(
+                    f"{name} {stats['processed']}条/{stats['throughput_per_second']}每秒"
+                    for name, stats in stage_stats.items()
+                )
+            )
+
             # 第三阶段：任务完成处理（短时间数据库操作）
             await self._complete_task_execution(
                 task_id, 
@@ -839,6 +903,8 @@ class TaskExecutionService:
             # 清理运行中的任务记录
             if task_id in self.running_tasks:
                 del self.running_tasks[task_id]
+            self._pipelines.pop(task_id, None)
+            await progress_service.finish_task(task_id)
     
     async def _prepare_task_execution(self, task_id: int):
         """准备任务执行：获取任务信息和筛选消息（修复：支持多规则架构）"""
@@ -902,6 +968,8 @@ class TaskExecutionService:
             
             rule_ids = [assoc.rule_id for assoc in rule_associations]
             rules = db.query(FilterRule).filter(FilterRule.id.in_(rule_ids)).all()
+            # IN查询不保证顺序，按关联优先级排列，规则引擎按此顺序评估
+            rules.sort(key=lambda rule: rule_ids.index(rule.id))
             
             # 将对象数据提取为字典，避免会话绑定问题
             task_data = {
@@ -936,38 +1004,7 @@ class TaskExecutionService:
                 task_data['primary_rule_id'] = None
             
             # 提取所有规则数据
-            for rule in rules:
-                rule_data = {
-                    'id': rule.id,
-                    'name': rule.name,
-                    'keywords': rule.keywords,
-                    'exclude_keywords': rule.exclude_keywords,
-                    'media_types': rule.media_types,
-                    'sender_filter': rule.sender_filter,
-                    'min_file_size': rule.min_file_size,
-                    'max_file_size': rule.max_file_size,
-                    'include_forwarded': rule.include_forwarded,
-                    'date_from': rule.date_from,
-                    'date_to': rule.date_to,
-                    'min_views': rule.min_views,
-                    'max_views': rule.max_views,
-                    # 添加高级过滤条件
-                    'min_duration': getattr(rule, 'min_duration', None),
-                    'max_duration': getattr(rule, 'max_duration', None),
-                    'min_width': getattr(rule, 'min_width', None),
-                    'max_width': getattr(rule, 'max_width', None),
-                    'min_height': getattr(rule, 'min_height', None),
-                    'max_height': getattr(rule, 'max_height', None),
-                    'min_text_length': getattr(rule, 'min_text_length', None),
-                    'max_text_length': getattr(rule, 'max_text_length', None),
-                    'has_urls': getattr(rule, 'has_urls', None),
-                    'has_mentions': getattr(rule, 'has_mentions', None),
-                    'has_hashtags': getattr(rule, 'has_hashtags', None),
-                    'is_reply': getattr(rule, 'is_reply', None),
-                    'is_edited': getattr(rule, 'is_edited', None),
-                    'is_pinned': getattr(rule, 'is_pinned', None)
-                }
-                all_rules_data.append(rule_data)
+            all_rules_data = [rule_to_dict(rule) for rule in rules]
             
             # 检查增量查询字段
             task_data['last_processed_time'] = getattr(download_task, 'last_processed_time', None)
@@ -977,10 +1014,11 @@ class TaskExecutionService:
         for rule_data in all_rules_data:
             await self._ensure_rule_data_availability(rule_data['id'], task_id)
         
-        # 第三步：执行筛选查询（支持多规则OR逻辑）
-        messages = await self._filter_messages_with_multiple_rules(all_rules_data, task_data, task_id)
+        # 第三步：确定筛选来源并统计消息数，匹配和读取在执行阶段分页进行（多规则OR逻辑）
+        rule_set = CompiledRuleSet.compile(all_rules_data)
+        source, total_messages = await self._select_matching_messages(rule_set, task_data, task_id)
         
-        if len(messages) == 0:
+        if total_messages == 0:
             await self._complete_task_execution(task_id, "没有找到符合任何规则条件的消息")
             return None
         
@@ -991,48 +1029,20 @@ class TaskExecutionService:
             if not download_task:
                 return None
                 
-            download_task.total_messages = len(messages)
+            download_task.total_messages = total_messages
             download_task.downloaded_messages = 0
             download_task.progress = 0
             db.commit()
         
-        return task_data, messages, all_rules_data
+        messages = self._stream_matching_messages(source, rule_set, task_data, task_id)
+        return task_data, messages, total_messages, all_rules_data
     
-    async def _update_task_progress(self, task_id: int, progress: int, downloaded_count: int):
-        """更新任务进度（优化：减少频繁的数据库更新）"""
-        # 只在进度发生显著变化时才更新数据库
-        if not hasattr(self, '_last_progress_update'):
-            self._last_progress_update = {}
-        
-        last_update = self._last_progress_update.get(task_id, {'progress': -1, 'count': -1})
-        
-        # 减少数据库更新频率：只有在进度变化超过10%或下载数量变化超过20时才更新
-        progress_diff = abs(progress - last_update['progress'])
-        count_diff = abs(downloaded_count - last_update['count'])
-        
-        if progress_diff >= 10 or count_diff >= 20 or progress == 0 or progress == 100:
-            logger.debug(f"任务{task_id}: 触发进度更新 - 进度: {progress}%, 下载数: {downloaded_count}")
-            try:
-                # 使用专用数据库管理器进行进度更新
-                async with task_db_manager.get_task_session(task_id, "progress") as session:
-                    download_task = session.query(DownloadTask).filter(DownloadTask.id == task_id).first()
-                    if download_task:
-                        logger.debug(f"任务{task_id}: 找到任务记录，更新进度数据")
-                        download_task.progress = progress
-                        download_task.downloaded_messages = downloaded_count
-                        session.commit()
-                        
-                        # 记录最后更新的进度
-                        self._last_progress_update[task_id] = {
-                            'progress': progress, 
-                            'count': downloaded_count
-                        }
-                        logger.debug(f"任务{task_id}: 进度更新成功 - 进度: {progress}%, 下载数: {downloaded_count}")
-                    else:
-                        logger.warning(f"任务{task_id}: 未找到任务记录，无法更新进度")
-                        
-            except Exception as e:
-                logger.error(f"任务{task_id}: 更新任务进度失败 - {e}", exc_info=True)  # 不抛出异常，避免中断下载
+    async def _update_task_progress(self, task_id: int, progress: int, downloaded_count: int, total: int):
+        """更新任务进度
+
+        只写入进度服务的内存状态，由进度服务按频率推送，并按检查点间隔通过单写线程落库。
+        """
+        progress_service.update_task(task_id, progress, downloaded_count, total)
     
     async def _complete_task_execution(self, task_id: int, message: str):
         """完成任务执行"""
@@ -1083,229 +1093,191 @@ class TaskExecutionService:
             logger.warning(f"规则数据同步失败，继续使用现有数据: {e}")
             await self._log_task_event(task_id, "WARNING", f"规则数据同步失败: {str(e)}")
     
-    async def _filter_messages_optimized(self, rule_data: dict, task_data: dict, task_id: int) -> List[TelegramMessage]:
-        """优化的消息筛选方法（使用数据字典，减少数据库锁定时间）"""
-        # 第一步：快速构建查询，不立即执行
-        base_query_params = {
-            'group_id': task_data['group_id'],
-            'last_processed_time': task_data.get('last_processed_time'),
-            'force_full_scan': task_data.get('force_full_scan', False)
-        }
-        
-# 第二步：使用专用数据库管理器执行查询
-        logger.info(f"任务{task_id}: 开始批量查询操作，群组ID: {base_query_params['group_id']}")
-        async with task_db_manager.get_task_session(task_id, "batch_query") as db:
-            try:
-                # 基础查询 - 预加载group关联以避免后续会话绑定问题
-                logger.debug(f"任务{task_id}: 构建基础查询条件")
-                from sqlalchemy.orm import joinedload
-                query = db.query(TelegramMessage).options(joinedload(TelegramMessage.group)).filter(TelegramMessage.group_id == base_query_params['group_id'])
-                
-                # 增量查询优化
-                if base_query_params['last_processed_time']:
-                    query = query.filter(TelegramMessage.date > base_query_params['last_processed_time'])
-                    await self._log_task_event(task_id, "INFO", f"增量筛选: 只查询 {base_query_params['last_processed_time']} 之后的消息")
-                    logger.info(f"增量筛选: 只查询 {base_query_params['last_processed_time']} 之后的消息")
-                elif not base_query_params['force_full_scan']:
-                    await self._log_task_event(task_id, "INFO", "使用完整数据集进行筛选")
-                    logger.info("使用规则的完整数据集进行筛选")
-                
-                # 应用规则筛选
-                query = self._apply_rule_filters_from_dict(query, rule_data)
-
-                # 分批查询以减少锁定时间 - 优化对象获取逻辑
-                batch_size = await self._calculate_optimal_batch_size(db, base_query_params['group_id'])
-                all_results = []
-                offset = 0
-                query_stats = {
-                    'total_batches': 0,
-                    'total_records': 0,
-                    'start_time': time.time()
-                }
-                
-                while True:
-                    # 执行分批查询
-                    batch_query = query.order_by(TelegramMessage.date.desc()).offset(offset).limit(batch_size)
-                    batch_results = batch_query.all()
-                    
-                    if not batch_results:
-                        break
-                    
-                    # 立即将批次结果从会话中分离
-                    for message in batch_results:
-                        db.expunge(message)
-                        
-                    all_results.extend(batch_results)
-                    offset += batch_size
-                    
-                    # 如果批次小于限制，说明已经是最后一批
-                    if len(batch_results) < batch_size:
-                        break
-                        
-                    # 每批之间短暂释放锁
-                    await asyncio.sleep(0.01)
-                
-                logger.info(f"任务 {task_id} 筛选完成，共找到 {len(all_results)} 条消息")
-                logger.debug(f"任务{task_id}: 所有消息对象已在批次处理中从会话分离")
-                
-                # 第三步：使用单独的会话更新任务时间
-                if all_results and base_query_params['last_processed_time'] is not None:
-                    await self._update_task_processed_time(task_data['task_id'], all_results)
-                
-                return all_results
-                
-            except Exception as e:
-                logger.error(f"任务{task_id}: 消息筛选查询失败: {e}", exc_info=True)
-                await self._log_task_event(task_id, "ERROR", f"消息筛选失败: {str(e)}")
-                raise
-    
-    async def _filter_messages_with_multiple_rules(self, all_rules_data: List[dict], task_data: dict, task_id: int) -> List[TelegramMessage]:
-        """支持多规则的消息筛选方法（使用OR逻辑组合多个规则）"""
-        # 第一步：快速构建查询，不立即执行
-        base_query_params = {
+    def _build_candidate_query(self, db: Session, rule_set: CompiledRuleSet, base_query_params: dict):
+        """构建候选消息查询
+
+        只包含群组、增量时间和规则集的宽松预筛条件，并且只查询规则评估需要的列，
+        精确判断由编译后的规则集在内存中完成。
+        """
+        columns = [getattr(TelegramMessage, name) for name in RULE_MESSAGE_FIELDS]
+        query = db.query(*columns).filter(TelegramMessage.group_id == base_query_params['group_id'])
+
+        # 增量查询优化
+        if base_query_params['last_processed_time']:
+            query = query.filter(TelegramMessage.date > base_query_params['last_processed_time'])
+
+        return query.filter(*rule_set.prefilter_conditions())
+
+    def _selection_params(self, task_data: dict) -> dict:
+        return {
             'group_id': task_data['group_id'],
             'last_processed_time': task_data.get('last_processed_time'),
             'force_full_scan': task_data.get('force_full_scan', False)
         }
-        
-        logger.info(f"任务{task_id}: 开始多规则批量查询操作，群组ID: {base_query_params['group_id']}, 规则数量: {len(all_rules_data)}")
-        
-        # 第二步：使用专用数据库管理器执行查询
-        async with task_db_manager.get_task_session(task_id, "batch_query") as db:
-            try:
-                # 基础查询 - 预加载group关联以避免后续会话绑定问题
-                logger.debug(f"任务{task_id}: 构建基础查询条件")
-                from sqlalchemy.orm import joinedload
-                from sqlalchemy import or_
-                
-                query = db.query(TelegramMessage).options(joinedload(TelegramMessage.group)).filter(
-                    TelegramMessage.group_id == base_query_params['group_id']
+
+    async def _select_matching_messages(self, rule_set: CompiledRuleSet, task_data: dict, task_id: int) -> Tuple[str, int]:
+        """确定筛选来源并统计消息数
+
+        入库时写入的匹配结果已就绪时按覆盖索引读取；否则回退为用编译后的规则集
+        分页评估候选消息。这里只做计数，匹配结果由 _stream_matching_messages 分页读取。
+
+        Returns:
+            (来源, 消息数)。来源为 SELECTION_MATCHES 时消息数为精确值；为 SELECTION_SCAN 时
+            为通过预筛的候选消息数(上限)，流水线在读取结束后修正为实际数量
+        """
+        base_query_params = self._selection_params(task_data)
+        logger.info(f"任务{task_id}: 开始多规则筛选，群组ID: {base_query_params['group_id']}, 规则数量: {len(rule_set)}")
+
+        if base_query_params['last_processed_time']:
+            await self._log_task_event(task_id, "INFO", f"增量筛选: 只查询 {base_query_params['last_processed_time']} 之后的消息")
+            logger.info(f"增量筛选: 只查询 {base_query_params['last_processed_time']} 之后的消息")
+        elif not base_query_params['force_full_scan']:
+            await self._log_task_event(task_id, "INFO", "使用完整数据集进行多规则筛选")
+            logger.info("使用规则的完整数据集进行多规则筛选")
+
+        def count_matches() -> Optional[int]:
+            with read_only_session() as db:
+                if not rule_match_service.is_ready(db, base_query_params['group_id'], rule_set):
+                    return None
+                return rule_match_service.count_pending_matches(
+                    db, base_query_params['group_id'], rule_set,
+                    since=base_query_params['last_processed_time'],
                 )
-                
-                # 增量查询优化
-                if base_query_params['last_processed_time']:
-                    query = query.filter(TelegramMessage.date > base_query_params['last_processed_time'])
-                    await self._log_task_event(task_id, "INFO", f"增量筛选: 只查询 {base_query_params['last_processed_time']} 之后的消息")
-                    logger.info(f"增量筛选: 只查询 {base_query_params['last_processed_time']} 之后的消息")
-                elif not base_query_params['force_full_scan']:
-                    await self._log_task_event(task_id, "INFO", "使用完整数据集进行多规则筛选")
-                    logger.info("使用规则的完整数据集进行多规则筛选")
-                
-                # 应用多规则筛选（OR逻辑）
-                rule_conditions = []
-                for rule_data in all_rules_data:
-                    logger.debug(f"任务{task_id}: 处理规则 {rule_data['id']} - {rule_data['name']}")
-                    
-                    # 为每个规则创建一个子查询条件
-                    rule_query = db.query(TelegramMessage.id).filter(TelegramMessage.group_id == base_query_params['group_id'])
-                    
-                    # 增量查询条件也应用到每个规则
-                    if base_query_params['last_processed_time']:
-                        rule_query = rule_query.filter(TelegramMessage.date > base_query_params['last_processed_time'])
-                    
-                    # 应用规则筛选条件
-                    rule_query = self._apply_rule_filters_from_dict(rule_query, rule_data)
-                    
-                    # 添加到OR条件中
-                    rule_conditions.append(TelegramMessage.id.in_(rule_query))
-                
-                # 如果有规则条件，应用OR逻辑
-                if rule_conditions:
-                    query = query.filter(or_(*rule_conditions))
-                    logger.info(f"任务{task_id}: 应用了 {len(rule_conditions)} 个规则的OR组合条件")
-                
-                # 分批查询以减少锁定时间
-                batch_size = 1000  # 每批1000条记录
-                all_results = []
-                offset = 0
-                
-                while True:
-                    # 执行分批查询
-                    batch_query = query.order_by(TelegramMessage.date.desc()).offset(offset).limit(batch_size)
-                    batch_results = batch_query.all()
-                    
-                    if not batch_results:
-                        break
-                    
-                    # 立即将批次结果从会话中分离
-                    for message in batch_results:
-                        db.expunge(message)
-                        
-                    all_results.extend(batch_results)
-                    offset += batch_size
-                    
-                    # 如果批次小于限制，说明已经是最后一批
-                    if len(batch_results) < batch_size:
-                        break
-                        
-                    # 每批之间短暂释放锁
-                    await asyncio.sleep(0.01)
-                
-                logger.info(f"任务 {task_id} 多规则筛选完成，共找到 {len(all_results)} 条消息")
-                logger.debug(f"任务{task_id}: 所有消息对象已在批次处理中从会话分离")
-                
-                # 第三步：使用单独的会话更新任务时间
-                if all_results and base_query_params['last_processed_time'] is not None:
-                    await self._update_task_processed_time(task_data['task_id'], all_results)
-                
-                return all_results
-                
-            except Exception as e:
-                logger.error(f"任务{task_id}: 多规则消息筛选查询失败: {e}", exc_info=True)
-                await self._log_task_event(task_id, "ERROR", f"多规则消息筛选失败: {str(e)}")
-                raise
-    
-    async def _update_task_processed_time(self, task_id: int, messages: List[TelegramMessage]):
+
+        def count_candidates() -> int:
+            with read_only_session() as db:
+                return self._build_candidate_query(db, rule_set, base_query_params).count()
+
+        try:
+            # 入库时已完成匹配: 直接范围读取匹配结果
+            total = await asyncio.to_thread(count_matches)
+            if total is not None:
+                logger.info(f"任务 {task_id} 使用入库匹配结果，共找到 {total} 条消息")
+                return SELECTION_MATCHES, total
+
+            # 匹配结果尚未就绪(规则刚修改或新关联到群组): 回退为规则引擎扫描，并唤醒后台重建
+            rule_match_service.stats.task_fallbacks += 1
+            rule_match_service.wake()
+            total = await asyncio.to_thread(count_candidates)
+            logger.info(f"任务 {task_id} 匹配结果未就绪，由规则引擎分页评估 {total} 条候选消息")
+            return SELECTION_SCAN, total
+        except Exception as e:
+            logger.error(f"任务{task_id}: 多规则消息筛选查询失败: {e}", exc_info=True)
+            await self._log_task_event(task_id, "ERROR", f"多规则消息筛选失败: {str(e)}")
+            raise
+
+    async def _stream_matching_messages(self, source: str, rule_set: CompiledRuleSet, task_data: dict,
+                                        task_id: int) -> AsyncIterator[TelegramMessage]:
+        """分页筛选并流式产出消息
+
+        按 (date, id) 倒序用键集分页: 每页先读取匹配结果或评估一页候选消息，再按主键
+        读取这一页命中的消息，取完立即分离对象并关闭会话。数据库读取都在工作线程中
+        使用只读会话完成。命中的规则和关键词附加在消息对象上
+        (matched_rule_id/matched_rule_name/matched_keyword)。
+        内存中只保留当前一页，下游流水线在第一页返回后立即开始下载。
+        """
+        from sqlalchemy.orm import joinedload, load_only
+
+        base_query_params = self._selection_params(task_data)
+        group_id = base_query_params['group_id']
+        yielded = 0
+        scanned = 0
+        newest_date = None
+
+        def match_page(after: Optional[tuple]) -> Tuple[List[tuple], Optional[tuple], int]:
+            """返回 (本页命中的 (主键, 时间, RuleMatch), 下一页游标, 本页评估的候选数)，游标为空表示读取结束"""
+            with read_only_session() as db:
+                if source == SELECTION_MATCHES:
+                    page_size = self.config.selection_page_size
+                    chunk = rule_match_service.read_pending_matches(
+                        db, group_id, rule_set,
+                        since=base_query_params['last_processed_time'],
+                        after=after, limit=page_size,
+                    )
+                    next_key = (chunk[-1][1], chunk[-1][0]) if len(chunk) == page_size else None
+                    return chunk, next_key, len(chunk)
+
+                page_size = self.config.rule_scan_page_size
+                query = self._build_candidate_query(db, rule_set, base_query_params)
+                if after is not None:
+                    last_date, last_id = after
+                    query = query.filter(or_(
+                        TelegramMessage.date < last_date,
+                        and_(TelegramMessage.date == last_date, TelegramMessage.id < last_id)
+                    ))
+                page = query.order_by(TelegramMessage.date.desc(), TelegramMessage.id.desc()).limit(page_size).all()
+                chunk = []
+                for row in page:
+                    match = rule_set.match(row)
+                    if match is not None:
+                        chunk.append((row.id, row.date, match))
+                next_key = (page[-1].date, page[-1].id) if len(page) == page_size else None
+                return chunk, next_key, len(page)
+
+        def read_page(chunk: List[tuple]) -> List[TelegramMessage]:
+            with read_only_session() as db:
+                rows = db.query(TelegramMessage).options(
+                    load_only(*DOWNLOAD_MESSAGE_COLUMNS),
+                    # Jellyfin下载需要 message.group.telegram_id
+                    joinedload(TelegramMessage.group).load_only(
+                        TelegramGroup.id, TelegramGroup.telegram_id, TelegramGroup.title, TelegramGroup.username
+                    )
+                ).filter(TelegramMessage.id.in_([pk for pk, _, _ in chunk])).all()
+                # 分离对象，会话关闭后仍可读取已加载的列
+                for message in rows:
+                    db.expunge(message)
+
+            by_id = {message.id: message for message in rows}
+            page = []
+            for pk, _, match in chunk:
+                message = by_id.get(pk)
+                if message is None:
+                    # 筛选后被删除的消息
+                    continue
+                message.matched_rule_id = match.rule_id
+                message.matched_rule_name = match.rule_name
+                message.matched_keyword = match.keyword
+                page.append(message)
+            return page
+
+        after = None
+        while True:
+            chunk, after, evaluated = await asyncio.to_thread(match_page, after)
+            scanned += evaluated
+            if chunk:
+                if newest_date is None:
+                    newest_date = chunk[0][1]
+                for message in await asyncio.to_thread(read_page, chunk):
+                    yielded += 1
+                    yield message
+            if after is None:
+                break
+
+        logger.debug(f"任务{task_id}: 流式筛选结束，评估 {scanned} 条，共产出 {yielded} 条消息")
+
+        # 增量任务在全部消息产出后更新最后处理时间
+        if newest_date is not None and base_query_params['last_processed_time'] is not None:
+            await self._update_task_processed_time(task_data['task_id'], newest_date)
+
+    async def _update_task_processed_time(self, task_id: int, latest_message_time: datetime):
         """单独的会话更新任务处理时间"""
         try:
-            latest_message_time = max(msg.date for msg in messages if msg.date)
-            with optimized_db_session(max_retries=10) as update_db:
-                task_update = update_db.query(DownloadTask).filter(DownloadTask.id == task_id).first()
-                if task_update:
-                    task_update.last_processed_time = latest_message_time
-                    update_db.commit()
-                    logger.debug(f"更新任务 {task_id} 处理时间: {latest_message_time}")
+            if await db_writer.execute(UpdateTaskState(task_id, {"last_processed_time": latest_message_time})):
+                logger.debug(f"更新任务 {task_id} 处理时间: {latest_message_time}")
         except Exception as e:
             logger.warning(f"更新任务处理时间失败: {e}")  # 不抛出异常，因为这不是关键操作
     
     def _apply_rule_filters(self, query, rule: FilterRule):
         """应用规则筛选条件"""
         # 关键词筛选
-        if rule.keywords:
-            keyword_conditions = []
-            for keyword in rule.keywords:
-                text_condition = and_(
-                    TelegramMessage.text.isnot(None),
-                    TelegramMessage.text.contains(keyword)
-                )
-                sender_condition = and_(
-                    TelegramMessage.sender_name.isnot(None),
-                    TelegramMessage.sender_name.contains(keyword)
-                )
-                filename_condition = and_(
-                    TelegramMessage.media_filename.isnot(None),
-                    TelegramMessage.media_filename.contains(keyword)
-                )
-                keyword_conditions.append(or_(text_condition, sender_condition, filename_condition))
-            if keyword_conditions:
-                query = query.filter(or_(*keyword_conditions))
+        keyword_condition = keyword_match_condition(rule.keywords)
+        if keyword_condition is not None:
+            query = query.filter(keyword_condition)
         
         # 排除关键词
-        if rule.exclude_keywords:
-            for exclude_keyword in rule.exclude_keywords:
-                text_exclude = and_(
-                    TelegramMessage.text.isnot(None),
-                    TelegramMessage.text.contains(exclude_keyword)
-                )
-                sender_exclude = and_(
-                    TelegramMessage.sender_name.isnot(None),
-                    TelegramMessage.sender_name.contains(exclude_keyword)
-                )
-                filename_exclude = and_(
-                    TelegramMessage.media_filename.isnot(None),
-                    TelegramMessage.media_filename.contains(exclude_keyword)
-                )
-                query = query.filter(~or_(text_exclude, sender_exclude, filename_exclude))
+        exclude_condition = keyword_match_condition(rule.exclude_keywords)
+        if exclude_condition is not None:
+            query = query.filter(~exclude_condition)
         
         # 其他筛选条件
         if rule.media_types:
@@ -1330,78 +1302,6 @@ class TaskExecutionService:
         
         return query
 
-    def _apply_rule_filters_from_dict(self, query, rule_data: dict):
-        """应用规则筛选条件（使用字典数据，避免SQLAlchemy会话绑定问题）"""
-        from sqlalchemy import and_, or_
-        from ..models.telegram import TelegramMessage
-        
-        # 关键词筛选
-        keywords = rule_data.get('keywords')
-        if keywords:
-            keyword_conditions = []
-            for keyword in keywords:
-                text_condition = and_(
-                    TelegramMessage.text.isnot(None),
-                    TelegramMessage.text.contains(keyword)
-                )
-                sender_condition = and_(
-                    TelegramMessage.sender_name.isnot(None),
-                    TelegramMessage.sender_name.contains(keyword)
-                )
-                filename_condition = and_(
-                    TelegramMessage.media_filename.isnot(None),
-                    TelegramMessage.media_filename.contains(keyword)
-                )
-                keyword_conditions.append(or_(text_condition, sender_condition, filename_condition))
-            if keyword_conditions:
-                query = query.filter(or_(*keyword_conditions))
-        
-        # 排除关键词
-        exclude_keywords = rule_data.get('exclude_keywords')
-        if exclude_keywords:
-            for exclude_keyword in exclude_keywords:
-                text_exclude = and_(
-                    TelegramMessage.text.isnot(None),
-                    TelegramMessage.text.contains(exclude_keyword)
-                )
-                sender_exclude = and_(
-                    TelegramMessage.sender_name.isnot(None),
-                    TelegramMessage.sender_name.contains(exclude_keyword)
-                )
-                filename_exclude = and_(
-                    TelegramMessage.media_filename.isnot(None),
-                    TelegramMessage.media_filename.contains(exclude_keyword)
-                )
-                query = query.filter(~or_(text_exclude, sender_exclude, filename_exclude))
-        
-        # 其他筛选条件
-        media_types = rule_data.get('media_types')
-        if media_types:
-            query = query.filter(TelegramMessage.media_type.in_(media_types))
-        
-        sender_filter = rule_data.get('sender_filter')
-        if sender_filter:
-            query = query.filter(TelegramMessage.sender_username.in_(sender_filter))
-        
-        # 文件大小过滤
-        min_file_size = rule_data.get('min_file_size')
-        if min_file_size is not None:
-            query = query.filter(TelegramMessage.media_size >= min_file_size)
-        
-        max_file_size = rule_data.get('max_file_size')
-        if max_file_size is not None:
-            query = query.filter(TelegramMessage.media_size <= max_file_size)
-        
-        include_forwarded = rule_data.get('include_forwarded', True)
-        if not include_forwarded:
-            query = query.filter(TelegramMessage.is_forwarded == False)
-        
-        # 只选择有媒体的消息
-        query = query.filter(TelegramMessage.media_type != 'text')
-        query = query.filter(TelegramMessage.media_type.isnot(None))
-        
-        return query
-    
     def _get_matched_keyword(self, message: 'TelegramMessage', rule_data: dict) -> str:
         """
         检测消息匹配了哪个关键字，用于文件命名
@@ -1463,42 +1363,13 @@ class TaskExecutionService:
             logger.info("使用规则的完整数据集进行筛选")
         
         # 应用规则筛选
-        if rule.keywords:
-            keyword_conditions = []
-            for keyword in rule.keywords:
-                # 处理text字段可能为空的情况，同时搜索消息文本、发送者名称和媒体文件名
-                text_condition = and_(
-                    TelegramMessage.text.isnot(None),
-                    TelegramMessage.text.contains(keyword)
-                )
-                sender_condition = and_(
-                    TelegramMessage.sender_name.isnot(None),
-                    TelegramMessage.sender_name.contains(keyword)
-                )
-                filename_condition = and_(
-                    TelegramMessage.media_filename.isnot(None),
-                    TelegramMessage.media_filename.contains(keyword)
-                )
-                keyword_conditions.append(or_(text_condition, sender_condition, filename_condition))
-            if keyword_conditions:
-                query = query.filter(or_(*keyword_conditions))
-        
-        if rule.exclude_keywords:
-            for exclude_keyword in rule.exclude_keywords:
-                # 处理text字段可能为空的情况，排除包含关键词的消息文本、发送者名称和媒体文件名
-                text_exclude = and_(
-                    TelegramMessage.text.isnot(None),
-                    TelegramMessage.text.contains(exclude_keyword)
-                )
-                sender_exclude = and_(
-                    TelegramMessage.sender_name.isnot(None),
-                    TelegramMessage.sender_name.contains(exclude_keyword)
-                )
-                filename_exclude = and_(
-                    TelegramMessage.media_filename.isnot(None),
-                    TelegramMessage.media_filename.contains(exclude_keyword)
-                )
-                query = query.filter(~or_(text_exclude, sender_exclude, filename_exclude))
+        keyword_condition = keyword_match_condition(rule.keywords)
+        if keyword_condition is not None:
+            query = query.filter(keyword_condition)
+        
+        exclude_condition = keyword_match_condition(rule.exclude_keywords)
+        if exclude_condition is not None:
+            query = query.filter(~exclude_condition)
         
         if rule.media_types:
             query = query.filter(TelegramMessage.media_type.in_(rule.media_types))
@@ -1554,7 +1425,22 @@ class TaskExecutionService:
         return results
     
     async def _download_message_media(self, message: TelegramMessage, task_data: dict, task_id: int) -> bool:
-        """下载单个消息的媒体文件"""
+        """下载单个消息的媒体文件（下载、整理、写记录依次执行）"""
+        success, file_path, needs_organize = await self._fetch_message_media(message, task_data, task_id)
+        if not success or not needs_organize:
+            return success
+
+        organized_path = await self._organize_downloaded_file(file_path, message, task_data, task_id)
+        await self._create_download_record(message, task_data, organized_path or file_path, task_id)
+        return True
+
+    async def _fetch_message_media(self, message: TelegramMessage, task_data: dict, task_id: int) -> tuple:
+        """下载阶段：获取单个消息的媒体文件
+
+        Returns:
+            (是否成功, 本地文件路径, 是否需要后续整理和写记录)
+            Jellyfin格式由Jellyfin服务完成整理，不再进入后续阶段。
+        """
         try:
             # 检查是否使用 Jellyfin 格式
             if task_data.get('use_jellyfin_structure') and self.jellyfin_service:
@@ -1582,23 +1468,24 @@ class TaskExecutionService:
                     
                     if not download_task or not group:
                         logger.error(f"任务{task_id}: 无法获取下载任务或群组信息")
-                        return False
+                        return False, None, False
                     
-                    success, error_msg, file_paths = await self.jellyfin_service.download_media_with_jellyfin_structure(
-                        message=message,
-                        group=group,
-                        task=download_task,
-                        jellyfin_config=jellyfin_config
-                    )
+                    with tracer.span("jellyfin_download"):
+                        success, error_msg, file_paths = await self.jellyfin_service.download_media_with_jellyfin_structure(
+                            message=message,
+                            group=group,
+                            task=download_task,
+                            jellyfin_config=jellyfin_config
+                        )
                 
                 if success:
                     logger.info(f"Jellyfin格式下载成功: {file_paths.get('main_media', 'unknown')}")
                     await self._log_task_event(task_id, "INFO", f"Jellyfin格式下载成功，文件数: {len(file_paths)}")
-                    return True
+                    return True, file_paths.get('main_media'), False
                 else:
                     logger.error(f"Jellyfin格式下载失败: {error_msg}")
                     await self._log_task_event(task_id, "ERROR", f"Jellyfin格式下载失败: {error_msg}")
-                    return False
+                    return False, None, False
             elif task_data.get('use_jellyfin_structure') and not self.jellyfin_service:
                 # Jellyfin服务未可用，回退到传统下载
                 logger.warning("Jellyfin服务不可用，使用传统下载方式")
@@ -1614,21 +1501,13 @@ class TaskExecutionService:
             file_path = os.path.join(download_dir, filename)
             
             # 完整的文件存在性和完整性检查
-            file_check_result = await self._comprehensive_file_check(file_path, message)
+            with tracer.span("file_check"):
+                file_check_result = await self._comprehensive_file_check(file_path, message)
 
             if file_check_result['exists'] and file_check_result['valid']:
                 logger.info(f"文件已存在且完整，跳过下载: {file_path}")
-
-                # 即使文件已存在，也检查是否需要整理
-                organize_success = await self._organize_downloaded_file(file_path, message, task_data, task_id)
-
-                # 创建下载记录（使用整理后的文件路径）
-                final_file_path = file_path
-                if organize_success and hasattr(self, '_last_organized_path'):
-                    final_file_path = self._last_organized_path
-
-                await self._create_download_record(message, task_data, final_file_path, task_id)
-                return True
+                # 即使文件已存在，也交给后续阶段检查是否需要整理
+                return True, file_path, True
 
             elif file_check_result['exists'] and not file_check_result['valid']:
                 logger.warning(f"文件存在但不完整，将重新下载: {file_path}")
@@ -1642,25 +1521,19 @@ class TaskExecutionService:
             # 检查媒体下载器是否可用
             if not self.media_downloader:
                 logger.error(f"媒体下载器不可用，无法下载文件: {filename}")
-                return False
+                return False, None, False
             
-            # 定义进度回调函数（兼容不同的进度回调签名）
-            async def progress_callback(current: int, total: int, progress_percent: float = None):
-                # 如果没有提供进度百分比，自己计算
-                if progress_percent is None and total > 0:
-                    progress_percent = (current / total) * 100
-                elif progress_percent is None:
-                    progress_percent = 0
-                    
-                await self._log_download_progress(task_id, message.id, current, total, progress_percent)
+            # 进度回调只更新进度服务中的最新值，推送和落库由进度服务按频率合并完成
+            def progress_callback(current: int, total: int, progress_percent: float = None):
+                progress_service.report(task_id, message.id, current, total)
             
             # 实时从数据库获取最新的群组ID，避免使用缓存的过期数据
             from ..models.telegram import TelegramGroup as TGGroup  # 使用别名避免作用域问题
-            with optimized_db_session() as db:
+            with tracer.span("group_lookup"), optimized_db_session() as db:
                 current_group = db.query(TGGroup).filter(TGGroup.id == task_data['group_id']).first()
                 if not current_group:
                     logger.error(f"任务{task_id}: 无法找到群组ID {task_data['group_id']}")
-                    return False, None
+                    return False, None, False
                 current_group_telegram_id = current_group.telegram_id
             
             # 调试日志：确认传递的ID
@@ -1676,34 +1549,26 @@ class TaskExecutionService:
                 message_id=message.message_id,
                 progress_callback=progress_callback
             )
+            progress_service.complete(task_id, message.id, success=bool(success))
             
             if success:
                 logger.info(f"成功下载文件: {filename}")
-                
-                # 文件下载成功后进行整理
-                organize_success = await self._organize_downloaded_file(file_path, message, task_data, task_id)
-                
-                # 创建下载记录（使用整理后的文件路径）
-                final_file_path = file_path  # 如果整理失败，使用原始路径
-                if organize_success and hasattr(self, '_last_organized_path'):
-                    final_file_path = self._last_organized_path
-                
-                await self._create_download_record(message, task_data, final_file_path, task_id)
-                return True
+                return True, file_path, True
             else:
                 logger.warning(f"下载文件失败: {filename}")
-                return False
+                return False, None, False
             
         except Exception as e:
+            progress_service.complete(task_id, message.id, success=False)
             logger.error(f"下载消息 {message.id} 的媒体文件失败: {e}")
             await self._log_task_event(task_id, "ERROR", f"下载文件失败: {str(e)}")
-            return False
+            return False, None, False
 
     async def _organize_downloaded_file(self, 
                                        file_path: str, 
                                        message: 'TelegramMessage', 
                                        task_data: dict, 
-                                       task_id: int) -> bool:
+                                       task_id: int) -> Optional[str]:
         """
         整理已下载的文件
         
@@ -1714,7 +1579,7 @@ class TaskExecutionService:
             task_id: 任务ID
         
         Returns:
-            整理是否成功
+            整理后的文件路径，整理失败返回None
         """
         try:
             logger.info(f"任务{task_id}: 开始整理文件 {file_path}")
@@ -1741,17 +1606,15 @@ class TaskExecutionService:
                     logger.warning(f"任务{task_id}: 获取群组信息失败，使用默认名称: {e}")
                     task_data['group_name'] = 'Unknown_Group'
             
-            # 使用文件组织服务整理文件
-            success, organized_path, error_msg = self.file_organizer.organize_downloaded_file(
+            # 使用文件组织服务整理文件（哈希、移动和生成元数据都是阻塞IO，放到工作线程执行）
+            success, organized_path, error_msg = await asyncio.to_thread(
+                self.file_organizer.organize_downloaded_file,
                 source_path=file_path,
                 message=message,
                 task_data=task_data
             )
             
             if success:
-                # 记录整理后的路径，供后续创建下载记录使用
-                self._last_organized_path = organized_path
-                
                 if organized_path != file_path:
                     logger.info(f"任务{task_id}: 文件已整理到 {organized_path}")
                     await self._log_task_event(task_id, "INFO", f"文件已整理: {os.path.basename(organized_path)}")
@@ -1764,17 +1627,17 @@ class TaskExecutionService:
                 else:
                     self._organization_stats = {'organized_files': 1}
                 
-                return True
+                return organized_path
             else:
                 logger.error(f"任务{task_id}: 文件整理失败 - {error_msg}")
                 await self._log_task_event(task_id, "ERROR", f"文件整理失败: {error_msg}")
-                return False
+                return None
                 
         except Exception as e:
             error_msg = f"整理文件时发生异常: {str(e)}"
             logger.error(f"任务{task_id}: {error_msg}")
             await self._log_task_event(task_id, "ERROR", error_msg)
-            return False
+            return None
 
     async def _create_download_record(self, 
                                      message: 'TelegramMessage', 
@@ -1793,53 +1656,61 @@ class TaskExecutionService:
         Returns:
             创建是否成功
         """
+        return await self._create_download_records([(message, file_path)], task_data, task_id) == 1
+
+    async def _create_download_records(self,
+                                      entries: List[tuple],
+                                      task_data: dict,
+                                      task_id: int) -> int:
+        """
+        批量创建或更新下载记录（经单写线程合并提交）
+        
+        Args:
+            entries: (消息对象, 文件路径) 列表
+            task_data: 任务数据
+            task_id: 任务ID
+        
+        Returns:
+            成功写入的记录数
+        """
+        if not entries:
+            return 0
+
         try:
-            from ..models.rule import DownloadRecord
-            from datetime import datetime, timezone
-            
-            # 使用短时间数据库会话创建记录
-            async with task_db_manager.get_task_session(task_id, "create_record") as db:
-                # 检查记录是否已存在（避免重复创建）
-                existing_record = db.query(DownloadRecord).filter(
-                    DownloadRecord.task_id == task_data['task_id'],
-                    DownloadRecord.message_id == message.message_id
-                ).first()
-                
-                if existing_record:
-                    # 更新现有记录的路径
-                    existing_record.local_file_path = file_path
-                    logger.debug(f"任务{task_id}: 更新现有下载记录 {existing_record.id}")
-                else:
-                    # 创建新的下载记录
-                    file_stat = os.stat(file_path) if os.path.exists(file_path) else None
-                    
-                    record = DownloadRecord(
-                        task_id=task_data['task_id'],
-                        file_name=os.path.basename(file_path),
-                        local_file_path=file_path,
-                        file_size=file_stat.st_size if file_stat else None,
-                        file_type=message.media_type,
-                        message_id=message.message_id,
-                        sender_id=getattr(message, 'sender_id', None),
-                        sender_name=getattr(message, 'sender_name', None),
-                        message_date=getattr(message, 'date', None),
-                        message_text=getattr(message, 'text', None),
-                        download_status="completed",
-                        download_progress=100,
-                        download_started_at=datetime.now(timezone.utc),
-                        download_completed_at=datetime.now(timezone.utc)
-                    )
-                    
-                    db.add(record)
-                    logger.debug(f"任务{task_id}: 创建新下载记录 {message.message_id}")
-                
-                db.commit()
-                return True
+            # 文件状态在提交写命令前获取，避免写线程做磁盘IO
+            file_sizes = {}
+            for message, file_path in entries:
+                file_sizes[file_path] = os.path.getsize(file_path) if os.path.exists(file_path) else None
+
+            now = datetime.now(timezone.utc)
+            rows = [
+                {
+                    "task_id": task_data['task_id'],
+                    "file_name": os.path.basename(file_path),
+                    "local_file_path": file_path,
+                    "file_size": file_sizes.get(file_path),
+                    "file_type": message.media_type,
+                    "message_id": message.message_id,
+                    "sender_id": getattr(message, 'sender_id', None),
+                    "sender_name": getattr(message, 'sender_name', None),
+                    "message_date": getattr(message, 'date', None),
+                    "message_text": getattr(message, 'text', None),
+                    "download_status": "completed",
+                    "download_progress": 100,
+                    "download_started_at": now,
+                    "download_completed_at": now,
+                }
+                for message, file_path in entries
+            ]
+            # 已存在的记录只更新路径，新记录批量插入，一次提交
+            written = await db_writer.execute(UpsertDownloadRecords(task_data['task_id'], rows))
+            logger.debug(f"任务{task_id}: 批量写入下载记录 {written} 条")
+            return written
                 
         except Exception as e:
             logger.error(f"任务{task_id}: 创建下载记录失败 - {str(e)}")
             await self._log_task_event(task_id, "WARNING", f"创建下载记录失败: {str(e)}")
-            return False
+            return 0
     
     def _get_file_extension(self, media_type: str) -> str:
         """根据媒体类型获取文件扩展名"""
@@ -1972,18 +1843,10 @@ class TaskExecutionService:
         self.last_log_flush = time.time()  # 更新刷新时间
         
         try:
-            with optimized_db_session(max_retries=10) as db:
-                for log in logs_to_write:
-                    # 只保存重要日志到数据库
-                    if log["level"] in ["ERROR", "WARNING", "INFO"]:
-                        db_log = TaskLog(
-                            task_id=log["task_id"],
-                            level=log["level"],
-                            message=log["message"],
-                            details=log["details"],
-                            created_at=log["created_at"]
-                        )
-                        db.add(db_log)
+            # 只保存重要日志到数据库
+            await db_writer.execute(InsertTaskLogs([
+                log for log in logs_to_write if log["level"] in ["ERROR", "WARNING", "INFO"]
+            ]))
         except Exception as e:
             logger.error(f"批量写入日志失败: {e}")
             # 失败时将未写入的重要日志重新加入队列
@@ -1991,36 +1854,6 @@ class TaskExecutionService:
                 if log["level"] in ["ERROR", "WARNING", "INFO"]:
                     self.pending_logs.append(log)
     
-    async def _log_download_progress(self, task_id: int, message_id: int, current: int, total: int, progress_percent: float = None):
-        """记录下载进度（优化：减少数据库写入频率）"""
-        if total > 0:
-            # 使用提供的进度百分比，或者自己计算
-            if progress_percent is not None:
-                progress = int(progress_percent)
-            else:
-                progress = int(current / total * 100)
-            
-            # 只在特定进度节点记录日志，避免频繁数据库写入导致锁定
-            # 记录：0%, 25%, 50%, 75%, 100% 和每10%的整数进度
-            if progress == 0 or progress == 100 or progress % 25 == 0 or progress % 10 == 0:
-                await self._log_task_event(
-                    task_id, 
-                    "DEBUG", 
-                    f"消息 {message_id} 下载进度: {progress}%",
-                    {"message_id": message_id, "current": current, "total": total, "progress_percent": progress_percent}
-                )
-    
-    async def _send_progress_update(self, task_id: int, progress: int, downloaded: int, total: int):
-        """发送进度更新"""
-        await websocket_manager.broadcast({
-            "type": "task_progress",
-            "task_id": task_id,
-            "progress": progress,
-            "downloaded": downloaded,
-            "total": total,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        })
-    
     async def _send_task_status_update(self, task_id: int, status: str, message: str):
         """发送任务状态更新"""
         await websocket_manager.broadcast({
@@ -2039,6 +1872,17 @@ class TaskExecutionService:
         """检查任务是否正在运行"""
         return task_id in self.running_tasks
 
+    def get_pipeline_stats(self, task_id: Optional[int] = None) -> Union[Dict[str, Any], List[Dict[str, Any]], None]:
+        """获取下载流水线各阶段统计
+
+        Args:
+            task_id: 指定任务ID时返回该任务的统计，否则返回所有运行中任务的统计
+        """
+        if task_id is not None:
+            pipeline = self._pipelines.get(task_id)
+            return pipeline.get_stats() if pipeline else None
+        return [pipeline.get_stats() for pipeline in self._pipelines.values()]
+
     async def shutdown(self, timeout: float = None):
         """优雅关闭服务"""
         shutdown_timeout = timeout or self.config.graceful_shutdown_timeout
@@ -2130,6 +1974,12 @@ class TaskExecutionService:
             "circuit_breaker_open": self._circuit_breaker_open,
             "running_tasks": len(self.running_tasks),
             "max_concurrent_tasks": self.config.max_concurrent_tasks,
+            "download_concurrency": {
+                "per_task": self.config.download_concurrency_per_task,
+                "global": self.config.global_download_concurrency,
+                "organize_workers": self.config.organize_workers
+            },
+            "pipelines": self.get_pipeline_stats(),
             "failure_count": self._failure_count,
             "uptime_seconds": time.time() - self._startup_time,
             "metrics": {
@@ -2195,10 +2045,6 @@ class TaskExecutionService:
             if hasattr(self, '_organization_stats'):
                 delattr(self, '_organization_stats')
 
-            # 清理进度更新缓存
-            if hasattr(self, '_last_progress_update'):
-                self._last_progress_update.clear()
-
             high_perf_logger.debug("内存清理完成")
 
         except Exception as e:
@@ -2366,27 +2212,6 @@ class TaskExecutionService:
             logger.error(f"数据库连接重新初始化失败: {e}")
             raise
 
-    async def _calculate_optimal_batch_size(self, db, group_id: int) -> int:
-        """计算最优批处理大小"""
-        try:
-            # 获取群组消息数量估算
-            from sqlalchemy import func
-            message_count = db.query(func.count(TelegramMessage.id)).filter_by(group_id=group_id).scalar()
-
-            # 根据消息数量动态调整批处理大小
-            if message_count < 1000:
-                return 100  # 小群组使用较小批处理
-            elif message_count < 10000:
-                return 500  # 中等群组
-            elif message_count < 100000:
-                return 1000  # 大群组
-            else:
-                return 2000  # 超大群组
-
-        except Exception as e:
-            logger.warning(f"计算最优批处理大小失败: {e}，使用默认值")
-            return 1000
-
     async def _comprehensive_file_check(self, file_path: str, message) -> dict:
         """完整的文件存在性和完整性检查"""
         result = {
@@ -2467,4 +2292,5 @@ class TaskExecutionService:
             logger.error(f"备份损坏文件失败 {file_path}: {e}")
 
 # 创建全局加固的任务执行服务实例
-task_execution_service = TaskExecutionService()
\ No newline at end of file
+task_execution_service = TaskExecutionService()
+download_job_queue.register_handler(JOB_KIND_TASK, task_execution_service.run_task_job)
\ No newline at end of file
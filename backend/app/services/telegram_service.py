@@ -21,8 +21,8 @@ Author: TgGod Team
 Version: 1.0.0
 """
 
-from telethon import TelegramClient, errors
-from telethon.errors import FloodWaitError, AuthKeyUnregisteredError
+from telethon import TelegramClient, errors, utils as telethon_utils
+from telethon.errors import AuthKeyUnregisteredError
 from telethon.tl.types import (
     Channel,
     Chat,
@@ -35,6 +35,9 @@ from telethon.tl.functions.channels import GetFullChannelRequest
 from telethon.tl.functions.messages import GetHistoryRequest
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 import asyncio
 import logging
 import time
@@ -47,7 +50,9 @@ from ..models.telegram import TelegramGroup, TelegramMessage
 from ..database import get_db
 from ..utils.db_optimization import optimized_db_session
 from ..core.memory_manager import memory_manager
+from ..core.rate_governor import RPC_ENTITY, RPC_GET_FILE, RPC_HISTORY, rate_governor
 from ..core.telegram_cache import telegram_cache
+from .message_ingest import MessageIngestResult, bulk_upsert_messages
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +68,152 @@ class TelegramConfig:
         self.retry_attempts = 3
 
 
+class SyncEntityCache:
+    """单次同步内的实体解析缓存(有界LRU)
+
+    批量处理历史消息时，同一转发来源/频道会反复出现。缓存解析结果(包括失败结果)，
+    避免每条消息都触发 get_entity / GetFullChannelRequest。
+    """
+
+    _MISSING = object()
+
+    def __init__(self, max_size: int = 2000):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Any, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self._entries.get(key, self._MISSING)
+        if value is self._MISSING:
+            self.misses += 1
+            return self._MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+_sync_entity_cache: ContextVar[Optional[SyncEntityCache]] = ContextVar("sync_entity_cache", default=None)
+
+
+def _peer_key(peer) -> Any:
+    """把 Peer/实体对象转换为可哈希的缓存键"""
+    if isinstance(peer, int):
+        return peer
+    try:
+        return telethon_utils.get_peer_id(peer)
+    except Exception:
+        return repr(peer)
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Telegram消息时间为UTC aware，朴素时间按UTC处理"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class HistoryCursor:
+    """消息历史的连续游标(从新到旧)
+
+    通过 offset_date 直接定位到时间窗口末尾，只在窗口内向前翻页；
+    多个时间窗口按从新到旧的顺序依次读取时共用同一个游标，每条消息只拉取一次。
+    窗口之间存在空档时重新按 offset_date 定位，跳过空档内的历史。
+    翻页频率由 RPC 限速器的 history 类别统一控制。
+    """
+
+    def __init__(self, client, entity, batch_size: int = 100):
+        self.client = client
+        self.entity = entity
+        self.batch_size = batch_size
+        self.requests = 0
+        self.fetched = 0
+        self._buffer: deque = deque()
+        self._offset_id = 0
+        self._offset_date: Optional[datetime] = None
+        self._oldest_date: Optional[datetime] = None
+        self._exhausted = False
+
+    def seek(self, end_date: datetime):
+        """定位到 end_date 之前(不含)的最新消息"""
+        end_date = _as_utc(end_date)
+        while self._buffer and self._buffer[0].date >= end_date:
+            self._buffer.popleft()
+        if self._buffer:
+            return
+        # 缓冲区已空：尚未开始读取，或者当前位置比目标窗口更新，直接跳到窗口末尾
+        if self._oldest_date is None or self._oldest_date >= end_date:
+            self._offset_id = 0
+            self._offset_date = end_date
+            self._exhausted = False
+
+    async def _fetch(self):
+        history = await rate_governor.call(
+            RPC_HISTORY,
+            self.client,
+            GetHistoryRequest(
+                peer=self.entity,
+                limit=self.batch_size,
+                offset_id=self._offset_id,
+                offset_date=self._offset_date,
+                add_offset=0,
+                max_id=0,
+                min_id=0,
+                hash=0,
+            )
+        )
+        self.requests += 1
+        batch = [msg for msg in history.messages if getattr(msg, "date", None)]
+        if not history.messages:
+            self._exhausted = True
+            return
+
+        self.fetched += len(batch)
+        self._buffer.extend(batch)
+        last = history.messages[-1]
+        self._offset_id = last.id
+        self._offset_date = None
+        if batch:
+            self._oldest_date = batch[-1].date
+        if len(history.messages) < self.batch_size:
+            self._exhausted = True
+
+    async def read_window(self, start_date: datetime, limit: Optional[int] = None):
+        """按从新到旧的顺序产出 [start_date, seek时的end_date) 内的原始消息"""
+        start_date = _as_utc(start_date)
+        produced = 0
+        while limit is None or produced < limit:
+            if not self._buffer:
+                if self._exhausted:
+                    return
+                await self._fetch()
+                continue
+
+            msg = self._buffer[0]
+            if msg.date < start_date:
+                # 留在缓冲区，供下一个(更早的)时间窗口使用
+                return
+            self._buffer.popleft()
+            produced += 1
+            yield msg
+
+
 class TelegramHealthMetrics:
     """Telegram健康监控指标类"""
 
@@ -114,6 +265,10 @@ class TelegramService:
         self._auto_reconnect_task = None
         self._session_refresh_task = None
 
+        # 当前登录用户缓存(认证后获取一次，登出/重连时清除)
+        self._self_user = None
+        self._self_user_lock: Optional[asyncio.Lock] = None
+
         # 限率管理
         self._rate_limiter = {}
         self._last_api_call = 0
@@ -190,12 +345,14 @@ class TelegramService:
 
     async def disconnect(self):
         """断开Telegram客户端"""
+        self.invalidate_self_user()
         if self.client:
             await self.client.disconnect()
             self.client = None
             logger.info("Telegram客户端已断开")
 
     async def reconnect(self):
+        self.invalidate_self_user()
         if self.client:
             try:
                 await self.client.disconnect()
@@ -204,6 +361,52 @@ class TelegramService:
         self.client = None
         await self.initialize()
 
+    async def get_self_user(self, refresh: bool = False):
+        """获取当前登录用户(带缓存)
+
+        Args:
+            refresh: 忽略缓存重新获取
+
+        Returns:
+            当前用户对象，未登录时返回None
+        """
+        if self._self_user is not None and not refresh:
+            return self._self_user
+
+        if self._self_user_lock is None:
+            self._self_user_lock = asyncio.Lock()
+
+        async with self._self_user_lock:
+            if self._self_user is not None and not refresh:
+                return self._self_user
+            if not self.client:
+                return None
+            self._self_user = await self.client.get_me()
+            if self._self_user is not None:
+                logger.debug(f"已缓存当前用户: {self._self_user.id}")
+            return self._self_user
+
+    def invalidate_self_user(self):
+        """清除当前用户缓存(登出、重连、重新登录时调用)"""
+        self._self_user = None
+
+    @contextmanager
+    def entity_cache_scope(self, max_size: int = 2000):
+        """为一次同步建立实体解析缓存；嵌套调用复用外层缓存"""
+        current = _sync_entity_cache.get()
+        if current is not None:
+            yield current
+            return
+
+        cache = SyncEntityCache(max_size=max_size)
+        token = _sync_entity_cache.set(cache)
+        try:
+            yield cache
+        finally:
+            _sync_entity_cache.reset(token)
+            if cache.hits or cache.misses:
+                logger.debug(f"同步实体缓存统计: {cache.get_stats()}")
+
     def is_connected(self) -> bool:
         """检查Telegram客户端是否已连接"""
         try:
@@ -241,25 +444,9 @@ class TelegramService:
             logger.error(f"检查用户授权状态失败: {e}")
             return False
 
-    async def _handle_flood_wait(self, func, *args, **kwargs):
-        """处理Flood Wait错误的重试机制"""
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                return await func(*args, **kwargs)
-            except FloodWaitError as e:
-                if attempt < max_retries - 1:
-                    wait_time = min(e.seconds, 300)  # 最多等待5分钟
-                    logger.warning(
-                        f"遇到Flood Wait，等待{wait_time}秒后重试 (尝试 {attempt + 1}/{max_retries})"
-                    )
-                    await asyncio.sleep(wait_time)
-                else:
-                    logger.error(f"达到最大重试次数，Flood Wait错误: {e}")
-                    raise
-            except Exception as e:
-                logger.error(f"执行函数时出错: {e}")
-                raise
+    async def _handle_api_call_with_protection(self, func, *args, rpc: str = RPC_ENTITY, **kwargs):
+        """经 RPC 限速器执行 API 调用，FloodWait 由限速器统一等待和重试"""
+        return await rate_governor.call(rpc, func, *args, **kwargs)
 
     async def get_group_info(self, group_identifier) -> Optional[Dict[str, Any]]:
         """获取群组信息 - 支持用户名、ID或实体对象（带完整保护）"""
@@ -379,7 +566,7 @@ class TelegramService:
                 else:
                     # 尝试通过用户名或ID获取实体
                     logger.info(f"尝试获取实体: {group_identifier}")
-                    entity = await self.client.get_entity(group_identifier)
+                    entity = await rate_governor.call(RPC_ENTITY, self.client.get_entity, group_identifier)
                     logger.info(f"成功获取实体: {getattr(entity, 'title', 'Unknown')}")
 
             except Exception as e:
@@ -390,13 +577,15 @@ class TelegramService:
             message_count = 0
 
             try:
-                async for message in self.client.iter_messages(
-                    entity, limit=limit, offset_id=offset_id
-                ):
-                    message_data = await self._process_message(message)
-                    if message_data:
-                        messages.append(message_data)
-                        message_count += 1
+                with self.entity_cache_scope():
+                    await rate_governor.acquire(RPC_HISTORY)
+                    async for message in self.client.iter_messages(
+                        entity, limit=limit, offset_id=offset_id
+                    ):
+                        message_data = await self._process_message(message)
+                        if message_data:
+                            messages.append(message_data)
+                            message_count += 1
 
                 logger.info(f"成功获取 {message_count} 条消息")
 
@@ -412,8 +601,9 @@ class TelegramService:
     async def _process_message(self, message: Message) -> Optional[Dict[str, Any]]:
         """处理单条消息"""
         try:
-            # 获取当前用户信息
-            current_user = await self.client.get_me()
+            # 当前用户信息(缓存，不再每条消息请求一次)
+            current_user = await self.get_self_user()
+            current_user_id = current_user.id if current_user else None
 
             # 基本信息
             message_data = {
@@ -442,7 +632,7 @@ class TelegramService:
             if message.sender:
                 if isinstance(message.sender, User):
                     # 检查是否是当前用户发送的消息
-                    is_current_user = message.sender.id == current_user.id
+                    is_current_user = message.sender.id == current_user_id
 
                     message_data.update(
                         {
@@ -598,7 +788,9 @@ class TelegramService:
                         file_path = os.path.join(
                             media_dir, media_info["media_filename"]
                         )
-                        await self.client.download_media(message.media, file_path)
+                        await rate_governor.call(
+                            RPC_GET_FILE, self.client.download_media, message.media, file_path
+                        )
 
                         # 保存相对路径
                         media_info["media_path"] = (
@@ -676,7 +868,9 @@ class TelegramService:
                         os.makedirs(media_dir, exist_ok=True)
 
                         file_path = os.path.join(media_dir, original_filename)
-                        await self.client.download_media(message.media, file_path)
+                        await rate_governor.call(
+                            RPC_GET_FILE, self.client.download_media, message.media, file_path
+                        )
 
                         # 保存相对路径
                         media_info["media_path"] = (
@@ -729,7 +923,9 @@ class TelegramService:
             file_path = os.path.join(download_path, filename)
 
             # 下载文件
-            await self.client.download_media(message.media, file_path)
+            await rate_governor.call(
+                RPC_GET_FILE, self.client.download_media, message.media, file_path
+            )
 
             logger.info(f"媒体文件下载成功: {file_path}")
             return file_path
@@ -741,127 +937,40 @@ class TelegramService:
     async def save_messages_to_db(
         self, group_id: int, messages: List[Dict[str, Any]], db: Session
     ) -> int:
-        """保存消息到数据库，返回保存的消息数量"""
-        try:
-            saved_count = 0
+        """保存消息到数据库，返回新增的消息数量"""
+        result = await self.ingest_messages(group_id, messages, db)
+        return result.inserted if result else 0
 
-            for message_data in messages:
-                # 检查消息是否已存在
-                existing_message = (
-                    db.query(TelegramMessage)
-                    .filter(
-                        TelegramMessage.group_id == group_id,
-                        TelegramMessage.message_id == message_data["message_id"],
-                    )
-                    .first()
-                )
-
-                if existing_message:
-                    continue
-
-                # 清理数据，确保没有 Telethon 对象
-                cleaned_data = self._clean_message_data(message_data)
+    async def ingest_messages(
+        self,
+        group_id: int,
+        messages: List[Dict[str, Any]],
+        db: Session,
+        update_existing: bool = True,
+    ) -> Optional[MessageIngestResult]:
+        """批量入库消息，已存在的消息同步编辑、浏览数和反应等字段
 
-                # 创建消息记录
-                message = TelegramMessage(group_id=group_id, **cleaned_data)
-                db.add(message)
-                saved_count += 1
+        Args:
+            group_id: 数据库中的群组ID
+            messages: 消息字典列表
+            db: 数据库会话，所有分块在同一事务内提交
+            update_existing: 是否更新已存在消息的可变字段
 
+        Returns:
+            MessageIngestResult: 新增/更新/跳过数量，失败时返回None
+        """
+        try:
+            result = bulk_upsert_messages(db, group_id, messages, update_existing=update_existing)
             db.commit()
-            logger.info(f"成功保存 {saved_count} 条消息到数据库")
-            return saved_count
+            logger.info(
+                f"消息入库完成: 新增 {result.inserted} 条, 更新 {result.updated} 条, 跳过 {result.skipped} 条"
+            )
+            return result
 
         except Exception as e:
             logger.error(f"保存消息到数据库失败: {e}")
             db.rollback()
-            return 0
-
-    def _clean_message_data(self, message_data: Dict[str, Any]) -> Dict[str, Any]:
-        """清理消息数据，移除或转换不兼容的对象"""
-        cleaned_data = {}
-
-        # 定义允许的字段和其类型转换规则
-        allowed_fields = {
-            "message_id",
-            "sender_id",
-            "sender_username",
-            "sender_name",
-            "text",
-            "media_type",
-            "media_path",
-            "media_size",
-            "media_filename",
-            "media_file_id",
-            "media_file_unique_id",
-            "media_downloaded",
-            "media_download_url",
-            "media_download_error",
-            "media_thumbnail_path",
-            "view_count",
-            "is_forwarded",
-            "forwarded_from",
-            "forwarded_from_id",
-            "forwarded_from_type",
-            "forwarded_date",
-            "is_own_message",
-            "reply_to_message_id",
-            "edit_date",
-            "is_pinned",
-            "reactions",
-            "mentions",
-            "hashtags",
-            "urls",
-            "media_group_id",
-            "date",
-        }
-
-        for key, value in message_data.items():
-            if key not in allowed_fields:
-                logger.warning(f"跳过未知字段: {key}")
-                continue
-
-            # 跳过 None 值
-            if value is None:
-                cleaned_data[key] = None
-                continue
-
-            # 检查并跳过 Telethon 对象
-            if hasattr(value, "__class__"):
-                type_str = str(type(value))
-                if "telethon" in type_str.lower() or "peer" in type_str.lower():
-                    logger.warning(f"跳过 Telethon 对象字段 {key}: {type(value)}")
-                    continue
-
-            # 转换特殊类型
-            if key in ["reactions", "mentions", "hashtags", "urls"]:
-                if isinstance(value, (list, dict)):
-                    import json
-
-                    try:
-                        cleaned_data[key] = json.dumps(value, ensure_ascii=False)
-                    except (TypeError, ValueError) as e:
-                        logger.warning(f"JSON序列化失败 {key}: {e}")
-                        cleaned_data[key] = str(value)
-                else:
-                    cleaned_data[key] = str(value) if value is not None else None
-            elif key in ["forwarded_date", "edit_date", "date"]:
-                # 确保日期字段是正确的格式
-                if hasattr(value, "isoformat"):
-                    cleaned_data[key] = value
-                elif isinstance(value, str):
-                    cleaned_data[key] = value
-                else:
-                    logger.warning(f"日期字段 {key} 格式异常: {type(value)}")
-                    cleaned_data[key] = None
-            else:
-                # 其他字段直接赋值，但确保不是对象
-                if isinstance(value, (str, int, float, bool)) or value is None:
-                    cleaned_data[key] = value
-                else:
-                    logger.warning(f"字段 {key} 类型异常: {type(value)}, 转换为字符串")
-                    cleaned_data[key] = str(value)
-
-        return cleaned_data
+            return None
 
     async def sync_group_messages(
         self,
@@ -896,9 +1005,9 @@ class TelegramService:
             # 获取群组实体
             try:
                 if group.username:
-                    entity = await self.client.get_entity(group.username)
+                    entity = await rate_governor.call(RPC_ENTITY, self.client.get_entity, group.username)
                 else:
-                    entity = await self.client.get_entity(group.chat_id)
+                    entity = await rate_governor.call(RPC_ENTITY, self.client.get_entity, group.chat_id)
             except Exception as e:
                 logger.error(f"无法获取群组实体 {group_id}: {e}")
                 return {"success": False, "error": f"无法获取群组实体: {str(e)}"}
@@ -979,7 +1088,7 @@ class TelegramService:
                     logger.info(f"使用实体对象: {getattr(entity, 'title', 'Unknown')}")
                 else:
                     logger.info(f"尝试获取实体: {group_identifier}")
-                    entity = await self.client.get_entity(group_identifier)
+                    entity = await rate_governor.call(RPC_ENTITY, self.client.get_entity, group_identifier)
             except Exception as e:
                 logger.error(f"获取群组实体失败: {e}")
                 return {"success": False, "error": f"获取群组实体失败: {e}"}
@@ -1015,118 +1124,119 @@ class TelegramService:
 
             total_months = len(months)
 
-            try:
-                # 按月同步消息
-                for i, month_info in enumerate(months):
-                    try:
-                        year = month_info.get("year")
-                        month = month_info.get("month")
-
-                        if not year or not month:
-                            logger.error(f"月份信息不完整: {month_info}")
-                            sync_result["failed_months"].append(
-                                {"month": month_info, "error": "月份信息不完整"}
-                            )
-                            continue
-
-                        logger.info(f"开始同步 {year}-{month:02d} 的消息...")
+            # 从新到旧处理月份，所有月份共用一个历史游标，每条消息只拉取一次
+            ordered_months = sorted(
+                months,
+                key=lambda m: (m.get("year") or 0, m.get("month") or 0),
+                reverse=True,
+            )
+            cursor = HistoryCursor(self.client, entity, batch_size=100)
 
-                        # 发送进度更新
-                        if group_id:
-                            try:
-                                from ..websocket import websocket_manager
+            try:
+                # 整个同步过程共用一个实体缓存
+                with self.entity_cache_scope():
+                    # 按月同步消息
+                    for i, month_info in enumerate(ordered_months):
+                        try:
+                            year = month_info.get("year")
+                            month = month_info.get("month")
 
-                                # 向所有连接的客户端发送进度更新
-                                connected_clients = (
-                                    websocket_manager.get_connected_clients()
-                                )
-                                logger.info(
-                                    f"向 {len(connected_clients)} 个客户端发送进度更新"
+                            if not year or not month:
+                                logger.error(f"月份信息不完整: {month_info}")
+                                sync_result["failed_months"].append(
+                                    {"month": month_info, "error": "月份信息不完整"}
                                 )
-
-                                progress_message = {
-                                    "type": "monthly_sync_progress",
-                                    "data": {
-                                        "currentMonth": f"{year}-{month:02d}",
-                                        "progress": i,
-                                        "total": total_months,
-                                        "completed": sync_result["months_synced"],
-                                        "failed": len(sync_result["failed_months"]),
-                                    },
-                                    "timestamp": datetime.now().isoformat(),
-                                }
-
-                                for client_id in connected_clients:
-                                    await websocket_manager.send_message(
-                                        client_id, progress_message
+                                continue
+
+                            logger.info(f"开始同步 {year}-{month:02d} 的消息...")
+
+                            # 发送进度更新
+                            if group_id:
+                                try:
+                                    from ..websocket import websocket_manager
+
+                                    progress_message = {
+                                        "type": "monthly_sync_progress",
+                                        "data": {
+                                            "currentMonth": f"{year}-{month:02d}",
+                                            "progress": i,
+                                            "total": total_months,
+                                            "completed": sync_result["months_synced"],
+                                            "failed": len(sync_result["failed_months"]),
+                                        },
+                                        "timestamp": datetime.now().isoformat(),
+                                    }
+
+                                    await websocket_manager.broadcast(
+                                        progress_message, topic=f"group:{group_id}"
                                     )
-                                    logger.info(f"进度消息已发送给客户端 {client_id}")
-
-                            except Exception as ws_e:
-                                logger.warning(f"WebSocket进度推送失败: {ws_e}")
 
-                        # 计算时间范围
-                        start_date = datetime(year, month, 1, tzinfo=timezone.utc)
-                        if month == 12:
-                            end_date = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
-                        else:
-                            end_date = datetime(year, month + 1, 1, tzinfo=timezone.utc)
+                                except Exception as ws_e:
+                                    logger.warning(f"WebSocket进度推送失败: {ws_e}")
 
-                        # 获取该月的消息
-                        month_messages = await self._get_messages_by_time_range(
-                            entity, start_date, end_date
-                        )
+                            # 计算时间范围
+                            start_date = datetime(year, month, 1, tzinfo=timezone.utc)
+                            if month == 12:
+                                end_date = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+                            else:
+                                end_date = datetime(year, month + 1, 1, tzinfo=timezone.utc)
 
-                        # 保存消息到数据库（使用共享的数据库会话）
-                        if group_id is None:
-                            logger.error(f"未找到群组记录: {entity.id}")
-                            sync_result["failed_months"].append(
-                                {"month": month_info, "error": "未找到群组记录"}
+                            # 获取该月的消息
+                            month_messages = await self._get_messages_by_time_range(
+                                entity, start_date, end_date, cursor=cursor
                             )
-                            continue
 
-                        # 使用短连接保存消息
-                        saved_count = 0
-                        try:
-                            with optimized_db_session(
-                                autocommit=True, max_retries=3
-                            ) as db:
-                                saved_count = await self.save_messages_to_db(
-                                    group_id, month_messages, db
+                            # 保存消息到数据库（使用共享的数据库会话）
+                            if group_id is None:
+                                logger.error(f"未找到群组记录: {entity.id}")
+                                sync_result["failed_months"].append(
+                                    {"month": month_info, "error": "未找到群组记录"}
                                 )
-                        except Exception as e:
-                            logger.error(f"保存消息到数据库失败: {e}")
-                            saved_count = 0
+                                continue
 
-                        # 统计结果
-                        month_stat = {
-                            "year": year,
-                            "month": month,
-                            "total_messages": len(month_messages),
-                            "saved_messages": saved_count,
-                            "start_date": start_date.isoformat(),
-                            "end_date": end_date.isoformat(),
-                        }
-
-                        sync_result["monthly_stats"].append(month_stat)
-                        sync_result["total_messages"] += saved_count
-                        sync_result["months_synced"] += 1
-
-                        logger.info(
-                            f"✓ {year}-{month:02d} 同步完成: {saved_count}/{len(month_messages)} 条消息"
-                        )
+                            # 使用短连接保存消息
+                            saved_count = 0
+                            try:
+                                with optimized_db_session(
+                                    autocommit=True, max_retries=3
+                                ) as db:
+                                    saved_count = await self.save_messages_to_db(
+                                        group_id, month_messages, db
+                                    )
+                            except Exception as e:
+                                logger.error(f"保存消息到数据库失败: {e}")
+                                saved_count = 0
+
+                            # 统计结果
+                            month_stat = {
+                                "year": year,
+                                "month": month,
+                                "total_messages": len(month_messages),
+                                "saved_messages": saved_count,
+                                "start_date": start_date.isoformat(),
+                                "end_date": end_date.isoformat(),
+                            }
+
+                            sync_result["monthly_stats"].append(month_stat)
+                            sync_result["total_messages"] += saved_count
+                            sync_result["months_synced"] += 1
+
+                            logger.info(
+                                f"✓ {year}-{month:02d} 同步完成: {saved_count}/{len(month_messages)} 条消息"
+                            )
 
-                    except Exception as e:
-                        logger.error(f"同步 {year}-{month:02d} 失败: {e}")
-                        sync_result["failed_months"].append(
-                            {"month": month_info, "error": str(e)}
-                        )
+                        except Exception as e:
+                            logger.error(f"同步 {year}-{month:02d} 失败: {e}")
+                            sync_result["failed_months"].append(
+                                {"month": month_info, "error": str(e)}
+                            )
 
-                        # 添加延迟以避免API限制
-                        await asyncio.sleep(2)
+                            # 添加延迟以避免API限制
+                            await asyncio.sleep(2)
 
                 logger.info(
-                    f"按月同步完成: 总计 {sync_result['total_messages']} 条消息"
+                    f"按月同步完成: 总计 {sync_result['total_messages']} 条消息, "
+                    f"历史请求 {cursor.requests} 次, 拉取 {cursor.fetched} 条"
                 )
                 return sync_result
 
@@ -1145,78 +1255,48 @@ class TelegramService:
             return {"success": False, "error": str(e)}
 
     async def _get_messages_by_time_range(
-        self, entity, start_date: datetime, end_date: datetime
+        self,
+        entity,
+        start_date: datetime,
+        end_date: datetime,
+        cursor: Optional[HistoryCursor] = None,
+        max_messages: int = 10000,
     ) -> List[Dict[str, Any]]:
-        """根据时间范围获取消息"""
-        try:
-            messages = []
-            offset_id = 0
-            batch_size = 200
-            max_messages = 10000  # 单月最大消息数限制
-
-            while len(messages) < max_messages:
-                try:
-                    # 获取消息历史
-                    history = await self.client(
-                        GetHistoryRequest(
-                            peer=entity,
-                            limit=batch_size,
-                            offset_id=offset_id,
-                            offset_date=None,
-                            add_offset=0,
-                            max_id=0,
-                            min_id=0,
-                            hash=0,
-                        )
-                    )
-
-                    if not history.messages:
-                        break
+        """根据时间范围获取消息
 
-                    batch_messages = []
-                    for msg in history.messages:
-                        # 检查消息时间是否在范围内
-                        if msg.date < start_date:
-                            # 已经超出时间范围，停止获取
-                            return messages
+        通过 offset_date 直接定位到 end_date，只在时间窗口内向前翻页。
 
-                        if msg.date >= end_date:
-                            # 还没到时间范围，继续获取
-                            offset_id = msg.id
-                            continue
-
-                        # 在时间范围内，处理消息
-                        message_data = await self._process_message(msg)
-                        if message_data:
-                            batch_messages.append(message_data)
-
-                    messages.extend(batch_messages)
-
-                    # 如果这批消息少于请求的数量，说明已经到达历史消息的末尾
-                    if len(history.messages) < batch_size:
-                        break
-
-                    # 更新offset_id为最后一条消息的ID
-                    offset_id = history.messages[-1].id
-
-                    # 添加短暂延迟以避免API限制
-                    await asyncio.sleep(0.5)
-
-                except FloodWaitError as e:
-                    logger.warning(f"遇到频率限制，等待 {e.seconds} 秒...")
-                    await asyncio.sleep(e.seconds)
-                except Exception as e:
-                    logger.error(f"获取消息批次失败: {e}")
-                    break
+        Args:
+            entity: 群组实体
+            start_date: 起始时间(含)
+            end_date: 结束时间(不含)
+            cursor: 共享的历史游标，多个时间窗口从新到旧依次读取时传入同一个
+            max_messages: 单个时间窗口的最大消息数
+        """
+        if cursor is None:
+            cursor = HistoryCursor(self.client, entity, batch_size=100)
+        cursor.seek(end_date)
 
-            logger.info(
-                f"获取到 {len(messages)} 条消息 ({start_date.strftime('%Y-%m')})"
-            )
-            return messages
+        messages = []
+        try:
+            # 同一时间段内的转发来源只解析一次
+            # 翻页遇到的 FloodWait 由限速器等待重试
+            with self.entity_cache_scope():
+                async for msg in cursor.read_window(
+                    start_date, limit=max_messages - len(messages)
+                ):
+                    message_data = await self._process_message(msg)
+                    if message_data:
+                        messages.append(message_data)
 
         except Exception as e:
             logger.error(f"根据时间范围获取消息失败: {e}")
-            return []
+
+        logger.info(
+            f"获取到 {len(messages)} 条消息 ({start_date.strftime('%Y-%m')}), "
+            f"累计请求 {cursor.requests} 次"
+        )
+        return messages
 
     async def get_default_sync_months(self, count: int = 3) -> List[Dict[str, Any]]:
         """获取默认的同步月份（最近N个月）"""
@@ -1243,7 +1323,7 @@ class TelegramService:
             await self.initialize()
 
             # 获取群组实体
-            entity = await self.client.get_entity(group_username)
+            entity = await rate_governor.call(RPC_ENTITY, self.client.get_entity, group_username)
 
             # 发送消息
             message = await self.client.send_message(
@@ -1266,7 +1346,7 @@ class TelegramService:
     ) -> List[int]:
         await self.initialize()
 
-        entity = await self.client.get_entity(group_username)
+        entity = await rate_governor.call(RPC_ENTITY, self.client.get_entity, group_username)
         sent_message_ids: List[int] = []
 
         for index, upload_file in enumerate(files):
@@ -1301,7 +1381,7 @@ class TelegramService:
                 return False
 
             # 获取群组实体
-            entity = await self.client.get_entity(group_identifier)
+            entity = await rate_governor.call(RPC_ENTITY, self.client.get_entity, group_identifier)
 
             # 删除消息
             await self.client.delete_messages(entity, message_id)
@@ -1321,7 +1401,7 @@ class TelegramService:
             await self.initialize()
 
             # 获取群组实体
-            entity = await self.client.get_entity(group_username)
+            entity = await rate_governor.call(RPC_ENTITY, self.client.get_entity, group_username)
 
             # 编辑消息
             await self.client.edit_message(entity, message_id, new_text)
@@ -1339,7 +1419,7 @@ class TelegramService:
             await self.initialize()
 
             # 获取群组实体
-            entity = await self.client.get_entity(group_username)
+            entity = await rate_governor.call(RPC_ENTITY, self.client.get_entity, group_username)
 
             # 置顶消息
             await self.client.pin_message(entity, message_id)
@@ -1357,7 +1437,7 @@ class TelegramService:
             await self.initialize()
 
             # 获取群组实体
-            entity = await self.client.get_entity(group_username)
+            entity = await rate_governor.call(RPC_ENTITY, self.client.get_entity, group_username)
 
             # 取消置顶消息
             await self.client.unpin_message(entity, message_id)
@@ -1391,6 +1471,18 @@ class TelegramService:
                 result["forwarded_from_id"] = forward_info.from_id
                 result["forwarded_from_type"] = "user"
 
+                # 同一次同步内先查实体缓存，避免重复解析同一转发来源
+                entity_cache = _sync_entity_cache.get()
+                cache_key = ("forward_user", _peer_key(forward_info.from_id))
+                cached_name = (
+                    entity_cache.get(cache_key)
+                    if entity_cache is not None
+                    else SyncEntityCache._MISSING
+                )
+                if cached_name is not SyncEntityCache._MISSING:
+                    result["forwarded_from"] = cached_name
+                    return result
+
                 # 使用缓存安全获取用户信息
                 user_info = await telegram_cache.get_user_safe(
                     self.client, forward_info.from_id
@@ -1404,7 +1496,7 @@ class TelegramService:
                 else:
                     # 尝试直接从Telegram获取用户信息
                     try:
-                        user = await self.client.get_entity(forward_info.from_id)
+                        user = await rate_governor.call(RPC_ENTITY, self.client.get_entity, forward_info.from_id)
                         if isinstance(user, User):
                             result["forwarded_from"] = (
                                 f"{user.first_name or ''} {user.last_name or ''}".strip()
@@ -1417,6 +1509,9 @@ class TelegramService:
                         )
                         result["forwarded_from"] = f"用户{forward_info.from_id}"
 
+                if entity_cache is not None:
+                    entity_cache.put(cache_key, result["forwarded_from"])
+
             elif forward_info.chat:
                 # 从群组/频道转发
                 chat = forward_info.chat
@@ -1562,6 +1657,25 @@ class TelegramService:
             logger.warning(f"预加载群组数据失败: {e}")
 
     async def _check_forward_permissions(self, forward_info):
+        """检查转发权限(同一次同步内按来源缓存结果)"""
+        if not forward_info:
+            return False
+
+        entity_cache = _sync_entity_cache.get()
+        if entity_cache is None:
+            return await self._resolve_forward_permissions(forward_info)
+
+        source = forward_info.chat if forward_info.chat else forward_info.from_id
+        cache_key = ("forward_permission", _peer_key(source))
+        cached = entity_cache.get(cache_key)
+        if cached is not SyncEntityCache._MISSING:
+            return cached
+
+        allowed = await self._resolve_forward_permissions(forward_info)
+        entity_cache.put(cache_key, allowed)
+        return allowed
+
+    async def _resolve_forward_permissions(self, forward_info):
         """检查转发权限的完整实现"""
         try:
             # 基础权限检查
@@ -1598,7 +1712,7 @@ class TelegramService:
             elif forward_info.from_id:
                 # 检查用户是否允许被转发
                 try:
-                    user = await self.client.get_entity(forward_info.from_id)
+                    user = await rate_governor.call(RPC_ENTITY, self.client.get_entity, forward_info.from_id)
                     if isinstance(user, User):
                         # 检查用户隐私设置（通过尝试获取用户信息判断）
                         return not (user.deleted or getattr(user, "restricted", False))
@@ -0,0 +1,479 @@
+"""TgGod 缩略图服务
+
+按需（或下载完成时预生成）生成多种预设尺寸的 WebP/JPEG 缩略图:
+
+- PIL 缩放和 ffmpeg 抽帧都在进程池中执行，事件循环中不运行任何图片处理
+- 结果按内容寻址存放在缓存目录中: 本地文件以 (大小 + 首尾各64KB) 的摘要为键，
+  同一文件无论被整理到哪个路径都只生成一次；Telegram 内嵌缩略图以文件ID为键
+- 缓存目录有总大小上限，按最近访问时间(mtime)淘汰，命中时刷新访问时间
+- 媒体尚未下载时使用 Telegram 消息自带的 thumbs，只下载几KB的缩略图而不是整个文件
+- 同一缩略图的并发请求合并为一次生成
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Set, Tuple, Union
+
+from ..config import settings
+from .file_content_index import compute_partial_hash
+
+logger = logging.getLogger(__name__)
+
+# 预设尺寸: 最长边像素
+THUMBNAIL_PRESETS = {
+    "small": 160,
+    "medium": 320,
+    "large": 640,
+}
+DEFAULT_PRESET = "medium"
+
+# 格式: (PIL格式名, MIME类型, 保存参数)
+THUMBNAIL_FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+DEFAULT_FORMAT = "webp"
+
+# 下载完成时预生成的 (尺寸, 格式)
+PREWARM_PRESETS = (("small", "webp"), ("medium", "webp"))
+
+# 可以从本地文件生成缩略图的媒体类型
+RENDERABLE_MEDIA_TYPES = ("photo", "video", "sticker", "video_note")
+VIDEO_MEDIA_TYPES = ("video", "video_note")
+
+# 命中时刷新访问时间的最小间隔，避免每次读取都写元数据
+TOUCH_INTERVAL = 3600
+
+# 淘汰时清理到上限的比例，避免每次写入都触发淘汰
+EVICT_TARGET_RATIO = 0.9
+
+
+# ----------------------------------------------------------------------
+# 进程池中执行的渲染函数（模块级函数，便于序列化）
+# ----------------------------------------------------------------------
+
+def _render_image(source: Union[str, bytes], dest: str, max_side: int, fmt: str) -> int:
+    """把图片缩放到最长边 max_side 并以指定格式原子写入 dest，返回文件大小"""
+    from PIL import Image, ImageOps
+
+    pil_format, _, save_options = THUMBNAIL_FORMATS[fmt]
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+        # JPEG 按目标尺寸降采样解码，大图无需完整解码
+        img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+        if pil_format == "JPEG" and img.mode != "RGB":
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            rgba = img.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            img = background
+        elif pil_format == "WEBP" and img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA")
+
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                img.save(f, format=pil_format, **save_options)
+            os.replace(tmp_path, dest)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return os.path.getsize(dest)
+
+
+def _extract_video_frame(path: str, seek: float) -> Optional[bytes]:
+    """用 ffmpeg 抽取一帧为PNG字节，失败返回None"""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return None
+    for position in (seek, 0):
+        cmd = [
+            ffmpeg, "-v", "error", "-ss", f"{position:.2f}", "-i", path,
+            "-frames:v", "1", "-f", "image2pipe", "-vcodec", "png", "-",
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, timeout=30)
+        except subprocess.TimeoutExpired:
+            continue
+        if result.returncode == 0 and result.stdout:
+            return result.stdout
+        if position == 0:
+            break
+    return None
+
+
+def _render_video(path: str, dest: str, max_side: int, fmt: str, seek: float) -> int:
+    frame = _extract_video_frame(path, seek)
+    if not frame:
+        raise RuntimeError(f"无法从视频抽取帧: {path}")
+    return _render_image(frame, dest, max_side, fmt)
+
+
+# ----------------------------------------------------------------------
+# 服务
+# ----------------------------------------------------------------------
+
+@dataclass
+class ThumbnailStats:
+    """缩略图服务统计"""
+    hits: int = 0
+    misses: int = 0
+    generated: int = 0
+    failed: int = 0
+    telegram_thumbs: int = 0
+    prewarmed: int = 0
+    evictions: int = 0
+    evicted_bytes: int = 0
+    total_render_seconds: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests * 100, 2) if requests else 0.0,
+            "generated": self.generated,
+            "failed": self.failed,
+            "telegram_thumbs": self.telegram_thumbs,
+            "prewarmed": self.prewarmed,
+            "evictions": self.evictions,
+            "evicted_bytes": self.evicted_bytes,
+            "avg_render_ms": round(self.total_render_seconds / self.generated * 1000, 2) if self.generated else 0.0,
+        }
+
+
+class ThumbnailService:
+    """缩略图生成与缓存服务"""
+
+    def __init__(self):
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._digests_lock = threading.Lock()
+        self._background: Set[asyncio.Task] = set()
+        self._cache_bytes: Optional[int] = None
+        self._evicting = False
+        self.stats = ThumbnailStats()
+
+    @property
+    def cache_dir(self) -> str:
+        return settings.thumbnail_cache_dir
+
+    @property
+    def max_cache_bytes(self) -> int:
+        return settings.thumbnail_cache_max_mb * 1024 * 1024
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def negotiate_format(accept: Optional[str], requested: Optional[str] = None) -> str:
+        """请求未指定格式时，浏览器声明支持WebP则用WebP，否则JPEG"""
+        if requested in THUMBNAIL_FORMATS:
+            return requested
+        if accept and "image/webp" in accept:
+            return "webp"
+        return "jpeg"
+
+    @staticmethod
+    def mime_type(fmt: str) -> str:
+        return THUMBNAIL_FORMATS[fmt][1]
+
+    async def get_thumbnail(
+        self,
+        message: Any,
+        preset: str = DEFAULT_PRESET,
+        fmt: str = DEFAULT_FORMAT,
+        chat_id: Optional[int] = None,
+    ) -> Optional[str]:
+        """获取消息媒体的缩略图路径，必要时生成
+
+        依次尝试: 已下载的原文件、下载时保存的缩略图、Telegram 内嵌缩略图。
+
+        Args:
+            message: 含 media_type/media_downloaded/media_path/media_thumbnail_path/
+                media_file_id/media_duration/message_id 字段的消息行
+            preset: 预设尺寸名
+            fmt: webp 或 jpeg
+            chat_id: 群组的 Telegram ID，提供时允许从 Telegram 获取内嵌缩略图
+
+        Returns:
+            缩略图文件路径，无法生成时返回None
+        """
+        if message.media_downloaded and message.media_path and message.media_type in RENDERABLE_MEDIA_TYPES:
+            path = await self.render_file(
+                message.media_path, message.media_type, preset, fmt,
+                duration=getattr(message, "media_duration", None),
+            )
+            if path:
+                return path
+
+        if message.media_thumbnail_path:
+            path = await self.render_file(message.media_thumbnail_path, "photo", preset, fmt)
+            if path:
+                return path
+
+        if chat_id is not None:
+            return await self.render_telegram_thumb(
+                chat_id, message.message_id, getattr(message, "media_file_id", None), preset, fmt
+            )
+        return None
+
+    async def render_file(
+        self,
+        path: str,
+        media_type: str,
+        preset: str = DEFAULT_PRESET,
+        fmt: str = DEFAULT_FORMAT,
+        duration: Optional[float] = None,
+    ) -> Optional[str]:
+        """从本地图片/视频文件生成缩略图，源文件不存在或生成失败返回None"""
+        try:
+            digest = await asyncio.to_thread(self._file_digest, path)
+        except OSError:
+            return None
+
+        dest = self._cache_path(digest, preset, fmt)
+        if self._lookup(dest):
+            return dest
+
+        max_side = THUMBNAIL_PRESETS[preset]
+        if media_type in VIDEO_MEDIA_TYPES:
+            # 与原视频缩略图一致，取1/3时长处的帧
+            seek = duration / 3 if duration else 1.0
+            job = (_render_video, path, dest, max_side, fmt, seek)
+        else:
+            job = (_render_image, path, dest, max_side, fmt)
+        return await self._generate(dest, job)
+
+    async def render_telegram_thumb(
+        self,
+        chat_id: int,
+        message_id: int,
+        file_id: Optional[str],
+        preset: str = DEFAULT_PRESET,
+        fmt: str = DEFAULT_FORMAT,
+    ) -> Optional[str]:
+        """使用 Telegram 消息自带的缩略图生成，无需下载完整媒体"""
+        source_key = f"telegram:{file_id}" if file_id else f"telegram:{chat_id}:{message_id}"
+        digest = hashlib.sha256(source_key.encode()).hexdigest()
+        dest = self._cache_path(digest, preset, fmt)
+        if self._lookup(dest):
+            return dest
+
+        async def fetch_and_render() -> Optional[str]:
+            data = await self._fetch_telegram_thumb(chat_id, message_id)
+            if not data:
+                return None
+            self.stats.telegram_thumbs += 1
+            return await self._run((_render_image, data, dest, THUMBNAIL_PRESETS[preset], fmt), dest)
+
+        return await self._dedupe(dest, fetch_and_render)
+
+    def prewarm(self, path: Optional[str], media_type: Optional[str], duration: Optional[float] = None):
+        """下载完成后在后台预生成常用尺寸，不阻塞调用方"""
+        if not path or media_type not in RENDERABLE_MEDIA_TYPES:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        async def _prewarm():
+            for preset, fmt in PREWARM_PRESETS:
+                if await self.render_file(path, media_type, preset, fmt, duration=duration):
+                    self.stats.prewarmed += 1
+
+        task = loop.create_task(_prewarm())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def shutdown(self):
+        """取消预生成任务并关闭进程池"""
+        for task in list(self._background):
+            task.cancel()
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats.to_dict()
+        stats.update({
+            "cache_dir": self.cache_dir,
+            "cache_bytes": self._cache_bytes,
+            "max_cache_bytes": self.max_cache_bytes,
+            "inflight": len(self._inflight),
+            "workers": settings.thumbnail_workers,
+        })
+        return stats
+
+    # ------------------------------------------------------------------
+    # 缓存
+    # ------------------------------------------------------------------
+
+    def _cache_path(self, digest: str, preset: str, fmt: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}_{preset}.{fmt}")
+
+    def _file_digest(self, path: str) -> str:
+        """文件内容摘要（与文件内容索引相同的局部哈希），按 (路径, 大小, mtime) 缓存"""
+        st = os.stat(path)
+        key = (path, st.st_size, st.st_mtime_ns)
+        with self._digests_lock:
+            digest = self._digests.get(key)
+            if digest is not None:
+                self._digests.move_to_end(key)
+                return digest
+
+        digest = compute_partial_hash(path, st.st_size)
+
+        with self._digests_lock:
+            self._digests[key] = digest
+            if len(self._digests) > 4096:
+                self._digests.popitem(last=False)
+        return digest
+
+    def _lookup(self, dest: str) -> bool:
+        try:
+            mtime = os.stat(dest).st_mtime
+        except OSError:
+            self.stats.misses += 1
+            return False
+        self.stats.hits += 1
+        if time.time() - mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(dest, None)
+            except OSError:
+                pass
+        return True
+
+    def _scan_cache(self):
+        """统计缓存目录，超出上限时按 mtime 从旧到新淘汰"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_cache_bytes:
+            target = self.max_cache_bytes * EVICT_TARGET_RATIO
+            entries.sort()
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.stats.evictions += 1
+                self.stats.evicted_bytes += size
+        return total
+
+    async def _account(self, written: int):
+        if self._cache_bytes is None:
+            self._cache_bytes = 0
+            self._cache_bytes = await asyncio.to_thread(self._scan_cache)
+            return
+        self._cache_bytes += written
+        if self._cache_bytes > self.max_cache_bytes and not self._evicting:
+            self._evicting = True
+            try:
+                self._cache_bytes = await asyncio.to_thread(self._scan_cache)
+                logger.info(f"缩略图缓存淘汰完成，当前 {self._cache_bytes / 1024 / 1024:.1f}MB")
+            finally:
+                self._evicting = False
+
+    # ------------------------------------------------------------------
+    # 生成
+    # ------------------------------------------------------------------
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=settings.thumbnail_workers)
+        return self._pool
+
+    async def _generate(self, dest: str, job: tuple) -> Optional[str]:
+        return await self._dedupe(dest, lambda: self._run(job, dest))
+
+    async def _dedupe(self, dest: str, factory) -> Optional[str]:
+        future = self._inflight.get(dest)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[dest] = future
+        try:
+            result = await factory()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_result(None)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.stats.failed += 1
+            logger.warning(f"生成缩略图失败 {dest}: {e}")
+            return None
+        finally:
+            self._inflight.pop(dest, None)
+
+    async def _run(self, job: tuple, dest: str) -> str:
+        func, *args = job
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        try:
+            written = await loop.run_in_executor(self._get_pool(), func, *args)
+        except BrokenProcessPool:
+            # 工作进程异常退出（如解码畸形图片崩溃），重建进程池
+            self._pool = None
+            raise
+        self.stats.generated += 1
+        self.stats.total_render_seconds += time.monotonic() - started
+        await self._account(written)
+        return dest
+
+    async def _fetch_telegram_thumb(self, chat_id: int, message_id: int) -> Optional[bytes]:
+        from ..core.rate_governor import RPC_ENTITY, RPC_GET_FILE, RPC_HISTORY, rate_governor
+        from .download_client_pool import download_client_pool
+
+        async with download_client_pool.lease(chat_id=chat_id) as client:
+            entity = await rate_governor.call(RPC_ENTITY, client.get_entity, chat_id)
+            message = await rate_governor.call(RPC_HISTORY, client.get_messages, entity, ids=message_id)
+            if not message or not message.media:
+                return None
+            # thumb=-1 取最大的内嵌缩略图（内联的 stripped/cached 尺寸无需网络请求）
+            return await rate_governor.call(RPC_GET_FILE, client.download_media, message, file=bytes, thumb=-1)
+
+
+# 全局缩略图服务实例
+thumbnail_service = ThumbnailService()
+
+
+def get_thumbnail_service() -> ThumbnailService:
+    """获取缩略图服务实例"""
+    return thumbnail_service
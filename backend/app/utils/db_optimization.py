@@ -10,6 +10,7 @@ from contextlib import contextmanager
 from typing import Any, Callable, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import OperationalError
+from ..core.metrics import DB_LOCK_RETRIES
 from ..database import SessionLocal
 
 logger = logging.getLogger(__name__)
@@ -117,6 +118,7 @@ def optimized_db_session(autocommit: bool = True, max_retries: int = 5):
                     session = None
                 
                 if retry_count <= max_retries:
+                    DB_LOCK_RETRIES.labels("optimized_session").inc()
                     # 更合理的重试等待时间，考虑数据库busy_timeout
                     if retry_count <= 2:
                         wait_time = 0.5 * retry_count  # 前两次快速重试
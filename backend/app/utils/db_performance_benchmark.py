@@ -8,6 +8,8 @@
 - 负载测试
 - 连接泄漏压力测试
 - 性能回归测试
+- 查询计划回归检查(EXPLAIN QUERY PLAN)
+- 读接口并发负载测试(p50/p95/p99延迟与事件循环延迟)
 
 Author: TgGod Team
 Version: 1.0.0
@@ -32,6 +34,41 @@ from ..services.connection_pool_monitor import get_pool_monitor
 
 logger = logging.getLogger(__name__)
 
+# 热点查询及其期望使用的索引；计划中出现全表扫描或未使用期望索引即视为回归
+QUERY_PLAN_CHECKS: Dict[str, Dict[str, str]] = {
+    "message_exists_lookup": {
+        "sql": "SELECT id FROM telegram_messages WHERE group_id = 1 AND message_id = 1",
+        "expected_index": "uq_telegram_messages_group_message",
+    },
+    "group_messages_page": {
+        "sql": "SELECT id FROM telegram_messages WHERE group_id = 1 ORDER BY date DESC LIMIT 50",
+        "expected_index": "ix_telegram_messages_group_date",
+    },
+    "group_messages_keyset": {
+        "sql": (
+            "SELECT id FROM telegram_messages WHERE group_id = 1 "
+            "AND (date < '2024-01-01' OR (date = '2024-01-01' AND id < 1)) "
+            "ORDER BY date DESC, id DESC LIMIT 500"
+        ),
+        "expected_index": "ix_telegram_messages_group_date",
+    },
+    "rule_media_filter": {
+        "sql": (
+            "SELECT id FROM telegram_messages WHERE group_id = 1 AND media_type = 'video' "
+            "AND date > '2024-01-01' AND media_type IS NOT NULL AND media_type != 'text'"
+        ),
+        "expected_index": "ix_telegram_messages_group_media_date",
+    },
+    "downloading_messages": {
+        "sql": "SELECT id FROM telegram_messages WHERE is_downloading = 1",
+        "expected_index": "ix_telegram_messages_is_downloading",
+    },
+    "downloaded_media": {
+        "sql": "SELECT id FROM telegram_messages WHERE media_downloaded = 1",
+        "expected_index": "ix_telegram_messages_media_downloaded",
+    },
+}
+
 @dataclass
 class BenchmarkResult:
     """基准测试结果"""
@@ -306,6 +343,207 @@ class DatabaseBenchmark:
         logger.info(f"连接泄漏测试完成")
         return result
 
+    def run_query_plan_check(self, checks: Optional[Dict[str, Dict[str, str]]] = None) -> Dict[str, Any]:
+        """查询计划回归检查
+
+        对热点查询执行 EXPLAIN QUERY PLAN，确认使用了期望的索引且没有全表扫描。
+
+        Args:
+            checks: 查询名称 -> {"sql", "expected_index"}，默认使用 QUERY_PLAN_CHECKS
+
+        Returns:
+            包含每条查询计划详情和整体是否通过的字典
+        """
+        checks = checks or QUERY_PLAN_CHECKS
+        results = {}
+
+        with enhanced_db_session(autocommit=False, context="query_plan_check") as session:
+            for name, check in checks.items():
+                try:
+                    rows = session.execute(text(f"EXPLAIN QUERY PLAN {check['sql']}")).fetchall()
+                    plan = [row[-1] for row in rows]
+                    full_scan = any(
+                        step.startswith("SCAN ") and "USING" not in step and "telegram_messages" in step
+                        for step in plan
+                    )
+                    uses_index = any(check["expected_index"] in step for step in plan)
+                    results[name] = {
+                        "passed": uses_index and not full_scan,
+                        "expected_index": check["expected_index"],
+                        "uses_expected_index": uses_index,
+                        "full_scan": full_scan,
+                        "plan": plan,
+                    }
+                except Exception as e:
+                    results[name] = {
+                        "passed": False,
+                        "expected_index": check["expected_index"],
+                        "error": str(e),
+                    }
+
+        failed = [name for name, result in results.items() if not result["passed"]]
+        if failed:
+            logger.warning(f"查询计划回归检查未通过: {failed}")
+        else:
+            logger.info(f"查询计划回归检查通过，共 {len(results)} 条查询")
+
+        return {
+            "passed": not failed,
+            "failed_checks": failed,
+            "checks": results,
+            "checked_at": datetime.now().isoformat(),
+        }
+
+    async def run_endpoint_load_test(
+        self,
+        endpoints: Optional[List[str]] = None,
+        concurrent_requests: int = 20,
+        requests_per_endpoint: int = 100,
+        headers: Optional[Dict[str, str]] = None,
+        base_url: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """读接口并发负载测试
+
+        以固定并发度对读密集接口发起请求，统计各接口的响应时间分位数；
+        同时用心跳协程测量事件循环延迟，数据库调用阻塞事件循环时该值会明显升高。
+
+        Args:
+            endpoints: 待测接口路径，None时使用默认的读密集接口
+            concurrent_requests: 同时在途的请求数
+            requests_per_endpoint: 每个接口的请求总数
+            headers: 请求头(需要认证的接口传入Authorization)
+            base_url: 目标服务地址，None时直接在进程内通过ASGI调用应用
+        """
+        import httpx
+
+        if endpoints is None:
+            endpoints = await self._default_load_test_endpoints()
+
+        if base_url:
+            client = httpx.AsyncClient(base_url=base_url, headers=headers, timeout=60)
+        else:
+            from ..main import app
+            client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app),
+                base_url="http://benchmark",
+                headers=headers,
+                timeout=60
+            )
+
+        semaphore = asyncio.Semaphore(concurrent_requests)
+        loop_lags: List[float] = []
+        running = True
+
+        async def loop_lag_probe(interval: float = 0.01):
+            while running:
+                expected = time.perf_counter() + interval
+                await asyncio.sleep(interval)
+                loop_lags.append(max(0.0, time.perf_counter() - expected))
+
+        async def timed_request(path: str):
+            async with semaphore:
+                op_start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    return time.perf_counter() - op_start, response.status_code < 400
+                except Exception as e:
+                    logger.error(f"负载测试请求失败 [{path}]: {e}")
+                    return time.perf_counter() - op_start, False
+
+        report: Dict[str, Any] = {
+            "concurrent_requests": concurrent_requests,
+            "requests_per_endpoint": requests_per_endpoint,
+            "endpoints": {}
+        }
+        probe_task = asyncio.create_task(loop_lag_probe())
+        try:
+            for path in endpoints:
+                logger.info(f"开始接口负载测试: {path}")
+                start_time = datetime.now()
+                outcomes = await asyncio.gather(
+                    *(timed_request(path) for _ in range(requests_per_endpoint))
+                )
+                end_time = datetime.now()
+                duration = (end_time - start_time).total_seconds()
+
+                response_times = [elapsed for elapsed, ok in outcomes if ok]
+                error_count = len(outcomes) - len(response_times)
+
+                if response_times:
+                    avg_time = statistics.mean(response_times)
+                    min_time = min(response_times)
+                    max_time = max(response_times)
+                    p50_time = statistics.median(response_times)
+                    p95_time = statistics.quantiles(response_times, n=20)[18] if len(response_times) >= 20 else max_time
+                    p99_time = statistics.quantiles(response_times, n=100)[98] if len(response_times) >= 100 else max_time
+                else:
+                    avg_time = min_time = max_time = p50_time = p95_time = p99_time = 0.0
+
+                result = BenchmarkResult(
+                    test_name=f"endpoint_load_{path}",
+                    duration=duration,
+                    total_operations=len(outcomes),
+                    operations_per_second=len(outcomes) / duration if duration > 0 else 0.0,
+                    avg_response_time=avg_time,
+                    min_response_time=min_time,
+                    max_response_time=max_time,
+                    p95_response_time=p95_time,
+                    p99_response_time=p99_time,
+                    success_rate=len(response_times) / len(outcomes) if outcomes else 0.0,
+                    error_count=error_count,
+                    concurrent_level=concurrent_requests,
+                    start_time=start_time,
+                    end_time=end_time,
+                    additional_metrics={"path": path, "p50_response_time": p50_time}
+                )
+                self.results.append(result)
+
+                report["endpoints"][path] = {
+                    "requests": result.total_operations,
+                    "requests_per_second": round(result.operations_per_second, 2),
+                    "success_rate": round(result.success_rate, 4),
+                    "p50_ms": round(p50_time * 1000, 2),
+                    "p95_ms": round(p95_time * 1000, 2),
+                    "p99_ms": round(p99_time * 1000, 2),
+                    "max_ms": round(max_time * 1000, 2),
+                }
+        finally:
+            running = False
+            await probe_task
+            await client.aclose()
+
+        if loop_lags:
+            report["event_loop_lag"] = {
+                "samples": len(loop_lags),
+                "p99_ms": round(
+                    (statistics.quantiles(loop_lags, n=100)[98] if len(loop_lags) >= 100 else max(loop_lags)) * 1000, 2
+                ),
+                "max_ms": round(max(loop_lags) * 1000, 2),
+            }
+        logger.info(f"接口负载测试完成: {len(endpoints)} 个接口")
+        return report
+
+    async def _default_load_test_endpoints(self) -> List[str]:
+        """默认压测的读密集接口，群组取库中第一个群组"""
+        from sqlalchemy import select
+        from ..database import AsyncSessionLocal
+        from ..models.telegram import TelegramGroup
+
+        endpoints = [
+            "/api/telegram/groups/unread-summary",
+            "/api/download-history/records?page=1&page_size=20",
+        ]
+        async with AsyncSessionLocal() as session:
+            group_id = await session.scalar(select(TelegramGroup.id).order_by(TelegramGroup.id).limit(1))
+        if group_id is not None:
+            endpoints = [
+                f"/api/telegram/groups/{group_id}/messages?limit=50",
+                f"/api/telegram/groups/{group_id}/messages/paginated?limit=50",
+                f"/api/telegram/groups/{group_id}/stats?force_refresh=true",
+                f"/api/telegram/groups/{group_id}/unread",
+            ] + endpoints
+        return endpoints
+
     def run_comprehensive_benchmark(self) -> Dict[str, Any]:
         """运行综合性能基准测试"""
         logger.info("开始综合性能基准测试")
@@ -321,7 +559,7 @@ class DatabaseBenchmark:
 
         try:
             # 1. 连接池压力测试
-            logger.info("1/4 - 连接池压力测试")
+            logger.info("1/5 - 连接池压力测试")
             stress_result = self.run_connection_pool_stress_test(
                 concurrent_connections=10,
                 operations_per_connection=20,
@@ -330,7 +568,7 @@ class DatabaseBenchmark:
             benchmark_results["tests"]["stress_test"] = stress_result
 
             # 2. 查询性能测试
-            logger.info("2/4 - 查询性能测试")
+            logger.info("2/5 - 查询性能测试")
             query_tests = {
                 "simple_select": "SELECT 1",
                 "pragma_check": "PRAGMA foreign_keys",
@@ -344,7 +582,7 @@ class DatabaseBenchmark:
             benchmark_results["tests"]["query_performance"] = query_results
 
             # 3. 连接池容量测试
-            logger.info("3/4 - 连接池容量测试")
+            logger.info("3/5 - 连接池容量测试")
             capacity_result = self.run_connection_pool_stress_test(
                 concurrent_connections=initial_pool_status.get('pool_size', 10) + 5,
                 operations_per_connection=10,
@@ -353,13 +591,17 @@ class DatabaseBenchmark:
             benchmark_results["tests"]["capacity_test"] = capacity_result
 
             # 4. 连接泄漏检测测试
-            logger.info("4/4 - 连接泄漏检测测试")
+            logger.info("4/5 - 连接泄漏检测测试")
             leak_result = self.run_connection_leak_test(
                 leak_count=5,
                 leak_duration=10
             )
             benchmark_results["tests"]["leak_detection"] = leak_result
 
+            # 5. 查询计划回归检查
+            logger.info("5/5 - 查询计划回归检查")
+            benchmark_results["tests"]["query_plans"] = self.run_query_plan_check()
+
             # 记录最终状态
             final_pool_status = self.monitor.get_current_status()
             benchmark_results["final_pool_status"] = final_pool_status
@@ -8,8 +8,12 @@ from functools import wraps
 from typing import Any, Callable
 from sqlalchemy.exc import OperationalError
 
+from ..core.metrics import DB_LOCK_RETRIES
+
 logger = logging.getLogger(__name__)
 
+_LOCK_RETRIES = DB_LOCK_RETRIES.labels("db_retry")
+
 def db_retry(max_retries: int = 3, delay: float = 0.1, backoff: float = 2.0):
     """
     数据库操作重试装饰器
@@ -35,6 +39,7 @@ def db_retry(max_retries: int = 3, delay: float = 0.1, backoff: float = 2.0):
                     # 只对特定的数据库错误进行重试
                     if any(error in error_msg for error in ['database is locked', 'timeout', 'busy']):
                         if attempt < max_retries:
+                            _LOCK_RETRIES.inc()
                             logger.warning(f"数据库操作失败，{current_delay:.2f}秒后重试 (尝试 {attempt + 1}/{max_retries}): {e}")
                             time.sleep(current_delay)
                             current_delay *= backoff
@@ -65,6 +70,7 @@ def db_retry(max_retries: int = 3, delay: float = 0.1, backoff: float = 2.0):
                     # 只对特定的数据库错误进行重试
                     if any(error in error_msg for error in ['database is locked', 'timeout', 'busy']):
                         if attempt < max_retries:
+                            _LOCK_RETRIES.inc()
                             logger.warning(f"数据库操作失败，{current_delay:.2f}秒后重试 (尝试 {attempt + 1}/{max_retries}): {e}")
                             await asyncio.sleep(current_delay)
                             current_delay *= backoff
@@ -0,0 +1,538 @@
+"""单写线程数据库写入队列
+
+SQLite同一时刻只允许一个写事务。异步代码中直接打开同步会话写库时，
+锁等待(busy_timeout)和重试延迟都会阻塞事件循环。本模块提供:
+
+- DatabaseWriter: 独立线程持有唯一的写连接，通过队列接收类型化的写命令，
+  把短时间内到达的命令合并到一个事务中提交(group commit)，并以可等待对象返回结果
+- 每条命令在独立的SAVEPOINT中执行，单条命令失败不会影响同批次的其他命令
+- read_only_session(): 只读WAL连接池，读请求不与写线程竞争写锁
+
+Example:
+    ```python
+    from app.utils.db_writer import db_writer, UpdateTaskState
+
+    await db_writer.execute(UpdateTaskState(task_id, {"progress": 50}))
+    db_writer.submit(InsertTaskLogs([log_entry]))  # 不等待结果
+    ```
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+import concurrent.futures
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine, event, func, insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ..core.metrics import DB_COMMIT_DURATION, DB_LOCK_RETRIES, DB_WRITES
+from ..database import database_url
+
+logger = logging.getLogger(__name__)
+
+IS_SQLITE = "sqlite" in database_url
+LOCK_ERROR_KEYWORDS = ("database is locked", "busy", "timeout")
+
+_WRITER_LOCK_RETRIES = DB_LOCK_RETRIES.labels("writer")
+
+
+# ----------------------------------------------------------------------
+# 写命令
+# ----------------------------------------------------------------------
+
+class WriteCommand:
+    """写命令基类
+
+    apply() 在写线程中执行，返回值作为 execute() 的结果。
+    返回值不能是绑定到写会话的ORM对象(提交后会被清理)。
+    """
+
+    name = "write"
+
+    def apply(self, session: Session) -> Any:
+        raise NotImplementedError
+
+
+@dataclass
+class CallableWrite(WriteCommand):
+    """执行任意写函数，用于尚未定义专用命令的写操作"""
+    fn: Callable[[Session], Any]
+    name: str = "callable"
+
+    def apply(self, session: Session) -> Any:
+        return self.fn(session)
+
+
+@dataclass
+class UpdateTaskState(WriteCommand):
+    """更新下载任务字段(进度、状态、错误信息等)"""
+    task_id: int
+    fields: Dict[str, Any]
+    name: str = "task_state"
+
+    def apply(self, session: Session) -> int:
+        from ..models.rule import DownloadTask
+        return (
+            session.query(DownloadTask)
+            .filter(DownloadTask.id == self.task_id)
+            .update(self.fields, synchronize_session=False)
+        )
+
+
+@dataclass
+class UpdateMessageDownloadState(WriteCommand):
+    """更新消息的下载状态字段"""
+    message_pk: int
+    fields: Dict[str, Any]
+    mark_started: bool = False
+    name: str = "message_download_state"
+
+    def apply(self, session: Session) -> int:
+        from ..models.telegram import TelegramMessage
+        values = dict(self.fields)
+        if self.mark_started:
+            values["download_started_at"] = func.coalesce(
+                TelegramMessage.download_started_at, datetime.now(timezone.utc)
+            )
+        return (
+            session.query(TelegramMessage)
+            .filter(TelegramMessage.id == self.message_pk)
+            .update(values, synchronize_session=False)
+        )
+
+
+@dataclass
+class InsertTaskLogs(WriteCommand):
+    """批量写入任务日志"""
+    entries: List[Dict[str, Any]]
+    name: str = "task_logs"
+
+    def apply(self, session: Session) -> int:
+        from ..models.log import TaskLog
+        rows = [
+            {
+                "task_id": entry.get("task_id"),
+                "level": entry["level"],
+                "message": entry["message"],
+                "details": entry.get("details"),
+                "created_at": entry.get("created_at") or datetime.now(timezone.utc),
+            }
+            for entry in self.entries
+        ]
+        if rows:
+            session.execute(insert(TaskLog.__table__), rows)
+        return len(rows)
+
+
+@dataclass
+class UpsertDownloadRecords(WriteCommand):
+    """写入下载记录，同一任务内已存在的消息只更新文件路径"""
+    task_id: int
+    rows: List[Dict[str, Any]]
+    name: str = "download_records"
+
+    def apply(self, session: Session) -> int:
+        from ..models.rule import DownloadRecord
+        if not self.rows:
+            return 0
+        message_ids = [row["message_id"] for row in self.rows]
+        existing = {
+            row.message_id: row.id
+            for row in session.query(DownloadRecord.id, DownloadRecord.message_id).filter(
+                DownloadRecord.task_id == self.task_id,
+                DownloadRecord.message_id.in_(message_ids),
+            )
+        }
+        new_rows = []
+        for row in self.rows:
+            record_id = existing.get(row["message_id"])
+            if record_id is not None:
+                session.query(DownloadRecord).filter(DownloadRecord.id == record_id).update(
+                    {"local_file_path": row["local_file_path"]}, synchronize_session=False
+                )
+            else:
+                new_rows.append(row)
+                existing[row["message_id"]] = -1
+        if new_rows:
+            session.execute(insert(DownloadRecord.__table__), new_rows)
+        return len(self.rows)
+
+
+@dataclass
+class IngestMessages(WriteCommand):
+    """批量写入群组消息(见 message_ingest.bulk_upsert_messages)"""
+    group_id: int
+    messages: List[Dict[str, Any]]
+    update_existing: bool = True
+    name: str = "ingest_messages"
+
+    def apply(self, session: Session):
+        from ..services.message_ingest import bulk_upsert_messages
+        return bulk_upsert_messages(session, self.group_id, self.messages, update_existing=self.update_existing)
+
+
+@dataclass
+class DeleteMessages(WriteCommand):
+    """删除群组消息，默认保留媒体已下载的记录"""
+    group_id: int
+    message_ids: List[int]
+    keep_downloaded: bool = True
+    name: str = "delete_messages"
+
+    def apply(self, session: Session) -> int:
+        from ..models.rule_match import RuleMessageMatch
+        from ..models.telegram import TelegramMessage
+        query = session.query(TelegramMessage).filter(
+            TelegramMessage.group_id == self.group_id,
+            TelegramMessage.message_id.in_(self.message_ids),
+        )
+        if self.keep_downloaded:
+            query = query.filter(TelegramMessage.media_downloaded.isnot(True))
+        # SQLite未启用外键级联，先删除这些消息的规则匹配结果
+        session.query(RuleMessageMatch).filter(
+            RuleMessageMatch.message_id.in_(query.with_entities(TelegramMessage.id))
+        ).delete(synchronize_session=False)
+        return query.delete(synchronize_session=False)
+
+
+# ----------------------------------------------------------------------
+# 写线程
+# ----------------------------------------------------------------------
+
+@dataclass
+class _PendingWrite:
+    command: WriteCommand
+    future: Any = None
+    loop: Optional[asyncio.AbstractEventLoop] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class WriterStats:
+    """写线程统计"""
+    submitted: int = 0
+    committed: int = 0
+    failed: int = 0
+    batches: int = 0
+    max_batch_size: int = 0
+    lock_retries: int = 0
+    total_commit_seconds: float = 0.0
+    max_commit_seconds: float = 0.0
+    total_wait_seconds: float = 0.0
+    by_command: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "submitted": self.submitted,
+            "committed": self.committed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch_size": round(self.committed / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "lock_retries": self.lock_retries,
+            "avg_commit_ms": round(self.total_commit_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+            "max_commit_ms": round(self.max_commit_seconds * 1000, 2),
+            "avg_queue_wait_ms": (
+                round(self.total_wait_seconds / (self.committed + self.failed) * 1000, 2)
+                if self.committed + self.failed else 0.0
+            ),
+            "by_command": dict(self.by_command),
+        }
+
+
+_STOP = object()
+
+
+def _create_writer_engine():
+    if not IS_SQLITE:
+        return create_engine(database_url, pool_size=1, max_overflow=0, pool_pre_ping=True, echo=False)
+
+    engine = create_engine(
+        database_url,
+        connect_args={"check_same_thread": False, "timeout": 30, "isolation_level": None},
+        poolclass=StaticPool,
+        echo=False,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _begin_immediate(conn):
+        # 驱动层关闭了隐式事务，这里显式开启写事务，SAVEPOINT 才能正常工作
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return engine
+
+
+class DatabaseWriter:
+    """单写线程数据库写入器
+
+    Args:
+        max_batch_size: 单个事务最多合并的命令数
+        max_batch_wait: 收到第一条命令后等待更多命令合并的最长时间(秒)
+        max_retries: 提交遇到锁冲突时的重试次数
+    """
+
+    def __init__(self, max_batch_size: int = 256, max_batch_wait: float = 0.005, max_retries: int = 5):
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait
+        self.max_retries = max_retries
+        self.stats = WriterStats()
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._engine = None
+
+    # ------------------------------------------------------------------
+    # 提交接口
+    # ------------------------------------------------------------------
+
+    async def execute(self, command: WriteCommand) -> Any:
+        """提交写命令并等待其所在事务提交完成
+
+        Raises:
+            命令执行失败或提交失败时抛出对应异常
+        """
+        loop = asyncio.get_running_loop()
+        pending = _PendingWrite(command, loop.create_future(), loop)
+        self._enqueue(pending)
+        return await pending.future
+
+    def submit(self, command: WriteCommand):
+        """提交写命令但不等待结果(失败只记录日志)"""
+        self._enqueue(_PendingWrite(command))
+
+    def execute_sync(self, command: WriteCommand, timeout: Optional[float] = None) -> Any:
+        """在线程中同步提交写命令并等待结果"""
+        pending = _PendingWrite(command, concurrent.futures.Future())
+        self._enqueue(pending)
+        return pending.future.result(timeout=timeout)
+
+    def _enqueue(self, pending: _PendingWrite):
+        self.start()
+        self.stats.submitted += 1
+        self._queue.put(pending)
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._engine is None:
+                self._engine = _create_writer_engine()
+            self._thread = threading.Thread(target=self._run, name="tggod-db-writer", daemon=True)
+            self._thread.start()
+            logger.info("数据库写线程已启动")
+
+    def stop(self, timeout: float = 10.0):
+        """处理完队列中已有的命令后停止写线程"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            logger.warning(f"数据库写线程未在 {timeout} 秒内退出，剩余 {self._queue.qsize()} 条命令")
+        self._thread = None
+        logger.info("数据库写线程已停止")
+
+    # ------------------------------------------------------------------
+    # 写线程
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        session = Session(bind=self._engine, autoflush=False, expire_on_commit=False)
+        stopping = False
+        try:
+            while not stopping:
+                first = self._queue.get()
+                if first is _STOP:
+                    break
+                batch = [first]
+                deadline = time.monotonic() + self.max_batch_wait
+                while len(batch) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._commit_batch(session, batch)
+        finally:
+            session.close()
+
+    def _commit_batch(self, session: Session, batch: List[_PendingWrite]):
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            outcomes = []
+            try:
+                with session.begin():
+                    for pending in batch:
+                        try:
+                            with session.begin_nested():
+                                outcomes.append((True, pending.command.apply(session)))
+                        except Exception as e:
+                            if isinstance(e, OperationalError) and self._is_lock_error(e):
+                                raise
+                            outcomes.append((False, e))
+                break
+            except OperationalError as e:
+                session.rollback()
+                if self._is_lock_error(e) and attempt < self.max_retries:
+                    self.stats.lock_retries += 1
+                    _WRITER_LOCK_RETRIES.inc()
+                    time.sleep(min(0.05 * (2 ** attempt), 2.0))
+                    continue
+                logger.error(f"数据库写入批次提交失败 ({len(batch)} 条命令): {e}")
+                outcomes = [(False, e)] * len(batch)
+                break
+            except Exception as e:
+                session.rollback()
+                logger.error(f"数据库写入批次提交失败 ({len(batch)} 条命令): {e}")
+                outcomes = [(False, e)] * len(batch)
+                break
+            finally:
+                session.expunge_all()
+
+        elapsed = time.monotonic() - started
+        self.stats.batches += 1
+        self.stats.max_batch_size = max(self.stats.max_batch_size, len(batch))
+        self.stats.total_commit_seconds += elapsed
+        self.stats.max_commit_seconds = max(self.stats.max_commit_seconds, elapsed)
+        DB_COMMIT_DURATION.observe(elapsed)
+
+        for pending, (ok, value) in zip(batch, outcomes):
+            self.stats.total_wait_seconds += started - pending.enqueued_at
+            name = pending.command.name
+            self.stats.by_command[name] = self.stats.by_command.get(name, 0) + 1
+            DB_WRITES.labels(name, "committed" if ok else "failed").inc()
+            if ok:
+                self.stats.committed += 1
+            else:
+                self.stats.failed += 1
+                if pending.future is None:
+                    logger.warning(f"写命令 {name} 执行失败: {value}")
+            self._resolve(pending, ok, value)
+
+    @staticmethod
+    def _is_lock_error(error: Exception) -> bool:
+        message = str(error).lower()
+        return any(keyword in message for keyword in LOCK_ERROR_KEYWORDS)
+
+    @staticmethod
+    def _resolve(pending: _PendingWrite, ok: bool, value: Any):
+        future = pending.future
+        if future is None:
+            return
+        if pending.loop is None:
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+            return
+
+        def _set():
+            if future.done():
+                return
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+        try:
+            pending.loop.call_soon_threadsafe(_set)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats.to_dict()
+        stats["queue_depth"] = self._queue.qsize()
+        stats["running"] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+
+# ----------------------------------------------------------------------
+# 只读连接池
+# ----------------------------------------------------------------------
+
+def _read_only_url(url: str) -> str:
+    """sqlite:///path -> sqlite:///file:/abs/path?mode=ro&uri=true"""
+    path = url.split(":///", 1)[1]
+    if path.startswith("file:") or path in ("", ":memory:"):
+        return url
+    return f"sqlite:///file:{os.path.abspath(path)}?mode=ro&uri=true"
+
+
+def _create_read_engine():
+    if not IS_SQLITE:
+        from ..database import engine
+        return engine
+
+    engine = create_engine(
+        _read_only_url(database_url),
+        connect_args={"check_same_thread": False, "timeout": 30},
+        pool_size=8,
+        max_overflow=8,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        echo=False,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_read_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only=ON")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+    return engine
+
+
+read_engine = _create_read_engine()
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+@contextmanager
+def read_only_session():
+    """只读会话(WAL快照读，不持有写锁)"""
+    session = ReadSessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+
+
+db_writer = DatabaseWriter()
+
+
+def get_db_writer() -> DatabaseWriter:
+    """获取全局数据库写入器"""
+    return db_writer
@@ -25,6 +25,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy.exc import OperationalError, DisconnectionError, TimeoutError
 from sqlalchemy import text
 
+from ..core.metrics import DB_LOCK_RETRIES
 from ..database import SessionLocal
 from ..services.connection_pool_monitor import get_pool_monitor
 
@@ -199,6 +200,7 @@ def _create_session_with_retry(max_retries: int, timeout: float) -> Session:
                         pass
 
                 if retry_count <= max_retries:
+                    DB_LOCK_RETRIES.labels("enhanced_session").inc()
                     # 指数退避策略
                     wait_time = min(0.1 * (2 ** retry_count), 2.0)
                     logger.warning(f"数据库连接失败，{wait_time:.2f}秒后重试 (尝试 {retry_count}/{max_retries})")
@@ -0,0 +1,381 @@
+"""群组统计计数表维护工具
+
+群组统计和仪表盘原先每次请求都对 telegram_messages 做多次 COUNT 扫描，
+只能靠进程内5分钟缓存挡住，结果既慢又不新。本模块在 telegram_messages 上
+维护触发器，随消息的插入/更新/删除在同一事务内增量更新 group_stats:
+
+- 入库、删除、下载状态变化都经过触发器，任何写入路径下计数都精确且实时
+- 更新触发器只在参与统计的列真正变化时执行，普通的入库 upsert 不产生额外写入
+- group_activity_hourly 按小时记录新消息/新下载，用于最近24小时统计
+- rebuild_group_stats(): 从消息表全量重建计数（一次性修复命令）
+- ensure_group_stats(): 启动时补建触发器（数据库由 create_all 建表、未执行迁移的情况）
+
+非SQLite数据库不创建触发器，统计接口回退为对消息表的实时聚合查询。
+
+命令行重建: python -m app.utils.group_stats [--group-id ID]
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func, select, text
+
+from ..database import database_url, engine
+from ..models.group_stats import GroupActivityHourly, GroupStats
+
+logger = logging.getLogger(__name__)
+
+STATS_TABLE = "group_stats"
+ACTIVITY_TABLE = "group_activity_hourly"
+
+# 按小时的活动记录保留时长，只需覆盖最近24小时统计窗口
+ACTIVITY_RETENTION = "-2 days"
+
+HOUR_FORMAT = "%Y-%m-%d %H:00:00"
+
+
+def _flag(condition: str) -> str:
+    return f"CASE WHEN {condition} THEN 1 ELSE 0 END"
+
+
+# 计数列及其对单条消息的取值，{r} 替换为 new/old/telegram_messages
+COUNTERS = (
+    ("total_messages", "1"),
+    ("media_messages", _flag("{r}.media_type IS NOT NULL")),
+    ("photo_messages", _flag("{r}.media_type = 'photo'")),
+    ("video_messages", _flag("{r}.media_type = 'video'")),
+    ("document_messages", _flag("{r}.media_type = 'document'")),
+    ("audio_messages", _flag("{r}.media_type = 'audio'")),
+    ("voice_messages", _flag("{r}.media_type = 'voice'")),
+    ("sticker_messages", _flag("{r}.media_type = 'sticker'")),
+    ("video_note_messages", _flag("{r}.media_type = 'video_note'")),
+    ("forwarded_messages", _flag("{r}.is_forwarded = TRUE")),
+    ("pinned_messages", _flag("{r}.is_pinned = TRUE")),
+    ("reaction_messages", _flag("{r}.reactions IS NOT NULL")),
+    ("downloaded_messages", _flag("{r}.media_downloaded = TRUE")),
+    (
+        "downloaded_media_size",
+        "CASE WHEN {r}.media_downloaded = TRUE THEN COALESCE({r}.media_size, 0) ELSE 0 END",
+    ),
+)
+
+STAT_COLUMNS = tuple(name for name, _ in COUNTERS)
+
+# 影响计数的消息列，其余列（下载进度、文本等）的更新不触发统计维护
+TRACKED_COLUMNS = (
+    "group_id", "media_type", "is_forwarded", "is_pinned",
+    "reactions", "media_downloaded", "media_size", "date",
+)
+
+
+def _values(row: str) -> str:
+    return ", ".join(expr.format(r=row) for _, expr in COUNTERS)
+
+
+def _add_new_row() -> str:
+    """把 new 行计入所属群组（不存在统计行时创建）"""
+    columns = ", ".join(STAT_COLUMNS)
+    increments = ", ".join(f"{name} = {name} + excluded.{name}" for name in STAT_COLUMNS)
+    return f"""
+        INSERT INTO {STATS_TABLE} (group_id, {columns}, last_message_date, updated_at)
+        VALUES (new.group_id, {_values("new")}, new.date, CURRENT_TIMESTAMP)
+        ON CONFLICT(group_id) DO UPDATE SET {increments},
+            last_message_date = CASE
+                WHEN last_message_date IS NULL OR excluded.last_message_date > last_message_date
+                THEN excluded.last_message_date ELSE last_message_date END,
+            updated_at = excluded.updated_at;
+    """
+
+
+def _remove_old_row() -> str:
+    """从所属群组中扣除 old 行；删除的是最新消息时按 (group_id, date) 索引重新取最大值"""
+    decrements = ", ".join(
+        f"{name} = {name} - ({expr.format(r='old')})" for name, expr in COUNTERS
+    )
+    return f"""
+        UPDATE {STATS_TABLE} SET {decrements},
+            last_message_date = CASE
+                WHEN old.date >= last_message_date
+                THEN (SELECT MAX(date) FROM telegram_messages WHERE group_id = old.group_id)
+                ELSE last_message_date END,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE group_id = old.group_id;
+    """
+
+
+def _changed_condition() -> str:
+    return " OR ".join(f"old.{name} IS NOT new.{name}" for name in TRACKED_COLUMNS)
+
+
+GROUP_STATS_DDL = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {STATS_TABLE}_ai AFTER INSERT ON telegram_messages BEGIN
+        {_add_new_row()}
+        INSERT INTO {ACTIVITY_TABLE} (group_id, hour_start, new_messages, new_downloads)
+        VALUES (new.group_id, strftime('{HOUR_FORMAT}', 'now'), 1, {_flag("new.media_downloaded = TRUE")})
+        ON CONFLICT(group_id, hour_start) DO UPDATE SET
+            new_messages = new_messages + 1,
+            new_downloads = new_downloads + excluded.new_downloads;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {STATS_TABLE}_ad AFTER DELETE ON telegram_messages BEGIN
+        {_remove_old_row()}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {STATS_TABLE}_au
+    AFTER UPDATE OF {", ".join(TRACKED_COLUMNS)} ON telegram_messages
+    WHEN {_changed_condition()}
+    BEGIN
+        {_remove_old_row()}
+        {_add_new_row()}
+        INSERT INTO {ACTIVITY_TABLE} (group_id, hour_start, new_messages, new_downloads)
+        SELECT new.group_id, strftime('{HOUR_FORMAT}', 'now'), 0, 1
+        WHERE new.media_downloaded = TRUE AND COALESCE(old.media_downloaded, FALSE) = FALSE
+        ON CONFLICT(group_id, hour_start) DO UPDATE SET new_downloads = new_downloads + 1;
+    END
+    """,
+    # 每个群组每小时最多新建一个活动行，此时顺带清理过期的活动行
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {ACTIVITY_TABLE}_prune AFTER INSERT ON {ACTIVITY_TABLE} BEGIN
+        DELETE FROM {ACTIVITY_TABLE}
+        WHERE group_id = new.group_id
+          AND hour_start < strftime('{HOUR_FORMAT}', 'now', '{ACTIVITY_RETENTION}');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {STATS_TABLE}_group_ad AFTER DELETE ON telegram_groups BEGIN
+        DELETE FROM {STATS_TABLE} WHERE group_id = old.id;
+        DELETE FROM {ACTIVITY_TABLE} WHERE group_id = old.id;
+    END
+    """,
+)
+
+TRIGGER_NAMES = (
+    f"{STATS_TABLE}_ai", f"{STATS_TABLE}_ad", f"{STATS_TABLE}_au",
+    f"{ACTIVITY_TABLE}_prune", f"{STATS_TABLE}_group_ad",
+)
+
+
+def _aggregate_sql(where: str = "") -> str:
+    sums = ", ".join(
+        f"COALESCE(SUM({expr.format(r='telegram_messages')}), 0) AS {name}"
+        for name, expr in COUNTERS
+    )
+    return f"SELECT group_id, {sums}, MAX(date) AS last_message_date FROM telegram_messages {where} GROUP BY group_id"
+
+
+def _rebuild_statements(group_id: Optional[int]):
+    where = "WHERE group_id = :group_id" if group_id is not None else ""
+    created_where = f"{where} AND" if where else "WHERE"
+    columns = ", ".join(STAT_COLUMNS)
+    return (
+        f"DELETE FROM {STATS_TABLE} {where}",
+        f"""
+        INSERT INTO {STATS_TABLE} (group_id, {columns}, last_message_date, updated_at)
+        SELECT group_id, {columns}, last_message_date, CURRENT_TIMESTAMP
+        FROM ({_aggregate_sql(where)}) AS aggregated
+        """,
+        f"DELETE FROM {ACTIVITY_TABLE} {where}",
+        f"""
+        INSERT INTO {ACTIVITY_TABLE} (group_id, hour_start, new_messages, new_downloads)
+        SELECT group_id, strftime('{HOUR_FORMAT}', created_at), COUNT(*), 0
+        FROM telegram_messages
+        {created_where} created_at >= strftime('{HOUR_FORMAT}', 'now', '{ACTIVITY_RETENTION}')
+        GROUP BY group_id, strftime('{HOUR_FORMAT}', created_at)
+        """,
+        # 没有独立的下载完成时间，以下载完成时写入的 updated_at 近似
+        f"""
+        INSERT INTO {ACTIVITY_TABLE} (group_id, hour_start, new_messages, new_downloads)
+        SELECT group_id, strftime('{HOUR_FORMAT}', updated_at), 0, COUNT(*)
+        FROM telegram_messages
+        {created_where} media_downloaded = TRUE
+          AND updated_at >= strftime('{HOUR_FORMAT}', 'now', '{ACTIVITY_RETENTION}')
+        GROUP BY group_id, strftime('{HOUR_FORMAT}', updated_at)
+        ON CONFLICT(group_id, hour_start) DO UPDATE SET new_downloads = excluded.new_downloads
+        """,
+    )
+
+
+_available: Optional[bool] = None
+_available_lock = threading.Lock()
+
+
+def _triggers_exist(connection) -> bool:
+    names = {
+        row[0] for row in connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE :prefix"),
+            {"prefix": "group_%"},
+        )
+    }
+    return all(name in names for name in TRIGGER_NAMES)
+
+
+def ensure_group_stats() -> bool:
+    """确保统计表的维护触发器存在，新建触发器时从消息表重建计数
+
+    Returns:
+        增量统计是否可用
+    """
+    global _available
+
+    with _available_lock:
+        if "sqlite" not in database_url:
+            _available = False
+            return False
+
+        try:
+            GroupStats.__table__.create(bind=engine, checkfirst=True)
+            GroupActivityHourly.__table__.create(bind=engine, checkfirst=True)
+            with engine.begin() as connection:
+                created = not _triggers_exist(connection)
+                for statement in GROUP_STATS_DDL:
+                    connection.execute(text(statement))
+                if created:
+                    for statement in _rebuild_statements(None):
+                        connection.execute(text(statement))
+                    logger.info("群组统计触发器已创建并完成计数重建")
+            _available = True
+        except Exception as e:
+            logger.warning(f"群组统计触发器不可用，统计接口回退为实时聚合: {e}")
+            _available = False
+
+        return _available
+
+
+def is_group_stats_available() -> bool:
+    """增量统计是否可用（首次调用时检查一次并缓存）"""
+    global _available
+
+    if _available is None:
+        with _available_lock:
+            if _available is None:
+                if "sqlite" not in database_url:
+                    _available = False
+                else:
+                    try:
+                        with engine.connect() as connection:
+                            _available = _triggers_exist(connection)
+                    except Exception as e:
+                        logger.warning(f"检查群组统计触发器失败: {e}")
+                        return False
+    return _available
+
+
+def rebuild_group_stats(group_id: Optional[int] = None) -> int:
+    """从 telegram_messages 全量重建群组计数（单个事务内完成，期间的写入会等待）
+
+    Args:
+        group_id: 只重建指定群组，None 重建全部
+
+    Returns:
+        重建后的统计行数
+    """
+    if not is_group_stats_available():
+        return 0
+
+    params = {"group_id": group_id} if group_id is not None else {}
+    with engine.begin() as connection:
+        for statement in _rebuild_statements(group_id):
+            connection.execute(text(statement), params)
+        count_query = select(func.count()).select_from(GroupStats)
+        if group_id is not None:
+            count_query = count_query.where(GroupStats.group_id == group_id)
+        rows = connection.execute(count_query).scalar() or 0
+    logger.info(f"群组统计重建完成: {rows} 个群组")
+    return rows
+
+
+# ----------------------------------------------------------------------
+# 读取
+# ----------------------------------------------------------------------
+
+def empty_stats() -> Dict[str, Any]:
+    stats: Dict[str, Any] = {name: 0 for name in STAT_COLUMNS}
+    stats["last_message_date"] = None
+    return stats
+
+
+def stats_to_dict(row) -> Dict[str, Any]:
+    """计数查询结果行（mapping）转换为字典，None 表示群组还没有消息"""
+    if row is None:
+        return empty_stats()
+    stats = {name: row[name] or 0 for name in STAT_COLUMNS}
+    stats["last_message_date"] = row["last_message_date"]
+    return stats
+
+
+def group_stats_statement(group_id: int):
+    """单个群组的计数查询: 可用时按主键读取统计行，否则实时聚合"""
+    if is_group_stats_available():
+        return select(
+            *[getattr(GroupStats, name) for name in STAT_COLUMNS],
+            GroupStats.last_message_date,
+        ).where(GroupStats.group_id == group_id)
+    return text(_aggregate_sql("WHERE group_id = :group_id")).bindparams(group_id=group_id)
+
+
+def totals_statement():
+    """全部群组的计数合计（统计表每个群组一行）"""
+    if is_group_stats_available():
+        return select(
+            *[func.coalesce(func.sum(getattr(GroupStats, name)), 0).label(name) for name in STAT_COLUMNS],
+            func.max(GroupStats.last_message_date).label("last_message_date"),
+        )
+    sums = ", ".join(
+        f"COALESCE(SUM({expr.format(r='telegram_messages')}), 0) AS {name}"
+        for name, expr in COUNTERS
+    )
+    return text(f"SELECT {sums}, MAX(date) AS last_message_date FROM telegram_messages")
+
+
+def activity_statement(hours: int = 24):
+    """最近 hours 小时（按整点对齐）的新消息数和新下载数"""
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    if is_group_stats_available():
+        return select(
+            func.coalesce(func.sum(GroupActivityHourly.new_messages), 0).label("new_messages"),
+            func.coalesce(func.sum(GroupActivityHourly.new_downloads), 0).label("new_downloads"),
+        ).where(GroupActivityHourly.hour_start >= since.strftime(HOUR_FORMAT))
+    return text(
+        "SELECT "
+        "(SELECT COUNT(*) FROM telegram_messages WHERE created_at >= :since) AS new_messages, "
+        "(SELECT COUNT(*) FROM telegram_messages "
+        "WHERE media_downloaded = TRUE AND updated_at >= :since) AS new_downloads"
+    ).bindparams(since=since)
+
+
+def media_distribution(stats: Dict[str, Any]) -> Dict[str, int]:
+    """按媒体类型的分布，未单独计数的类型归入 other"""
+    distribution = {
+        "photo": stats["photo_messages"],
+        "video": stats["video_messages"],
+        "document": stats["document_messages"],
+        "audio": stats["audio_messages"],
+        "voice": stats["voice_messages"],
+        "sticker": stats["sticker_messages"],
+        "video_note": stats["video_note_messages"],
+    }
+    distribution["other"] = stats["media_messages"] - sum(distribution.values())
+    return {media_type: count for media_type, count in distribution.items() if count > 0}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="从消息表重建群组统计计数")
+    parser.add_argument("--group-id", type=int, default=None, help="只重建指定群组")
+    args = parser.parse_args()
+
+    if not ensure_group_stats():
+        logger.error("❌ 当前数据库不支持增量群组统计")
+    else:
+        rows = rebuild_group_stats(args.group_id)
+        logger.info(f"✅ 重建完成: {rows} 个群组")
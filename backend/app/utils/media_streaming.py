@@ -0,0 +1,258 @@
+"""媒体文件流式输出工具
+
+为已下载的媒体文件和缩略图提供符合HTTP缓存与分段语义的响应:
+
+- ETag / If-None-Match、Last-Modified / If-Modified-Since 条件请求，未变化时返回304
+- Range / If-Range 单段范围请求返回206，视频拖动进度条时只传输所需部分
+- Cache-Control 按调用方给定的时长缓存，仅内容寻址的URL可标记 immutable
+- ASGI服务器支持 http.response.zerocopysend 扩展时使用零拷贝 sendfile 输出，
+  否则按块读取输出
+- 配置 media_accel_redirect 后，媒体目录内的文件通过 nginx X-Accel-Redirect
+  交由 nginx 发送（sendfile 且由 nginx 处理 Range）
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import logging
+import mimetypes
+import os
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# 按媒体类型的默认MIME类型（无法从扩展名推断时使用）
+DEFAULT_MIME_TYPES = {
+    "photo": "image/jpeg",
+    "video": "video/mp4",
+    "document": "application/octet-stream",
+    "audio": "audio/mpeg",
+    "voice": "audio/ogg",
+}
+
+CHUNK_SIZE = 256 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """请求的范围超出文件大小"""
+
+
+def guess_media_type(path: str, media_type: Optional[str] = None) -> str:
+    mime_type, _ = mimetypes.guess_type(path)
+    return mime_type or DEFAULT_MIME_TYPES.get(media_type or "", "application/octet-stream")
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def content_disposition(filename: str, attachment: bool = False) -> str:
+    disposition = "attachment" if attachment else "inline"
+    return f"{disposition}; filename*=utf-8''{quote(filename)}"
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """解析单段 Range 头，返回闭区间 (start, end)
+
+    语法无效或多段范围返回 None（按完整文件响应）；范围不可满足时抛出 RangeNotSatisfiable。
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec or "," in spec:
+        return None
+
+    start_text, sep, end_text = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not start_text:
+            # 后缀范围: bytes=-N 表示最后N个字节
+            suffix = int(end_text)
+            if suffix <= 0 or size <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - suffix, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else None
+    except ValueError:
+        return None
+
+    if end is not None and end < start:
+        return None
+    # 先判断起点是否越界再截断终点，bytes=N- 在 N >= size 时同样不可满足
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, size - 1 if end is None else min(end, size - 1)
+
+
+def _etag_matches(header: str, etag: str, weak: bool = True) -> bool:
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def _not_modified(headers, etag: str, mtime: float) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _if_range_matches(headers, etag: str, last_modified: str) -> bool:
+    if_range = headers.get("if-range")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # If-Range 只接受强比较
+        return _etag_matches(if_range, etag, weak=False)
+    return if_range == last_modified
+
+
+def _accel_path(path: str) -> Optional[str]:
+    prefix = settings.media_accel_redirect
+    if not prefix:
+        return None
+    media_root = os.path.realpath(settings.media_root)
+    real_path = os.path.realpath(path)
+    if os.path.commonpath([media_root, real_path]) != media_root:
+        return None
+    relative = os.path.relpath(real_path, media_root).replace(os.sep, "/")
+    return prefix.rstrip("/") + "/" + quote(relative)
+
+
+class MediaFileResponse(Response):
+    """输出文件的一段（或全部）内容"""
+
+    def __init__(
+        self,
+        path: str,
+        start: int,
+        length: int,
+        status_code: int,
+        headers: Dict[str, str],
+        media_type: str,
+    ):
+        self.path = path
+        self.start = start
+        self.length = length
+        super().__init__(content=None, status_code=status_code, headers=headers, media_type=media_type)
+        self.headers["content-length"] = str(length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if scope["method"].upper() == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.fileno(),
+                    "offset": self.start,
+                    "count": self.length,
+                    "more_body": False,
+                })
+            return
+
+        remaining = self.length
+        async with await anyio.open_file(self.path, mode="rb") as f:
+            await f.seek(self.start)
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    # 文件在输出过程中被截断
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def stream_media_file(
+    request,
+    path: str,
+    media_type: str,
+    filename: str,
+    max_age: int,
+    immutable: bool = False,
+    attachment: bool = False,
+    vary: Optional[str] = None,
+    etag: Optional[str] = None,
+) -> Response:
+    """按请求头构建媒体文件响应（200/206/304/416）
+
+    etag 默认由文件大小和修改时间生成；内容寻址的缓存文件可传入稳定的ETag。
+
+    Raises:
+        FileNotFoundError: 文件不存在或不是普通文件
+    """
+    stat_result = os.stat(path)
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise FileNotFoundError(path)
+
+    size = stat_result.st_size
+    etag = f'"{etag}"' if etag else make_etag(stat_result)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    cache_control = f"public, max-age={max_age}" + (", immutable" if immutable else "")
+    headers = {
+        "etag": etag,
+        "last-modified": last_modified,
+        "cache-control": cache_control,
+        "accept-ranges": "bytes",
+    }
+    if vary:
+        headers["vary"] = vary
+
+    if _not_modified(request.headers, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    headers["content-disposition"] = content_disposition(filename, attachment)
+
+    accel_path = _accel_path(path)
+    if accel_path:
+        # nginx 根据原请求头自行处理 Range，并用 sendfile 输出
+        headers["x-accel-redirect"] = accel_path
+        return Response(status_code=200, headers=headers, media_type=media_type)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and _if_range_matches(request.headers, etag, last_modified):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            headers["content-range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        return MediaFileResponse(path, 0, size, 200, headers, media_type)
+
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return MediaFileResponse(path, start, end - start + 1, 206, headers, media_type)
@@ -0,0 +1,297 @@
+"""消息全文检索(FTS5)工具
+
+消息搜索和规则关键词筛选原先使用 LIKE '%关键词%'，每次都要全表扫描
+text/sender_name/media_filename 三列。本模块维护一张外部内容(external content)
+FTS5虚拟表，由 telegram_messages 上的触发器保持同步:
+
+- 使用 trigram 分词器，MATCH 语义与原先的子串包含一致，中文无需额外分词
+- keyword_match_condition(): 把规则关键词/排除关键词转换为 FTS MATCH 子查询条件
+- search_condition(): 消息列表 search 参数的过滤条件
+- ranked_search_statement(): 按 bm25 相关度排序并返回高亮片段的搜索语句
+- ensure_message_fts(): 启动时补建索引(数据库由 create_all 建表、未执行迁移的情况)
+
+trigram 无法匹配少于3个字符的关键词，这类关键词以及 FTS5 不可用时
+(非SQLite或SQLite版本过低)自动回退到原来的 LIKE 条件，结果保持一致。
+
+Author: TgGod Team
+Version: 1.0.0
+"""
+
+import logging
+import threading
+from typing import Iterable, Optional, Sequence
+
+from sqlalchemy import String, and_, cast, column, func, literal_column, or_, select, table, text
+from sqlalchemy.exc import OperationalError
+
+from ..database import database_url, engine
+from ..models.telegram import TelegramMessage
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "telegram_messages_fts"
+
+# trigram 分词的最短可匹配长度
+MIN_TRIGRAM_LENGTH = 3
+
+# 规则关键词匹配的列（与原 LIKE 条件一致，不含话题标签）
+RULE_COLUMNS = ("text", "sender_name", "media_filename")
+
+# bm25 列权重: text, sender_name, media_filename, hashtags
+BM25_WEIGHTS = (10.0, 2.0, 4.0, 3.0)
+
+FTS_DDL = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text, sender_name, media_filename, hashtags,
+        content='telegram_messages', content_rowid='id',
+        tokenize='trigram'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON telegram_messages BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text, sender_name, media_filename, hashtags)
+        VALUES (new.id, new.text, new.sender_name, new.media_filename, new.hashtags);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON telegram_messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text, sender_name, media_filename, hashtags)
+        VALUES ('delete', old.id, old.text, old.sender_name, old.media_filename, old.hashtags);
+    END
+    """,
+    # 只在索引列变化时更新，下载状态等高频字段的更新不触及FTS
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+    AFTER UPDATE OF text, sender_name, media_filename, hashtags ON telegram_messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text, sender_name, media_filename, hashtags)
+        VALUES ('delete', old.id, old.text, old.sender_name, old.media_filename, old.hashtags);
+        INSERT INTO {FTS_TABLE}(rowid, text, sender_name, media_filename, hashtags)
+        VALUES (new.id, new.text, new.sender_name, new.media_filename, new.hashtags);
+    END
+    """,
+)
+
+FTS_REBUILD = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')"
+
+_fts = table(FTS_TABLE, column("rowid"))
+
+_available: Optional[bool] = None
+_available_lock = threading.Lock()
+
+
+def _fts_table_exists(connection) -> bool:
+    row = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": FTS_TABLE},
+    ).first()
+    return row is not None
+
+
+def ensure_message_fts() -> bool:
+    """确保FTS索引及同步触发器存在，新建时从现有消息回填
+
+    Returns:
+        FTS是否可用
+    """
+    global _available
+
+    with _available_lock:
+        if "sqlite" not in database_url:
+            _available = False
+            return False
+
+        try:
+            with engine.begin() as connection:
+                created = not _fts_table_exists(connection)
+                for statement in FTS_DDL:
+                    connection.execute(text(statement))
+                if created:
+                    connection.execute(text(FTS_REBUILD))
+                    logger.info("消息全文索引已创建并完成回填")
+            _available = True
+        except OperationalError as e:
+            # SQLite 3.34 之前没有 trigram 分词器
+            logger.warning(f"消息全文索引不可用，关键词匹配回退为LIKE: {e}")
+            _available = False
+
+        return _available
+
+
+def rebuild_message_fts() -> bool:
+    """从 telegram_messages 全量重建FTS索引"""
+    if not is_fts_available():
+        return False
+    with engine.begin() as connection:
+        connection.execute(text(FTS_REBUILD))
+    logger.info("消息全文索引重建完成")
+    return True
+
+
+def is_fts_available() -> bool:
+    """FTS索引是否存在（首次调用时检查一次并缓存）"""
+    global _available
+
+    if _available is None:
+        with _available_lock:
+            if _available is None:
+                if "sqlite" not in database_url:
+                    _available = False
+                else:
+                    try:
+                        with engine.connect() as connection:
+                            _available = _fts_table_exists(connection)
+                    except Exception as e:
+                        logger.warning(f"检查消息全文索引失败: {e}")
+                        return False
+    return _available
+
+
+def quote_phrase(keyword: str) -> str:
+    """把关键词转义为FTS5短语，避免其中的运算符和引号被解析为查询语法"""
+    return '"' + keyword.replace('"', '""') + '"'
+
+
+def build_match_query(
+    keywords: Iterable[str],
+    columns: Optional[Sequence[str]] = None,
+    operator: str = "OR",
+) -> Optional[str]:
+    """构造 MATCH 查询串，columns 为空时匹配全部列"""
+    phrases = [quote_phrase(kw) for kw in keywords if kw]
+    if not phrases:
+        return None
+    if columns:
+        prefix = "{" + " ".join(columns) + "} : "
+        phrases = [prefix + phrase for phrase in phrases]
+    return f" {operator} ".join(phrases)
+
+
+def _match(query: str):
+    return literal_column(FTS_TABLE).op("MATCH")(query)
+
+
+def _like_condition(keyword: str, columns: Sequence[str]):
+    conditions = []
+    for name in columns:
+        attr = getattr(TelegramMessage, name)
+        if name == "hashtags":
+            # JSON列按存储的文本做子串匹配
+            attr = cast(attr, String)
+        conditions.append(and_(attr.isnot(None), attr.contains(keyword)))
+    return or_(*conditions)
+
+
+def _split_keywords(keywords: Iterable[str]):
+    keywords = [kw.strip() for kw in keywords if kw and kw.strip()]
+    if not is_fts_available():
+        return [], keywords
+    indexed = [kw for kw in keywords if len(kw) >= MIN_TRIGRAM_LENGTH]
+    short = [kw for kw in keywords if len(kw) < MIN_TRIGRAM_LENGTH]
+    return indexed, short
+
+
+def keyword_match_condition(
+    keywords: Optional[Iterable[str]],
+    columns: Sequence[str] = RULE_COLUMNS,
+):
+    """任一关键词出现在指定列中的过滤条件，没有有效关键词时返回None
+
+    排除关键词使用 ~keyword_match_condition(exclude_keywords)。
+    """
+    if not keywords:
+        return None
+
+    indexed, short = _split_keywords(keywords)
+    conditions = []
+
+    match_query = build_match_query(indexed, columns)
+    if match_query:
+        conditions.append(
+            TelegramMessage.id.in_(select(_fts.c.rowid).where(_match(match_query)))
+        )
+    conditions.extend(_like_condition(kw, columns) for kw in short)
+
+    if not conditions:
+        return None
+    return or_(*conditions)
+
+
+def search_condition(search: str):
+    """消息搜索条件: 按空白拆分的每个词都需出现在正文、发送者、文件名或话题标签中"""
+    terms = search.split()
+    if not terms:
+        return None
+
+    indexed, short = _split_keywords(terms)
+    all_columns = RULE_COLUMNS + ("hashtags",)
+    conditions = []
+
+    match_query = build_match_query(indexed, operator="AND")
+    if match_query:
+        conditions.append(
+            TelegramMessage.id.in_(select(_fts.c.rowid).where(_match(match_query)))
+        )
+    conditions.extend(_like_condition(term, all_columns) for term in short)
+
+    return and_(*conditions)
+
+
+def ranked_search_statement(
+    search: str,
+    group_id: Optional[int] = None,
+    snippet_tokens: int = 16,
+    highlight: Sequence[str] = ("<mark>", "</mark>"),
+):
+    """按相关度排序的搜索语句
+
+    返回 select(TelegramMessage, score, snippet)。能走FTS时按 bm25 升序
+    (越小越相关)排序并生成高亮片段；否则回退为按时间倒序、片段为NULL。
+    调用方自行追加其他过滤条件和分页。
+    """
+    terms = search.split()
+    indexed, short = _split_keywords(terms)
+    match_query = build_match_query(indexed, operator="AND")
+
+    if match_query:
+        fts_ref = literal_column(FTS_TABLE)
+        score = func.bm25(fts_ref, *BM25_WEIGHTS).label("score")
+        snippet = func.snippet(
+            fts_ref, -1, highlight[0], highlight[1], "…", snippet_tokens
+        ).label("snippet")
+        stmt = (
+            select(TelegramMessage, score, snippet)
+            .join(_fts, _fts.c.rowid == TelegramMessage.id)
+            .where(_match(match_query))
+        )
+        order_by = [score, TelegramMessage.date.desc()]
+    else:
+        stmt = select(
+            TelegramMessage,
+            literal_column("NULL").label("score"),
+            literal_column("NULL").label("snippet"),
+        )
+        order_by = [TelegramMessage.date.desc()]
+
+    all_columns = RULE_COLUMNS + ("hashtags",)
+    for term in short:
+        stmt = stmt.where(_like_condition(term, all_columns))
+    if group_id is not None:
+        stmt = stmt.where(TelegramMessage.group_id == group_id)
+
+    return stmt.order_by(*order_by)
+
+
+def get_fts_status() -> dict:
+    """FTS索引状态，用于诊断接口"""
+    status = {"available": is_fts_available(), "table": FTS_TABLE, "indexed_rows": None}
+    if status["available"]:
+        try:
+            with engine.connect() as connection:
+                status["indexed_rows"] = connection.execute(
+                    text(f"SELECT COUNT(*) FROM {FTS_TABLE}_docsize")
+                ).scalar()
+        except Exception as e:
+            logger.debug(f"读取消息全文索引行数失败: {e}")
+    return status
+
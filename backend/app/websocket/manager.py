@@ -17,6 +17,16 @@ Message Types:
     - message: 实时消息
     - group_status: 群组状态
     - message_stats: 消息统计
+    - task_progress / download_progress: 进度聚合服务按频率合并推送的任务与文件进度
+    - progress_snapshot: 新连接建立时发送的当前进度快照
+
+Topics:
+    - system: 系统状态和通知(不丢弃)
+    - logs: 日志(队列满时丢弃最旧)
+    - task:<id>: 单个任务的进度和状态(队列满时丢弃最旧)
+    - group:<id>: 单个群组的消息和状态(不丢弃)
+    - downloads: 手动下载进度(队列满时丢弃最旧)
+    未发送过订阅请求的客户端默认接收所有主题，保持与旧客户端兼容。
 
 Features:
     - 并发连接支持
@@ -25,25 +35,183 @@ Features:
     - 类型安全的消息传输
     - 实时状态监控
     - 广播和单播支持
+    - 每个客户端独立的有界发送队列和写协程，慢客户端不阻塞其他客户端和调用方
+    - 每次广播只序列化一次
+    - 按主题配置的丢弃策略，队列深度和发送延迟统计
 
 Author: TgGod Team
 Version: 1.0.0
 """
 
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+import asyncio
 import json
 import logging
+import time
 from datetime import datetime
 
+from ..core.metrics import WEBSOCKET_FRAMES, WEBSOCKET_SEND_LATENCY
+
 logger = logging.getLogger(__name__)
 
+# 丢弃策略
+DROP_OLDEST = "drop_oldest"  # 队列满时丢弃该客户端队列中最旧的可丢弃消息
+NEVER_DROP = "never"         # 从不丢弃，超过硬上限视为客户端失去响应并断开
+
+WILDCARD_TOPIC = "*"
+DIRECT_TOPIC = "direct"
+SEND_TIMEOUT = 10.0
+# 不可丢弃消息允许超出队列容量的倍数
+NEVER_DROP_OVERFLOW_FACTOR = 4
+
+_FRAMES_SENT = WEBSOCKET_FRAMES.labels("sent")
+_FRAMES_DROPPED = WEBSOCKET_FRAMES.labels("dropped")
+
+
+@dataclass
+class TopicPolicy:
+    """主题发送策略"""
+    max_queue: int = 256
+    drop_policy: str = DROP_OLDEST
+
+
+# 按主题族(冒号前的部分)配置的默认策略
+DEFAULT_TOPIC_POLICIES: Dict[str, TopicPolicy] = {
+    "system": TopicPolicy(max_queue=256, drop_policy=NEVER_DROP),
+    DIRECT_TOPIC: TopicPolicy(max_queue=256, drop_policy=NEVER_DROP),
+    "group": TopicPolicy(max_queue=512, drop_policy=NEVER_DROP),
+    "task": TopicPolicy(max_queue=64, drop_policy=DROP_OLDEST),
+    "downloads": TopicPolicy(max_queue=64, drop_policy=DROP_OLDEST),
+    "logs": TopicPolicy(max_queue=256, drop_policy=DROP_OLDEST),
+}
+
+_PROGRESS_TYPES = {"progress", "task_progress", "task_status", "download_progress"}
+_GROUP_TYPES = {"message", "message_stats", "group_status", "monthly_sync_progress", "monthly_sync_complete"}
+
 def datetime_handler(obj):
     """JSON序列化时处理datetime对象"""
     if isinstance(obj, datetime):
         return obj.isoformat()
     raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
 
+def topic_family(topic: str) -> str:
+    """主题族，例如 task:12 -> task"""
+    return topic.split(":", 1)[0]
+
+
+def infer_topic(message: dict) -> str:
+    """根据消息类型推断主题，供未显式指定主题的广播使用"""
+    message_type = message.get("type")
+    data = message.get("data") if isinstance(message.get("data"), dict) else {}
+    if message_type == "log":
+        return "logs"
+    if message_type in _PROGRESS_TYPES:
+        task_id = message.get("task_id", data.get("task_id"))
+        return f"task:{task_id}" if task_id is not None else "downloads"
+    if message_type in _GROUP_TYPES:
+        group_id = message.get("group_id", data.get("group_id", data.get("chat_id")))
+        if group_id is not None:
+            return f"group:{group_id}"
+    return "system"
+
+
+@dataclass
+class _OutboundFrame:
+    text: str
+    topic: str
+    droppable: bool
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class ClientChannel:
+    """单个客户端的发送通道: 有界队列 + 独立写协程"""
+
+    def __init__(self, client_id: str, websocket: WebSocket, on_failure):
+        self.client_id = client_id
+        self.websocket = websocket
+        self.subscriptions: Set[str] = {WILDCARD_TOPIC}
+        self.explicit_subscriptions = False
+        self.queue: Deque[_OutboundFrame] = deque()
+        self.connected_at = time.time()
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.latencies: Deque[float] = deque(maxlen=512)
+        self._wakeup = asyncio.Event()
+        self._on_failure = on_failure
+        self._closed = False
+        self._writer = asyncio.create_task(self._writer_loop())
+
+    def wants(self, topic: str) -> bool:
+        if topic == DIRECT_TOPIC or WILDCARD_TOPIC in self.subscriptions:
+            return True
+        return topic in self.subscriptions or f"{topic_family(topic)}:*" in self.subscriptions
+
+    def enqueue(self, frame: _OutboundFrame, policy: TopicPolicy) -> bool:
+        """入队，返回False表示客户端已积压到必须断开"""
+        if self._closed:
+            return True
+        if len(self.queue) >= policy.max_queue:
+            if frame.droppable:
+                victim = next((f for f in self.queue if f.droppable), None)
+                if victim is None:
+                    self.dropped += 1
+                    _FRAMES_DROPPED.inc()
+                    return True
+                self.queue.remove(victim)
+                self.dropped += 1
+                _FRAMES_DROPPED.inc()
+            elif len(self.queue) >= policy.max_queue * NEVER_DROP_OVERFLOW_FACTOR:
+                return False
+        self.queue.append(frame)
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self._wakeup.set()
+        return True
+
+    async def _writer_loop(self):
+        try:
+            while True:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                frame = self.queue.popleft()
+                await asyncio.wait_for(self.websocket.send_text(frame.text), timeout=SEND_TIMEOUT)
+                latency = time.monotonic() - frame.enqueued_at
+                self.sent += 1
+                self.latencies.append(latency)
+                WEBSOCKET_SEND_LATENCY.observe(latency)
+                _FRAMES_SENT.inc()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending to {self.client_id}: {e}")
+            self._on_failure(self.client_id, self)
+
+    def close(self):
+        self._closed = True
+        self.queue.clear()
+        if not self._writer.done() and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0
+        return {
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "avg_send_latency_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "p99_send_latency_ms": round(p99 * 1000, 2),
+            "subscriptions": sorted(self.subscriptions),
+            "connected_seconds": round(time.time() - self.connected_at, 1),
+        }
+
+
 class WebSocketManager:
     """实时WebSocket连接管理器
 
@@ -53,6 +221,7 @@ class WebSocketManager:
 
     Attributes:
         active_connections (Dict[str, WebSocket]): 活跃连接字典，键为客户端ID
+        channels (Dict[str, ClientChannel]): 每个客户端的发送通道(队列、写协程、订阅)
 
     Methods:
         connect(): 建立新的WebSocket连接
@@ -77,9 +246,13 @@ class WebSocketManager:
     def __init__(self):
         """初始化WebSocket管理器
 
-        创建空的活跃连接字典。
+        创建空的活跃连接字典和默认主题策略。
         """
         self.active_connections: Dict[str, WebSocket] = {}
+        self.channels: Dict[str, ClientChannel] = {}
+        self.topic_policies: Dict[str, TopicPolicy] = dict(DEFAULT_TOPIC_POLICIES)
+        self.topic_stats: Dict[str, Dict[str, int]] = {}
+        self.disconnected_slow_clients = 0
     
     async def connect(self, websocket: WebSocket, client_id: str):
         """建立新的WebSocket连接
@@ -100,7 +273,11 @@ class WebSocketManager:
             - 连接成功后客户端可以接收实时消息
         """
         await websocket.accept()
+        old_channel = self.channels.pop(client_id, None)
+        if old_channel:
+            old_channel.close()
         self.active_connections[client_id] = websocket
+        self.channels[client_id] = ClientChannel(client_id, websocket, self._on_channel_failure)
         logger.info(f"Client {client_id} connected. Total connections: {len(self.active_connections)}")
     
     def disconnect(self, client_id: str):
@@ -121,6 +298,9 @@ class WebSocketManager:
             - 通常在发送消息失败时自动调用
             - 客户端主动断开时也会调用
         """
+        channel = self.channels.pop(client_id, None)
+        if channel:
+            channel.close()
         if client_id in self.active_connections:
             del self.active_connections[client_id]
             logger.info(f"Client {client_id} disconnected. Total connections: {len(self.active_connections)}")
@@ -148,26 +328,31 @@ class WebSocketManager:
             - 如果客户端不存在，静默忽略
             - 支持任意复杂的JSON数据结构
         """
-        if client_id in self.active_connections:
-            try:
-                await self.active_connections[client_id].send_text(json.dumps(message, default=datetime_handler))
-            except Exception as e:
-                logger.error(f"Error sending message to {client_id}: {e}")
-                self.disconnect(client_id)
+        channel = self.channels.get(client_id)
+        if channel is None:
+            return
+        try:
+            frame = _OutboundFrame(json.dumps(message, default=datetime_handler), DIRECT_TOPIC, droppable=False)
+        except Exception as e:
+            logger.error(f"Error serializing message to {client_id}: {e}")
+            return
+        self._enqueue(channel, frame, self.get_topic_policy(DIRECT_TOPIC))
     
-    async def broadcast(self, message: dict):
-        """广播消息给所有连接的客户端
+    async def broadcast(self, message: dict, topic: Optional[str] = None):
+        """广播消息给订阅了该主题的客户端
 
-        同时向所有活跃的WebSocket连接发送相同的消息。
+        消息只序列化一次，然后放入每个订阅客户端的发送队列，由各自的写协程发送，
+        调用方不等待任何客户端的网络写入。
 
         Args:
             message (dict): 要广播的消息字典
+            topic (str, optional): 消息主题，为None时根据消息类型推断
 
         Process:
-            1. 遍历所有活跃连接
-            2. 尝试向每个客户端发送消息
-            3. 收集发送失败的客户端
-            4. 清理断开的连接
+            1. 确定主题和对应的丢弃策略
+            2. 序列化一次
+            3. 放入所有订阅客户端的队列，队列满时按策略丢弃
+            4. 积压超过硬上限的客户端被断开
 
         Error Handling:
             - 单个客户端发送失败不影响其他客户端
@@ -180,21 +365,105 @@ class WebSocketManager:
             - 实时数据同步
 
         Note:
-            - 高并发情况下可能较慢
-            - 大消息可能影响性能
+            - 慢客户端只影响自己的队列
         """
-        disconnected_clients = []
-
-        for client_id, connection in self.active_connections.items():
-            try:
-                await connection.send_text(json.dumps(message, default=datetime_handler))
-            except Exception as e:
-                logger.error(f"Error broadcasting to {client_id}: {e}")
-                disconnected_clients.append(client_id)
-        
-        # 清理断开的连接
-        for client_id in disconnected_clients:
+        topic = topic or infer_topic(message)
+        policy = self.get_topic_policy(topic)
+        stats = self.topic_stats.setdefault(topic_family(topic), {"published": 0, "delivered": 0})
+        stats["published"] += 1
+
+        targets = [channel for channel in list(self.channels.values()) if channel.wants(topic)]
+        if not targets:
+            return
+        try:
+            text = json.dumps(message, default=datetime_handler)
+        except Exception as e:
+            logger.error(f"Error serializing broadcast message: {e}")
+            return
+
+        droppable = policy.drop_policy == DROP_OLDEST
+        for channel in targets:
+            if self._enqueue(channel, _OutboundFrame(text, topic, droppable), policy):
+                stats["delivered"] += 1
+
+    async def broadcast_message(self, message: dict, topic: Optional[str] = None):
+        """broadcast的别名，兼容旧调用"""
+        await self.broadcast(message, topic)
+
+    def _enqueue(self, channel: ClientChannel, frame: _OutboundFrame, policy: TopicPolicy) -> bool:
+        if channel.enqueue(frame, policy):
+            return True
+        logger.warning(f"Client {channel.client_id} 发送队列积压 {len(channel.queue)} 条，断开慢客户端")
+        self.disconnected_slow_clients += 1
+        self._drop_channel(channel.client_id, channel)
+        return False
+
+    def _on_channel_failure(self, client_id: str, channel: ClientChannel):
+        self._drop_channel(client_id, channel)
+
+    def _drop_channel(self, client_id: str, channel: ClientChannel):
+        # 只清理仍是当前通道的连接，避免误删同一client_id的新连接
+        if self.channels.get(client_id) is channel:
             self.disconnect(client_id)
+            asyncio.get_running_loop().create_task(self._close_socket(channel.websocket))
+        else:
+            channel.close()
+
+    @staticmethod
+    async def _close_socket(websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    # ------------------------------------------------------------------
+    # 主题订阅
+    # ------------------------------------------------------------------
+
+    def subscribe(self, client_id: str, topics: Iterable[str], exclusive: bool = True) -> List[str]:
+        """订阅主题
+
+        客户端首次显式订阅时取消默认的全部订阅，之后只接收system、定向消息和已订阅主题。
+        支持 task:* / group:* 形式的通配。
+
+        Args:
+            client_id: 客户端ID
+            topics: 主题列表
+            exclusive: 为False时只追加主题，不取消默认的全部订阅(用于旧的subscribe_group协议)
+
+        Returns:
+            List[str]: 当前订阅的主题
+        """
+        channel = self.channels.get(client_id)
+        if channel is None:
+            return []
+        if exclusive and not channel.explicit_subscriptions:
+            channel.subscriptions = {"system"}
+            channel.explicit_subscriptions = True
+        channel.subscriptions.update(str(topic) for topic in topics if topic)
+        return sorted(channel.subscriptions)
+
+    def unsubscribe(self, client_id: str, topics: Iterable[str]) -> List[str]:
+        """取消订阅主题"""
+        channel = self.channels.get(client_id)
+        if channel is None:
+            return []
+        channel.subscriptions.difference_update(str(topic) for topic in topics)
+        return sorted(channel.subscriptions)
+
+    def configure_topic(self, topic_family_name: str, max_queue: Optional[int] = None,
+                        drop_policy: Optional[str] = None):
+        """修改某个主题族的队列容量和丢弃策略"""
+        if drop_policy is not None and drop_policy not in (DROP_OLDEST, NEVER_DROP):
+            raise ValueError(f"不支持的丢弃策略: {drop_policy}")
+        current = self.get_topic_policy(topic_family_name)
+        self.topic_policies[topic_family_name] = TopicPolicy(
+            max_queue=max(1, max_queue) if max_queue else current.max_queue,
+            drop_policy=drop_policy or current.drop_policy,
+        )
+
+    def get_topic_policy(self, topic: str) -> TopicPolicy:
+        return self.topic_policies.get(topic_family(topic)) or self.topic_policies["system"]
     
     async def send_log(self, log_data: dict, client_id: str = None):
         """发送日志消息到客户端
@@ -405,6 +674,28 @@ class WebSocketManager:
             - 不包括断开的连接
         """
         return len(self.active_connections)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接、队列深度和发送延迟统计"""
+        clients = {client_id: channel.get_stats() for client_id, channel in self.channels.items()}
+        return {
+            "connection_count": len(self.active_connections),
+            "total_queue_depth": sum(c["queue_depth"] for c in clients.values()),
+            "max_queue_depth": max((c["max_queue_depth"] for c in clients.values()), default=0),
+            "total_sent": sum(c["sent"] for c in clients.values()),
+            "total_dropped": sum(c["dropped"] for c in clients.values()),
+            "max_p99_send_latency_ms": max((c["p99_send_latency_ms"] for c in clients.values()), default=0.0),
+            "disconnected_slow_clients": self.disconnected_slow_clients,
+            "topics": {
+                name: {
+                    **counters,
+                    "max_queue": self.get_topic_policy(name).max_queue,
+                    "drop_policy": self.get_topic_policy(name).drop_policy,
+                }
+                for name, counters in self.topic_stats.items()
+            },
+            "clients": clients,
+        }
     
     def get_connected_clients(self) -> List[str]:
         """获取当前所有活跃客户端的ID列表
@@ -460,16 +751,10 @@ class WebSocketManager:
             - 与其他send_*方法不同，不会自动添加timestamp
             - 需要客户端在活跃连接列表中
         """
-        logger.info(f"尝试发送消息到客户端 {client_id}, 消息类型: {message_data.get('type', 'unknown')}")
+        logger.debug(f"尝试发送消息到客户端 {client_id}, 消息类型: {message_data.get('type', 'unknown')}")
         
-        if client_id in self.active_connections:
-            try:
-                message_json = json.dumps(message_data)
-                await self.active_connections[client_id].send_text(message_json)
-                logger.info(f"消息成功发送到 {client_id}: {message_data.get('type', 'unknown')}")
-            except Exception as e:
-                logger.error(f"发送消息到 {client_id} 失败: {e}")
-                self.disconnect(client_id)
+        if client_id in self.channels:
+            await self.send_personal_message(message_data, client_id)
         else:
             logger.warning(f"客户端 {client_id} 不在活跃连接列表中，当前连接: {list(self.active_connections.keys())}")
     
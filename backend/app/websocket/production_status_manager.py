@@ -25,13 +25,13 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any, Callable
 from dataclasses import dataclass, asdict
 from enum import Enum
-import psutil
 import socket
 import threading
 from pathlib import Path
 
 from app.websocket.manager import websocket_manager
 from app.services.service_monitor import ServiceMonitor
+from app.services.system_metrics_sampler import get_system_metrics_sampler
 from app.database import get_db
 from sqlalchemy.orm import Session
 
@@ -630,7 +630,7 @@ class ProductionStatusManager:
     async def _check_filesystem_health(self) -> Dict[str, Any]:
         """Check filesystem health and space"""
         try:
-            disk_usage = psutil.disk_usage("/")
+            disk_usage = get_system_metrics_sampler().latest().disk
             free_space_percent = (disk_usage.free / disk_usage.total) * 100
 
             metrics = {
@@ -673,39 +673,26 @@ class ProductionStatusManager:
     async def _collect_system_metrics(self):
         """Collect comprehensive system performance metrics"""
         try:
-            # CPU metrics
-            cpu_percent = psutil.cpu_percent(interval=1)
-
-            # Memory metrics
-            memory = psutil.virtual_memory()
-            memory_percent = memory.percent
+            # Read the latest sample instead of blocking the event loop on psutil
+            snapshot = get_system_metrics_sampler().latest()
 
             # Disk metrics
-            disk = psutil.disk_usage("/")
-            disk_percent = (disk.used / disk.total) * 100
-
-            # Network I/O
-            network_io = psutil.net_io_counters()._asdict()
-
-            # System load
-            try:
-                load_avg = list(psutil.getloadavg())
-            except AttributeError:
-                load_avg = [0.0, 0.0, 0.0]  # Windows fallback
+            disk = snapshot.disk
+            disk_percent = (disk.used / disk.total) * 100 if disk else 0.0
 
             # WebSocket connections
             active_connections = websocket_manager.get_connection_count()
 
             self.system_metrics = SystemMetrics(
-                cpu_percent=cpu_percent,
-                memory_percent=memory_percent,
+                cpu_percent=snapshot.cpu_percent,
+                memory_percent=snapshot.memory_percent,
                 disk_percent=disk_percent,
-                network_io=network_io,
+                network_io=snapshot.network_io,
                 active_connections=active_connections,
                 total_tasks=0,  # Will be updated by task service
                 failed_tasks=0,  # Will be updated by task service
-                uptime=time.time() - psutil.boot_time(),
-                load_average=load_avg,
+                uptime=snapshot.uptime,
+                load_average=list(snapshot.load_average),
             )
 
         except Exception as e: